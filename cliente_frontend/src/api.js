@@ -26,4 +26,63 @@ apiClient.interceptors.request.use(
   }
 );
 
+// 5. Los listados vienen paginados por cursor: { next, previous, results }.
+// Esta función sigue los "next" y junta todas las páginas, devolviendo
+// { data: [...] } igual que un apiClient.get de antes.
+export const obtenerTodos = async (url, params = {}) => {
+  let respuesta = await apiClient.get(url, { params });
+  if (!respuesta.data || !Array.isArray(respuesta.data.results)) return respuesta;
+
+  const data = [...respuesta.data.results];
+  while (respuesta.data.next) {
+    respuesta = await apiClient.get(respuesta.data.next);
+    data.push(...respuesta.data.results);
+  }
+  return { data };
+};
+
+// 6. Avisos en vivo del servidor (Server-Sent Events). `alRecibir(tipo, datos)`
+// se llama con 'pedido', 'pedido_borrado', 'ruta', 'incidencia' o 'reinicio'
+// (este último: se perdieron avisos, hay que recargar todo). `alConectar(true/false)`
+// avisa si el canal está abierto; si el servidor no lo soporta queda en false.
+// Devuelve una función para cerrar la conexión.
+export const suscribirEventos = (alRecibir, alConectar = () => {}) => {
+  const token = localStorage.getItem('token');
+  if (!token || typeof EventSource === 'undefined') return () => {};
+
+  const fuente = new EventSource(`${apiClient.defaults.baseURL}/eventos/?token=${encodeURIComponent(token)}`);
+  ['pedido', 'pedido_borrado', 'ruta', 'incidencia', 'reinicio'].forEach(tipo => {
+    fuente.addEventListener(tipo, evento => alRecibir(tipo, JSON.parse(evento.data)));
+  });
+  fuente.onopen = () => alConectar(true);
+  fuente.onerror = () => alConectar(false);  // EventSource reintenta solo
+  return () => fuente.close();
+};
+
+// 7. Las operaciones pesadas (asignar rutas, despacho masivo) pueden responder
+// 202 con una tarea de la cola del servidor. Esta función consulta la tarea
+// hasta que termina y devuelve { data: resultado } como si la respuesta hubiera
+// llegado directo; si falla, rechaza con el mismo formato de error de axios.
+const errorDeTarea = (datos) => {
+  const error = new Error(datos.error);
+  error.response = { data: datos };
+  return error;
+};
+
+export const esperarTarea = async (respuesta, cadaMs = 1000, maxEsperaMs = 5 * 60 * 1000) => {
+  if (respuesta.status !== 202 || !respuesta.data.tarea_id) return respuesta;
+
+  const limite = Date.now() + maxEsperaMs;
+  let tarea = respuesta.data;
+  while (tarea.estado === 'pendiente' || tarea.estado === 'en_curso') {
+    if (Date.now() > limite) {
+      throw errorDeTarea({ error: "La tarea sigue en cola; revise más tarde si se completó." });
+    }
+    await new Promise(listo => setTimeout(listo, cadaMs));
+    tarea = (await apiClient.get(`/tareas/${tarea.tarea_id}/`)).data;
+  }
+  if (tarea.estado === 'fallida') throw errorDeTarea({ ...(tarea.resultado || {}), error: tarea.error });
+  return { data: tarea.resultado };
+};
+
 export default apiClient;
\ No newline at end of file
@@ -1,5 +1,5 @@
 import React, { useState, useEffect } from 'react';
-import apiClient from '../api';
+import apiClient, { obtenerTodos } from '../api';
 import { Link } from 'react-router-dom';
 // Importamos los iconos necesarios (Teléfono, Camión, etc.)
 import { FaUserTie, FaIdCard, FaTrash, FaEdit, FaPlus, FaPhone, FaTruck, FaUserLock } from 'react-icons/fa';
@@ -21,7 +21,7 @@ function ConductoresPage() {
   const [showForm, setShowForm] = useState(false);
 
   const fetchConductores = () => {
-    apiClient.get('/conductores/')
+    obtenerTodos('/conductores/')
       .then(response => {
         setConductores(response.data);
         setLoading(false);
@@ -1,5 +1,5 @@
-import React, { useState, useEffect } from 'react';
-import apiClient from '../api';
+import React, { useState, useEffect, useRef } from 'react';
+import apiClient, { esperarTarea, obtenerTodos, suscribirEventos } from '../api';
 import { MapContainer, TileLayer, Marker, Popup } from 'react-leaflet';
 import 'leaflet/dist/leaflet.css';
 import L from 'leaflet';
@@ -40,8 +40,9 @@ function LogisticaPage() {
   const fetchData = () => {
     setLoading(true);
     Promise.all([
-      apiClient.get('/pedidos/'),
-      apiClient.get('/conductores/')
+      // Sólo los pedidos abiertos: el historial entregado no se muestra aquí
+      obtenerTodos('/pedidos/', { estado: 'pendiente,en_camino' }),
+      obtenerTodos('/conductores/')
     ])
       .then(([responsePedidos, responseConductores]) => {
         setPedidos(responsePedidos.data);
@@ -56,6 +57,48 @@ function LogisticaPage() {
 
   useEffect(() => { fetchData(); }, []);
 
+  // --- AVISOS EN VIVO ---
+  // Con el canal abierto, los cambios (propios o de otros) llegan como eventos
+  // y sólo se vuelve a pedir lo que cambió, no las listas completas.
+  const enVivo = useRef(false);
+  const recargarSiNoHayEventos = () => { if (!enVivo.current) fetchData(); };
+
+  const ABIERTOS = ['pendiente', 'en_camino'];
+  const actualizarPedidos = (nuevos, quitarIds = []) => {
+    setPedidos(prev => {
+      const porId = new Map(prev.map(p => [p.id, p]));
+      quitarIds.forEach(id => porId.delete(id));
+      nuevos.forEach(p => ABIERTOS.includes(p.estado) ? porId.set(p.id, p) : porId.delete(p.id));
+      return [...porId.values()].sort((a, b) => a.id - b.id);
+    });
+  };
+  const actualizarConductor = (conductor) => {
+    setConductores(prev => prev.map(c => c.id === conductor.id ? conductor : c));
+  };
+
+  useEffect(() => {
+    const alRecibir = (tipo, datos) => {
+      if (tipo === 'reinicio') {
+        fetchData();
+      } else if (tipo === 'pedido_borrado') {
+        actualizarPedidos([], [datos.id]);
+      } else if (tipo === 'pedido') {
+        if (!ABIERTOS.includes(datos.estado)) { actualizarPedidos([], [datos.id]); return; }
+        apiClient.get(`/pedidos/${datos.id}/`)
+          .then(r => actualizarPedidos([r.data]))
+          .catch(err => console.error(err));
+      } else if (tipo === 'ruta') {
+        obtenerTodos('/pedidos/', { ruta: datos.id })
+          .then(r => actualizarPedidos(r.data))
+          .catch(err => console.error(err));
+        apiClient.get(`/conductores/${datos.conductor_id}/`)
+          .then(r => actualizarConductor(r.data))
+          .catch(err => console.error(err));
+      }
+    };
+    return suscribirEventos(alRecibir, abierto => { enVivo.current = abierto; });
+  }, []);
+
   const handleDeletePedido = (id) => {
     if(window.confirm("¿Estás seguro de eliminar este pedido? Se borrará permanentemente.")) {
         apiClient.delete(`/pedidos/${id}/`)
@@ -64,7 +107,7 @@ function LogisticaPage() {
                 if(pedidosSeleccionados.includes(id)) {
                     handleTogglePedido(id);
                 }
-                fetchData(); // Recargamos
+                recargarSiNoHayEventos();
                 // Si el modal estaba abierto con este pedido, lo cerramos
                 if (pedidoVer && pedidoVer.id === id) cerrarModal();
             })
@@ -87,21 +130,52 @@ function LogisticaPage() {
     if (pedidosSeleccionados.length === 0) { alert("Seleccione al menos un pedido."); return; }
     if (!conductorSeleccionado) { alert("Seleccione un conductor."); return; }
 
-    const datosAsignacion = {
+    const asignar = (reasignar) => apiClient.post('/logistica/asignar-ruta/', {
       conductor_id: conductorSeleccionado,
-      pedido_ids: pedidosSeleccionados
-    };
-
-    apiClient.post('/logistica/asignar-ruta/', datosAsignacion)
+      pedido_ids: pedidosSeleccionados,
+      reasignar
+    })
+      .then(esperarTarea)
       .then(response => {
         alert(response.data.mensaje);
         setPedidosSeleccionados([]);
         setConductorSeleccionado('');
-        fetchData();
+        recargarSiNoHayEventos();
       })
       .catch(error => {
         console.error("Error:", error);
-        alert("Error al asignar la ruta.");
+        // Pedidos que ya están en la ruta de otro conductor: moverlos sólo si se confirma
+        const yaAsignados = error.response?.status === 409 && error.response.data?.pedido_ids;
+        if (!reasignar && yaAsignados &&
+            window.confirm(`Los pedidos ${yaAsignados.join(', ')} ya tienen ruta. ¿Reasignarlos a este conductor?`)) {
+          asignar(true);
+          return;
+        }
+        alert(error.response?.data?.error || "Error al asignar la ruta.");
+      });
+
+    asignar(false);
+  };
+
+  // Reparte TODOS los pendientes entre los conductores disponibles en una sola llamada
+  const handleDespachoMasivo = () => {
+    if (!window.confirm("¿Repartir todos los pedidos pendientes entre los conductores disponibles?")) return;
+
+    apiClient.post('/logistica/despacho-masivo/', {})
+      .then(esperarTarea)
+      .then(response => {
+        let mensaje = response.data.mensaje;
+        if (response.data.sin_asignar.length > 0) {
+          mensaje += `\nSin asignar (capacidad o GPS): ${response.data.sin_asignar.length} pedidos.`;
+        }
+        alert(mensaje);
+        setPedidosSeleccionados([]);
+        setConductorSeleccionado('');
+        recargarSiNoHayEventos();
+      })
+      .catch(error => {
+        console.error("Error:", error);
+        alert(error.response?.data?.error || "Error en el despacho masivo.");
       });
   };
 
@@ -210,6 +284,9 @@ function LogisticaPage() {
             <button type="submit" className="btn btn-primary width-100">
               <FiSend /> ASIGNAR AHORA
             </button>
+            <button type="button" className="btn btn-success width-100" style={{marginTop: '10px'}} onClick={handleDespachoMasivo}>
+              <FaRoute /> DESPACHO AUTOMÁTICO
+            </button>
           </form>
         </section>
 
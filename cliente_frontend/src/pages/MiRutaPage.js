@@ -1,6 +1,6 @@
-import React, { useState, useEffect } from 'react';
-import apiClient from '../api';
-import { MapContainer, TileLayer, Marker, Popup, Polyline } from 'react-leaflet';
+import React, { useState, useEffect, useRef } from 'react';
+import apiClient, { suscribirEventos } from '../api';
+import { MapContainer, TileLayer, Marker, CircleMarker, Popup, Polyline } from 'react-leaflet';
 import 'leaflet/dist/leaflet.css';
 import L from 'leaflet';
 // ... (tus importaciones de iconos siguen igual) ...
@@ -15,6 +15,7 @@ L.Icon.Default.mergeOptions({
 });
 
 const centroCochabamba = [-17.393879, -66.156944];
+const ENVIAR_GPS_CADA_MS = 15000;
 
 function MiRutaPage() {
   const [datosRuta, setDatosRuta] = useState(null);
@@ -22,15 +23,21 @@ function MiRutaPage() {
   const [error, setError] = useState(null);
   const [rutaPolilinea, setRutaPolilinea] = useState([]); // Estado para la línea de calle
 
-  const fetchRuta = () => {
-    setLoading(true);
-    apiClient.get('/mi-ruta/')
+  // Primera carga: la ruta completa. Después de cada entrega se pide sólo lo
+  // que cambió desde la última `version` (?since=) y se mezcla con lo que hay.
+  const fetchRuta = (anterior = null) => {
+    if (!anterior) setLoading(true);
+    const params = anterior && anterior.version ? { since: anterior.version } : {};
+    apiClient.get('/mi-ruta/', { params })
       .then(response => {
-        setDatosRuta(response.data);
+        const datos = mezclarCambios(anterior, response.data);
+        setDatosRuta(datos);
         setLoading(false);
-        // Una vez tenemos los datos, calculamos la ruta visual
-        if (response.data && response.data.pedidos) {
-           calcularRutaCalles(response.data);
+        // Sólo se recalcula el recorrido si cambiaron las paradas
+        const cambiaron = !anterior || response.data.completa !== false
+          || response.data.cambiados.length > 0 || response.data.quitados.length > 0;
+        if (datos.pedidos && datos.pedidos.length > 0 && cambiaron) {
+           calcularRutaCalles(datos);
         }
       })
       .catch(err => {
@@ -40,43 +47,38 @@ function MiRutaPage() {
       });
   };
 
-  // --- FUNCIÓN PARA OBTENER LA RUTA POR CALLES (OSRM) ---
+  const mezclarCambios = (anterior, respuesta) => {
+    if (!anterior || respuesta.completa !== false) return respuesta;
+    const { cambiados, quitados, ...cabecera } = respuesta;
+    const porId = new Map((anterior.pedidos || []).map(p => [p.id, p]));
+    quitados.forEach(id => porId.delete(id));
+    cambiados.forEach(p => porId.set(p.id, p));
+    const pedidos = [...porId.values()].sort((a, b) => a.secuencia - b.secuencia);
+    if (pedidos.length === 0) return { mensaje: "Has completado tu ruta.", version: respuesta.version };
+    return { ...cabecera, pedidos };
+  };
+
+  // --- FUNCIÓN PARA OBTENER LA RUTA POR CALLES (servidor) ---
   const calcularRutaCalles = async (data) => {
     const origen = data.origen;
     const pedidos = data.pedidos || [];
     
     if (pedidos.length === 0) return;
 
-    // Construimos la URL de coordenadas: longitud,latitud;longitud,latitud...
-    // OSRM usa formato: lon,lat
-    let coordenadasStr = `${origen.lng},${origen.lat}`;
-    
-    pedidos.forEach(p => {
-        if(p.latitud && p.longitud) {
-            coordenadasStr += `;${p.longitud},${p.latitud}`;
-        }
-    });
-
-    // Llamada a la API pública de OSRM (Gratuita para demos)
-    const url = `https://router.project-osrm.org/route/v1/driving/${coordenadasStr}?overview=full&geometries=geojson`;
+    // Puntos en orden de visita como [lat, lng] (el mismo formato que usa Leaflet)
+    const puntos = [
+        [origen.lat, origen.lng],
+        ...pedidos.filter(p => p.latitud && p.longitud).map(p => [p.latitud, p.longitud])
+    ];
 
     try {
-        const response = await fetch(url);
-        const json = await response.json();
-        
-        if (json.code === 'Ok' && json.routes.length > 0) {
-            // OSRM devuelve [lon, lat], Leaflet necesita [lat, lon]. Invertimos.
-            const geometria = json.routes[0].geometry.coordinates.map(coord => [coord[1], coord[0]]);
-            setRutaPolilinea(geometria);
-        }
+        // El backend calcula el recorrido con el mapa de calles local y lo guarda en caché
+        const response = await apiClient.post('/logistica/ruta-vial/', { puntos });
+        setRutaPolilinea(response.data.geometria);
     } catch (error) {
         console.error("Error calculando ruta visual:", error);
-        // Fallback: Si falla OSRM, usamos línea recta
-        const lineaRecta = [
-            [origen.lat, origen.lng],
-            ...pedidos.map(p => [p.latitud, p.longitud])
-        ];
-        setRutaPolilinea(lineaRecta);
+        // Fallback: Si el servidor no tiene mapa de calles, usamos línea recta
+        setRutaPolilinea(puntos);
     }
   };
 
@@ -84,13 +86,61 @@ function MiRutaPage() {
     fetchRuta();
   }, []);
 
+  // --- AVISOS EN VIVO ---
+  // Si el despacho agrega paradas o cambia un pedido de la ruta, se piden sólo los cambios.
+  const datosActuales = useRef(null);
+  const enVivo = useRef(false);
+  useEffect(() => { datosActuales.current = datosRuta; }, [datosRuta]);
+
+  useEffect(() => {
+    const alRecibir = (tipo) => {
+      if (tipo === 'reinicio') fetchRuta();
+      else if (tipo === 'pedido' || tipo === 'pedido_borrado' || tipo === 'ruta') fetchRuta(datosActuales.current);
+    };
+    return suscribirEventos(alRecibir, abierto => { enVivo.current = abierto; });
+  }, []);
+
+  // --- GPS DEL CONDUCTOR ---
+  // Las posiciones se juntan y se mandan en lotes cada ENVIAR_GPS_CADA_MS.
+  const [miPosicion, setMiPosicion] = useState(null);
+  const muestrasGps = useRef([]);
+
+  useEffect(() => {
+    if (!navigator.geolocation) return undefined;
+    const vigilancia = navigator.geolocation.watchPosition(
+      pos => {
+        const muestra = { lat: pos.coords.latitude, lng: pos.coords.longitude, t: pos.timestamp };
+        muestrasGps.current.push(muestra);
+        setMiPosicion([muestra.lat, muestra.lng]);
+      },
+      err => console.error("GPS no disponible:", err),
+      { enableHighAccuracy: true, maximumAge: 5000 }
+    );
+    const enviar = () => {
+      const muestras = muestrasGps.current.splice(0, 500);
+      if (muestras.length === 0) return;
+      apiClient.post('/conductor/telemetria/', { muestras })
+        .catch(err => {
+          // Sin conexión se guardan para el próximo envío; si el servidor las rechazó, no
+          if (!err.response) muestrasGps.current = [...muestras, ...muestrasGps.current].slice(-2000);
+        });
+    };
+    const intervalo = setInterval(enviar, ENVIAR_GPS_CADA_MS);
+    return () => {
+      navigator.geolocation.clearWatch(vigilancia);
+      clearInterval(intervalo);
+      enviar();
+    };
+  }, []);
+
   const marcarEntregado = (pedidoId) => {
     if (!window.confirm("¿Confirmar entrega y pago del pedido?")) return;
 
     apiClient.patch(`/pedidos/${pedidoId}/`, { estado: 'entregado' })
       .then(() => {
         alert("¡Entrega registrada!");
-        fetchRuta(); 
+        // Con el canal abierto el aviso de la entrega ya trae los cambios
+        if (!enVivo.current) fetchRuta(datosRuta);
       })
       .catch(err => {
         alert("Error al actualizar");
@@ -144,6 +194,13 @@ function MiRutaPage() {
               <Popup>🏭 Fábrica PIL (Inicio)</Popup>
             </Marker>
 
+            {/* Posición actual del conductor */}
+            {miPosicion && (
+              <CircleMarker center={miPosicion} radius={9} pathOptions={{ color: '#fff', fillColor: '#28a745', fillOpacity: 1, weight: 3 }}>
+                <Popup>🚚 Estás aquí</Popup>
+              </CircleMarker>
+            )}
+
             {/* Marcadores de Pedidos */}
             {pedidos.map((pedido, index) => (
               pedido.latitud && (
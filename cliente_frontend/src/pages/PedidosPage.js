@@ -1,5 +1,5 @@
 import React, { useState, useEffect } from 'react'; 
-import apiClient from '../api'; 
+import apiClient, { obtenerTodos } from '../api'; 
 import { MapContainer, TileLayer, Marker, useMapEvents, useMap } from 'react-leaflet'; 
 import 'leaflet/dist/leaflet.css';
 import L from 'leaflet';
@@ -58,8 +58,8 @@ function PedidosPage() {
   // --- FUNCIÓN PARA RECARGAR DATOS (Útil después de crear un cliente nuevo) ---
   const cargarDatos = () => {
     Promise.all([
-      apiClient.get(API_CLIENTES),
-      apiClient.get(API_PRODUCTOS)
+      obtenerTodos(API_CLIENTES),
+      obtenerTodos(API_PRODUCTOS)
     ])
     .then(([responseClientes, responseProductos]) => {
       setClientes(responseClientes.data);
@@ -1,5 +1,5 @@
 import React, { useState, useEffect } from 'react';
-import apiClient from '../api';
+import apiClient, { obtenerTodos } from '../api';
 import { Link } from 'react-router-dom';
 import './ProductosPage.css'; // CSS Actualizado
 import { FaEdit, FaTrash, FaPlus } from 'react-icons/fa';
@@ -13,7 +13,7 @@ function ProductosPage() {
   const rol = localStorage.getItem('rol');
 
   const fetchProductos = () => {
-    apiClient.get(API_URL)
+    obtenerTodos(API_URL)
       .then(response => {
         setProductos(response.data);
         setLoading(false);
@@ -67,8 +67,19 @@ function ProductosPage() {
               
               {/* IMAGEN */}
               <div className="product-image-container">
-                {producto.imagen ? (
-                  <img src={producto.imagen} alt={producto.nombre} className="product-image" />
+                {producto.imagenes ? (
+                  // Miniatura WebP (JPEG si el navegador no la soporta); el original sólo como último recurso
+                  <picture>
+                    <source type="image/webp" srcSet={`${producto.imagenes.thumb.webp} 200w, ${producto.imagenes.medium.webp} 600w`} sizes="(max-width: 600px) 50vw, 250px" />
+                    <img
+                      src={producto.imagenes.thumb.jpeg}
+                      srcSet={`${producto.imagenes.thumb.jpeg} 200w, ${producto.imagenes.medium.jpeg} 600w`}
+                      sizes="(max-width: 600px) 50vw, 250px"
+                      alt={producto.nombre} className="product-image" loading="lazy" decoding="async"
+                    />
+                  </picture>
+                ) : producto.imagen ? (
+                  <img src={producto.imagen} alt={producto.nombre} className="product-image" loading="lazy" />
                 ) : (
                   <div className="no-image-placeholder">{producto.nombre.charAt(0).toUpperCase()}</div>
                 )}
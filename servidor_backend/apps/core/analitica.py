@@ -0,0 +1,102 @@
+# En: apps/core/analitica.py
+
+"""
+KPIs y gráficos de los reportes, compartidos por dashboard_analytics_view y
+reportes_view.
+
+Los números de pedidos, entregas y productos salen de las tablas de
+estadísticas diarias (estadisticas.py), que tienen unas pocas filas por día:
+el costo no crece con el historial de pedidos. Cada tabla se lee con un solo
+aggregate(Sum(..., filter=Q(...))) en vez de una consulta por número.
+"""
+
+import datetime
+
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Conductor, Incidencia, EstadisticaPedidosDia, EstadisticaProductoDia
+
+
+def _suma(filtro):
+    return Coalesce(Sum('cantidad', filter=filtro), 0)
+
+
+def _conteos_pedidos(hoy):
+    del_mes = Q(fecha__gte=hoy.replace(day=1))
+    return EstadisticaPedidosDia.objects.aggregate(
+        pendientes=_suma(Q(estado='pendiente')),
+        en_camino=_suma(Q(estado='en_camino')),
+        total_mes=_suma(del_mes),
+        entregados_mes=_suma(del_mes & Q(estado='entregado')),
+        entregados_hoy=_suma(Q(fecha=hoy, estado='entregado')),
+    )
+
+
+def _conteos_conductores():
+    return Conductor.objects.aggregate(
+        totales=Count('id'),
+        activos=Count('id', filter=Q(estado='en_ruta')),
+    )
+
+
+def _pedidos_por_dia(desde):
+    pedidos_por_dia = (
+        EstadisticaPedidosDia.objects.filter(fecha__gte=desde)
+        .values('fecha')
+        .annotate(total=Sum('cantidad'))
+        .filter(total__gt=0)
+        .order_by('fecha')
+    )
+    return {
+        "labels": [item['fecha'].strftime("%d/%m") for item in pedidos_por_dia],
+        "data": [item['total'] for item in pedidos_por_dia],
+    }
+
+
+def _top_conductores():
+    return list(
+        Conductor.objects
+        .annotate(entregas=Coalesce(Sum('estadisticas__entregas'), 0))
+        .order_by('-entregas')[:5]
+        .values('nombre', 'entregas')
+    )
+
+
+def _top_productos():
+    return list(
+        EstadisticaProductoDia.objects
+        .values('producto__nombre')
+        .annotate(total_vendido=Sum('unidades'))
+        .filter(total_vendido__gt=0)
+        .order_by('-total_vendido')[:5]
+    )
+
+
+def resumen_dashboard(hoy=None):
+    """Todo lo que muestra la página de reportes, en 6 consultas."""
+    hoy = hoy or timezone.now().date()
+    pedidos = _conteos_pedidos(hoy)
+    conductores = _conteos_conductores()
+
+    total_mes = pedidos['total_mes']
+    tasa_exito = round((pedidos['entregados_mes'] / total_mes * 100), 1) if total_mes > 0 else 0
+
+    return {
+        "kpis": {
+            "total_mes": total_mes,
+            "tasa_exito": tasa_exito,
+            "conductores_activos": conductores['activos'],
+            "conductores_totales": conductores['totales'],
+            "incidencias": Incidencia.objects.count(),
+        },
+        "grafico_dias": _pedidos_por_dia(hoy - datetime.timedelta(days=7)),
+        "grafico_estados": {
+            "pendientes": pedidos['pendientes'],
+            "en_camino": pedidos['en_camino'],
+            "entregados_hoy": pedidos['entregados_hoy'],
+        },
+        "top_conductores": _top_conductores(),
+        "top_productos": _top_productos(),
+    }
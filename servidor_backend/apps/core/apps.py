@@ -2,4 +2,8 @@ from django.apps import AppConfig
 
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'apps.core'  # <--- CAMBIA ESTA LÍNEA
\ No newline at end of file
+    name = 'apps.core'  # <--- CAMBIA ESTA LÍNEA
+
+    def ready(self):
+        from . import signals  # noqa: F401  (registra los receptores)
+        from . import tareas  # noqa: F401  (registra los tipos de tarea de la cola)
@@ -0,0 +1,175 @@
+# En: apps/core/cache_mi_ruta.py
+
+"""
+Caché por ruta de lo que devuelve /core/api/mi-ruta/, con sincronización
+por diferencias.
+
+El conductor recarga su ruta después de cada entrega. En vez de volver a
+serializar todas las paradas, se guarda por ruta el último resultado con un
+número de versión, y cada parada recuerda en qué versión cambió por última
+vez. Con ?since=<version> la respuesta trae sólo las paradas que cambiaron o
+se agregaron después y los ids de las que salieron de la lista.
+
+Al cambiar un pedido, su cliente, sus detalles, un producto, la ruta o sus
+paradas se marca la ruta como "sucia" (ver signals.py y guardar_ruta); la
+siguiente lectura vuelve a calcular las filas y las compara con las
+guardadas para decidir qué cambió. Las rutas que no se tocaron no se
+recalculan.
+"""
+
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from .models import RutaParada
+
+PREFIJO = 'mi_ruta'
+
+
+def _configuracion():
+    config = {
+        'ACTIVA': True,
+        'ALIAS': 'default',
+        'TTL': 6 * 60 * 60,
+    }
+    config.update(getattr(settings, 'CACHE_MI_RUTA', {}))
+    return config
+
+
+def _cache():
+    return caches[_configuracion()['ALIAS']]
+
+
+def _clave_estado(ruta_id):
+    return f'{PREFIJO}:estado:{ruta_id}'
+
+
+def _clave_cambios(ruta_id):
+    return f'{PREFIJO}:cambios:{ruta_id}'
+
+
+# -----------------------------------------------------------------
+# INVALIDACIÓN
+# -----------------------------------------------------------------
+
+def _marcar(ruta_ids):
+    cache = _cache()
+    for ruta_id in ruta_ids:
+        try:
+            cache.incr(_clave_cambios(ruta_id))
+        except ValueError:
+            pass  # Nunca se leyó: no hay nada guardado que invalidar
+
+
+def invalidar_rutas(ruta_ids):
+    """Como cache_respuestas.invalidar: ahora y otra vez al confirmar la transacción."""
+    ruta_ids = {ruta_id for ruta_id in ruta_ids if ruta_id}
+    if not ruta_ids or not _configuracion()['ACTIVA']:
+        return
+    _marcar(ruta_ids)
+    transaction.on_commit(lambda: _marcar(ruta_ids))
+
+
+def rutas_con_paradas(pendientes=True, **filtro):
+    """Ids de las rutas con paradas (pendientes, salvo pendientes=False) que cumplen `filtro`."""
+    paradas = RutaParada.objects.filter(**filtro)
+    if pendientes:
+        paradas = paradas.exclude(pedido__estado='entregado')
+    return set(paradas.values_list('ruta_id', flat=True).distinct())
+
+
+# -----------------------------------------------------------------
+# LECTURA
+# -----------------------------------------------------------------
+
+def _plano(datos):
+    return json.loads(json.dumps(datos, cls=DjangoJSONEncoder))
+
+
+def _cambios_actuales(cache, ruta_id):
+    clave = _clave_cambios(ruta_id)
+    cambios = cache.get(clave)
+    if cambios is None:
+        # Empieza en la hora actual para no coincidir con un estado viejo
+        cache.add(clave, time.time_ns(), None)
+        cambios = cache.get(clave)
+    return cambios
+
+
+def obtener(ruta, calcular):
+    """
+    Estado vigente de la ruta:
+
+        {'version', 'base', 'cabecera', 'filas': {id: (version, fila)}, 'quitados': {id: version}}
+
+    `calcular()` devuelve (cabecera, filas) y sólo se llama si la ruta cambió
+    desde la última lectura. `base` es la versión más vieja desde la que se
+    pueden dar diferencias.
+    """
+    config = _configuracion()
+    if not config['ACTIVA']:
+        cabecera, filas = calcular()
+        return {
+            'version': 0, 'base': 1, 'cabecera': _plano(cabecera),
+            'filas': {fila['id']: (0, fila) for fila in _plano(filas)}, 'quitados': {},
+        }
+
+    cache = _cache()
+    cambios = _cambios_actuales(cache, ruta.id)
+    anterior = cache.get(_clave_estado(ruta.id))
+    if anterior is not None and anterior['cambios'] == cambios:
+        return anterior
+
+    cabecera, filas = calcular()
+    cabecera, filas = _plano(cabecera), {fila['id']: fila for fila in _plano(filas)}
+    if anterior is None:
+        version = time.time_ns() // 1_000_000
+        estado = {
+            'version': version, 'base': version, 'cabecera': cabecera,
+            'filas': {id_: (version, fila) for id_, fila in filas.items()}, 'quitados': {},
+        }
+    else:
+        estado = _diferencias(anterior, cabecera, filas)
+    estado['cambios'] = cambios
+    cache.set(_clave_estado(ruta.id), estado, config['TTL'])
+    return estado
+
+
+def _diferencias(anterior, cabecera, filas):
+    version = anterior['version'] + 1
+    salieron = anterior['filas'].keys() - filas.keys()
+    hubo_cambios = bool(salieron) or cabecera != anterior['cabecera']
+    nuevas = {}
+    for id_, fila in filas.items():
+        previa = anterior['filas'].get(id_)
+        if previa is not None and previa[1] == fila:
+            nuevas[id_] = previa
+        else:
+            nuevas[id_] = (version, fila)
+            hubo_cambios = True
+    if not hubo_cambios:
+        return dict(anterior)
+
+    quitados = {id_: v for id_, v in anterior['quitados'].items() if id_ not in filas}
+    quitados.update(dict.fromkeys(salieron, version))
+    return {'version': version, 'base': anterior['base'], 'cabecera': cabecera, 'filas': nuevas, 'quitados': quitados}
+
+
+def _por_secuencia(filas):
+    return sorted(filas, key=lambda fila: fila['secuencia'])
+
+
+def filas_desde(estado, desde=None):
+    """
+    (filas, quitados, completa). Sin `desde`, o si es anterior a lo que se
+    recuerda, devuelve todas las filas y completa=True.
+    """
+    if desde is None or not estado['base'] <= desde <= estado['version']:
+        return _por_secuencia(fila for _, fila in estado['filas'].values()), [], True
+    filas = _por_secuencia(fila for version, fila in estado['filas'].values() if version > desde)
+    quitados = sorted(id_ for id_, version in estado['quitados'].items() if version > desde)
+    return filas, quitados, False
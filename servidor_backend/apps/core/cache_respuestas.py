@@ -0,0 +1,212 @@
+# En: apps/core/cache_respuestas.py
+
+"""
+Caché de respuestas GET que son iguales para todos los usuarios: los
+reportes y los listados de productos y categorías.
+
+Cada respuesta se guarda con un TTL corto bajo una clave que incluye la
+"versión" de su grupo. Al guardar o borrar un modelo del que depende el
+grupo (ver GRUPOS_POR_MODELO y signals.py) se incrementa la versión y las
+respuestas viejas dejan de encontrarse; el TTL sólo acota lo que cambia sin
+escrituras (p. ej. el "hoy" de los reportes al pasar la medianoche).
+
+Cada respuesta lleva un ETag: si el cliente manda If-None-Match con el mismo
+valor se responde 304 sin cuerpo. Los aciertos y fallos se cuentan por grupo
+(`contadores()`, GET /core/api/cache/) y se informan en la cabecera X-Cache.
+
+Con varios procesos hay que usar un backend compartido (FileBasedCache,
+Redis...): con LocMemCache cada proceso invalida sólo su propia copia.
+"""
+
+import functools
+import hashlib
+import json
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import Conductor, Ruta, Pedido, DetallePedido, Categoria, Producto, Incidencia
+
+PREFIJO = 'respuestas'
+
+# Qué grupos quedan desactualizados cuando cambia cada modelo
+GRUPOS_POR_MODELO = {
+    Pedido: ('reportes',),
+    DetallePedido: ('reportes',),
+    Ruta: ('reportes',),
+    Conductor: ('reportes',),
+    Incidencia: ('reportes',),
+    Producto: ('reportes', 'productos'),
+    # Borrar una categoría deja productos.categoria en NULL sin señales de Producto
+    Categoria: ('productos', 'categorias'),
+}
+
+
+def _configuracion():
+    config = {
+        'ACTIVA': True,
+        'ALIAS': 'default',
+        'TTL': {'reportes': 60, 'productos': 300, 'categorias': 300},
+    }
+    config.update(getattr(settings, 'CACHE_RESPUESTAS', {}))
+    return config
+
+
+def _cache():
+    return caches[_configuracion()['ALIAS']]
+
+
+# -----------------------------------------------------------------
+# CONTADORES
+# -----------------------------------------------------------------
+
+_contadores = Counter()
+_lock_contadores = threading.Lock()
+
+
+def _contar(grupo, resultado):
+    with _lock_contadores:
+        _contadores[(grupo, resultado)] += 1
+
+
+def contadores():
+    """
+    {grupo: {'aciertos', 'fallos', 'no_modificados'}} desde que arrancó el
+    proceso. `no_modificados` son los 304, que también cuentan como acierto
+    o fallo según si la respuesta estaba guardada.
+    """
+    with _lock_contadores:
+        copia = dict(_contadores)
+    grupos = sorted({grupo for grupo, _ in copia})
+    return {
+        grupo: {resultado: copia.get((grupo, resultado), 0) for resultado in ('aciertos', 'fallos', 'no_modificados')}
+        for grupo in grupos
+    }
+
+
+def reiniciar_contadores():
+    with _lock_contadores:
+        _contadores.clear()
+
+
+# -----------------------------------------------------------------
+# VERSIONES E INVALIDACIÓN
+# -----------------------------------------------------------------
+
+def _clave_version(grupo):
+    return f'{PREFIJO}:version:{grupo}'
+
+
+def _version(cache, grupo):
+    clave = _clave_version(grupo)
+    version = cache.get(clave)
+    if version is None:
+        # Empieza en la hora actual: si la caché perdió la clave, la versión
+        # nueva nunca coincide con la de respuestas que sigan guardadas.
+        cache.add(clave, time.time_ns(), None)
+        version = cache.get(clave)
+    return version
+
+
+def _incrementar(grupos):
+    cache = _cache()
+    for grupo in grupos:
+        try:
+            cache.incr(_clave_version(grupo))
+        except ValueError:
+            pass  # Sin versión guardada no hay respuestas que invalidar
+
+
+def invalidar(*grupos):
+    """
+    Descarta las respuestas guardadas de `grupos`. Se invalida ya (para que
+    la misma transacción no lea datos viejos) y otra vez al confirmar, por si
+    otra request volvió a guardar la respuesta antes del commit.
+    """
+    if not _configuracion()['ACTIVA']:
+        return
+    _incrementar(grupos)
+    transaction.on_commit(lambda: _incrementar(grupos))
+
+
+def invalidar_modelo(modelo):
+    invalidar(*GRUPOS_POR_MODELO.get(modelo, ()))
+
+
+# -----------------------------------------------------------------
+# SERVIR DESDE LA CACHÉ
+# -----------------------------------------------------------------
+
+def _congelar(data):
+    """
+    (etag, data como JSON plano). Lo que se guarda son dicts y listas
+    comunes: los ReturnList de DRF arrastran su serializador al picklearse.
+    """
+    contenido = json.dumps(data, cls=DjangoJSONEncoder, sort_keys=True)
+    return '"%s"' % hashlib.md5(contenido.encode()).hexdigest(), json.loads(contenido)
+
+
+def _coincide(request, etag):
+    enviados = request.headers.get('If-None-Match', '')
+    return etag in (valor.strip().removeprefix('W/') for valor in enviados.split(','))
+
+
+def servir(request, grupo, calcular):
+    """
+    Respuesta de `calcular()` (una Response de DRF) pasando por la caché del
+    grupo. Sólo se guardan las respuestas 200 de GET. La clave incluye la URL
+    completa: los filtros, el cursor y el host de los enlaces `next`.
+    """
+    config = _configuracion()
+    if not config['ACTIVA'] or request.method != 'GET':
+        return calcular()
+
+    cache = _cache()
+    clave = f'{PREFIJO}:{grupo}:{_version(cache, grupo)}:{request.build_absolute_uri()}'
+    guardada = cache.get(clave)
+    if guardada is None:
+        respuesta = calcular()
+        if respuesta.status_code != status.HTTP_200_OK:
+            return respuesta
+        guardada = _congelar(respuesta.data)
+        cache.set(clave, guardada, config['TTL'][grupo])
+        _contar(grupo, 'fallos')
+        x_cache = 'MISS'
+    else:
+        _contar(grupo, 'aciertos')
+        x_cache = 'HIT'
+
+    etag, data = guardada
+    if _coincide(request, etag):
+        _contar(grupo, 'no_modificados')
+        respuesta = Response(status=status.HTTP_304_NOT_MODIFIED)
+    elif x_cache == 'HIT':
+        respuesta = Response(data)
+    respuesta['ETag'] = etag
+    respuesta['X-Cache'] = x_cache
+    return respuesta
+
+
+def respuesta_cacheada(grupo):
+    """Decorador para vistas de función (debajo de @api_view y @permission_classes)."""
+    def decorador(vista):
+        @functools.wraps(vista)
+        def envoltura(request, *args, **kwargs):
+            return servir(request, grupo, lambda: vista(request, *args, **kwargs))
+        return envoltura
+    return decorador
+
+
+class ListadoCacheado:
+    """Mixin de ViewSet: el `list` pasa por la caché de `grupo_cache`."""
+    grupo_cache = None
+
+    def list(self, request, *args, **kwargs):
+        return servir(request, self.grupo_cache, lambda: super(ListadoCacheado, self).list(request, *args, **kwargs))
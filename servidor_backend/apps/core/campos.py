@@ -0,0 +1,153 @@
+# En: apps/core/campos.py
+
+"""
+?fields= y ?expand= en los GET de la API.
+
+    /core/api/pedidos/?fields=id,estado,latitud,longitud
+    /core/api/pedidos/?fields=id,detalles.cantidad,detalles.producto&expand=detalles.producto
+    /core/api/rutas/?expand=conductor,paradas.pedido
+
+`fields` deja sólo esos campos (con punto, los de un serializador anidado);
+`expand` cambia la clave primaria de una relación por el objeto completo,
+con los serializadores de Meta.expandibles. Los nombres desconocidos se
+ignoran. En POST, PUT y PATCH no se aplican: se validaría sin los campos.
+
+Las consultas siguen a los campos: `ajustar_consulta()` arma el
+select_related / prefetch_related a partir de los campos que quedaron, así
+que un campo que no se pide no agrega JOINs ni consultas (y uno expandido
+tampoco genera una consulta por fila).
+"""
+
+import sys
+
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+
+METODOS_LECTURA = ('GET', 'HEAD')
+
+
+def arbol(texto):
+    """'id,detalles.cantidad' -> {'id': None, 'detalles': {'cantidad': None}}; None = completo."""
+    resultado = {}
+    for ruta in texto.split(','):
+        partes = [parte.strip() for parte in ruta.split('.') if parte.strip()]
+        nivel = resultado
+        for i, parte in enumerate(partes):
+            if i == len(partes) - 1:
+                nivel[parte] = None
+            else:
+                if nivel.get(parte, {}) is None:
+                    break  # ya se pidió completo
+                nivel = nivel.setdefault(parte, {})
+    return resultado
+
+
+def solicitados(request):
+    """(campos, expandir) de los query params; (None, None) si no hay o no es un GET."""
+    if request is None or request.method not in METODOS_LECTURA:
+        return None, None
+    campos = request.query_params.get('fields')
+    expandir = request.query_params.get('expand')
+    return (arbol(campos) if campos else None), (arbol(expandir) if expandir else None)
+
+
+# -----------------------------------------------------------------
+# SERIALIZADORES
+# -----------------------------------------------------------------
+
+def _hijo(campo):
+    return campo.child if isinstance(campo, serializers.ListSerializer) else campo
+
+
+class CamposDinamicos:
+    """
+    Mixin de serializador. El de más arriba toma ?fields= y ?expand= del
+    request del contexto; a los anidados se los pasa él. También acepta
+    `campos=` y `expandir=` (árboles como los de `arbol()`) al crearlo.
+    """
+
+    def __init__(self, *args, campos=None, expandir=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if campos is None and expandir is None and 'context' in kwargs:
+            campos, expandir = solicitados(kwargs['context'].get('request'))
+        if campos is not None or expandir is not None:
+            self.recortar(campos, expandir)
+
+    def recortar(self, campos, expandir):
+        expandir = expandir or {}
+        expandibles = getattr(self.Meta, 'expandibles', {})
+        modulo = sys.modules[type(self).__module__]
+        expandidos = set()
+        for nombre, sub_expandir in expandir.items():
+            if nombre in expandibles and nombre in self.fields and (campos is None or nombre in campos):
+                clase = getattr(modulo, expandibles[nombre])
+                self.fields[nombre] = clase(read_only=True, expandir=sub_expandir)
+                expandidos.add(nombre)
+
+        for nombre in list(self.fields):
+            if campos is not None and nombre not in campos:
+                self.fields.pop(nombre)
+                continue
+            sub_campos = campos.get(nombre) if campos is not None else None
+            # Los expandidos ya recibieron su parte de `expand` al crearse
+            sub_expandir = None if nombre in expandidos else expandir.get(nombre)
+            hijo = _hijo(self.fields[nombre])
+            if isinstance(hijo, CamposDinamicos) and (sub_campos is not None or sub_expandir is not None):
+                hijo.recortar(sub_campos, sub_expandir)
+
+
+# -----------------------------------------------------------------
+# CONSULTAS
+# -----------------------------------------------------------------
+
+def relaciones(serializer, prefijo='', en_lista=False):
+    """(select_related, prefetch_related) que necesitan los campos de lectura del serializador."""
+    seleccionar, precargar = set(), set()
+    modelo = serializer.Meta.model
+    for campo in serializer.fields.values():
+        if campo.write_only or not campo.source_attrs:
+            continue
+        camino, muchos, actual = [], en_lista, modelo
+        for i, atributo in enumerate(campo.source_attrs):
+            try:
+                relacion = actual._meta.get_field(atributo)
+            except FieldDoesNotExist:
+                break  # propiedad o método del modelo
+            if not relacion.is_relation:
+                break
+            # Una clave primaria sola se lee de <campo>_id, sin JOIN
+            ultimo = i == len(campo.source_attrs) - 1
+            if ultimo and isinstance(campo, serializers.PrimaryKeyRelatedField) and relacion.concrete:
+                break
+            camino.append(atributo)
+            muchos = muchos or relacion.one_to_many or relacion.many_to_many
+            actual = relacion.related_model
+        if not camino:
+            continue
+
+        ruta = prefijo + '__'.join(camino)
+        (precargar if muchos else seleccionar).add(ruta)
+        hijo = _hijo(campo)
+        if isinstance(hijo, serializers.ModelSerializer):
+            sub_seleccionar, sub_precargar = relaciones(hijo, ruta + '__', muchos)
+            seleccionar |= sub_seleccionar
+            precargar |= sub_precargar
+    return seleccionar, precargar
+
+
+def ajustar_consulta(queryset, serializer):
+    """`queryset` con sólo los JOINs y prefetch que usan los campos del serializador."""
+    seleccionar, precargar = relaciones(_hijo(serializer))
+    queryset = queryset.select_related(None).prefetch_related(None)
+    if seleccionar:
+        queryset = queryset.select_related(*sorted(seleccionar))
+    if precargar:
+        queryset = queryset.prefetch_related(*sorted(precargar))
+    return queryset
+
+
+class ConsultaSegunCampos:
+    """Mixin de ViewSet: get_queryset() con los JOINs que piden los campos del serializador."""
+
+    def get_queryset(self):
+        return ajustar_consulta(super().get_queryset(), self.get_serializer())
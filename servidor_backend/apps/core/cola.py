@@ -0,0 +1,276 @@
+# En: apps/core/cola.py
+
+"""
+Cola de tareas en la base de datos, para sacar el trabajo pesado
+(optimizar rutas, generar imágenes, recalcular estadísticas) de las
+requests sin depender de un broker externo.
+
+Cada tipo de tarea es una función registrada con @tarea (ver tareas.py).
+`encolar()` guarda una fila Tarea y devuelve enseguida; la vista responde
+202 con su id y el frontend consulta GET /core/api/tareas/<id>/ hasta que
+termine. Las ejecuta `python manage.py trabajar_tareas`, que levanta
+TAREAS['PROCESOS'] procesos junto al servidor.
+
+Para tomar una tarea sin que dos trabajadores se la lleven a la vez se usa
+un UPDATE condicional (... WHERE estado = 'pendiente'), que funciona igual
+en SQLite que en otras bases. Primero salen las de mayor prioridad.
+
+Si una tarea lanza una excepción se reintenta más tarde (RETRASO_BASE_S,
+el doble cada vez) hasta `max_intentos`; las excepciones de `sin_reintento`
+y ErrorTarea la dan por fallida de una vez. Si un trabajador muere con una
+tarea en curso, vuelve a la cola cuando pasa TIEMPO_MAXIMO_S.
+
+Con TAREAS['ACTIVA'] = False (el valor por defecto) no se guarda nada: las
+vistas trabajan dentro de la request como antes y lo demás se ejecuta al
+confirmar la transacción.
+
+Las tareas corren en otro proceso, así que lo que hacen fuera de la base
+(invalidar las cachés de mi-ruta y de respuestas, publicar eventos SSE)
+sólo llega al servidor si CACHES y EVENTOS['CANAL'] son compartidos. Con
+una caché en memoria (LocMemCache) o CanalLocal la cola no se activa
+aunque ACTIVA sea True: `activa()` avisa en el log y devuelve False.
+"""
+
+import datetime
+import json
+import logging
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .eventos import configuracion_eventos
+from .models import Tarea
+
+logger = logging.getLogger(__name__)
+
+Definicion = namedtuple('Definicion', 'funcion prioridad max_intentos sin_reintento')
+
+# tipo -> Definicion; se llena al importar tareas.py (CoreConfig.ready)
+TIPOS = {}
+
+
+def configuracion_cola():
+    config = {
+        'ACTIVA': False,
+        'PROCESOS': 2,
+        'ESPERA_S': 1.0,
+        'TIEMPO_MAXIMO_S': 15 * 60,
+        'RETRASO_BASE_S': 10,
+        'CONSERVAR_DIAS': 7,
+    }
+    config.update(getattr(settings, 'TAREAS', {}))
+    return config
+
+
+# Cachés que viven en la memoria de cada proceso
+CACHES_LOCALES = ('django.core.cache.backends.locmem.LocMemCache',)
+
+_avisados = set()
+
+
+def sin_compartir():
+    """Lo que impide correr tareas en otro proceso: cachés o canal de eventos en memoria."""
+    motivos = [
+        f"CACHES['{alias}'] usa {config['BACKEND']}"
+        for alias, config in settings.CACHES.items() if config['BACKEND'] in CACHES_LOCALES
+    ]
+    canal = configuracion_eventos()['CANAL']
+    if not getattr(import_string(canal), 'compartido', False):
+        motivos.append(f"EVENTOS['CANAL'] es {canal}")
+    return motivos
+
+
+def activa():
+    if not configuracion_cola()['ACTIVA']:
+        return False
+    motivos = sin_compartir()
+    if motivos:
+        clave = tuple(motivos)
+        if clave not in _avisados:
+            _avisados.add(clave)
+            logger.warning(
+                "TAREAS['ACTIVA'] se ignora: los trabajadores no verían lo mismo que el servidor (%s).",
+                "; ".join(motivos),
+            )
+        return False
+    return True
+
+
+class ErrorTarea(Exception):
+    """
+    Falla definitiva (no se reintenta). El mensaje queda en Tarea.error y
+    `datos`, si hay, en Tarea.resultado.
+    """
+
+    def __init__(self, mensaje, **datos):
+        super().__init__(mensaje)
+        self.datos = datos
+
+
+def tarea(tipo, prioridad=0, max_intentos=3, sin_reintento=()):
+    """Registra la función como tipo de tarea. Los argumentos tienen que poder pasarse a JSON."""
+    def registrar(funcion):
+        TIPOS[tipo] = Definicion(funcion, prioridad, max_intentos, (ErrorTarea, *sin_reintento))
+        return funcion
+    return registrar
+
+
+# -----------------------------------------------------------------
+# ENCOLAR Y CONSULTAR
+# -----------------------------------------------------------------
+
+def encolar(tipo, prioridad=None, **argumentos):
+    """
+    Crea la tarea (visible para los trabajadores al confirmar la transacción)
+    y la devuelve. Sin cola activa la ejecuta al confirmar y devuelve None.
+    """
+    definicion = TIPOS[tipo]
+    if not activa():
+        transaction.on_commit(lambda: _ejecutar_aqui(tipo, definicion, argumentos))
+        return None
+    return Tarea.objects.create(
+        tipo=tipo,
+        argumentos=argumentos,
+        prioridad=definicion.prioridad if prioridad is None else prioridad,
+        max_intentos=definicion.max_intentos,
+    )
+
+
+def _ejecutar_aqui(tipo, definicion, argumentos):
+    try:
+        definicion.funcion(**argumentos)
+    except Exception:
+        logger.exception("Falló la tarea %s %s", tipo, argumentos)
+
+
+def estado(tarea):
+    """Lo que devuelve GET /core/api/tareas/<id>/."""
+    return {
+        "tarea_id": tarea.id,
+        "tipo": tarea.tipo,
+        "estado": tarea.estado,
+        "intentos": tarea.intentos,
+        "resultado": tarea.resultado,
+        "error": tarea.error or None,
+        "creada": tarea.creada,
+        "terminada": tarea.terminada,
+    }
+
+
+# -----------------------------------------------------------------
+# TRABAJADOR
+# -----------------------------------------------------------------
+
+def tomar(trabajador):
+    """Marca como en_curso la próxima tarea disponible y la devuelve (o None)."""
+    ahora = timezone.now()
+    candidatas = list(
+        Tarea.objects.filter(estado='pendiente', disponible_desde__lte=ahora)
+        .order_by('-prioridad', 'disponible_desde', 'id').values_list('id', flat=True)[:10]
+    )
+    vence = ahora + datetime.timedelta(seconds=configuracion_cola()['TIEMPO_MAXIMO_S'])
+    for tarea_id in candidatas:
+        # Si otro trabajador la tomó primero, el UPDATE no cambia ninguna fila
+        tomada = Tarea.objects.filter(pk=tarea_id, estado='pendiente').update(
+            estado='en_curso', trabajador=trabajador, intentos=F('intentos') + 1, vence=vence,
+        )
+        if tomada:
+            return Tarea.objects.get(pk=tarea_id)
+    return None
+
+
+def _plano(resultado):
+    return json.loads(json.dumps(resultado, cls=DjangoJSONEncoder))
+
+
+def _cerrar(tarea, **campos):
+    """Guarda el final de la tarea si sigue siendo de este trabajador (no venció y la tomó otro)."""
+    cambiadas = Tarea.objects.filter(pk=tarea.pk, estado='en_curso', trabajador=tarea.trabajador).update(**campos)
+    if cambiadas:
+        for campo, valor in campos.items():
+            setattr(tarea, campo, valor)
+    return tarea
+
+
+def ejecutar(tarea):
+    """Corre una tarea ya tomada y registra el resultado, el error o el reintento."""
+    definicion = TIPOS.get(tarea.tipo)
+    try:
+        if definicion is None:
+            raise ErrorTarea(f"Tipo de tarea desconocido: {tarea.tipo}")
+        resultado = definicion.funcion(**tarea.argumentos)
+    except Exception as e:
+        mensaje = str(e) or type(e).__name__
+        definitiva = definicion is None or isinstance(e, definicion.sin_reintento)
+        if definitiva or tarea.intentos >= tarea.max_intentos:
+            if not definitiva:
+                logger.exception("La tarea %s (%s) falló %s veces", tarea.id, tarea.tipo, tarea.intentos)
+            return _cerrar(
+                tarea, estado='fallida', error=mensaje, vence=None, terminada=timezone.now(),
+                resultado=_plano(getattr(e, 'datos', None) or None),
+            )
+        logger.warning("La tarea %s (%s) falló, se reintenta: %s", tarea.id, tarea.tipo, mensaje)
+        espera = configuracion_cola()['RETRASO_BASE_S'] * 2 ** (tarea.intentos - 1)
+        return _cerrar(
+            tarea, estado='pendiente', error=mensaje, vence=None,
+            disponible_desde=timezone.now() + datetime.timedelta(seconds=espera),
+        )
+    return _cerrar(
+        tarea, estado='completada', resultado=_plano(resultado), error='', vence=None, terminada=timezone.now(),
+    )
+
+
+def liberar_vencidas():
+    """Devuelve a la cola las tareas de trabajadores que murieron (o las da por fallidas si ya no quedan intentos)."""
+    vencidas = Tarea.objects.filter(estado='en_curso', vence__lt=timezone.now())
+    fallidas = vencidas.filter(intentos__gte=F('max_intentos')).update(
+        estado='fallida', error="El trabajador no terminó a tiempo.", vence=None, terminada=timezone.now(),
+    )
+    reintentadas = vencidas.update(estado='pendiente', vence=None, trabajador='')
+    return reintentadas + fallidas
+
+
+def depurar_terminadas():
+    """Borra las tareas terminadas hace más de CONSERVAR_DIAS días."""
+    limite = timezone.now() - datetime.timedelta(days=configuracion_cola()['CONSERVAR_DIAS'])
+    borradas, _ = Tarea.objects.filter(estado__in=['completada', 'fallida'], terminada__lt=limite).delete()
+    return borradas
+
+
+def trabajar(trabajador, detener=None, una_vez=False):
+    """
+    Bucle de un trabajador: toma y ejecuta tareas hasta que se active el
+    evento `detener`. Con una_vez=True vuelve cuando no quedan disponibles.
+    Devuelve cuántas ejecutó.
+    """
+    espera = configuracion_cola()['ESPERA_S']
+    ejecutadas = 0
+    ultima_depuracion = 0
+    while detener is None or not detener.is_set():
+        # Como entre requests: descarta conexiones caídas o viejas (salvo dentro
+        # de una transacción, p. ej. en las pruebas)
+        if not transaction.get_connection().in_atomic_block:
+            close_old_connections()
+        tarea_actual = tomar(trabajador)
+        if tarea_actual is not None:
+            ejecutar(tarea_actual)
+            ejecutadas += 1
+            continue
+
+        liberar_vencidas()
+        if time.monotonic() - ultima_depuracion > 60 * 60:
+            depurar_terminadas()
+            ultima_depuracion = time.monotonic()
+        if una_vez:
+            break
+        if detener is not None:
+            detener.wait(espera)
+        else:
+            time.sleep(espera)
+    return ejecutadas
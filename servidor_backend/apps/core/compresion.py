@@ -0,0 +1,164 @@
+# En: apps/core/compresion.py
+
+"""
+Compresión de respuestas negociada con Accept-Encoding: brotli si el
+cliente lo acepta y el paquete `brotli` está instalado, si no gzip.
+
+Un listado de pedidos en JSON se reduce a una décima parte o menos, lo que
+en la red móvil de los conductores pesa más que los milisegundos de
+comprimir. Sólo se comprimen los tipos de COMPRESION['TIPOS'] (JSON, CSV,
+NDJSON, texto) y, si no son streaming, a partir de COMPRESION['UMBRAL']
+bytes: por debajo la cabecera gzip se come la ganancia. Las imágenes ya
+vienen comprimidas.
+
+Las respuestas streaming (exportaciones) se comprimen bloque a bloque en un
+único flujo, con un flush por bloque para no retenerlos. Los eventos SSE no
+se tocan nunca: los proxies y algunos navegadores los acumulan si van
+comprimidos. Como en GZipMiddleware de Django, el ETag pasa a ser débil
+(W/"...") y se agrega Vary: Accept-Encoding.
+"""
+
+import zlib
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+try:
+    import brotli
+except ImportError:  # pip install brotli
+    brotli = None
+
+
+def configuracion_compresion():
+    config = {
+        'ACTIVA': True,
+        'UMBRAL': 1024,
+        'NIVEL_GZIP': 6,
+        'CALIDAD_BROTLI': 5,
+        'TIPOS': ['application/json', 'application/x-ndjson', 'text/csv', 'text/plain', 'text/html'],
+    }
+    config.update(getattr(settings, 'COMPRESION', {}))
+    return config
+
+
+# -----------------------------------------------------------------
+# COMPRESORES
+# -----------------------------------------------------------------
+
+class _Gzip:
+    def __init__(self, config):
+        # wbits=31: formato gzip (cabecera y CRC), no zlib crudo
+        self._compresor = zlib.compressobj(config['NIVEL_GZIP'], zlib.DEFLATED, 31)
+
+    def bloque(self, datos):
+        return self._compresor.compress(datos) + self._compresor.flush(zlib.Z_SYNC_FLUSH)
+
+    def todo(self, datos):
+        return self._compresor.compress(datos) + self._compresor.flush()
+
+    def terminar(self):
+        return self._compresor.flush()
+
+
+class _Brotli:
+    def __init__(self, config):
+        self._compresor = brotli.Compressor(quality=config['CALIDAD_BROTLI'])
+
+    def bloque(self, datos):
+        return self._compresor.process(datos) + self._compresor.flush()
+
+    def todo(self, datos):
+        return self._compresor.process(datos) + self._compresor.finish()
+
+    def terminar(self):
+        return self._compresor.finish()
+
+
+def codificaciones_disponibles():
+    """En orden de preferencia."""
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+COMPRESORES = {'br': _Brotli, 'gzip': _Gzip}
+
+
+def negociar(accept_encoding):
+    """La codificación a usar según la cabecera Accept-Encoding (None = sin comprimir)."""
+    calidades = {}
+    for parte in accept_encoding.split(','):
+        nombre, _, parametros = parte.strip().partition(';')
+        calidad = 1.0
+        parametro = parametros.strip()
+        if parametro.startswith('q='):
+            try:
+                calidad = float(parametro[2:])
+            except ValueError:
+                calidad = 0.0
+        if nombre:
+            calidades[nombre.strip().lower()] = calidad
+    comodin = calidades.get('*', 0.0)
+    candidatas = [(calidades.get(c, comodin), c) for c in codificaciones_disponibles()]
+    # Con la misma calidad gana la primera (brotli)
+    mejor = max(candidatas, key=lambda candidata: candidata[0])
+    return mejor[1] if mejor[0] > 0 else None
+
+
+# -----------------------------------------------------------------
+# MIDDLEWARE
+# -----------------------------------------------------------------
+
+def _comprimir_flujo(contenido, compresor):
+    for bloque in contenido:
+        datos = compresor.bloque(bloque)
+        if datos:
+            yield datos
+    yield compresor.terminar()
+
+
+async def _comprimir_flujo_asincrono(contenido, compresor):
+    async for bloque in contenido:
+        datos = compresor.bloque(bloque)
+        if datos:
+            yield datos
+    yield compresor.terminar()
+
+
+class CompresionMiddleware(MiddlewareMixin):
+    """Va arriba en MIDDLEWARE: comprime lo que dejan los demás."""
+
+    def process_response(self, request, response):
+        config = configuracion_compresion()
+        if not config['ACTIVA'] or response.has_header('Content-Encoding'):
+            return response
+        tipo = response.get('Content-Type', '').split(';')[0].strip().lower()
+        if tipo not in config['TIPOS'] or tipo == 'text/event-stream':
+            return response
+        if not response.streaming and len(response.content) < config['UMBRAL']:
+            return response
+
+        # Aunque este cliente no comprima, la respuesta depende de la cabecera
+        patch_vary_headers(response, ('Accept-Encoding',))
+        codificacion = negociar(request.headers.get('Accept-Encoding', ''))
+        if codificacion is None:
+            return response
+        compresor = COMPRESORES[codificacion](config)
+
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = _comprimir_flujo_asincrono(response.streaming_content, compresor)
+            else:
+                response.streaming_content = _comprimir_flujo(response.streaming_content, compresor)
+            del response['Content-Length']
+        else:
+            comprimido = compresor.todo(response.content)
+            if len(comprimido) >= len(response.content):
+                return response
+            response.content = comprimido
+            response['Content-Length'] = str(len(comprimido))
+
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = codificacion
+        return response
@@ -0,0 +1,490 @@
+# En: apps/core/despacho.py
+
+"""
+Despacho de pedidos: guardar rutas y repartir pendientes entre conductores.
+"""
+
+import math
+import multiprocessing
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.db.models import Sum
+
+from .cache_mi_ruta import invalidar_rutas
+from .cache_respuestas import invalidar
+from .estadisticas import foto_pedidos, registrar_pedidos
+from .eventos import publicar
+from .matriz_distancias import matriz_para_pedidos
+from .pendientes_ruta import registrar_pendientes
+from .telemetria import posiciones_conductores
+from .models import Conductor, Vehiculo, Ruta, RutaParada, Pedido, DetallePedido
+from .optimizacion import (
+    ORIGEN_POR_DEFECTO, configuracion_optimizador, configuracion_tiempos, estimar_llegadas,
+    insertar_en_ruta, optimizar_ruta, tramos_haversine
+)
+from .optimizacion_grupos import resolver_grupo
+from .ruteo_vial import matriz_para_optimizador
+
+
+class ConflictoAsignacion(Exception):
+    """Otro despachador asignó estos pedidos (o cambió la ruta) al mismo tiempo."""
+
+
+# -----------------------------------------------------------------
+# GUARDAR UNA RUTA
+# -----------------------------------------------------------------
+
+def ruta_activa_de(conductor):
+    """Última ruta del conductor si todavía tiene pedidos sin entregar (Ruta.activa)."""
+    ruta_actual = Ruta.objects.filter(conductor=conductor).last()
+    if ruta_actual and ruta_actual.activa:
+        return ruta_actual
+    return None
+
+
+def calcular_tramos(ruta_ordenada, origen=ORIGEN_POR_DEFECTO, salida=None):
+    """
+    {pedido_id: (distancia_tramo_km, eta)} para los pedidos con GPS de
+    `ruta_ordenada`, recorridos en ese orden desde `origen` a partir de
+    `salida` (ahora, por defecto). Los tramos se calculan todos juntos.
+    """
+    con_gps = [p for p in ruta_ordenada if _tiene_gps(p)]
+    if not con_gps:
+        return {}
+    tramos = tramos_haversine([origen] + [(p.latitud, p.longitud) for p in con_gps])
+    etas, _ = estimar_llegadas(tramos, salida or timezone.now())
+    return {p.id: (float(d), eta) for p, d, eta in zip(con_gps, tramos, etas)}
+
+
+def totales_ruta(tramos_km):
+    """(distancia_km, tiempo_estimado_min) de una ruta a partir de sus tramos."""
+    config = configuracion_tiempos()
+    distancia = sum(tramos_km)
+    minutos = distancia / config['VELOCIDAD_KMH'] * 60 + len(tramos_km) * config['SERVICIO_MIN']
+    return Decimal(distancia).quantize(Decimal('0.01')), int(round(minutos))
+
+
+def _km(valor):
+    return Decimal(valor).quantize(Decimal('0.001'))
+
+
+def _grados(valor):
+    return Decimal(str(valor)).quantize(Decimal('0.000001'))
+
+
+@transaction.atomic
+def guardar_ruta(conductor, ruta_ordenada, ruta_activa=None, origen=ORIGEN_POR_DEFECTO):
+    """
+    Asigna `ruta_ordenada` (pedidos ya ordenados) al conductor y devuelve
+    (ruta, mensaje). Sin `ruta_activa` se crea una ruta nueva. Con
+    `ruta_activa`, `ruta_ordenada` es el nuevo orden de TODAS sus paradas
+    pendientes más los pedidos nuevos: se renumeran después de las paradas
+    ya entregadas. `origen` es desde dónde se recorre `ruta_ordenada`; se
+    guarda en la ruta para que mi-ruta lo muestre.
+
+    Cada parada guarda la distancia desde la anterior y su hora estimada
+    de llegada; la ruta guarda la distancia y el tiempo totales.
+
+    Todo ocurre en una transacción y con un número fijo de escrituras, sin
+    importar cuántos pedidos sean. Los pedidos nuevos se toman con un único
+    UPDATE ... WHERE id IN (...) AND ruta IS NULL: si otro despachador ya
+    tomó alguno, se lanza ConflictoAsignacion y no se guarda nada. Para
+    mover pedidos que ya están en la ruta de otro conductor hay que
+    liberarlos antes, en la misma transacción (ver liberar_pedidos).
+    """
+    tramos = calcular_tramos(ruta_ordenada, origen)
+    tramos_km = [d for d, _ in tramos.values()]
+    origen_latitud, origen_longitud = _grados(origen[0]), _grados(origen[1])
+
+    paradas_existentes = {}
+    base = 0
+    if ruta_activa:
+        ruta_final = ruta_activa
+        ids_ordenados = {pedido.id for pedido in ruta_ordenada}
+        for parada in ruta_final.paradas.all():
+            if parada.pedido_id in ids_ordenados:
+                paradas_existentes[parada.pedido_id] = parada
+            else:
+                base = max(base, parada.secuencia)
+                if parada.distancia_tramo is not None:
+                    tramos_km.append(float(parada.distancia_tramo))
+        distancia, tiempo_estimado = totales_ruta(tramos_km)
+        Ruta.objects.filter(pk=ruta_final.pk).update(
+            distancia=distancia, tiempo_estimado=tiempo_estimado,
+            origen_latitud=origen_latitud, origen_longitud=origen_longitud,
+        )
+        ruta_final.distancia, ruta_final.tiempo_estimado = distancia, tiempo_estimado
+        ruta_final.origen_latitud, ruta_final.origen_longitud = origen_latitud, origen_longitud
+        mensaje = f"Pedidos agregados a la Ruta #{ruta_final.id}."
+    else:
+        distancia, tiempo_estimado = totales_ruta(tramos_km)
+        ruta_final = Ruta.objects.create(
+            conductor=conductor,
+            distancia=distancia,
+            tiempo_estimado=tiempo_estimado,
+            origen_latitud=origen_latitud,
+            origen_longitud=origen_longitud,
+        )
+        mensaje = f"Nueva Ruta #{ruta_final.id} creada."
+
+    nuevos = [pedido for pedido in ruta_ordenada if pedido.id not in paradas_existentes]
+    ids = [pedido.id for pedido in nuevos]
+    libres = Pedido.objects.filter(id__in=ids, ruta__isnull=True).exclude(estado='entregado')
+    # update() no dispara señales: las estadísticas y los pendientes se ajustan a mano
+    antes = foto_pedidos(libres)
+    tomados = libres.update(ruta=ruta_final, estado='en_camino')
+    if tomados != len(ids):
+        raise ConflictoAsignacion("Algunos pedidos ya fueron asignados a otra ruta.")
+    despues = foto_pedidos(Pedido.objects.filter(id__in=ids))
+    registrar_pedidos(antes, despues)
+    registrar_pendientes(antes, despues)
+    for pedido in nuevos:
+        pedido.ruta = ruta_final
+        pedido.estado = 'en_camino'
+
+    paradas_nuevas, paradas_movidas = [], []
+    for secuencia, pedido in enumerate(ruta_ordenada, start=base + 1):
+        distancia_tramo, eta = tramos.get(pedido.id, (None, None))
+        distancia_tramo = None if distancia_tramo is None else _km(distancia_tramo)
+        parada = paradas_existentes.get(pedido.id)
+        if parada is None:
+            paradas_nuevas.append(RutaParada(
+                ruta=ruta_final, pedido=pedido, secuencia=secuencia,
+                distancia_tramo=distancia_tramo, eta=eta
+            ))
+        else:
+            parada.secuencia, parada.distancia_tramo, parada.eta = secuencia, distancia_tramo, eta
+            paradas_movidas.append(parada)
+    RutaParada.objects.bulk_create(paradas_nuevas)
+    RutaParada.objects.bulk_update(paradas_movidas, ['secuencia', 'distancia_tramo', 'eta'])
+
+    Conductor.objects.filter(pk=conductor.pk).update(estado='en_ruta')
+    conductor.estado = 'en_ruta'
+    # Los update() y bulk_* de arriba no disparan las señales que limpian las cachés
+    invalidar('reportes')
+    invalidar_rutas([ruta_final.id])
+    publicar(
+        'ruta', {'id': ruta_final.id, 'conductor_id': conductor.id, 'pedido_ids': [p.id for p in ruta_ordenada]},
+        conductor.id,
+    )
+
+    return ruta_final, mensaje
+
+
+def liberar_pedidos(pedidos):
+    """
+    Saca `pedidos` de las rutas en que están para reasignarlos: borra sus
+    paradas y los deja pendientes y sin ruta, listos para guardar_ruta. Se
+    llama dentro de la transacción de la nueva asignación. Si alguno se
+    entregó o cambió de ruta desde que se leyó, lanza ConflictoAsignacion.
+    """
+    por_ruta = defaultdict(list)
+    for pedido in pedidos:
+        if pedido.ruta_id is not None:
+            por_ruta[pedido.ruta_id].append(pedido.id)
+    if not por_ruta:
+        return
+
+    ids = [pedido_id for pedido_ids in por_ruta.values() for pedido_id in pedido_ids]
+    antes = foto_pedidos(Pedido.objects.filter(id__in=ids))
+    liberados = sum(
+        Pedido.objects.filter(id__in=pedido_ids, ruta_id=ruta_id)
+        .exclude(estado='entregado').update(ruta=None, estado='pendiente')
+        for ruta_id, pedido_ids in por_ruta.items()
+    )
+    if liberados != len(ids):
+        raise ConflictoAsignacion("Algunos pedidos ya se entregaron o cambiaron de ruta.")
+    despues = foto_pedidos(Pedido.objects.filter(id__in=ids))
+    registrar_pedidos(antes, despues)
+    registrar_pendientes(antes, despues)
+    # Una ruta que se quedó sin pedidos por entregar ya no está activa: su
+    # conductor vuelve a estar disponible (como al entregar el último pedido)
+    vaciadas = Ruta.objects.filter(pk__in=por_ruta, activa=False).values('conductor_id')
+    Conductor.objects.filter(pk__in=vaciadas).exclude(ruta__activa=True).update(estado='disponible')
+    RutaParada.objects.filter(pedido_id__in=ids).delete()
+    for pedido in pedidos:
+        pedido.ruta, pedido.estado = None, 'pendiente'
+
+    invalidar('reportes')
+    invalidar_rutas(por_ruta)
+    # El conductor que los tenía recibe su ruta sin esos pedidos
+    for ruta_id, conductor_id in Ruta.objects.filter(pk__in=por_ruta).values_list('id', 'conductor_id'):
+        restantes = list(RutaParada.objects.filter(ruta_id=ruta_id).values_list('pedido_id', flat=True))
+        publicar('ruta', {'id': ruta_id, 'conductor_id': conductor_id, 'pedido_ids': restantes}, conductor_id)
+
+
+def _tiene_gps(pedido):
+    return pedido.latitud is not None and pedido.longitud is not None
+
+
+def _matriz_de(origen, pedidos):
+    """
+    Matriz de [origen] + pedidos: por calles si el ruteo vial está activado
+    para el optimizador, si no la caché de distancias entre clientes.
+    """
+    if not pedidos:
+        return None
+    dist = matriz_para_optimizador([origen] + [(p.latitud, p.longitud) for p in pedidos])
+    return dist if dist is not None else matriz_para_pedidos(origen, pedidos)
+
+
+def ordenar_pedidos(pedidos, origen=ORIGEN_POR_DEFECTO):
+    """Pedidos en orden de visita desde `origen`; los que no tienen GPS van al final."""
+    con_gps = [p for p in pedidos if _tiene_gps(p)]
+    sin_gps = [p for p in pedidos if not _tiene_gps(p)]
+    orden = optimizar_ruta(
+        [(p.latitud, p.longitud) for p in con_gps], origen,
+        dist=_matriz_de(origen, con_gps),
+    )
+    return [con_gps[i] for i in orden] + sin_gps
+
+
+def origen_en_curso(paradas):
+    """Desde dónde sigue una ruta en curso: la última parada entregada o la planta."""
+    entregadas = [p.pedido for p in paradas if p.pedido.estado == 'entregado']
+    if entregadas and _tiene_gps(entregadas[-1]):
+        return (entregadas[-1].latitud, entregadas[-1].longitud)
+    return ORIGEN_POR_DEFECTO
+
+
+def origen_de(conductor, por_defecto=ORIGEN_POR_DEFECTO):
+    """Posición GPS reciente del conductor (ver telemetria.py) o `por_defecto`."""
+    return posiciones_conductores.vigente(conductor.id) or por_defecto
+
+
+def reordenar_con_insercion(paradas, pedidos_nuevos, origen=None):
+    """
+    Nuevo orden de una ruta en curso: cada pedido nuevo se inserta en el
+    lugar más barato entre las paradas pendientes (ver insertar_en_ruta).
+    `paradas` son todas las RutaParada de la ruta, en orden. Sin `origen`
+    se parte de la última parada entregada (o de la planta si no hay
+    ninguna).
+    """
+    pendientes = [p.pedido for p in paradas if p.pedido.estado != 'entregado']
+    origen = origen or origen_en_curso(paradas)
+
+    existentes = [p for p in pendientes if _tiene_gps(p)]
+    nuevos = [p for p in pedidos_nuevos if _tiene_gps(p)]
+    sin_gps = [p for p in pendientes + pedidos_nuevos if not _tiene_gps(p)]
+    combinados = existentes + nuevos
+    orden = insertar_en_ruta(
+        [(p.latitud, p.longitud) for p in existentes],
+        [(p.latitud, p.longitud) for p in nuevos],
+        origen,
+        dist=_matriz_de(origen, combinados),
+    )
+    return [combinados[i] for i in orden] + sin_gps
+
+
+def asignar_a_conductor(conductor, pedidos_nuevos, intentos=3, reasignar=False):
+    """
+    Asigna `pedidos_nuevos` al conductor y devuelve (ruta, mensaje). Si
+    tiene una ruta en curso, se insertan entre sus paradas pendientes; si
+    no, se optimiza una ruta nueva. En los dos casos se parte de donde está
+    el conductor si mandó su GPS hace poco (si no, de la última entrega o
+    de la planta).
+
+    Los pedidos que ya tienen ruta dan ConflictoAsignacion, salvo con
+    `reasignar`: entonces se sacan de la ruta de su conductor anterior
+    (liberar_pedidos) y los que ya están en la ruta en curso de este
+    conductor se dejan donde están.
+
+    La optimización corre sin bloqueos; después, dentro de la transacción,
+    se bloquea la fila del conductor y se comprueba que su ruta activa y
+    sus paradas sigan iguales. Si cambiaron, se recalcula (hasta
+    `intentos` veces).
+    """
+    for _ in range(intentos):
+        ruta_activa = ruta_activa_de(conductor)
+        if reasignar and ruta_activa:
+            pedidos_nuevos = [p for p in pedidos_nuevos if p.ruta_id != ruta_activa.id]
+            if not pedidos_nuevos:
+                return ruta_activa, f"Los pedidos ya están en la Ruta #{ruta_activa.id}."
+        if ruta_activa:
+            paradas = list(ruta_activa.paradas.select_related('pedido'))
+            origen = origen_de(conductor, origen_en_curso(paradas))
+            ruta_ordenada = reordenar_con_insercion(paradas, pedidos_nuevos, origen)
+        else:
+            paradas = []
+            origen = origen_de(conductor)
+            ruta_ordenada = ordenar_pedidos(pedidos_nuevos, origen)
+
+        with transaction.atomic():
+            bloqueado = Conductor.objects.select_for_update().get(pk=conductor.pk)
+            sin_cambios = ruta_activa_de(bloqueado) == ruta_activa and (
+                not ruta_activa
+                or set(ruta_activa.paradas.values_list('id', flat=True)) == {p.id for p in paradas}
+            )
+            if sin_cambios:
+                if reasignar:
+                    liberar_pedidos(pedidos_nuevos)
+                return guardar_ruta(bloqueado, ruta_ordenada, ruta_activa, origen)
+
+    raise ConflictoAsignacion("La ruta del conductor cambió mientras se asignaba. Intente de nuevo.")
+
+
+# -----------------------------------------------------------------
+# DESPACHO MASIVO (VRP con capacidad)
+# -----------------------------------------------------------------
+
+def _configuracion_despacho():
+    config = {'PROCESOS': None, 'MIN_PEDIDOS_PARALELO': 200}
+    config.update(getattr(settings, 'DESPACHO', {}))
+    return config
+
+
+def cargas_por_pedido(pedidos):
+    """{pedido_id: unidades} sumando DetallePedido.cantidad en una sola consulta."""
+    filas = (
+        DetallePedido.objects
+        .filter(pedido__in=pedidos)
+        .values('pedido')
+        .annotate(total=Sum('cantidad'))
+    )
+    return {fila['pedido']: fila['total'] or 0 for fila in filas}
+
+
+def capacidades_por_conductor(conductores):
+    """
+    {conductor_id: capacidad}. El vehículo se encuentra por la placa del
+    conductor; si no tiene vehículo registrado la capacidad es ilimitada.
+    """
+    placas = [c.placa_vehiculo for c in conductores if c.placa_vehiculo]
+    capacidad_placa = dict(Vehiculo.objects.filter(placa__in=placas).values_list('placa', 'capacidad'))
+    return {c.id: capacidad_placa.get(c.placa_vehiculo, math.inf) for c in conductores}
+
+
+def agrupar_por_barrido(puntos, cargas, capacidades, origen=ORIGEN_POR_DEFECTO):
+    """
+    Algoritmo de barrido (sweep): ordena los pedidos por ángulo alrededor del
+    origen y llena a cada conductor con un sector contiguo, sin superar su
+    capacidad y repartiendo la carga de forma pareja.
+
+    `puntos` y `cargas` son listas paralelas; `capacidades` una lista por
+    conductor. Devuelve (grupos, sobrantes): una lista de índices de pedidos
+    por conductor y los índices que no entraron en ningún vehículo.
+    """
+    lat0, lng0 = float(origen[0]), float(origen[1])
+    angulos = [
+        math.atan2(float(lat) - lat0, (float(lng) - lng0) * math.cos(math.radians(lat0)))
+        for lat, lng in puntos
+    ]
+    cola = sorted(range(len(puntos)), key=lambda i: angulos[i])
+
+    # El barrido empieza después del hueco angular más grande, para no
+    # partir en dos un grupo de pedidos que cae justo sobre el corte en ±180°.
+    if len(cola) > 1:
+        huecos = [angulos[cola[k]] - angulos[cola[k - 1]] for k in range(1, len(cola))]
+        huecos.append(angulos[cola[0]] + 2 * math.pi - angulos[cola[-1]])
+        inicio = (huecos.index(max(huecos)) + 1) % len(cola)
+        cola = cola[inicio:] + cola[:inicio]
+
+    grupos = []
+    carga_restante = sum(cargas)
+    for k, capacidad in enumerate(capacidades):
+        conductores_restantes = len(capacidades) - k
+        # La parte pareja, pero nunca menos de lo que los siguientes no pueden llevar
+        capacidad_siguientes = sum(capacidades[k + 1:])
+        cuota = min(capacidad, max(
+            math.ceil(carga_restante / conductores_restantes), carga_restante - capacidad_siguientes,
+        ))
+        grupo, siguiente_cola, carga = [], [], 0
+        for posicion, i in enumerate(cola):
+            if carga >= cuota:
+                siguiente_cola.extend(cola[posicion:])
+                break
+            if carga + cargas[i] <= capacidad:
+                grupo.append(i)
+                carga += cargas[i]
+            else:
+                siguiente_cola.append(i)
+        grupos.append(grupo)
+        cola = siguiente_cola
+        carga_restante -= carga
+    return grupos, cola
+
+
+def resolver_grupos(grupos_de_puntos, origen=ORIGEN_POR_DEFECTO, origenes=None):
+    """
+    Optimiza cada grupo por separado; en paralelo si el despacho es grande.
+    `origenes` da un punto de partida por grupo (si no, todos parten de `origen`).
+    """
+    config = configuracion_optimizador()
+    origenes = origenes or [origen] * len(grupos_de_puntos)
+    trabajos = [
+        (puntos, inicio, config['MOTOR'], config['TIEMPO_LIMITE'])
+        for puntos, inicio in zip(grupos_de_puntos, origenes)
+    ]
+
+    despacho = _configuracion_despacho()
+    total = sum(len(puntos) for puntos in grupos_de_puntos)
+    # Un proceso daemonic (p. ej. un trabajador de multiprocessing) no puede
+    # crear el pool: ahí los grupos se resuelven uno tras otro.
+    paralelo = not multiprocessing.current_process().daemon
+    if paralelo and len(trabajos) > 1 and total >= despacho['MIN_PEDIDOS_PARALELO']:
+        with ProcessPoolExecutor(max_workers=despacho['PROCESOS']) as pool:
+            return list(pool.map(resolver_grupo, trabajos))
+    return [resolver_grupo(trabajo) for trabajo in trabajos]
+
+
+def despachar_pendientes(pedido_ids=None, conductor_ids=None, origen=ORIGEN_POR_DEFECTO):
+    """
+    Reparte los pedidos pendientes (sin ruta) entre los conductores
+    disponibles y crea una Ruta por conductor.
+
+    Devuelve (rutas, sin_asignar): rutas es una lista de
+    (ruta, conductor, pedidos_ordenados, carga, capacidad).
+    """
+    pedidos = Pedido.objects.filter(estado='pendiente', ruta__isnull=True).order_by('id')
+    if pedido_ids:
+        pedidos = pedidos.filter(id__in=pedido_ids)
+    conductores = Conductor.objects.filter(estado='disponible').order_by('id')
+    if conductor_ids:
+        conductores = conductores.filter(id__in=conductor_ids)
+
+    pedidos = list(pedidos)
+    conductores = list(conductores)
+    con_gps = [p for p in pedidos if p.latitud is not None and p.longitud is not None]
+    sin_asignar = [p for p in pedidos if p.latitud is None or p.longitud is None]
+    if not con_gps or not conductores:
+        return [], sin_asignar + con_gps
+
+    carga_pedido = cargas_por_pedido(con_gps)
+    capacidad_conductor = capacidades_por_conductor(conductores)
+
+    puntos = [(p.latitud, p.longitud) for p in con_gps]
+    # Un pedido sin detalles igual ocupa una parada: cuenta como 1 unidad.
+    cargas = [max(carga_pedido.get(p.id, 0), 1) for p in con_gps]
+    capacidades = [capacidad_conductor[c.id] for c in conductores]
+    grupos, sobrantes = agrupar_por_barrido(puntos, cargas, capacidades, origen)
+    sin_asignar += [con_gps[i] for i in sobrantes]
+
+    # Los grupos son independientes: se optimizan en paralelo. Cada ruta
+    # arranca donde está su conductor, si mandó su GPS hace poco.
+    asignaciones = [(c, g) for c, g in zip(conductores, grupos) if g]
+    origenes = [origen_de(c, origen) for c, _ in asignaciones]
+    ordenes = resolver_grupos([[puntos[i] for i in g] for _, g in asignaciones], origen, origenes)
+
+    rutas = []
+    with transaction.atomic():
+        # Bloquea a los conductores elegidos: si alguno dejó de estar
+        # disponible mientras se optimizaba, no se guarda ninguna ruta.
+        libres = set(
+            Conductor.objects.select_for_update()
+            .filter(id__in=[c.id for c, _ in asignaciones], estado='disponible')
+            .values_list('id', flat=True)
+        )
+        if len(libres) != len(asignaciones):
+            raise ConflictoAsignacion("Algún conductor ya recibió otra ruta. Intente de nuevo.")
+
+        for (conductor, grupo), orden, inicio in zip(asignaciones, ordenes, origenes):
+            ruta_ordenada = [con_gps[grupo[i]] for i in orden]
+            ruta, _ = guardar_ruta(conductor, ruta_ordenada, origen=inicio)
+            carga = sum(cargas[i] for i in grupo)
+            rutas.append((ruta, conductor, ruta_ordenada, carga, capacidad_conductor[conductor.id]))
+    return rutas, sin_asignar
@@ -0,0 +1,355 @@
+# En: apps/core/espacial.py
+
+"""
+Índice espacial de pedidos y clientes.
+
+Dos niveles:
+  * En la base de datos: columna `geocelda` (geohash) con índice, que se
+    mantiene en cada save(). Sirve para filtrar por zona sin recorrer toda
+    la tabla (rangos sobre el índice B-tree).
+  * En memoria: una grilla de celdas fijas por proceso, cargada la primera
+    vez que se usa y actualizada por señales (ver signals.py). Responde los
+    k más cercanos y búsquedas por radio sin tocar la base de datos, pero
+    no ve lo que escriben otros procesos: lo que no puede equivocarse (como
+    no duplicar clientes) consulta la columna `geocelda`.
+"""
+
+import heapq
+import math
+import threading
+
+from django.conf import settings
+from django.db.models import Q
+
+from .optimizacion import RADIO_TIERRA_KM
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def _configuracion():
+    config = {'PRECISION_GEOHASH': 7, 'CELDA_GRADOS': 0.01, 'MAX_CELDAS_CAJA': 32}
+    config.update(getattr(settings, 'INDICE_ESPACIAL', {}))
+    return config
+
+
+def distancia_km(lat1, lng1, lat2, lng2):
+    """Distancia haversine entre dos puntos, en km."""
+    lat1, lng1, lat2, lng2 = map(math.radians, (float(lat1), float(lng1), float(lat2), float(lng2)))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * RADIO_TIERRA_KM * math.asin(math.sqrt(min(a, 1.0)))
+
+
+# -----------------------------------------------------------------
+# GEOHASH (columna indexada en la base de datos)
+# -----------------------------------------------------------------
+
+def codificar_geohash(lat, lng, precision=None):
+    """Geohash de `precision` caracteres; '' si falta alguna coordenada."""
+    if lat is None or lng is None:
+        return ''
+    precision = precision or _configuracion()['PRECISION_GEOHASH']
+    lat, lng = float(lat), float(lng)
+    rango_lat, rango_lng = [-90.0, 90.0], [-180.0, 180.0]
+    resultado, bits, valor, es_lng = [], 0, 0, True
+    while len(resultado) < precision:
+        rango, x = (rango_lng, lng) if es_lng else (rango_lat, lat)
+        medio = (rango[0] + rango[1]) / 2
+        valor <<= 1
+        if x >= medio:
+            valor |= 1
+            rango[0] = medio
+        else:
+            rango[1] = medio
+        es_lng = not es_lng
+        bits += 1
+        if bits == 5:
+            resultado.append(_BASE32[valor])
+            bits, valor = 0, 0
+    return ''.join(resultado)
+
+
+def _tamano_celda_geohash(precision):
+    """(alto, ancho) en grados de una celda geohash de `precision` caracteres."""
+    bits = 5 * precision
+    return 180.0 / 2 ** (bits // 2), 360.0 / 2 ** (bits - bits // 2)
+
+
+def celdas_que_cubren(sur, oeste, norte, este):
+    """
+    Prefijos geohash que cubren la caja. Se usa la mayor precisión que no
+    pase de MAX_CELDAS_CAJA celdas, para que la consulta siga siendo corta.
+    """
+    config = _configuracion()
+    precision = config['PRECISION_GEOHASH']
+    while precision > 1:
+        alto, ancho = _tamano_celda_geohash(precision)
+        filas = math.floor(norte / alto) - math.floor(sur / alto) + 1
+        columnas = math.floor(este / ancho) - math.floor(oeste / ancho) + 1
+        if filas * columnas <= config['MAX_CELDAS_CAJA']:
+            break
+        precision -= 1
+
+    alto, ancho = _tamano_celda_geohash(precision)
+    celdas = set()
+    for fila in range(math.floor(sur / alto), math.floor(norte / alto) + 1):
+        for columna in range(math.floor(oeste / ancho), math.floor(este / ancho) + 1):
+            celdas.add(codificar_geohash((fila + 0.5) * alto, (columna + 0.5) * ancho, precision))
+    return sorted(celdas)
+
+
+def caja_de_radio(lat, lng, radio_km):
+    """(sur, oeste, norte, este) de la caja que contiene el círculo de `radio_km` alrededor del punto."""
+    lat, lng = float(lat), float(lng)
+    grados_lat = radio_km / RADIO_TIERRA_KM * 180 / math.pi
+    grados_lng = grados_lat / max(math.cos(math.radians(lat)), 1e-6)
+    return lat - grados_lat, lng - grados_lng, lat + grados_lat, lng + grados_lng
+
+
+def filtrar_por_caja(queryset, sur, oeste, norte, este):
+    """
+    Filtra un queryset de Pedido o Cliente por caja usando el índice de
+    `geocelda` (un rango por celda) y luego las coordenadas exactas.
+    """
+    condicion = Q()
+    for prefijo in celdas_que_cubren(sur, oeste, norte, este):
+        # '~' va después de todos los caracteres base32: [prefijo, prefijo~) es un rango del índice.
+        condicion |= Q(geocelda__gte=prefijo, geocelda__lt=prefijo + '~')
+    return queryset.filter(condicion).filter(
+        latitud__gte=sur, latitud__lte=norte,
+        longitud__gte=oeste, longitud__lte=este,
+    )
+
+
+# -----------------------------------------------------------------
+# GRILLA EN MEMORIA
+# -----------------------------------------------------------------
+
+class IndiceEspacial:
+    """
+    Grilla de celdas de CELDA_GRADOS x CELDA_GRADOS. `cargar` es una función
+    que devuelve [(id, lat, lng), ...] y se llama la primera vez que se usa
+    el índice; después se mantiene con `agregar` y `quitar`.
+
+    Sólo las escrituras toman el lock. Reemplazan el conjunto de ids de la
+    celda en vez de modificarlo, así las búsquedas lo recorren sin lock
+    (como mucho ven un punto en su celda vieja y en la nueva a la vez).
+    """
+
+    def __init__(self, cargar):
+        self._cargar = cargar
+        self._lock = threading.RLock()
+        self._celdas = {}
+        self._puntos = {}
+        self._cargado = False
+        self.tamano_celda = None
+
+    def _celda(self, lat, lng):
+        return (math.floor(lat / self.tamano_celda), math.floor(lng / self.tamano_celda))
+
+    def _asegurar_cargado(self):
+        if self._cargado:
+            return
+        with self._lock:
+            if self._cargado:
+                return
+            self.tamano_celda = _configuracion()['CELDA_GRADOS']
+            celdas, puntos = {}, {}
+            for id_, lat, lng in self._cargar():
+                lat, lng = float(lat), float(lng)
+                puntos[id_] = (lat, lng)
+                celdas.setdefault(self._celda(lat, lng), set()).add(id_)
+            self._celdas = {celda: frozenset(ids) for celda, ids in celdas.items()}
+            self._puntos = puntos
+            self._cargado = True
+
+    @property
+    def cargado(self):
+        return self._cargado
+
+    def reiniciar(self):
+        """Vacía el índice; se vuelve a cargar en el próximo uso."""
+        with self._lock:
+            self._celdas, self._puntos, self._cargado = {}, {}, False
+
+    def __len__(self):
+        self._asegurar_cargado()
+        return len(self._puntos)
+
+    def _agregar(self, id_, lat, lng):
+        self._quitar(id_)
+        lat, lng = float(lat), float(lng)
+        celda = self._celda(lat, lng)
+        # Primero el punto y después la celda: quien vea el id en la celda ya encuentra sus coordenadas.
+        self._puntos[id_] = (lat, lng)
+        self._celdas[celda] = self._celdas.get(celda, frozenset()) | {id_}
+
+    def _quitar(self, id_):
+        punto = self._puntos.get(id_)
+        if punto is None:
+            return
+        celda = self._celda(*punto)
+        ids = self._celdas.get(celda, frozenset()) - {id_}
+        if ids:
+            self._celdas[celda] = ids
+        else:
+            self._celdas.pop(celda, None)
+        del self._puntos[id_]
+
+    def agregar(self, id_, lat, lng):
+        """Agrega o mueve un punto. No hace nada si el índice aún no se cargó."""
+        if not self._cargado:
+            return
+        with self._lock:
+            if lat is None or lng is None:
+                self._quitar(id_)
+            else:
+                self._agregar(id_, lat, lng)
+
+    def quitar(self, id_):
+        if not self._cargado:
+            return
+        with self._lock:
+            self._quitar(id_)
+
+    def _anillo(self, centro, radio):
+        """Celdas a exactamente `radio` celdas (distancia de Chebyshev) de `centro`."""
+        fila, columna = centro
+        if radio == 0:
+            yield centro
+            return
+        for dc in range(-radio, radio + 1):
+            yield (fila - radio, columna + dc)
+            yield (fila + radio, columna + dc)
+        for df in range(-radio + 1, radio):
+            yield (fila + df, columna - radio)
+            yield (fila + df, columna + radio)
+
+    def k_cercanos(self, lat, lng, k):
+        """Los `k` puntos más cercanos: [(id, distancia_km), ...] de menor a mayor."""
+        self._asegurar_cargado()
+        lat, lng = float(lat), float(lng)
+        celdas, puntos = self._celdas, self._puntos
+        if not puntos or k <= 0:
+            return []
+        centro = self._celda(lat, lng)
+        # Una celda equivale como mínimo a esta distancia en km (en longitud se achica con la latitud).
+        km_por_celda = self.tamano_celda * math.pi / 180 * RADIO_TIERRA_KM * max(
+            math.cos(math.radians(min(abs(lat) + self.tamano_celda, 90.0))), 1e-6
+        )
+        candidatos = {}
+        radio = 0
+        restantes = len(puntos)
+        ocupadas = len(celdas)
+        while restantes > 0:
+            if (2 * radio + 1) ** 2 > ocupadas:
+                # Los anillos ya cubren más celdas de las que hay ocupadas (la
+                # consulta está lejos de todos los puntos): sale más barato
+                # medir la distancia a cada punto que seguir agrandándolos.
+                candidatos = {
+                    id_: distancia_km(lat, lng, p_lat, p_lng) for id_, (p_lat, p_lng) in list(puntos.items())
+                }
+                break
+            for celda in self._anillo(centro, radio):
+                for id_ in celdas.get(celda, ()):
+                    punto = puntos.get(id_)
+                    if punto is not None:
+                        candidatos[id_] = distancia_km(lat, lng, *punto)
+                        restantes -= 1
+            # Todo punto fuera de los anillos vistos está a más de radio * km_por_celda.
+            if len(candidatos) >= k and heapq.nsmallest(k, candidatos.values())[-1] <= radio * km_por_celda:
+                break
+            radio += 1
+        return [
+            (id_, d) for d, id_ in heapq.nsmallest(k, ((d, id_) for id_, d in candidatos.items()))
+        ]
+
+    def en_radio(self, lat, lng, radio_km):
+        """Puntos a menos de `radio_km`: [(id, distancia_km), ...] de menor a mayor."""
+        self._asegurar_cargado()
+        lat, lng = float(lat), float(lng)
+        puntos = self._puntos
+        resultado = []
+        for id_ in self.en_caja(*caja_de_radio(lat, lng, radio_km)):
+            punto = puntos.get(id_)
+            if punto is None:
+                continue
+            d = distancia_km(lat, lng, *punto)
+            if d <= radio_km:
+                resultado.append((id_, d))
+        resultado.sort(key=lambda par: par[1])
+        return resultado
+
+    def en_caja(self, sur, oeste, norte, este):
+        """Ids de los puntos dentro de la caja."""
+        self._asegurar_cargado()
+        celdas, puntos = self._celdas, self._puntos
+        fila_min, col_min = self._celda(sur, oeste)
+        fila_max, col_max = self._celda(norte, este)
+        resultado = []
+        if (fila_max - fila_min + 1) * (col_max - col_min + 1) > len(celdas):
+            # Caja enorme: conviene recorrer las celdas ocupadas.
+            recorrer = [c for c in list(celdas) if fila_min <= c[0] <= fila_max and col_min <= c[1] <= col_max]
+        else:
+            recorrer = (
+                (f, c) for f in range(fila_min, fila_max + 1) for c in range(col_min, col_max + 1)
+            )
+        for celda in recorrer:
+            for id_ in celdas.get(celda, ()):
+                punto = puntos.get(id_)
+                if punto is not None and sur <= punto[0] <= norte and oeste <= punto[1] <= este:
+                    resultado.append(id_)
+        return resultado
+
+
+# -----------------------------------------------------------------
+# ÍNDICES GLOBALES
+# -----------------------------------------------------------------
+
+# Sólo los pedidos abiertos van a memoria: el historial entregado crece sin
+# límite y para él alcanza con `filtrar_por_caja` sobre la base de datos.
+ESTADOS_INDEXADOS = ('pendiente', 'en_camino')
+
+
+def _cargar_pedidos():
+    from .models import Pedido
+    return (
+        Pedido.objects
+        .filter(estado__in=ESTADOS_INDEXADOS, latitud__isnull=False, longitud__isnull=False)
+        .values_list('id', 'latitud', 'longitud')
+        .iterator()
+    )
+
+
+def _cargar_clientes():
+    from .models import Cliente
+    return (
+        Cliente.objects
+        .filter(latitud__isnull=False, longitud__isnull=False)
+        .values_list('id', 'latitud', 'longitud')
+        .iterator()
+    )
+
+
+indice_pedidos = IndiceEspacial(_cargar_pedidos)
+indice_clientes = IndiceEspacial(_cargar_clientes)
+
+
+def cliente_cercano_con_nombre(nombre, lat, lng, radio_km=0.03):
+    """
+    Busca un cliente con el mismo nombre a menos de `radio_km` (30 m por
+    defecto). Se usa para no duplicar clientes al crear pedidos.
+
+    Consulta la base (rango de `geocelda` más el nombre) y no el índice en
+    memoria, que no ve los clientes creados por otros procesos.
+    """
+    from .models import Cliente
+    if lat is None or lng is None or not nombre:
+        return None
+    candidatos = filtrar_por_caja(
+        Cliente.objects.filter(nombre_cliente__iexact=nombre.strip()), *caja_de_radio(lat, lng, radio_km),
+    )
+    cercanos = sorted(
+        ((distancia_km(lat, lng, c.latitud, c.longitud), c.id, c) for c in candidatos),
+        key=lambda fila: fila[:2],
+    )
+    return next((cliente for distancia, _, cliente in cercanos if distancia <= radio_km), None)
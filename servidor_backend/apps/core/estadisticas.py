@@ -0,0 +1,167 @@
+# En: apps/core/estadisticas.py
+
+"""
+Tablas de estadísticas diarias (EstadisticaPedidosDia, EstadisticaConductorDia
+y EstadisticaProductoDia) que usan los reportes en lugar de recorrer Pedido y
+DetallePedido en cada request.
+
+Se mantienen por diferencias: antes de escribir se toma una "foto" de lo que
+aportaban las filas afectadas, después otra, y se suma la resta a la tabla
+(UPDATE ... SET cantidad = cantidad + n). Las escrituras normales pasan por
+las señales de signals.py; las que usan queryset.update() (guardar_ruta) lo
+hacen a mano con `foto_pedidos` + `registrar_pedidos`.
+
+Si alguna vez quedan desfasadas: python manage.py reconstruir_estadisticas
+"""
+
+from collections import Counter
+
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import DetallePedido, EstadisticaPedidosDia, EstadisticaConductorDia, EstadisticaProductoDia, Pedido, Ruta
+
+
+def _fecha(hora_entrega):
+    return timezone.localdate(hora_entrega) if hora_entrega else None
+
+
+def _sumar(modelo, claves, campo, deltas):
+    """Suma cada delta {(valores de `claves`): n} a `campo`, creando la fila si falta."""
+    for valores, delta in deltas.items():
+        if not delta:
+            continue
+        filtro = dict(zip(claves, valores))
+        if modelo.objects.filter(**filtro).update(**{campo: F(campo) + delta}):
+            continue
+        try:
+            with transaction.atomic():
+                modelo.objects.create(**filtro, **{campo: delta})
+        except IntegrityError:
+            # Otro proceso creó la fila entre el UPDATE y el INSERT
+            modelo.objects.filter(**filtro).update(**{campo: F(campo) + delta})
+
+
+# -----------------------------------------------------------------
+# PEDIDOS (por estado y entregas por conductor)
+# -----------------------------------------------------------------
+
+def foto_pedidos(queryset):
+    """
+    {id: (fecha, estado, conductor_id, ruta_id)} de los pedidos del queryset,
+    como están en la base (ruta_id lo usa pendientes_ruta.py).
+    """
+    return {
+        fila['id']: (_fecha(fila['hora_entrega']), fila['estado'], fila['ruta__conductor_id'], fila['ruta_id'])
+        for fila in queryset.values('id', 'hora_entrega', 'estado', 'ruta__conductor_id', 'ruta_id')
+    }
+
+
+def foto_pedido_guardado(pedido, antes, update_fields=None):
+    """
+    Foto (como foto_pedidos) de un pedido recién guardado, armada desde la
+    instancia en vez de volver a leerlo. `antes` es su foto previa ({} si
+    se acaba de crear): de ahí salen los campos que save(update_fields=...)
+    no escribió y el conductor, que sólo se consulta si cambió la ruta.
+    """
+    previa = antes.get(pedido.pk)
+
+    def valor(campos, indice, actual):
+        if previa is not None and update_fields is not None and not campos & set(update_fields):
+            return previa[indice]
+        return actual
+
+    # Como la guarda la base: un texto pasa a datetime y uno sin zona se toma en la zona por defecto
+    hora = Pedido._meta.get_field('hora_entrega').to_python(pedido.hora_entrega)
+    if hora is not None and timezone.is_naive(hora):
+        hora = timezone.make_aware(hora)
+    fecha = valor({'hora_entrega'}, 0, _fecha(hora))
+    estado = valor({'estado'}, 1, pedido.estado)
+    ruta_id = valor({'ruta', 'ruta_id'}, 3, pedido.ruta_id)
+    if previa is not None and previa[3] == ruta_id:
+        conductor_id = previa[2]
+    elif ruta_id is None:
+        conductor_id = None
+    else:
+        conductor_id = Ruta.objects.filter(pk=ruta_id).values_list('conductor_id', flat=True).first()
+    return {pedido.pk: (fecha, estado, conductor_id, ruta_id)}
+
+
+def registrar_pedidos(antes, despues):
+    """Aplica la diferencia entre dos fotos de `foto_pedidos` (una puede ser {})."""
+    por_estado, por_conductor = Counter(), Counter()
+    for foto, signo in ((antes, -1), (despues, 1)):
+        for fecha, estado, conductor_id, _ in foto.values():
+            por_estado[(fecha, estado)] += signo
+            if estado == 'entregado' and conductor_id:
+                por_conductor[(fecha, conductor_id)] += signo
+    _sumar(EstadisticaPedidosDia, ('fecha', 'estado'), 'cantidad', por_estado)
+    _sumar(EstadisticaConductorDia, ('fecha', 'conductor_id'), 'entregas', por_conductor)
+
+
+# -----------------------------------------------------------------
+# PRODUCTOS (unidades por día)
+# -----------------------------------------------------------------
+
+def foto_unidades(queryset):
+    """Counter {(fecha, producto_id): unidades} de un queryset de DetallePedido."""
+    unidades = Counter()
+    for fila in queryset.values('pedido__hora_entrega', 'producto_id', 'cantidad'):
+        unidades[(_fecha(fila['pedido__hora_entrega']), fila['producto_id'])] += fila['cantidad']
+    return unidades
+
+
+def registrar_unidades(antes, despues):
+    deltas = Counter(despues)
+    deltas.subtract(antes)
+    _sumar(EstadisticaProductoDia, ('fecha', 'producto_id'), 'unidades', deltas)
+
+
+def mover_unidades_de_pedido(pedido_id, fecha_anterior, fecha_nueva):
+    """Cuando cambia la hora_entrega de un pedido, sus unidades pasan al otro día."""
+    nuevas = foto_unidades(DetallePedido.objects.filter(pedido_id=pedido_id))
+    anteriores = Counter({(fecha_anterior, producto_id): n for (_, producto_id), n in nuevas.items()})
+    registrar_unidades(anteriores, nuevas)
+
+
+# -----------------------------------------------------------------
+# RECONSTRUCCIÓN COMPLETA
+# -----------------------------------------------------------------
+
+def reconstruir_estadisticas(using=DEFAULT_DB_ALIAS):
+    """
+    Borra y recalcula las tres tablas con tres consultas agrupadas.
+    Devuelve cuántas filas se crearon en cada tabla.
+    """
+    pedidos = Pedido.objects.using(using)
+    detalles = DetallePedido.objects.using(using)
+
+    with transaction.atomic(using=using):
+        por_estado = [
+            EstadisticaPedidosDia(fecha=fila['fecha'], estado=fila['estado'], cantidad=fila['cantidad'])
+            for fila in pedidos.annotate(fecha=TruncDate('hora_entrega'))
+            .values('fecha', 'estado').annotate(cantidad=Count('id')).order_by()
+        ]
+        por_conductor = [
+            EstadisticaConductorDia(fecha=fila['fecha'], conductor_id=fila['id_conductor'], entregas=fila['entregas'])
+            for fila in pedidos.filter(estado='entregado', ruta__conductor__isnull=False)
+            .annotate(fecha=TruncDate('hora_entrega'), id_conductor=F('ruta__conductor'))
+            .values('fecha', 'id_conductor').annotate(entregas=Count('id')).order_by()
+        ]
+        por_producto = [
+            EstadisticaProductoDia(fecha=fila['fecha'], producto_id=fila['producto'], unidades=fila['unidades'])
+            for fila in detalles.annotate(fecha=TruncDate('pedido__hora_entrega'))
+            .values('fecha', 'producto').annotate(unidades=Sum('cantidad')).order_by()
+        ]
+        tablas = (
+            (EstadisticaPedidosDia, por_estado),
+            (EstadisticaConductorDia, por_conductor),
+            (EstadisticaProductoDia, por_producto),
+        )
+        for tabla, filas in tablas:
+            tabla.objects.using(using).all().delete()
+            tabla.objects.using(using).bulk_create(filas, batch_size=1000)
+
+    return {'pedidos': len(por_estado), 'conductores': len(por_conductor), 'productos': len(por_producto)}
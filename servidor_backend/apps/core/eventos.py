@@ -0,0 +1,224 @@
+# En: apps/core/eventos.py
+
+"""
+Avisos en vivo (Server-Sent Events) para el despacho y los conductores.
+
+Cuando cambia el estado de un pedido, se asigna una ruta o se reporta una
+incidencia se publica un evento (ver signals.py y guardar_ruta). Los
+despachadores reciben todos; cada conductor, sólo los de sus rutas. El
+navegador se suscribe con EventSource a GET /core/api/eventos/?token=<token>
+(EventSource no puede mandar la cabecera Authorization).
+
+El canal por defecto (CanalLocal) vive en la memoria del proceso, así que
+necesita servirse con ASGI (`uvicorn djangoproject.asgi:application`, o
+daphne) y con un solo proceso; para varios procesos se puede apuntar
+EVENTOS['CANAL'] a otra clase con la misma interfaz (publicar / suscribir /
+cancelar) respaldada por un servicio compartido. Bajo WSGI (runserver) la
+vista responde 503 y el frontend vuelve a recargar las listas por su cuenta.
+
+Cada evento lleva un id creciente. Al reconectarse, EventSource manda
+Last-Event-ID y se reenvían los eventos que se perdió, si todavía están en
+el historial; si no, se manda `reinicio` para que recargue todo.
+"""
+
+import asyncio
+import json
+import threading
+from collections import deque, namedtuple
+from functools import lru_cache
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.module_loading import import_string
+from rest_framework.authtoken.models import Token
+
+Evento = namedtuple('Evento', 'id tipo datos conductor_id')
+
+
+def configuracion_eventos():
+    config = {
+        'CANAL': 'apps.core.eventos.CanalLocal',
+        'HISTORIAL': 500,
+        'MAX_COLA': 200,
+        'LATIDO': 15,
+    }
+    config.update(getattr(settings, 'EVENTOS', {}))
+    return config
+
+
+# -----------------------------------------------------------------
+# CANAL EN MEMORIA
+# -----------------------------------------------------------------
+
+class Suscripcion:
+    """Cola de eventos de un cliente conectado. Se lee desde su event loop."""
+
+    def __init__(self, conductor_id, max_cola):
+        self.conductor_id = conductor_id
+        self.loop = asyncio.get_running_loop()
+        self.cola = asyncio.Queue(maxsize=max_cola)
+        # Si el cliente no da abasto se descartan sus eventos y se le pide recargar
+        self.desbordada = False
+
+    def ve(self, evento):
+        """Los despachadores (conductor_id None) ven todo; un conductor, sólo lo suyo."""
+        return self.conductor_id is None or evento.conductor_id == self.conductor_id
+
+    def entregar(self, evento):
+        # Se llama desde el hilo que publica (una request síncrona)
+        try:
+            self.loop.call_soon_threadsafe(self._poner, evento)
+        except RuntimeError:
+            pass  # El loop del cliente ya se cerró; cancelar() llega enseguida
+
+    def _poner(self, evento):
+        if self.desbordada:
+            return
+        try:
+            self.cola.put_nowait(evento)
+        except asyncio.QueueFull:
+            self.desbordada = True
+
+    async def siguiente(self, timeout):
+        """Próximo evento, o None si pasó `timeout` sin eventos."""
+        try:
+            return await asyncio.wait_for(self.cola.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class CanalLocal:
+    """Pub/sub dentro del proceso, con un historial corto para reconexiones."""
+
+    # Un canal respaldado por un servicio compartido declara compartido = True
+    # (lo exige la cola de tareas, ver cola.sin_compartir)
+    compartido = False
+
+    def __init__(self, historial, max_cola):
+        self.max_cola = max_cola
+        self._lock = threading.Lock()
+        self._suscripciones = set()
+        self._historial = deque(maxlen=historial)
+        self._ultimo_id = 0
+
+    def publicar(self, tipo, datos, conductor_id=None):
+        with self._lock:
+            self._ultimo_id += 1
+            evento = Evento(self._ultimo_id, tipo, datos, conductor_id)
+            self._historial.append(evento)
+            suscripciones = [s for s in self._suscripciones if s.ve(evento)]
+        for suscripcion in suscripciones:
+            suscripcion.entregar(evento)
+        return evento
+
+    def ultimo_id(self):
+        with self._lock:
+            return self._ultimo_id
+
+    def _desde(self, ultimo_id, visible):
+        primero = self._historial[0].id if self._historial else self._ultimo_id + 1
+        if ultimo_id > self._ultimo_id or ultimo_id < primero - 1:
+            return None
+        return [e for e in self._historial if e.id > ultimo_id and visible(e)]
+
+    def desde(self, ultimo_id, conductor_id=None):
+        """Eventos posteriores a `ultimo_id` que ve `conductor_id`; None si ya no están en el historial."""
+        with self._lock:
+            return self._desde(ultimo_id, lambda e: conductor_id is None or e.conductor_id == conductor_id)
+
+    def suscribir(self, conductor_id=None, ultimo_id=None):
+        """(suscripción, eventos perdidos desde `ultimo_id`, como en `desde`)."""
+        suscripcion = Suscripcion(conductor_id, self.max_cola)
+        with self._lock:
+            self._suscripciones.add(suscripcion)
+            perdidos = [] if ultimo_id is None else self._desde(ultimo_id, suscripcion.ve)
+        return suscripcion, perdidos
+
+    def cancelar(self, suscripcion):
+        with self._lock:
+            self._suscripciones.discard(suscripcion)
+
+
+@lru_cache(maxsize=None)
+def canal():
+    config = configuracion_eventos()
+    return import_string(config['CANAL'])(historial=config['HISTORIAL'], max_cola=config['MAX_COLA'])
+
+
+def publicar(tipo, datos, conductor_id=None):
+    """Publica al confirmar la transacción: nadie recibe un cambio que se deshizo."""
+    transaction.on_commit(lambda: canal().publicar(tipo, datos, conductor_id))
+
+
+# -----------------------------------------------------------------
+# VISTA SSE
+# -----------------------------------------------------------------
+
+def _formato(evento):
+    datos = json.dumps(evento.datos, cls=DjangoJSONEncoder)
+    return f"id: {evento.id}\nevent: {evento.tipo}\ndata: {datos}\n\n"
+
+
+REINICIO = "event: reinicio\ndata: {}\n\n"
+
+
+def _usuario_del_token(clave):
+    """(usuario, conductor_id) del token, o None si no es válido."""
+    token = Token.objects.select_related('user__conductor').filter(key=clave).first()
+    if token is None or not token.user.is_active:
+        return None
+    conductor = getattr(token.user, 'conductor', None)
+    return token.user, conductor.id if conductor else None
+
+
+async def _transmitir(suscripcion, perdidos):
+    latido = configuracion_eventos()['LATIDO']
+    try:
+        # EventSource reintenta solo; la primera línea hace que el navegador
+        # reciba las cabeceras de inmediato
+        yield "retry: 3000\n\n"
+        if perdidos is None:
+            yield REINICIO
+        else:
+            for evento in perdidos:
+                yield _formato(evento)
+        while True:
+            evento = await suscripcion.siguiente(latido)
+            if suscripcion.desbordada:
+                suscripcion.desbordada = False
+                while not suscripcion.cola.empty():
+                    suscripcion.cola.get_nowait()
+                yield REINICIO
+            elif evento is None:
+                yield ": latido\n\n"
+            else:
+                yield _formato(evento)
+    finally:
+        canal().cancelar(suscripcion)
+
+
+async def eventos_view(request):
+    """GET /core/api/eventos/?token=... (text/event-stream)."""
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({"error": "Los eventos en vivo requieren servir la aplicación con ASGI."}, status=503)
+
+    clave = request.GET.get('token') or request.headers.get('Authorization', '').removeprefix('Token ').strip()
+    sesion = await sync_to_async(_usuario_del_token)(clave) if clave else None
+    if sesion is None:
+        return JsonResponse({"error": "Token inválido."}, status=401)
+    _, conductor_id = sesion
+
+    try:
+        ultimo_id = int(request.headers['Last-Event-ID'])
+    except (KeyError, ValueError):
+        ultimo_id = None
+    suscripcion, perdidos = canal().suscribir(conductor_id, ultimo_id)
+
+    respuesta = StreamingHttpResponse(_transmitir(suscripcion, perdidos), content_type='text/event-stream')
+    respuesta['Cache-Control'] = 'no-cache'
+    respuesta['X-Accel-Buffering'] = 'no'
+    return respuesta
@@ -0,0 +1,117 @@
+# En: apps/core/exportacion.py
+
+"""
+Exportación de pedidos, rutas e historial de entregas en CSV o NDJSON.
+
+Las filas se leen con values_list().iterator(chunk_size=...) y se mandan
+de a bloques con StreamingHttpResponse: en memoria hay un bloque a la vez,
+así que exportar un día o un año usa lo mismo. Los pedidos salen una fila
+por detalle (los que no tienen detalles, con esas columnas vacías).
+
+Bajo ASGI un iterador síncrono se junta entero antes de enviarse, así que
+ahí se envuelve en uno asíncrono que pide cada bloque con sync_to_async.
+"""
+
+import csv
+import io
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+# (columna en el archivo, campo de values_list)
+COLUMNAS_PEDIDOS = [
+    ('pedido_id', 'id'),
+    ('estado', 'estado'),
+    ('hora_entrega', 'hora_entrega'),
+    ('cliente_id', 'cliente_id'),
+    ('cliente', 'cliente__nombre_cliente'),
+    ('direccion', 'direccion'),
+    ('latitud', 'latitud'),
+    ('longitud', 'longitud'),
+    ('ruta_id', 'ruta_id'),
+    ('conductor', 'ruta__conductor__nombre'),
+    ('producto_id', 'detalles__producto_id'),
+    ('producto', 'detalles__producto__nombre'),
+    ('cantidad', 'detalles__cantidad'),
+    ('precio_unitario', 'detalles__precio_unitario'),
+]
+
+COLUMNAS_PARADAS = [
+    ('ruta_id', 'ruta_id'),
+    ('conductor_id', 'ruta__conductor_id'),
+    ('conductor', 'ruta__conductor__nombre'),
+    ('distancia_ruta', 'ruta__distancia'),
+    ('tiempo_estimado', 'ruta__tiempo_estimado'),
+    ('secuencia', 'secuencia'),
+    ('pedido_id', 'pedido_id'),
+    ('estado', 'pedido__estado'),
+    ('cliente', 'pedido__cliente__nombre_cliente'),
+    ('hora_entrega', 'pedido__hora_entrega'),
+    ('distancia_tramo', 'distancia_tramo'),
+    ('eta', 'eta'),
+]
+
+TIPOS_CONTENIDO = {'csv': 'text/csv; charset=utf-8', 'ndjson': 'application/x-ndjson'}
+
+
+def _configuracion():
+    config = {'CHUNK': 2000}
+    config.update(getattr(settings, 'EXPORTACION', {}))
+    return config
+
+
+# -----------------------------------------------------------------
+# FORMATOS
+# -----------------------------------------------------------------
+
+def _bloque_csv(filas, encabezado=None):
+    salida = io.StringIO()
+    escritor = csv.writer(salida)
+    if encabezado:
+        escritor.writerow(encabezado)
+    escritor.writerows(filas)
+    return salida.getvalue()
+
+
+def _bloque_ndjson(filas, nombres):
+    return ''.join(json.dumps(dict(zip(nombres, fila)), cls=DjangoJSONEncoder) + '\n' for fila in filas)
+
+
+def bloques(queryset, columnas, formato):
+    """Texto del archivo en bloques de EXPORTACION['CHUNK'] filas."""
+    nombres = [nombre for nombre, _ in columnas]
+    chunk = _configuracion()['CHUNK']
+    filas = queryset.values_list(*(campo for _, campo in columnas)).iterator(chunk_size=chunk)
+
+    if formato == 'csv':
+        yield _bloque_csv([], nombres)
+    bloque = []
+    for fila in filas:
+        bloque.append(fila)
+        if len(bloque) == chunk:
+            yield _bloque_csv(bloque) if formato == 'csv' else _bloque_ndjson(bloque, nombres)
+            bloque = []
+    if bloque:
+        yield _bloque_csv(bloque) if formato == 'csv' else _bloque_ndjson(bloque, nombres)
+
+
+async def _asincrono(iterador):
+    # thread_sensitive: todos los bloques se leen en el mismo hilo (y conexión)
+    siguiente = sync_to_async(lambda: next(iterador, None), thread_sensitive=True)
+    while (bloque := await siguiente()) is not None:
+        yield bloque
+
+
+def respuesta_exportacion(request, queryset, columnas, formato, nombre):
+    """StreamingHttpResponse que descarga `nombre`.<formato>."""
+    contenido = bloques(queryset, columnas, formato)
+    # Las vistas de DRF reciben un Request que envuelve al de Django
+    if isinstance(getattr(request, '_request', request), ASGIRequest):
+        contenido = _asincrono(contenido)
+    respuesta = StreamingHttpResponse(contenido, content_type=TIPOS_CONTENIDO[formato])
+    respuesta['Content-Disposition'] = f'attachment; filename="{nombre}.{formato}"'
+    return respuesta
@@ -0,0 +1,145 @@
+# En: apps/core/filtros.py
+
+"""
+Filtros por query params de los ViewSets del router.
+
+Todos se traducen a condiciones sobre columnas indexadas (claves foráneas,
+estado, hora_entrega, geocelda) para que la base de datos no tenga que
+recorrer la tabla entera. Un valor mal escrito responde 400 en lugar de
+ignorarse en silencio.
+"""
+
+import datetime
+
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from .espacial import filtrar_por_caja
+
+
+def inicio_del_dia(fecha):
+    """
+    Medianoche de `fecha` (hora local) como datetime. Los filtros de fechas
+    comparan contra la columna tal cual en vez de usar __date, que envuelve
+    la columna en una función y no deja usar el índice de hora_entrega.
+    """
+    return timezone.make_aware(datetime.datetime.combine(fecha, datetime.time.min))
+
+
+def _error(mensaje):
+    return ValidationError({"error": mensaje})
+
+
+def _lista(params, nombre):
+    """?estado=pendiente,en_camino -> ['pendiente', 'en_camino'] (None si no viene)."""
+    valor = params.get(nombre)
+    if not valor:
+        return None
+    return [v.strip() for v in valor.split(',') if v.strip()]
+
+
+def _enteros(params, nombre):
+    valores = _lista(params, nombre)
+    if valores is None:
+        return None
+    try:
+        return [int(v) for v in valores]
+    except ValueError:
+        raise _error(f"'{nombre}' debe ser uno o varios ids separados por coma.")
+
+
+def _dia(params, nombre, siguiente=False):
+    """
+    ?desde=AAAA-MM-DD como datetime al inicio de ese día (o del siguiente
+    con `siguiente`, para que ?hasta= incluya el día completo).
+    """
+    valor = params.get(nombre)
+    if not valor:
+        return None
+    try:
+        dia = datetime.date.fromisoformat(valor)
+    except ValueError:
+        raise _error(f"'{nombre}' debe tener el formato AAAA-MM-DD.")
+    if siguiente:
+        dia += datetime.timedelta(days=1)
+    return inicio_del_dia(dia)
+
+
+def _por_caja(queryset, params):
+    """?caja=sur,oeste,norte,este (grados) con el índice de geocelda."""
+    valor = params.get('caja')
+    if not valor:
+        return queryset
+    try:
+        sur, oeste, norte, este = (float(v) for v in valor.split(','))
+    except ValueError:
+        raise _error("'caja' debe ser sur,oeste,norte,este.")
+    return filtrar_por_caja(queryset, sur, oeste, norte, este)
+
+
+# -----------------------------------------------------------------
+# POR MODELO
+# -----------------------------------------------------------------
+
+def filtrar_pedidos(queryset, params):
+    """
+    estado, ruta, conductor, cliente (listas separadas por coma),
+    sin_ruta=1, desde/hasta (hora_entrega) y caja.
+    """
+    estados = _lista(params, 'estado')
+    if estados:
+        queryset = queryset.filter(estado__in=estados)
+    for nombre, campo in (('ruta', 'ruta_id'), ('conductor', 'ruta__conductor_id'), ('cliente', 'cliente_id')):
+        ids = _enteros(params, nombre)
+        if ids:
+            queryset = queryset.filter(**{f'{campo}__in': ids})
+    if params.get('sin_ruta') in ('1', 'true'):
+        queryset = queryset.filter(ruta__isnull=True)
+
+    desde = _dia(params, 'desde')
+    hasta = _dia(params, 'hasta', siguiente=True)
+    if desde:
+        queryset = queryset.filter(hora_entrega__gte=desde)
+    if hasta:
+        queryset = queryset.filter(hora_entrega__lt=hasta)
+    if params.get('orden', '').lstrip('-') == 'hora_entrega':
+        # El cursor no puede paginar sobre NULL
+        queryset = queryset.filter(hora_entrega__isnull=False)
+
+    return _por_caja(queryset, params)
+
+
+def filtrar_clientes(queryset, params):
+    """caja y nombre (empieza con, sin distinguir mayúsculas)."""
+    nombre = params.get('nombre')
+    if nombre:
+        queryset = queryset.filter(nombre_cliente__istartswith=nombre.strip())
+    return _por_caja(queryset, params)
+
+
+def filtrar_rutas(queryset, params):
+    ids = _enteros(params, 'conductor')
+    if ids:
+        queryset = queryset.filter(conductor_id__in=ids)
+    return queryset
+
+
+def filtrar_conductores(queryset, params):
+    estados = _lista(params, 'estado')
+    if estados:
+        queryset = queryset.filter(estado__in=estados)
+    return queryset
+
+
+def filtrar_productos(queryset, params):
+    ids = _enteros(params, 'categoria')
+    if ids:
+        queryset = queryset.filter(categoria_id__in=ids)
+    return queryset
+
+
+def filtrar_detalles(queryset, params):
+    ids = _enteros(params, 'pedido')
+    if ids:
+        queryset = queryset.filter(pedido_id__in=ids)
+    return queryset
@@ -0,0 +1,151 @@
+# En: apps/core/imagenes.py
+
+"""
+Variantes reducidas de Producto.imagen para el catálogo.
+
+Al subir (o cambiar) la imagen de un producto se encola una tarea (ver
+cola.py) que genera una versión por cada tamaño de VARIANTES['TAMANOS'] en
+WebP y en JPEG (para navegadores sin WebP). Los archivos se llaman
+<hash del original>-<tamaño>.<formato>: si la imagen cambia, cambia el
+nombre, así que se pueden servir con caché de un año (ver variante_view)
+y dos productos con la misma foto comparten los archivos.
+
+En Producto.variantes queda {'origen': <imagen de la que salieron>,
+'thumb': {'webp': <ruta>, 'jpeg': <ruta>}, ...}. Si al terminar el producto
+ya tiene otra imagen, el resultado se descarta.
+
+Para generar las que falten (productos cargados antes, o si el proceso se
+cortó): python manage.py generar_variantes
+"""
+
+import hashlib
+import io
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.views.static import serve
+from PIL import Image, ImageOps
+
+from .cache_respuestas import invalidar
+from .cola import encolar
+from .models import Producto
+
+FORMATOS = {'webp': 'WEBP', 'jpeg': 'JPEG'}
+
+
+def _configuracion():
+    config = {
+        'TAMANOS': {'thumb': 200, 'medium': 600},
+        'CALIDAD': {'webp': 80, 'jpeg': 82},
+        'CARPETA': 'productos/variantes',
+        'MAX_AGE': 365 * 24 * 60 * 60,
+    }
+    config.update(getattr(settings, 'VARIANTES', {}))
+    return config
+
+
+# -----------------------------------------------------------------
+# GENERACIÓN
+# -----------------------------------------------------------------
+
+def _reducir(original, lado):
+    """Copia que entra en un cuadrado de `lado` px (nunca se agranda)."""
+    copia = original.copy()
+    copia.thumbnail((lado, lado), Image.LANCZOS)
+    return copia
+
+
+def _codificar(imagen, formato, calidad):
+    if formato == 'jpeg' and imagen.mode != 'RGB':
+        # JPEG no tiene transparencia: se apoya sobre fondo blanco
+        fondo = Image.new('RGB', imagen.size, 'white')
+        fondo.paste(imagen, mask=imagen.getchannel('A') if 'A' in imagen.getbands() else None)
+        imagen = fondo
+    salida = io.BytesIO()
+    imagen.save(salida, FORMATOS[formato], quality=calidad, optimize=formato == 'jpeg')
+    return salida.getvalue()
+
+
+def crear_variantes(contenido):
+    """
+    Guarda las variantes de una imagen (bytes) y devuelve
+    {tamaño: {formato: ruta en el storage}}. Las que ya existen con el mismo
+    hash no se vuelven a generar.
+    """
+    config = _configuracion()
+    huella = hashlib.sha256(contenido).hexdigest()[:16]
+    original = None
+    variantes = {}
+    for tamano, lado in config['TAMANOS'].items():
+        variantes[tamano] = {}
+        for formato in FORMATOS:
+            nombre = f"{config['CARPETA']}/{huella}-{tamano}.{formato}"
+            if not default_storage.exists(nombre):
+                if original is None:
+                    original = Image.open(io.BytesIO(contenido))
+                    original = ImageOps.exif_transpose(original)
+                    if original.mode not in ('RGB', 'RGBA'):
+                        original = original.convert('RGBA' if 'transparency' in original.info else 'RGB')
+                datos = _codificar(_reducir(original, lado), formato, config['CALIDAD'][formato])
+                nombre = default_storage.save(nombre, ContentFile(datos))
+            variantes[tamano][formato] = nombre
+    return variantes
+
+
+def generar_variantes(producto_id):
+    """Genera las variantes de la imagen actual del producto. Devuelve True si las guardó."""
+    producto = Producto.objects.filter(pk=producto_id).first()
+    if producto is None or not producto.imagen:
+        return False
+    origen = producto.imagen.name
+    with producto.imagen.open('rb') as archivo:
+        contenido = archivo.read()
+    variantes = {'origen': origen, **crear_variantes(contenido)}
+
+    # Sólo si nadie cambió la imagen mientras tanto. update() no manda
+    # señales: el listado de productos se invalida a mano.
+    if not Producto.objects.filter(pk=producto_id, imagen=origen).update(variantes=variantes):
+        return False
+    invalidar('productos')
+    return True
+
+
+def programar_variantes(producto_id):
+    encolar('generar_variantes', producto_id=producto_id)
+
+
+def necesita_variantes(producto):
+    return bool(producto.imagen) and producto.variantes.get('origen') != producto.imagen.name
+
+
+# -----------------------------------------------------------------
+# URLS Y ARCHIVOS
+# -----------------------------------------------------------------
+
+def urls_variantes(producto, request=None):
+    """{tamaño: {formato: url}} para el serializador; None si todavía no hay variantes."""
+    if not producto.imagen or producto.variantes.get('origen') != producto.imagen.name:
+        return None
+    urls = {}
+    for tamano in _configuracion()['TAMANOS']:
+        rutas = producto.variantes.get(tamano)
+        if not rutas:
+            return None
+        urls[tamano] = {
+            formato: request.build_absolute_uri(default_storage.url(ruta)) if request else default_storage.url(ruta)
+            for formato, ruta in rutas.items()
+        }
+    return urls
+
+
+def variante_view(request, nombre):
+    """
+    Sirve una variante con caché larga: el nombre lleva el hash del
+    contenido, así que el archivo nunca cambia. En producción conviene que
+    lo sirva directamente el servidor web con la misma cabecera.
+    """
+    config = _configuracion()
+    respuesta = serve(request, f"{config['CARPETA']}/{nombre}", document_root=settings.MEDIA_ROOT)
+    respuesta['Cache-Control'] = f"public, max-age={config['MAX_AGE']}, immutable"
+    return respuesta
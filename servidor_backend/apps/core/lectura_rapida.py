@@ -0,0 +1,191 @@
+# En: apps/core/lectura_rapida.py
+
+"""
+Lectura rápida para los listados de pedidos más pedidos (/pedidos/,
+/mi-ruta/ y /conductor/historial/).
+
+Con miles de pedidos, lo que más tarda no es la base sino crear un objeto
+Pedido, uno por detalle y uno por producto, y pasar cada uno por los campos
+del ModelSerializer. Acá se leen filas con values_list(): los pedidos (con
+cliente, ruta y conductor en el mismo JOIN) y todos sus detalles (con el
+producto) en una segunda consulta, que se reparten en una sola pasada.
+
+El JSON es exactamente el de PedidoSerializer / PedidoConductorSerializer /
+RutaParadaSerializer: los decimales y fechas se formatean con los mismos
+campos de DRF (`_formato`) y una clave que el serializador omite (p. ej.
+conductor_asignado de un pedido sin conductor) también se omite acá. Con
+?fields= se leen sólo las columnas pedidas (ver campos.py). Lo comprueban
+los tests; para comparar tiempos:
+
+    python manage.py benchmark_serializadores
+"""
+
+from functools import lru_cache
+
+from django.db.models import QuerySet
+
+from .models import DetallePedido
+from .serializers import DetallePedidoSerializer, PedidoSerializer, RutaParadaSerializer
+
+# Campo del serializador -> columna de values(), en el orden del serializador.
+# Con ?fields= (ver campos.py) se leen sólo las columnas de los campos pedidos,
+# así que un campo que no se pide no agrega su JOIN.
+COLUMNAS_PEDIDO = {
+    'id': 'id',
+    'cliente': 'cliente_id',
+    'nombre_cliente': 'cliente__nombre_cliente',
+    'telefono_cliente': 'cliente__telefono',
+    'estado': 'estado',
+    'detalles': None,  # se leen aparte (detalles_por_pedido)
+    'latitud': 'latitud',
+    'longitud': 'longitud',
+    'conductor_asignado': 'ruta__conductor__nombre',
+}
+
+COLUMNAS_DETALLE = {
+    'id': 'id',
+    'producto': 'producto_id',
+    'nombre_producto': 'producto__nombre',
+    'cantidad': 'cantidad',
+    'precio_unitario': 'precio_unitario',
+}
+
+# Lo que necesita la paginación por cursor (ver PedidoViewSet.ordenes_cursor)
+CAMPOS_CURSOR = ('pk', 'hora_entrega')
+
+CAMPOS_PEDIDO_CONDUCTOR = (
+    'id', 'estado', 'latitud', 'longitud', 'cliente__nombre_cliente', 'cliente__telefono', 'cliente__direccion',
+)
+
+
+@lru_cache(maxsize=None)
+def _formato(serializer_class, campo):
+    """to_representation del campo del serializador (None queda None, como en DRF)."""
+    representar = serializer_class().fields[campo].to_representation
+    return lambda valor: None if valor is None else representar(valor)
+
+
+def _elegidos(columnas, campos):
+    """Los campos de `columnas` que pide `campos` (un árbol de campos.arbol(); None = todos)."""
+    return [campo for campo in columnas if campos is None or campo in campos]
+
+
+def detalles_por_pedido(pedidos, campos=None):
+    """
+    {pedido_id: [detalle como DetallePedidoSerializer]} de `pedidos` (una
+    lista de ids o un queryset de Pedido, que se usa como subconsulta).
+    """
+    claves = _elegidos(COLUMNAS_DETALLE, campos)
+    precio = _formato(DetallePedidoSerializer, 'precio_unitario') if 'precio_unitario' in claves else None
+    usar = getattr(pedidos, 'db', 'default')
+    filas = (
+        DetallePedido.objects.using(usar).filter(pedido__in=pedidos).order_by('id')
+        .values_list('pedido_id', *(COLUMNAS_DETALLE[clave] for clave in claves))
+    )
+    detalles = {}
+    for pedido_id, *valores in filas:
+        detalle = dict(zip(claves, valores))
+        if precio is not None:
+            detalle['precio_unitario'] = precio(detalle['precio_unitario'])
+        detalles.setdefault(pedido_id, []).append(detalle)
+    return detalles
+
+
+# -----------------------------------------------------------------
+# PEDIDOS (PedidoSerializer)
+# -----------------------------------------------------------------
+
+def filas_pedidos(queryset, campos=None):
+    """values() de `queryset` para paginar; se convierten con `pedidos()` y los mismos `campos`."""
+    columnas = [COLUMNAS_PEDIDO[clave] for clave in _elegidos(COLUMNAS_PEDIDO, campos) if COLUMNAS_PEDIDO[clave]]
+    if campos is None or 'conductor_asignado' in campos:
+        columnas.append('ruta__conductor_id')
+    return queryset.select_related(None).prefetch_related(None).values(*CAMPOS_CURSOR, 'id', *columnas)
+
+
+def pedidos(filas, campos=None):
+    """
+    Lista como PedidoSerializer(many=True).data a partir de `filas_pedidos()`
+    o de una página de sus filas. `campos` como en campos.arbol().
+    """
+    claves = _elegidos(COLUMNAS_PEDIDO, campos)
+    # Sin paginar, los detalles se filtran con una subconsulta y no con una
+    # lista de ids que puede pasar el límite de parámetros de SQLite
+    origen = filas.values('id') if isinstance(filas, QuerySet) else None
+    filas = list(filas)
+    detalles = None
+    if 'detalles' in claves and filas:
+        if origen is None:
+            origen = [fila['id'] for fila in filas]
+        detalles = detalles_por_pedido(origen, campos and campos['detalles'])
+    latitud = _formato(PedidoSerializer, 'latitud') if 'latitud' in claves else None
+    longitud = _formato(PedidoSerializer, 'longitud') if 'longitud' in claves else None
+    conductor = 'conductor_asignado' in claves
+
+    # Primero todas las claves en su orden; después se formatean las que hace falta
+    pares = [(clave, COLUMNAS_PEDIDO[clave] or 'id') for clave in claves]
+    resultado = []
+    for fila in filas:
+        pedido = {clave: fila[columna] for clave, columna in pares}
+        if detalles is not None:
+            pedido['detalles'] = detalles.get(fila['id'], [])
+        if latitud is not None:
+            pedido['latitud'] = latitud(pedido['latitud'])
+        if longitud is not None:
+            pedido['longitud'] = longitud(pedido['longitud'])
+        # El serializador omite la clave si el pedido no tiene ruta o la ruta no tiene conductor
+        if conductor and fila['ruta__conductor_id'] is None:
+            del pedido['conductor_asignado']
+        resultado.append(pedido)
+    return resultado
+
+
+# -----------------------------------------------------------------
+# PEDIDOS DEL CONDUCTOR (PedidoConductorSerializer)
+# -----------------------------------------------------------------
+
+def _pedido_conductor(fila, detalles, latitud, longitud):
+    id_, estado, lat, lng, nombre_cliente, telefono_cliente, direccion_texto = fila[:7]
+    return {
+        'id': id_,
+        'estado': estado,
+        'latitud': latitud(lat),
+        'longitud': longitud(lng),
+        'detalles': detalles.get(id_, []),
+        'nombre_cliente': nombre_cliente,
+        'telefono_cliente': telefono_cliente,
+        'direccion_texto': direccion_texto,
+    }
+
+
+def pedidos_conductor(queryset):
+    """Lista como PedidoConductorSerializer(queryset, many=True).data, en el orden del queryset."""
+    latitud = _formato(PedidoSerializer, 'latitud')
+    longitud = _formato(PedidoSerializer, 'longitud')
+    filas = list(queryset.select_related(None).prefetch_related(None).values_list(*CAMPOS_PEDIDO_CONDUCTOR))
+    detalles = detalles_por_pedido(queryset.values('id')) if filas else {}
+    return [_pedido_conductor(fila, detalles, latitud, longitud) for fila in filas]
+
+
+def paradas_con_pedidos(paradas):
+    """
+    Lo que arma mi-ruta para cada parada: PedidoConductorSerializer del
+    pedido más secuencia, distancia_tramo y eta de RutaParadaSerializer.
+    `paradas` es un queryset de RutaParada ya filtrado y ordenado.
+    """
+    latitud = _formato(PedidoSerializer, 'latitud')
+    longitud = _formato(PedidoSerializer, 'longitud')
+    distancia = _formato(RutaParadaSerializer, 'distancia_tramo')
+    eta = _formato(RutaParadaSerializer, 'eta')
+    filas = list(paradas.values_list(
+        *(f'pedido__{campo}' for campo in CAMPOS_PEDIDO_CONDUCTOR), 'secuencia', 'distancia_tramo', 'eta',
+    ))
+    detalles = detalles_por_pedido([fila[0] for fila in filas]) if filas else {}
+    resultado = []
+    for fila in filas:
+        pedido = _pedido_conductor(fila, detalles, latitud, longitud)
+        pedido['secuencia'] = fila[7]
+        pedido['distancia_tramo'] = distancia(fila[8])
+        pedido['eta'] = eta(fila[9])
+        resultado.append(pedido)
+    return resultado
@@ -0,0 +1,187 @@
+import datetime
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from apps.core.filtros import inicio_del_dia
+from apps.core.models import Conductor, Ruta, Cliente, Pedido
+
+ALIAS = 'benchmark'
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide las consultas más usadas de Pedido y Ruta con y sin los índices de "
+        "Meta.indexes, sobre una base SQLite temporal con datos de prueba (no toca la base real)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pedidos', type=int, default=1_000_000)
+        parser.add_argument('--repeticiones', type=int, default=5)
+        parser.add_argument('--archivo', help="Base SQLite a usar (por defecto, un archivo temporal que se borra al final)")
+        parser.add_argument('--semilla', type=int, default=1)
+
+    def handle(self, *args, **options):
+        archivo = options['archivo'] or os.path.join(tempfile.mkdtemp(), 'benchmark.sqlite3')
+        connections.databases[ALIAS] = {**connections.databases['default'], 'ENGINE': 'django.db.backends.sqlite3', 'NAME': archivo}
+        try:
+            self.stdout.write(f"Base temporal: {archivo}")
+            call_command('migrate', database=ALIAS, verbosity=0)
+            random.seed(options['semilla'])
+            self.sembrar(options['pedidos'])
+
+            consultas = self.consultas()
+            indices = [(modelo, indice) for modelo in (Pedido, Ruta) for indice in modelo._meta.indexes]
+
+            with connections[ALIAS].schema_editor() as editor:
+                for modelo, indice in indices:
+                    editor.remove_index(modelo, indice)
+            sin_indices = self.medir(consultas, options['repeticiones'])
+
+            with connections[ALIAS].schema_editor() as editor:
+                for modelo, indice in indices:
+                    editor.add_index(modelo, indice)
+            con_indices = self.medir(consultas, options['repeticiones'])
+
+            self.informar(consultas, sin_indices, con_indices)
+        finally:
+            connections[ALIAS].close()
+            del connections.databases[ALIAS]
+            if not options['archivo']:
+                os.remove(archivo)
+                os.rmdir(os.path.dirname(archivo))
+
+    # -----------------------------------------------------------------
+    # DATOS
+    # -----------------------------------------------------------------
+
+    def sembrar(self, cantidad):
+        """
+        ~25 pedidos por ruta y 300 conductores. Como en producción, casi todo
+        es historial entregado; los pendientes y en camino son pocos y
+        recientes.
+        """
+        inicio = time.perf_counter()
+        ahora = timezone.now()
+        n_rutas = max(cantidad // 25, 1)
+        n_clientes = max(cantidad // 50, 1)
+
+        with transaction.atomic(using=ALIAS):
+            Conductor.objects.using(ALIAS).bulk_create(
+                [Conductor(nombre=f'Conductor {i}', licencia=f'L-{i}') for i in range(300)]
+            )
+            conductores = list(Conductor.objects.using(ALIAS).values_list('id', flat=True))
+            Ruta.objects.using(ALIAS).bulk_create(
+                [Ruta(conductor_id=random.choice(conductores), distancia=0, tiempo_estimado=0) for _ in range(n_rutas)],
+                batch_size=5000,
+            )
+            rutas = list(Ruta.objects.using(ALIAS).values_list('id', flat=True))
+            Cliente.objects.using(ALIAS).bulk_create(
+                [Cliente(nombre_cliente=f'Cliente {i}', direccion='-') for i in range(n_clientes)], batch_size=5000,
+            )
+            clientes = list(Cliente.objects.using(ALIAS).values_list('id', flat=True))
+
+            # Las últimas rutas son las que están en curso
+            rutas_en_curso = rutas[-max(len(rutas) // 100, 1):]
+            lote = []
+            for i in range(cantidad):
+                sorteo = random.random()
+                if sorteo < 0.05:
+                    pedido = Pedido(estado='pendiente')
+                elif sorteo < 0.08:
+                    pedido = Pedido(estado='en_camino', ruta_id=random.choice(rutas_en_curso))
+                else:
+                    pedido = Pedido(
+                        estado='entregado', ruta_id=random.choice(rutas),
+                        hora_entrega=ahora - datetime.timedelta(minutes=random.randrange(2 * 365 * 24 * 60)),
+                    )
+                pedido.cliente_id = random.choice(clientes)
+                pedido.direccion = '-'
+                lote.append(pedido)
+                if len(lote) == 10000:
+                    Pedido.objects.using(ALIAS).bulk_create(lote)
+                    lote = []
+            Pedido.objects.using(ALIAS).bulk_create(lote)
+
+        self.stdout.write(f"Sembrados {cantidad} pedidos, {n_rutas} rutas en {time.perf_counter() - inicio:.1f} s")
+        self.conductor = random.choice(conductores)
+        self.ruta = random.choice(rutas_en_curso)
+
+    # -----------------------------------------------------------------
+    # CONSULTAS (las mismas que hacen las vistas)
+    # -----------------------------------------------------------------
+
+    def consultas(self):
+        pedidos = Pedido.objects.using(ALIAS)
+        hoy = timezone.now().date()
+        inicio_mes = inicio_del_dia(hoy.replace(day=1))
+        hace_7_dias = inicio_del_dia(hoy - datetime.timedelta(days=7))
+        inicio_hoy = inicio_del_dia(hoy)
+        return {
+            "Pendientes de una ruta (perform_update)":
+                lambda: pedidos.filter(ruta_id=self.ruta).exclude(estado='entregado').count(),
+            "Ruta actual del conductor (mi-ruta)":
+                lambda: Ruta.objects.using(ALIAS).filter(conductor_id=self.conductor).last(),
+            "Pedidos de una ruta (asignar_ruta)":
+                lambda: list(pedidos.filter(ruta_id=self.ruta).values_list('id', flat=True)),
+            "Pendientes sin ruta (despacho masivo)":
+                lambda: pedidos.filter(estado='pendiente', ruta__isnull=True).count(),
+            "Pedidos pendientes (dashboard)":
+                lambda: pedidos.filter(estado='pendiente').count(),
+            "Pedidos del mes (dashboard)":
+                lambda: pedidos.filter(hora_entrega__gte=inicio_mes).count(),
+            "Entregados del mes (dashboard)":
+                lambda: pedidos.filter(estado='entregado', hora_entrega__gte=inicio_mes).count(),
+            "Entregados hoy (dashboard)":
+                lambda: pedidos.filter(
+                    estado='entregado', hora_entrega__gte=inicio_hoy,
+                    hora_entrega__lt=inicio_hoy + datetime.timedelta(days=1),
+                ).count(),
+            "Pedidos por día, 7 días (dashboard)":
+                lambda: list(
+                    pedidos.filter(hora_entrega__gte=hace_7_dias)
+                    .annotate(dia=TruncDate('hora_entrega')).values('dia')
+                    .annotate(cantidad=Count('id')).order_by('dia')
+                ),
+        }
+
+    def medir(self, consultas, repeticiones):
+        """{nombre: (mediana_ms, plan)}."""
+        conexion = connections[ALIAS]
+        with conexion.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        resultado = {}
+        for nombre, consulta in consultas.items():
+            tiempos = []
+            for _ in range(repeticiones):
+                inicio = time.perf_counter()
+                consulta()
+                tiempos.append((time.perf_counter() - inicio) * 1000)
+            with CaptureQueriesContext(conexion) as capturadas:
+                consulta()
+            with conexion.cursor() as cursor:
+                cursor.execute('EXPLAIN QUERY PLAN ' + capturadas[-1]['sql'])
+                plan = '; '.join(fila[-1] for fila in cursor.fetchall())
+            resultado[nombre] = (statistics.median(tiempos), plan)
+        return resultado
+
+    def informar(self, consultas, sin_indices, con_indices):
+        self.stdout.write('')
+        for nombre in consultas:
+            antes, plan_antes = sin_indices[nombre]
+            despues, plan_despues = con_indices[nombre]
+            mejora = antes / despues if despues else float('inf')
+            self.stdout.write(self.style.MIGRATE_HEADING(nombre))
+            self.stdout.write(f"  sin índices: {antes:9.2f} ms   {plan_antes}")
+            self.stdout.write(f"  con índices: {despues:9.2f} ms   {plan_despues}")
+            self.stdout.write(self.style.SUCCESS(f"  {mejora:.1f}x"))
@@ -0,0 +1,66 @@
+import statistics
+import time
+
+from django.conf import settings
+from rest_framework.renderers import JSONRenderer
+
+from apps.core import lectura_rapida
+from apps.core.compresion import COMPRESORES, brotli, configuracion_compresion
+from apps.core.models import Pedido
+from apps.core.renderizadores import RenderizadorJSON
+
+from .benchmark_serializadores import ALIAS, Command as BenchmarkSerializadores
+
+
+class Command(BenchmarkSerializadores):
+    help = (
+        "Mide el JSON de la lista de pedidos con el renderer de DRF y con orjson, y cuánto "
+        "pesa sin comprimir, con gzip y con brotli, sobre una base SQLite temporal."
+    )
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.set_defaults(filas=[1_000, 10_000])
+
+    def handle(self, *args, **options):
+        if brotli is None:
+            self.stdout.write(self.style.WARNING("brotli no está instalado: sólo se mide gzip"))
+        super().handle(*args, **options)
+
+    def medir_filas(self, filas, options):
+        todos = lectura_rapida.pedidos(lectura_rapida.filas_pedidos(Pedido.objects.using(ALIAS).order_by('pk')))
+        pagina = {'next': None, 'previous': None, 'results': todos[:settings.REST_FRAMEWORK['PAGE_SIZE']]}
+        self.informar_json(f"Una página ({len(pagina['results'])} pedidos)", pagina, options['repeticiones'])
+        self.informar_json(f"Todos ({filas} pedidos)", todos, options['repeticiones'])
+
+    def cronometrar(self, funcion, repeticiones):
+        tiempos = []
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            resultado = funcion()
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+        return statistics.median(tiempos), resultado
+
+    def informar_json(self, nombre, datos, repeticiones):
+        antes, contenido_drf = self.cronometrar(lambda: JSONRenderer().render(datos), repeticiones)
+        despues, contenido = self.cronometrar(lambda: RenderizadorJSON().render(datos), repeticiones)
+        iguales = contenido == contenido_drf
+
+        self.stdout.write('')
+        self.stdout.write(self.style.MIGRATE_HEADING(nombre))
+        self.stdout.write(f"  render DRF (json):   {antes:9.2f} ms")
+        self.stdout.write(f"  render orjson:       {despues:9.2f} ms")
+        mejora = antes / despues if despues else float('inf')
+        if iguales:
+            self.stdout.write(self.style.SUCCESS(f"  {mejora:.1f}x, mismos bytes"))
+        else:
+            self.stdout.write(self.style.ERROR(f"  {mejora:.1f}x, LOS BYTES NO COINCIDEN"))
+
+        config = configuracion_compresion()
+        self.stdout.write(f"  sin comprimir: {len(contenido):>11,} bytes")
+        for codificacion in ('gzip', 'br') if brotli is not None else ('gzip',):
+            tiempo, comprimido = self.cronometrar(lambda: COMPRESORES[codificacion](config).todo(contenido), repeticiones)
+            self.stdout.write(
+                f"  {codificacion + ':':<14} {len(comprimido):>11,} bytes "
+                f"({len(comprimido) / len(contenido):.0%}) en {tiempo:.2f} ms"
+            )
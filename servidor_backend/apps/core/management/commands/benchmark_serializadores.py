@@ -0,0 +1,153 @@
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+
+from apps.core import lectura_rapida
+from apps.core.models import Conductor, Ruta, Cliente, Pedido, Producto, DetallePedido
+from apps.core.serializers import PedidoConductorSerializer, PedidoSerializer, pedidos_con_relaciones
+
+ALIAS = 'benchmark'
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara el armado de los listados de pedidos con los ModelSerializer y con "
+        "lectura_rapida (values()), sobre una base SQLite temporal con datos de prueba."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--filas', type=int, nargs='+', default=[1_000, 10_000, 100_000])
+        parser.add_argument('--repeticiones', type=int, default=3)
+        parser.add_argument('--archivo', help="Base SQLite a usar (por defecto, un archivo temporal que se borra al final)")
+        parser.add_argument('--semilla', type=int, default=1)
+
+    def handle(self, *args, **options):
+        archivo = options['archivo'] or os.path.join(tempfile.mkdtemp(), 'benchmark.sqlite3')
+        connections.databases[ALIAS] = {**connections.databases['default'], 'ENGINE': 'django.db.backends.sqlite3', 'NAME': archivo}
+        try:
+            self.stdout.write(f"Base temporal: {archivo}")
+            call_command('migrate', database=ALIAS, verbosity=0)
+            random.seed(options['semilla'])
+            self.preparar()
+            for filas in sorted(options['filas']):
+                self.sembrar(filas - Pedido.objects.using(ALIAS).count())
+                self.medir_filas(filas, options)
+        finally:
+            connections[ALIAS].close()
+            del connections.databases[ALIAS]
+            if not options['archivo']:
+                os.remove(archivo)
+                os.rmdir(os.path.dirname(archivo))
+
+    # -----------------------------------------------------------------
+    # DATOS
+    # -----------------------------------------------------------------
+
+    def preparar(self):
+        with transaction.atomic(using=ALIAS):
+            Conductor.objects.using(ALIAS).bulk_create(
+                [Conductor(nombre=f'Conductor {i}', licencia=f'L-{i}') for i in range(50)]
+            )
+            conductores = list(Conductor.objects.using(ALIAS).values_list('id', flat=True))
+            # Una de cada diez rutas sin conductor, para que falte conductor_asignado
+            Ruta.objects.using(ALIAS).bulk_create([
+                Ruta(conductor_id=None if i % 10 == 0 else random.choice(conductores), distancia=0, tiempo_estimado=0)
+                for i in range(500)
+            ])
+            Cliente.objects.using(ALIAS).bulk_create(
+                [Cliente(nombre_cliente=f'Cliente {i}', telefono='70000000', direccion='-') for i in range(2000)]
+            )
+            Producto.objects.using(ALIAS).bulk_create(
+                [Producto(nombre=f'Producto {i}', precio=random.randint(100, 5000) / 100) for i in range(30)]
+            )
+        self.rutas = list(Ruta.objects.using(ALIAS).values_list('id', flat=True))
+        self.clientes = list(Cliente.objects.using(ALIAS).values_list('id', flat=True))
+        self.productos = list(Producto.objects.using(ALIAS).values_list('id', 'precio'))
+        self.conductor = Conductor.objects.using(ALIAS).order_by('id').first()
+
+    def sembrar(self, cantidad):
+        """`cantidad` pedidos más, con 1 a 4 detalles cada uno; casi todos entregados y con ruta."""
+        if cantidad <= 0:
+            return
+        inicio = time.perf_counter()
+        with transaction.atomic(using=ALIAS):
+            ultimo = Pedido.objects.using(ALIAS).order_by('-id').values_list('id', flat=True).first() or 0
+            lote = []
+            for _ in range(cantidad):
+                con_ruta = random.random() < 0.9
+                lote.append(Pedido(
+                    cliente_id=random.choice(self.clientes), direccion='-',
+                    estado='entregado' if con_ruta else 'pendiente',
+                    ruta_id=random.choice(self.rutas) if con_ruta else None,
+                    latitud=round(-17.39 + random.uniform(-0.05, 0.05), 6),
+                    longitud=round(-66.15 + random.uniform(-0.05, 0.05), 6),
+                ))
+            Pedido.objects.using(ALIAS).bulk_create(lote, batch_size=5000)
+
+            detalles = []
+            for pedido_id in Pedido.objects.using(ALIAS).filter(id__gt=ultimo).values_list('id', flat=True):
+                for producto_id, precio in random.sample(self.productos, random.randint(1, 4)):
+                    detalles.append(DetallePedido(
+                        pedido_id=pedido_id, producto_id=producto_id, cantidad=random.randint(1, 5), precio_unitario=precio,
+                    ))
+            DetallePedido.objects.using(ALIAS).bulk_create(detalles, batch_size=5000)
+        self.stdout.write(f"Sembrados {cantidad} pedidos en {time.perf_counter() - inicio:.1f} s")
+
+    # -----------------------------------------------------------------
+    # MEDICIÓN
+    # -----------------------------------------------------------------
+
+    def medir_filas(self, filas, options):
+        self.informar(filas, self.medir(options['repeticiones']))
+
+    def casos(self):
+        """{nombre: (con ModelSerializer, con lectura_rapida)}, los mismos listados que las vistas."""
+        todos = Pedido.objects.using(ALIAS).order_by('pk')
+        historial = Pedido.objects.using(ALIAS).filter(ruta__conductor=self.conductor, estado='entregado').order_by('-id')
+        return {
+            "Lista de pedidos (/pedidos/)": (
+                lambda: PedidoSerializer(pedidos_con_relaciones(todos), many=True).data,
+                lambda: lectura_rapida.pedidos(lectura_rapida.filas_pedidos(todos)),
+            ),
+            "Historial del conductor (/conductor/historial/)": (
+                lambda: PedidoConductorSerializer(pedidos_con_relaciones(historial), many=True).data,
+                lambda: lectura_rapida.pedidos_conductor(historial),
+            ),
+        }
+
+    def medir(self, repeticiones):
+        """{nombre: (mediana_ms serializador, mediana_ms values(), cantidad, iguales)}."""
+        resultado = {}
+        for nombre, (serializador, rapida) in self.casos().items():
+            tiempos = {serializador: [], rapida: []}
+            for _ in range(repeticiones):
+                for funcion in tiempos:
+                    inicio = time.perf_counter()
+                    datos = funcion()
+                    tiempos[funcion].append((time.perf_counter() - inicio) * 1000)
+            esperado, obtenido = serializador(), rapida()
+            resultado[nombre] = (
+                statistics.median(tiempos[serializador]), statistics.median(tiempos[rapida]),
+                len(datos), json.dumps(esperado) == json.dumps(obtenido),
+            )
+        return resultado
+
+    def informar(self, filas, resultado):
+        self.stdout.write('')
+        self.stdout.write(self.style.MIGRATE_HEADING(f"{filas} pedidos"))
+        for nombre, (antes, despues, cantidad, iguales) in resultado.items():
+            mejora = antes / despues if despues else float('inf')
+            self.stdout.write(f"  {nombre} ({cantidad} filas)")
+            self.stdout.write(f"    ModelSerializer: {antes:9.1f} ms")
+            self.stdout.write(f"    values():        {despues:9.1f} ms")
+            if iguales:
+                self.stdout.write(self.style.SUCCESS(f"    {mejora:.1f}x, mismo JSON"))
+            else:
+                self.stdout.write(self.style.ERROR(f"    {mejora:.1f}x, EL JSON NO COINCIDE"))
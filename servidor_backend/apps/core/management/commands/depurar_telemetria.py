@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from apps.core.telemetria import depurar
+
+
+class Command(BaseCommand):
+    help = "Borra las posiciones GPS viejas y reduce a una por minuto las de más de unos días (telemetria.py)."
+
+    def handle(self, *args, **options):
+        viejas, reducidas = depurar()
+        self.stdout.write(self.style.SUCCESS(f"Borradas {viejas} muestras por antigüedad y {reducidas} al reducir."))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from apps.core.imagenes import generar_variantes, necesita_variantes
+from apps.core.models import Producto
+
+
+class Command(BaseCommand):
+    help = "Genera las variantes reducidas (WebP y JPEG) de las imágenes de productos que no las tengan (imagenes.py)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--todas', action='store_true', help="Regenera también las que ya existen.")
+
+    def handle(self, *args, **options):
+        productos = Producto.objects.exclude(imagen='').exclude(imagen__isnull=True).order_by('id')
+        generadas = errores = 0
+        for producto in productos.iterator():
+            if not options['todas'] and not necesita_variantes(producto):
+                continue
+            try:
+                generadas += generar_variantes(producto.id)
+            except Exception as e:
+                errores += 1
+                self.stderr.write(f"Producto {producto.id}: {e}")
+        self.stdout.write(self.style.SUCCESS(f"Variantes generadas para {generadas} productos ({errores} con error)."))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from apps.core.cola import activa, encolar
+from apps.core.estadisticas import reconstruir_estadisticas
+
+
+class Command(BaseCommand):
+    help = "Recalcula desde cero las tablas de estadísticas diarias de los reportes (estadisticas.py)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--en-cola', action='store_true', help="La deja en la cola de tareas (trabajar_tareas).")
+
+    def handle(self, *args, **options):
+        if options['en_cola'] and activa():
+            tarea = encolar('reconstruir_estadisticas')
+            self.stdout.write(self.style.SUCCESS(f"Encolada como tarea {tarea.id}."))
+            return
+        filas = reconstruir_estadisticas()
+        self.stdout.write(self.style.SUCCESS(
+            f"Estadísticas reconstruidas: {filas['pedidos']} filas por estado, "
+            f"{filas['conductores']} por conductor y {filas['productos']} por producto."
+        ))
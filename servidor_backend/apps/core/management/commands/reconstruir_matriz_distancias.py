@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.core.matriz_distancias import MatrizLlena, matriz_clientes, reconstruir_desde_clientes
+
+
+class Command(BaseCommand):
+    help = "Recalcula desde cero la caché de distancias entre clientes (matriz_distancias.py)."
+
+    def handle(self, *args, **options):
+        try:
+            reconstruir_desde_clientes()
+        except MatrizLlena as error:
+            raise CommandError(f"{error} Suba MATRIZ_DISTANCIAS['MAX_CLIENTES'] o desactive la caché.")
+        matriz_clientes.recargar()
+        self.stdout.write(self.style.SUCCESS(f"Matriz reconstruida: {len(matriz_clientes)} clientes en {matriz_clientes.ruta}"))
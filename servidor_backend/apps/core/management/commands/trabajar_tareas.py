@@ -0,0 +1,69 @@
+import multiprocessing
+import os
+import signal
+import socket
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+# Con multiprocessing en modo 'spawn' (Windows) cada hijo importa este módulo
+# antes de configurar Django: apps.core se importa dentro de las funciones.
+
+def _proceso(nombre, detener):
+    # Ctrl+C lo maneja el proceso principal: cada trabajador termina su tarea actual
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    import django
+    django.setup()
+    from apps.core.cola import trabajar
+    trabajar(nombre, detener)
+
+
+class Command(BaseCommand):
+    help = "Ejecuta las tareas de la cola (cola.py) con varios procesos hasta recibir Ctrl+C o SIGTERM."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--procesos', type=int, help="Cantidad de procesos (por defecto TAREAS['PROCESOS']).")
+        parser.add_argument('--una-vez', action='store_true', help="Ejecuta lo que haya en la cola y termina.")
+
+    def handle(self, *args, **options):
+        from apps.core.cola import configuracion_cola, sin_compartir, trabajar
+
+        # Puede quedar trabajo encolado de antes, pero lo que hagan las tareas no
+        # llega a las cachés ni a los eventos del servidor
+        for motivo in sin_compartir():
+            self.stderr.write(self.style.WARNING(f"{motivo}: el servidor no verá lo que hagan las tareas."))
+
+        base = f"{socket.gethostname()}:{os.getpid()}"
+        if options['una_vez']:
+            ejecutadas = trabajar(base, una_vez=True)
+            self.stdout.write(self.style.SUCCESS(f"{ejecutadas} tareas ejecutadas."))
+            return
+
+        procesos = options['procesos'] or configuracion_cola()['PROCESOS']
+        detener = multiprocessing.Event()
+        # Los hijos abren sus propias conexiones
+        connections.close_all()
+        # No daemonic: un despacho masivo grande abre su propio pool de procesos
+        # (despacho.resolver_grupos) y un proceso daemonic no puede tener hijos.
+        # Se detienen con `detener`, que activan Ctrl+C y SIGTERM.
+        hijos = [
+            multiprocessing.Process(target=_proceso, args=(f"{base}/{i}", detener))
+            for i in range(procesos)
+        ]
+        for hijo in hijos:
+            hijo.start()
+        self.stdout.write(f"{procesos} trabajadores esperando tareas (Ctrl+C para terminar).")
+
+        def terminar(*_):
+            detener.set()
+        signal.signal(signal.SIGINT, terminar)
+        signal.signal(signal.SIGTERM, terminar)
+        try:
+            for hijo in hijos:
+                hijo.join()
+        finally:
+            # Si el principal sale por otro motivo, los hijos no quedan sueltos
+            detener.set()
+            for hijo in hijos:
+                hijo.join()
+        self.stdout.write(self.style.SUCCESS("Trabajadores detenidos."))
@@ -0,0 +1,404 @@
+# En: apps/core/matriz_distancias.py
+
+"""
+Caché persistente de distancias entre clientes.
+
+Los clientes casi no cambian de lugar y se les entrega todas las semanas,
+así que sus distancias se guardan en un archivo .npy que se abre con
+memoria mapeada (np.memmap): leer la submatriz de una ruta no recalcula
+nada ni carga el archivo entero.
+
+Archivos (en settings.MATRIZ_DISTANCIAS['RUTA']):
+  * matriz.npy  - float32, capacidad x capacidad, en km
+  * ids.npy     - int64, id de Cliente de cada fila (-1 = libre)
+  * coords.npy  - float64, capacidad x 2, (lat, lng) con que se calculó la fila
+
+Cuando un cliente se crea o cambia de coordenadas sólo se recalcula su
+fila (y columna): O(n). Ver signals.py. Cada proceso deja los archivos
+abiertos y sólo los vuelve a abrir si otro los reemplazó (al crecer o al
+reconstruir la matriz).
+
+La matriz ocupa capacidad² x 4 bytes: 256 MB con 8.192 clientes. Por eso
+no crece más allá de MAX_CLIENTES; con más clientes con GPS que eso queda
+`llena`, el despacho deja de usarla y el optimizador calcula las distancias
+de cada ruta como si no existiera.
+
+Los archivos pueden haber quedado de otra base (una copia, otro entorno) o
+atrasados (cambios hechos con queryset.update(), sin señales). Por eso
+cada proceso, antes de usar la matriz por primera vez, la compara con la
+tabla Cliente (`sincronizar_con_clientes`) y corrige las filas que no
+coinciden.
+"""
+
+import contextlib
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+from .optimizacion import a_arreglos, distancias_entre, matriz_haversine
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+LIBRE = -1
+
+# Dos coordenadas se consideran iguales por debajo de esto (grados ≈ 1 cm).
+TOLERANCIA_GRADOS = 1e-7
+
+
+def _configuracion():
+    config = {
+        'ACTIVA': True,
+        'RUTA': Path(settings.BASE_DIR) / 'cache' / 'matriz_clientes',
+        'CAPACIDAD_INICIAL': 1024,
+        'MAX_CLIENTES': 8192,
+    }
+    config.update(getattr(settings, 'MATRIZ_DISTANCIAS', {}))
+    return config
+
+
+class MatrizLlena(Exception):
+    """Hay más clientes con GPS que MAX_CLIENTES: la matriz no se agranda más."""
+
+
+class MatrizDistancias:
+    """Matriz de distancias entre clientes en disco, actualizable fila por fila."""
+
+    def __init__(self, ruta=None):
+        self._ruta = Path(ruta) if ruta else None
+        self._lock = threading.RLock()
+        self._matriz = None
+        self._ids = None
+        self._coords = None
+        self._fila_de = {}
+        self._inodo = None
+        # Si ya se comparó con los clientes de la base en este proceso
+        self.sincronizada = False
+        # Si hizo falta pasar de MAX_CLIENTES (ver MatrizLlena)
+        self.llena = False
+
+    # --- archivos ---
+
+    @property
+    def ruta(self):
+        return self._ruta or Path(_configuracion()['RUTA'])
+
+    def existe(self):
+        return self._archivo('matriz').exists()
+
+    def _archivo(self, nombre):
+        return self.ruta / f'{nombre}.npy'
+
+    @contextlib.contextmanager
+    def _bloqueo(self):
+        """Bloqueo entre hilos y, donde se puede, entre procesos (fcntl)."""
+        with self._lock:
+            self.ruta.mkdir(parents=True, exist_ok=True)
+            if fcntl is None:
+                yield
+                return
+            with open(self.ruta / '.lock', 'w') as archivo:
+                fcntl.flock(archivo, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(archivo, fcntl.LOCK_UN)
+
+    def _crear(self, capacidad):
+        matriz = np.lib.format.open_memmap(self._archivo('matriz'), mode='w+', dtype=np.float32, shape=(capacidad, capacidad))
+        ids = np.lib.format.open_memmap(self._archivo('ids'), mode='w+', dtype=np.int64, shape=(capacidad,))
+        coords = np.lib.format.open_memmap(self._archivo('coords'), mode='w+', dtype=np.float64, shape=(capacidad, 2))
+        ids[:] = LIBRE
+        return matriz, ids, coords
+
+    def _inodo_en_disco(self):
+        try:
+            return os.stat(self._archivo('matriz')).st_ino
+        except FileNotFoundError:
+            return None
+
+    def _abrir(self):
+        """Abre los archivos (o los crea vacíos) y arma el índice id -> fila."""
+        if not self._archivo('matriz').exists():
+            config = _configuracion()
+            self._matriz, self._ids, self._coords = self._crear(min(config['CAPACIDAD_INICIAL'], config['MAX_CLIENTES']))
+        else:
+            self._matriz = np.load(self._archivo('matriz'), mmap_mode='r+')
+            self._ids = np.load(self._archivo('ids'), mmap_mode='r+')
+            self._coords = np.load(self._archivo('coords'), mmap_mode='r+')
+        self._inodo = self._inodo_en_disco()
+        self._indexar()
+
+    def _indexar(self):
+        ocupadas = np.flatnonzero(self._ids != LIBRE)
+        self._fila_de = dict(zip(self._ids[ocupadas].tolist(), ocupadas.tolist()))
+
+    def _refrescar(self):
+        """
+        Con el bloqueo tomado, antes de escribir: si otro proceso reemplazó
+        los archivos se vuelven a abrir; si no, los mapas siguen siendo los
+        mismos (memoria compartida) y alcanza con releer el índice.
+        """
+        if self._matriz is None or self._inodo != self._inodo_en_disco():
+            self._abrir()
+        else:
+            self._indexar()
+
+    def _asegurar_abierta(self):
+        if self._matriz is None:
+            with self._bloqueo():
+                if self._matriz is None:
+                    self._abrir()
+
+    def cerrar(self):
+        """Suelta los archivos; el próximo uso los vuelve a abrir y a comparar con los clientes."""
+        with self._lock:
+            self._matriz = self._ids = self._coords = None
+            self._fila_de = {}
+            self._inodo = None
+            self.sincronizada = False
+            self.llena = False
+
+    def recargar(self):
+        """Vuelve a leer el índice desde disco (otro proceso pudo haber escrito)."""
+        with self._bloqueo():
+            self._abrir()
+
+    def __len__(self):
+        self._asegurar_abierta()
+        return len(self._fila_de)
+
+    def _reemplazar(self, capacidad, llenar):
+        """
+        Escribe archivos nuevos de `capacidad` filas en una carpeta temporal
+        (llenar(matriz, ids, coords) pone el contenido) y recién entonces los
+        mueve en lugar de los actuales: quien tenga abiertos los anteriores
+        nunca ve un archivo a medio escribir.
+        """
+        temporal = MatrizDistancias(self.ruta / 'nueva')
+        temporal.ruta.mkdir(exist_ok=True)
+        arreglos = temporal._crear(capacidad)
+        llenar(*arreglos)
+        for arreglo in arreglos:
+            arreglo.flush()
+        del arreglos
+        self._matriz = self._ids = self._coords = None
+        for nombre in ('matriz', 'ids', 'coords'):
+            os.replace(temporal._archivo(nombre), self._archivo(nombre))
+        temporal.ruta.rmdir()
+        self._abrir()
+
+    def _llena(self):
+        self.llena = True
+        return MatrizLlena(f"Más de {_configuracion()['MAX_CLIENTES']} clientes con GPS (MAX_CLIENTES).")
+
+    def _crecer(self):
+        """Duplica la capacidad (hasta MAX_CLIENTES) copiando el contenido actual."""
+        anterior = len(self._ids)
+        capacidad = min(anterior * 2, _configuracion()['MAX_CLIENTES'])
+        if capacidad <= anterior:
+            raise self._llena()
+
+        def copiar(matriz, ids, coords):
+            matriz[:anterior, :anterior] = self._matriz
+            ids[:anterior] = self._ids
+            coords[:anterior] = self._coords
+
+        self._reemplazar(capacidad, copiar)
+
+    # --- escritura ---
+
+    def _al_dia(self, cliente_id, lat, lng):
+        fila = self._fila_de.get(cliente_id)
+        return fila is not None and np.allclose(self._coords[fila], (lat, lng), atol=TOLERANCIA_GRADOS, rtol=0)
+
+    def _actualizar(self, cliente_id, lat, lng):
+        """Como actualizar_cliente, con el bloqueo ya tomado y los archivos abiertos."""
+        if self._al_dia(cliente_id, lat, lng):
+            return
+        fila = self._fila_de.get(cliente_id)
+        if fila is None:
+            libres = np.flatnonzero(self._ids == LIBRE)
+            if not len(libres):
+                self._crecer()
+                libres = np.flatnonzero(self._ids == LIBRE)
+            fila = int(libres[0])
+
+        ocupadas = np.flatnonzero(self._ids != LIBRE)
+        distancias = distancias_entre([lat], [lng], self._coords[ocupadas, 0], self._coords[ocupadas, 1])[0]
+        self._matriz[fila, ocupadas] = distancias
+        self._matriz[ocupadas, fila] = distancias
+        self._matriz[fila, fila] = 0.0
+        self._coords[fila] = (lat, lng)
+        self._ids[fila] = cliente_id
+        self._fila_de[cliente_id] = fila
+        for arreglo in (self._matriz, self._ids, self._coords):
+            arreglo.flush()
+
+    def actualizar_cliente(self, cliente_id, lat, lng):
+        """Calcula (o recalcula) la fila de un cliente. Sin coordenadas, lo quita."""
+        if lat is None or lng is None:
+            self.quitar_cliente(cliente_id)
+            return
+        with self._bloqueo():
+            self._refrescar()
+            self._actualizar(cliente_id, float(lat), float(lng))
+
+    def quitar_cliente(self, cliente_id):
+        with self._bloqueo():
+            self._refrescar()
+            fila = self._fila_de.pop(cliente_id, None)
+            if fila is not None:
+                self._ids[fila] = LIBRE
+                self._ids.flush()
+
+    def reconstruir(self, clientes):
+        """Recalcula todo desde [(id, lat, lng), ...]. Lo usa el comando de mantenimiento."""
+        with self._bloqueo():
+            self._reconstruir(clientes)
+
+    def _reconstruir(self, clientes):
+        clientes = [(id_, float(lat), float(lng)) for id_, lat, lng in clientes]
+        n = len(clientes)
+        config = _configuracion()
+        if n > config['MAX_CLIENTES']:
+            raise self._llena()
+        capacidad = max(config['CAPACIDAD_INICIAL'], 1)
+        while capacidad < n:
+            capacidad *= 2
+        capacidad = min(capacidad, config['MAX_CLIENTES'])
+
+        def llenar(matriz, ids, coords):
+            if not n:
+                return
+            lats = np.array([c[1] for c in clientes])
+            lngs = np.array([c[2] for c in clientes])
+            # Por bloques de filas, para no tener la matriz float64 entera en memoria.
+            for inicio in range(0, n, 1024):
+                fin = min(inicio + 1024, n)
+                matriz[inicio:fin, :n] = distancias_entre(lats[inicio:fin], lngs[inicio:fin], lats, lngs)
+            ids[:n] = [c[0] for c in clientes]
+            coords[:n, 0], coords[:n, 1] = lats, lngs
+
+        self._reemplazar(capacidad, llenar)
+        self.sincronizada = True
+
+    def sincronizar(self, clientes):
+        """
+        Deja la matriz de acuerdo con [(id, lat, lng), ...] (los clientes de
+        la base): libera las filas de los que ya no están y recalcula las de
+        los que faltan o se movieron. Si es más de la mitad, la rehace
+        entera. Devuelve cuántos clientes corrigió. Con más de MAX_CLIENTES
+        clientes lanza MatrizLlena sin tocar los archivos.
+        """
+        clientes = {int(id_): (float(lat), float(lng)) for id_, lat, lng in clientes}
+        if len(clientes) > _configuracion()['MAX_CLIENTES']:
+            raise self._llena()
+        with self._bloqueo():
+            self._refrescar()
+            sobrantes = [id_ for id_ in self._fila_de if id_ not in clientes]
+            cambiados = [id_ for id_, (lat, lng) in clientes.items() if not self._al_dia(id_, lat, lng)]
+            if len(sobrantes) + len(cambiados) > len(clientes) // 2:
+                self._reconstruir([(id_, lat, lng) for id_, (lat, lng) in clientes.items()])
+            else:
+                for id_ in sobrantes:
+                    self._ids[self._fila_de.pop(id_)] = LIBRE
+                self._ids.flush()
+                for id_ in cambiados:
+                    self._actualizar(id_, *clientes[id_])
+            self.sincronizada = True
+        return len(sobrantes) + len(cambiados)
+
+    # --- lectura ---
+
+    def filas_de(self, cliente_ids, lats, lngs):
+        """
+        Fila en caché de cada punto, o -1 si el cliente no está o si el punto
+        no coincide con las coordenadas guardadas del cliente.
+        """
+        self._asegurar_abierta()
+        filas = np.full(len(cliente_ids), LIBRE, dtype=np.int64)
+        for i, cliente_id in enumerate(cliente_ids):
+            fila = self._fila_de.get(cliente_id)
+            if fila is not None and self._ids[fila] == cliente_id:
+                filas[i] = fila
+        con_fila = filas != LIBRE
+        if con_fila.any():
+            guardadas = self._coords[filas[con_fila]]
+            iguales = (
+                (np.abs(guardadas[:, 0] - lats[con_fila]) <= TOLERANCIA_GRADOS)
+                & (np.abs(guardadas[:, 1] - lngs[con_fila]) <= TOLERANCIA_GRADOS)
+            )
+            filas[np.flatnonzero(con_fila)[~iguales]] = LIBRE
+        return filas
+
+    def matriz_para(self, puntos, cliente_ids):
+        """
+        Matriz de distancias entre `puntos` [(lat, lng), ...]. Los pares de
+        clientes en caché se leen del archivo; sólo se calculan las filas de
+        los puntos que no están (por ejemplo, el origen). `cliente_ids` es
+        paralela a `puntos` (None si el punto no es un cliente).
+        """
+        lats, lngs = a_arreglos(puntos)
+        filas = self.filas_de(cliente_ids, lats, lngs)
+        en_cache = np.flatnonzero(filas != LIBRE)
+        if len(en_cache) < 2:
+            return matriz_haversine(lats, lngs)
+
+        dist = np.empty((len(puntos), len(puntos)), dtype=np.float64)
+        dist[np.ix_(en_cache, en_cache)] = self._matriz[np.ix_(filas[en_cache], filas[en_cache])]
+        fuera = np.flatnonzero(filas == LIBRE)
+        if len(fuera):
+            calculadas = distancias_entre(lats[fuera], lngs[fuera], lats, lngs)
+            dist[fuera, :] = calculadas
+            dist[:, fuera] = calculadas.T
+        return dist
+
+
+matriz_clientes = MatrizDistancias()
+
+
+def activa():
+    return _configuracion()['ACTIVA']
+
+
+def en_uso():
+    """Si las señales tienen que mantener la matriz: activada, ya creada y sin pasar de MAX_CLIENTES."""
+    return activa() and not matriz_clientes.llena and matriz_clientes.existe()
+
+
+def _clientes_con_gps():
+    from .models import Cliente
+    return Cliente.objects.filter(latitud__isnull=False, longitud__isnull=False).values_list('id', 'latitud', 'longitud')
+
+
+def reconstruir_desde_clientes():
+    matriz_clientes.reconstruir(_clientes_con_gps())
+
+
+def sincronizar_con_clientes():
+    """Corrige la matriz contra la tabla Cliente; devuelve cuántos clientes cambió."""
+    return matriz_clientes.sincronizar(_clientes_con_gps())
+
+
+def matriz_para_pedidos(origen, pedidos):
+    """
+    Matriz de [origen] + pedidos usando la caché de clientes cuando el
+    pedido está en las coordenadas de su cliente. None si la caché está
+    desactivada o llena (el optimizador la calcula entera). La primera vez
+    en cada proceso la compara con los clientes (y si no existe, la arma).
+    """
+    if not activa() or matriz_clientes.llena:
+        return None
+    if not matriz_clientes.sincronizada:
+        try:
+            sincronizar_con_clientes()
+        except MatrizLlena:
+            return None
+    puntos = [origen] + [(p.latitud, p.longitud) for p in pedidos]
+    return matriz_clientes.matriz_para(puntos, [None] + [p.cliente_id for p in pedidos])
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:49
+
+from django.db import migrations, models
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def _geohash(lat, lng, precision=7):
+    """Copia de espacial.codificar_geohash con la precisión por defecto de cuando se escribió."""
+    lat, lng = float(lat), float(lng)
+    rango_lat, rango_lng = [-90.0, 90.0], [-180.0, 180.0]
+    resultado, bits, valor, es_lng = [], 0, 0, True
+    while len(resultado) < precision:
+        rango, x = (rango_lng, lng) if es_lng else (rango_lat, lat)
+        medio = (rango[0] + rango[1]) / 2
+        valor <<= 1
+        if x >= medio:
+            valor |= 1
+            rango[0] = medio
+        else:
+            rango[1] = medio
+        es_lng = not es_lng
+        bits += 1
+        if bits == 5:
+            resultado.append(_BASE32[valor])
+            bits, valor = 0, 0
+    return ''.join(resultado)
+
+
+def calcular_geoceldas(apps, schema_editor):
+    alias = schema_editor.connection.alias
+    for nombre in ('Cliente', 'Pedido'):
+        modelo = apps.get_model('core', nombre)
+        filas = list(modelo.objects.using(alias).filter(latitud__isnull=False, longitud__isnull=False))
+        for fila in filas:
+            fila.geocelda = _geohash(fila.latitud, fila.longitud)
+        modelo.objects.using(alias).bulk_update(filas, ['geocelda'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_conductor_placa_vehiculo_conductor_telefono'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cliente',
+            name='geocelda',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=12),
+        ),
+        migrations.AddField(
+            model_name='pedido',
+            name='geocelda',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=12),
+        ),
+        migrations.RunPython(calcular_geoceldas, migrations.RunPython.noop),
+    ]
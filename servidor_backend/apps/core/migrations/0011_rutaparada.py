@@ -0,0 +1,102 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:50
+
+import django.db.models.deletion
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+
+from django.db import migrations, models
+
+
+def _coordenadas(punto):
+    try:
+        lat, lng = punto.strip().strip('()').split(',')
+        return Decimal(lat.strip()), Decimal(lng.strip())
+    except (ValueError, InvalidOperation):
+        return None
+
+
+def crear_paradas(apps, schema_editor):
+    """
+    Pasa el texto "(lat, lon); (lat, lon); ..." de cada ruta a RutaParada.
+    Cada pedido toma la posición de su coordenada en el texto; los que no
+    aparecen van al final, por id.
+    """
+    Ruta = apps.get_model('core', 'Ruta')
+    Pedido = apps.get_model('core', 'Pedido')
+    RutaParada = apps.get_model('core', 'RutaParada')
+
+    for ruta in Ruta.objects.all():
+        puntos = [_coordenadas(p) for p in ruta.puntos_de_entrega.split(';') if p.strip()]
+        posiciones = {}
+        for posicion, punto in enumerate(puntos):
+            posiciones.setdefault(punto, []).append(posicion)
+
+        def clave(pedido):
+            libres = posiciones.get((pedido.latitud, pedido.longitud))
+            return (libres.pop(0), pedido.id) if libres else (len(puntos), pedido.id)
+
+        pedidos = sorted(Pedido.objects.filter(ruta=ruta).order_by('id'), key=clave)
+        RutaParada.objects.bulk_create([
+            RutaParada(ruta=ruta, pedido=pedido, secuencia=secuencia)
+            for secuencia, pedido in enumerate(pedidos, start=1)
+        ])
+
+
+def crear_puntos(apps, schema_editor):
+    """
+    Vuelta atrás de crear_paradas: arma otra vez el texto "(lat, lon); ..."
+    de cada ruta con sus paradas en orden de `secuencia`, como lo escribía
+    asignar_ruta antes de RutaParada.
+    """
+    Ruta = apps.get_model('core', 'Ruta')
+    RutaParada = apps.get_model('core', 'RutaParada')
+    alias = schema_editor.connection.alias
+
+    puntos = defaultdict(str)
+    paradas = (
+        RutaParada.objects.using(alias).order_by('ruta_id', 'secuencia')
+        .values_list('ruta_id', 'pedido__latitud', 'pedido__longitud')
+    )
+    for ruta_id, lat, lng in paradas:
+        puntos[ruta_id] += f"({lat}, {lng}); "
+    rutas = list(Ruta.objects.using(alias).filter(pk__in=puntos))
+    for ruta in rutas:
+        ruta.puntos_de_entrega = puntos[ruta.id]
+    Ruta.objects.using(alias).bulk_update(rutas, ['puntos_de_entrega'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_cliente_geocelda_pedido_geocelda'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RutaParada',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('secuencia', models.PositiveIntegerField()),
+                ('distancia_tramo', models.DecimalField(blank=True, decimal_places=3, max_digits=10, null=True)),
+                ('eta', models.DateTimeField(blank=True, null=True)),
+                ('pedido', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='paradas', to='core.pedido')),
+                ('ruta', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='paradas', to='core.ruta')),
+            ],
+            options={
+                'ordering': ['ruta', 'secuencia'],
+                'indexes': [models.Index(fields=['ruta', 'secuencia'], name='core_rutapa_ruta_id_7b9973_idx')],
+                'constraints': [models.UniqueConstraint(fields=('ruta', 'pedido'), name='parada_unica_por_ruta')],
+            },
+        ),
+        migrations.RunPython(crear_paradas, crear_puntos),
+        # Con default para que, al volver atrás, la columna se pueda agregar a las rutas que ya existen.
+        migrations.AlterField(
+            model_name='ruta',
+            name='puntos_de_entrega',
+            field=models.TextField(default=''),
+        ),
+        migrations.RemoveField(
+            model_name='ruta',
+            name='puntos_de_entrega',
+        ),
+    ]
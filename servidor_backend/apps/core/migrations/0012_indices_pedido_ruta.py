@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_rutaparada'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['ruta', 'estado'], name='pedido_ruta_estado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['estado', 'hora_entrega'], name='pedido_estado_hora_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['hora_entrega'], name='pedido_hora_entrega_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ruta',
+            index=models.Index(fields=['conductor', 'id'], name='ruta_conductor_id_idx'),
+        ),
+    ]
@@ -0,0 +1,86 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+
+
+def _reconstruir_estadisticas(apps, using):
+    """Copia de estadisticas.reconstruir_estadisticas con los modelos históricos."""
+    pedidos = apps.get_model('core', 'Pedido').objects.using(using)
+    detalles = apps.get_model('core', 'DetallePedido').objects.using(using)
+    PedidosDia = apps.get_model('core', 'EstadisticaPedidosDia')
+    ConductorDia = apps.get_model('core', 'EstadisticaConductorDia')
+    ProductoDia = apps.get_model('core', 'EstadisticaProductoDia')
+
+    por_estado = [
+        PedidosDia(fecha=fila['fecha'], estado=fila['estado'], cantidad=fila['cantidad'])
+        for fila in pedidos.annotate(fecha=TruncDate('hora_entrega'))
+        .values('fecha', 'estado').annotate(cantidad=Count('id')).order_by()
+    ]
+    por_conductor = [
+        ConductorDia(fecha=fila['fecha'], conductor_id=fila['id_conductor'], entregas=fila['entregas'])
+        for fila in pedidos.filter(estado='entregado', ruta__conductor__isnull=False)
+        .annotate(fecha=TruncDate('hora_entrega'), id_conductor=F('ruta__conductor'))
+        .values('fecha', 'id_conductor').annotate(entregas=Count('id')).order_by()
+    ]
+    por_producto = [
+        ProductoDia(fecha=fila['fecha'], producto_id=fila['producto'], unidades=fila['unidades'])
+        for fila in detalles.annotate(fecha=TruncDate('pedido__hora_entrega'))
+        .values('fecha', 'producto').annotate(unidades=Sum('cantidad')).order_by()
+    ]
+    for tabla, filas in ((PedidosDia, por_estado), (ConductorDia, por_conductor), (ProductoDia, por_producto)):
+        tabla.objects.using(using).all().delete()
+        tabla.objects.using(using).bulk_create(filas, batch_size=1000)
+
+
+def calcular_estadisticas(apps, schema_editor):
+    _reconstruir_estadisticas(apps, schema_editor.connection.alias)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_indices_pedido_ruta'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EstadisticaPedidosDia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(blank=True, null=True)),
+                ('estado', models.CharField(max_length=50)),
+                ('cantidad', models.IntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('fecha', 'estado'), name='estadistica_pedidos_dia_unica')],
+            },
+        ),
+        migrations.CreateModel(
+            name='EstadisticaConductorDia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(blank=True, null=True)),
+                ('entregas', models.IntegerField(default=0)),
+                ('conductor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='estadisticas', to='core.conductor')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('fecha', 'conductor'), name='estadistica_conductor_dia_unica')],
+            },
+        ),
+        migrations.CreateModel(
+            name='EstadisticaProductoDia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(blank=True, null=True)),
+                ('unidades', models.IntegerField(default=0)),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='estadisticas', to='core.producto')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('fecha', 'producto'), name='estadistica_producto_dia_unica')],
+            },
+        ),
+        migrations.RunPython(calcular_estadisticas, migrations.RunPython.noop),
+    ]
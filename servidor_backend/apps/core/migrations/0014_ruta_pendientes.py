@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:18
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def calcular_pendientes(apps, schema_editor):
+    """Como pendientes_ruta.reconstruir_pendientes, con el modelo histórico."""
+    Ruta = apps.get_model('core', 'Ruta')
+    alias = schema_editor.connection.alias
+    rutas = list(
+        Ruta.objects.using(alias)
+        .annotate(n=Count('pedido', filter=~Q(pedido__estado='entregado')))
+    )
+    for ruta in rutas:
+        ruta.pendientes, ruta.activa = ruta.n, ruta.n > 0
+    Ruta.objects.using(alias).bulk_update(rutas, ['pendientes', 'activa'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_estadisticas_diarias'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ruta',
+            name='activa',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name='ruta',
+            name='pendientes',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(calcular_pendientes, migrations.RunPython.noop),
+    ]
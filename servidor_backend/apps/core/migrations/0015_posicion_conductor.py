@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_ruta_pendientes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PosicionConductor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('conductor_id', models.IntegerField()),
+                ('momento', models.DateTimeField()),
+                ('latitud_e6', models.IntegerField()),
+                ('longitud_e6', models.IntegerField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['conductor_id', 'momento'], name='posicion_conductor_momento_idx')],
+            },
+        ),
+    ]
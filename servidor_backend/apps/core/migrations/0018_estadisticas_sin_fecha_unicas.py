@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:06
+
+from django.db import migrations, models
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+
+
+def _reconstruir_estadisticas(apps, using):
+    """Copia de estadisticas.reconstruir_estadisticas con los modelos históricos."""
+    pedidos = apps.get_model('core', 'Pedido').objects.using(using)
+    detalles = apps.get_model('core', 'DetallePedido').objects.using(using)
+    PedidosDia = apps.get_model('core', 'EstadisticaPedidosDia')
+    ConductorDia = apps.get_model('core', 'EstadisticaConductorDia')
+    ProductoDia = apps.get_model('core', 'EstadisticaProductoDia')
+
+    por_estado = [
+        PedidosDia(fecha=fila['fecha'], estado=fila['estado'], cantidad=fila['cantidad'])
+        for fila in pedidos.annotate(fecha=TruncDate('hora_entrega'))
+        .values('fecha', 'estado').annotate(cantidad=Count('id')).order_by()
+    ]
+    por_conductor = [
+        ConductorDia(fecha=fila['fecha'], conductor_id=fila['id_conductor'], entregas=fila['entregas'])
+        for fila in pedidos.filter(estado='entregado', ruta__conductor__isnull=False)
+        .annotate(fecha=TruncDate('hora_entrega'), id_conductor=F('ruta__conductor'))
+        .values('fecha', 'id_conductor').annotate(entregas=Count('id')).order_by()
+    ]
+    por_producto = [
+        ProductoDia(fecha=fila['fecha'], producto_id=fila['producto'], unidades=fila['unidades'])
+        for fila in detalles.annotate(fecha=TruncDate('pedido__hora_entrega'))
+        .values('fecha', 'producto').annotate(unidades=Sum('cantidad')).order_by()
+    ]
+    for tabla, filas in ((PedidosDia, por_estado), (ConductorDia, por_conductor), (ProductoDia, por_producto)):
+        tabla.objects.using(using).all().delete()
+        tabla.objects.using(using).bulk_create(filas, batch_size=1000)
+
+
+def recalcular_estadisticas(apps, schema_editor):
+    # Sin la restricción pudieron quedar filas sin fecha duplicadas (y contadas de más)
+    _reconstruir_estadisticas(apps, schema_editor.connection.alias)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_tarea'),
+    ]
+
+    operations = [
+        migrations.RunPython(recalcular_estadisticas, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='estadisticaconductordia',
+            constraint=models.UniqueConstraint(condition=models.Q(('fecha__isnull', True)), fields=('conductor',), name='estadistica_conductor_dia_sin_fecha'),
+        ),
+        migrations.AddConstraint(
+            model_name='estadisticapedidosdia',
+            constraint=models.UniqueConstraint(condition=models.Q(('fecha__isnull', True)), fields=('estado',), name='estadistica_pedidos_dia_sin_fecha'),
+        ),
+        migrations.AddConstraint(
+            model_name='estadisticaproductodia',
+            constraint=models.UniqueConstraint(condition=models.Q(('fecha__isnull', True)), fields=('producto',), name='estadistica_producto_dia_sin_fecha'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_estadisticas_sin_fecha_unicas'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ruta',
+            name='origen_latitud',
+            field=models.DecimalField(blank=True, decimal_places=6, editable=False, max_digits=9, null=True),
+        ),
+        migrations.AddField(
+            model_name='ruta',
+            name='origen_longitud',
+            field=models.DecimalField(blank=True, decimal_places=6, editable=False, max_digits=9, null=True),
+        ),
+    ]
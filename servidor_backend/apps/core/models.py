@@ -1,5 +1,8 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
+
+from .espacial import codificar_geohash
 
 class Conductor(models.Model):
     # Vinculamos al conductor con un usuario de login
@@ -28,11 +31,20 @@ class Vehiculo(models.Model):
 
 class Ruta(models.Model):
     conductor = models.ForeignKey(Conductor, on_delete=models.CASCADE, null=True, blank=True)
-    puntos_de_entrega = models.TextField()
     distancia = models.DecimalField(max_digits=10, decimal_places=2)
     tiempo_estimado = models.IntegerField()
+    # Pedidos sin entregar y si queda alguno; los mantiene pendientes_ruta.py
+    pendientes = models.IntegerField(default=0, editable=False)
+    activa = models.BooleanField(default=False, editable=False)
+    # Desde dónde se ordenaron las paradas pendientes (GPS del conductor, última entrega o planta)
+    origen_latitud = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True, editable=False)
+    origen_longitud = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True, editable=False)
     def __str__(self): return f"Ruta {self.id}"
 
+    class Meta:
+        # La ruta actual de un conductor: filter(conductor=...).last()
+        indexes = [models.Index(fields=['conductor', 'id'], name='ruta_conductor_id_idx')]
+
 class Cliente(models.Model):
     nombre_cliente = models.CharField(max_length=255)
     telefono = models.CharField(max_length=20, blank=True)
@@ -40,8 +52,14 @@ class Cliente(models.Model):
     direccion = models.CharField(max_length=500)
     latitud = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     longitud = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    # Geohash de (latitud, longitud), indexado para búsquedas por zona (ver espacial.py)
+    geocelda = models.CharField(max_length=12, blank=True, default='', db_index=True, editable=False)
     def __str__(self): return self.nombre_cliente
 
+    def save(self, *args, **kwargs):
+        self.geocelda = codificar_geohash(self.latitud, self.longitud)
+        super().save(*args, **kwargs)
+
 class Pedido(models.Model):
     cliente = models.ForeignKey(Cliente, on_delete=models.CASCADE)
     direccion = models.CharField(max_length=500)
@@ -50,8 +68,24 @@ class Pedido(models.Model):
     estado = models.CharField(max_length=50, default='pendiente')
     hora_entrega = models.DateTimeField(null=True, blank=True)
     ruta = models.ForeignKey(Ruta, on_delete=models.CASCADE, null=True, blank=True)
+    geocelda = models.CharField(max_length=12, blank=True, default='', db_index=True, editable=False)
     def __str__(self): return f"Pedido {self.id}"
 
+    class Meta:
+        # Ver `python manage.py benchmark_indices` para los planes de consulta
+        indexes = [
+            # Pedidos pendientes de una ruta (perform_update, mi-ruta, asignar_ruta)
+            models.Index(fields=['ruta', 'estado'], name='pedido_ruta_estado_idx'),
+            # Conteos por estado y por estado + rango de fechas (dashboards)
+            models.Index(fields=['estado', 'hora_entrega'], name='pedido_estado_hora_idx'),
+            # Rangos de fechas sin estado (pedidos del mes, gráfico por día)
+            models.Index(fields=['hora_entrega'], name='pedido_hora_entrega_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.geocelda = codificar_geohash(self.latitud, self.longitud)
+        super().save(*args, **kwargs)
+
 class Categoria(models.Model):
     nombre = models.CharField(max_length=100, unique=True)
     descripcion = models.TextField(blank=True)
@@ -63,6 +97,8 @@ class Producto(models.Model):
     precio = models.DecimalField(max_digits=10, decimal_places=2)
     categoria = models.ForeignKey(Categoria, on_delete=models.SET_NULL, null=True, blank=True)
     imagen = models.ImageField(upload_to='productos/', null=True, blank=True)
+    # Tamaños reducidos de `imagen` en WebP y JPEG (ver imagenes.py)
+    variantes = models.JSONField(default=dict, blank=True, editable=False)
     def __str__(self): return self.nombre
 
 class DetallePedido(models.Model):
@@ -72,9 +108,130 @@ class DetallePedido(models.Model):
     precio_unitario = models.DecimalField(max_digits=10, decimal_places=2)
     def __str__(self): return f"Detalle {self.id}"
 
+class RutaParada(models.Model):
+    """Una parada de la ruta, en el orden en que el conductor debe visitarlas."""
+    ruta = models.ForeignKey(Ruta, related_name='paradas', on_delete=models.CASCADE)
+    pedido = models.ForeignKey(Pedido, related_name='paradas', on_delete=models.CASCADE)
+    secuencia = models.PositiveIntegerField()
+    distancia_tramo = models.DecimalField(max_digits=10, decimal_places=3, null=True, blank=True)  # km desde la parada anterior
+    eta = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['ruta', 'secuencia']
+        indexes = [models.Index(fields=['ruta', 'secuencia'])]
+        constraints = [models.UniqueConstraint(fields=['ruta', 'pedido'], name='parada_unica_por_ruta')]
+
+    def __str__(self): return f"Ruta {self.ruta_id} - Parada {self.secuencia}"
+
 class Incidencia(models.Model):
     conductor = models.ForeignKey(Conductor, on_delete=models.CASCADE)
     tipo = models.CharField(max_length=50)
     descripcion = models.TextField()
     fecha_reporte = models.DateTimeField(auto_now_add=True)
-    def __str__(self): return f"Incidencia {self.id}"
\ No newline at end of file
+    def __str__(self): return f"Incidencia {self.id}"
+
+class PosicionConductor(models.Model):
+    """
+    Muestra de GPS de un conductor (ver telemetria.py). Tabla de sólo
+    inserción y compacta: coordenadas en millonésimas de grado y el
+    conductor sin clave foránea, para que insertar no valide contra otra
+    tabla y para poder moverla a otra base de datos (TELEMETRIA['BASE']).
+    """
+    conductor_id = models.IntegerField()
+    momento = models.DateTimeField()
+    latitud_e6 = models.IntegerField()
+    longitud_e6 = models.IntegerField()
+
+    class Meta:
+        indexes = [models.Index(fields=['conductor_id', 'momento'], name='posicion_conductor_momento_idx')]
+
+    @property
+    def latitud(self): return self.latitud_e6 / 1e6
+
+    @property
+    def longitud(self): return self.longitud_e6 / 1e6
+
+    def __str__(self): return f"Conductor {self.conductor_id} @ {self.momento}"
+
+# --- COLA DE TAREAS (ver cola.py) ---
+
+class Tarea(models.Model):
+    """Trabajo pesado que ejecuta `python manage.py trabajar_tareas` fuera de la request."""
+    ESTADOS = [
+        ('pendiente', 'Pendiente'),
+        ('en_curso', 'En curso'),
+        ('completada', 'Completada'),
+        ('fallida', 'Fallida'),
+    ]
+    tipo = models.CharField(max_length=50)
+    argumentos = models.JSONField(default=dict)
+    prioridad = models.SmallIntegerField(default=0)  # Mayor = antes
+    estado = models.CharField(max_length=20, choices=ESTADOS, default='pendiente')
+    intentos = models.PositiveSmallIntegerField(default=0)
+    max_intentos = models.PositiveSmallIntegerField(default=3)
+    disponible_desde = models.DateTimeField(default=timezone.now)  # Los reintentos esperan
+    vence = models.DateTimeField(null=True, blank=True)  # Si sigue en_curso después, el trabajador murió
+    trabajador = models.CharField(max_length=100, blank=True)
+    resultado = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    creada = models.DateTimeField(auto_now_add=True)
+    terminada = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Lo que busca cada trabajador: pendientes por prioridad (índice parcial, chico)
+            models.Index(
+                fields=['-prioridad', 'disponible_desde', 'id'], name='tarea_pendiente_idx',
+                condition=models.Q(estado='pendiente'),
+            ),
+            # Tareas colgadas de un trabajador que murió
+            models.Index(fields=['estado', 'vence'], name='tarea_estado_vence_idx'),
+        ]
+
+    def __str__(self): return f"Tarea {self.id} {self.tipo} ({self.estado})"
+
+# --- ESTADÍSTICAS DIARIAS (ver estadisticas.py) ---
+# Totales por día que se mantienen al escribir pedidos y detalles, para que
+# los reportes lean unas pocas filas por día en vez de recorrer los pedidos.
+# `fecha` es el día de hora_entrega; NULL agrupa los pedidos sin fecha. Como
+# en un UNIQUE un NULL nunca es igual a otro, las filas sin fecha tienen su
+# propia restricción parcial (..._sin_fecha).
+
+class EstadisticaPedidosDia(models.Model):
+    fecha = models.DateField(null=True, blank=True)
+    estado = models.CharField(max_length=50)
+    cantidad = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['fecha', 'estado'], name='estadistica_pedidos_dia_unica'),
+            models.UniqueConstraint(fields=['estado'], condition=models.Q(fecha__isnull=True), name='estadistica_pedidos_dia_sin_fecha'),
+        ]
+
+    def __str__(self): return f"{self.fecha} {self.estado}: {self.cantidad}"
+
+class EstadisticaConductorDia(models.Model):
+    fecha = models.DateField(null=True, blank=True)
+    conductor = models.ForeignKey(Conductor, related_name='estadisticas', on_delete=models.CASCADE)
+    entregas = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['fecha', 'conductor'], name='estadistica_conductor_dia_unica'),
+            models.UniqueConstraint(fields=['conductor'], condition=models.Q(fecha__isnull=True), name='estadistica_conductor_dia_sin_fecha'),
+        ]
+
+    def __str__(self): return f"{self.fecha} {self.conductor_id}: {self.entregas}"
+
+class EstadisticaProductoDia(models.Model):
+    fecha = models.DateField(null=True, blank=True)
+    producto = models.ForeignKey(Producto, related_name='estadisticas', on_delete=models.CASCADE)
+    unidades = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['fecha', 'producto'], name='estadistica_producto_dia_unica'),
+            models.UniqueConstraint(fields=['producto'], condition=models.Q(fecha__isnull=True), name='estadistica_producto_dia_sin_fecha'),
+        ]
+
+    def __str__(self): return f"{self.fecha} {self.producto_id}: {self.unidades}"
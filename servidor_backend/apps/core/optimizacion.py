@@ -0,0 +1,299 @@
+# En: apps/core/optimizacion.py
+
+"""
+Motor de optimización de rutas.
+
+Todas las funciones trabajan sobre índices de una matriz de distancias
+(en km), donde el índice 0 es siempre el punto de partida. Los pedidos se
+cargan una sola vez en arreglos de NumPy y la matriz haversine se calcula
+en una sola pasada vectorizada.
+"""
+
+import datetime
+import time
+
+import numpy as np
+from django.conf import settings
+
+RADIO_TIERRA_KM = 6371.0088
+
+# Planta PIL Cochabamba: punto de partida cuando no hay otro.
+ORIGEN_POR_DEFECTO = (-17.393879, -66.156944)
+
+# Mejora mínima (km) para aceptar un movimiento; evita ciclos por redondeo.
+EPSILON = 1e-9
+
+
+# -----------------------------------------------------------------
+# DISTANCIAS
+# -----------------------------------------------------------------
+
+def a_arreglos(puntos):
+    """Convierte [(lat, lng), ...] (Decimal, float o str) en dos arreglos float64."""
+    coords = np.asarray(puntos, dtype=np.float64).reshape(-1, 2)
+    return coords[:, 0], coords[:, 1]
+
+
+def distancias_entre(lats1, lngs1, lats2, lngs2):
+    """Matriz len(lats1) x len(lats2) de distancias haversine en km."""
+    lat1 = np.radians(np.asarray(lats1, dtype=np.float64))
+    lng1 = np.radians(np.asarray(lngs1, dtype=np.float64))
+    lat2 = np.radians(np.asarray(lats2, dtype=np.float64))
+    lng2 = np.radians(np.asarray(lngs2, dtype=np.float64))
+    dlat = lat1[:, None] - lat2[None, :]
+    dlng = lng1[:, None] - lng2[None, :]
+    a = np.sin(dlat / 2.0) ** 2 + np.cos(lat1)[:, None] * np.cos(lat2)[None, :] * np.sin(dlng / 2.0) ** 2
+    return 2.0 * RADIO_TIERRA_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def matriz_haversine(lats, lngs):
+    """Matriz NxN de distancias haversine en km, calculada en una sola pasada."""
+    return distancias_entre(lats, lngs, lats, lngs)
+
+
+def tramos_haversine(puntos):
+    """Distancias en km entre puntos consecutivos de [(lat, lng), ...] (n-1 tramos)."""
+    lats, lngs = a_arreglos(puntos)
+    lat, lng = np.radians(lats), np.radians(lngs)
+    dlat, dlng = np.diff(lat), np.diff(lng)
+    a = np.sin(dlat / 2.0) ** 2 + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(dlng / 2.0) ** 2
+    return 2.0 * RADIO_TIERRA_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+# -----------------------------------------------------------------
+# TIEMPOS ESTIMADOS
+# -----------------------------------------------------------------
+
+def configuracion_tiempos():
+    config = {'VELOCIDAD_KMH': 25.0, 'SERVICIO_MIN': 5.0}
+    config.update(getattr(settings, 'ESTIMACION_TIEMPOS', {}))
+    return config
+
+
+def estimar_llegadas(tramos_km, salida):
+    """
+    Hora estimada de llegada a cada parada. Cada tramo se recorre a
+    VELOCIDAD_KMH y en cada parada anterior se demora SERVICIO_MIN.
+    Devuelve (etas, minutos_totales), donde los minutos incluyen el
+    servicio de la última parada.
+    """
+    config = configuracion_tiempos()
+    tramos_km = np.asarray(tramos_km, dtype=np.float64)
+    viaje = np.cumsum(tramos_km) / config['VELOCIDAD_KMH'] * 60.0
+    servicio = np.arange(len(tramos_km)) * config['SERVICIO_MIN']
+    minutos = viaje + servicio
+    etas = [salida + datetime.timedelta(minutes=float(m)) for m in minutos]
+    total = float(minutos[-1]) + config['SERVICIO_MIN'] if len(minutos) else 0.0
+    return etas, total
+
+
+# -----------------------------------------------------------------
+# CONSTRUCCIÓN Y MEJORA
+# -----------------------------------------------------------------
+
+def vecino_mas_cercano(dist, inicio=0):
+    """Recorrido inicial: desde `inicio`, siempre al punto no visitado más cercano."""
+    n = dist.shape[0]
+    visitado = np.zeros(n, dtype=bool)
+    visitado[inicio] = True
+    recorrido = [inicio]
+    actual = inicio
+    for _ in range(n - 1):
+        fila = np.where(visitado, np.inf, dist[actual])
+        actual = int(np.argmin(fila))
+        visitado[actual] = True
+        recorrido.append(actual)
+    return recorrido
+
+
+def _con_nodo_final(dist):
+    """
+    Agrega un nodo ficticio a distancia 0 de todos. Así una ruta abierta
+    (no vuelve a la planta) se trata como un ciclo que termina en él.
+    """
+    n = dist.shape[0]
+    ext = np.zeros((n + 1, n + 1), dtype=np.float64)
+    ext[:n, :n] = dist
+    return ext
+
+
+def mejorar_2opt(recorrido, dist, limite):
+    """
+    2-opt: invierte el tramo recorrido[i..j] si acorta la ruta. Para cada i
+    se evalúan todos los j de una vez con NumPy. `recorrido` empieza en la
+    planta y termina en el nodo ficticio; ninguno de los dos se mueve.
+    """
+    t = np.asarray(recorrido)
+    n = len(t)
+    mejoro = False
+    hubo_cambio = True
+    while hubo_cambio and time.perf_counter() < limite:
+        hubo_cambio = False
+        for i in range(1, n - 2):
+            a, b = t[i - 1], t[i]
+            c = t[i + 1:n - 1]
+            d = t[i + 2:n]
+            delta = dist[a, c] + dist[b, d] - dist[a, b] - dist[c, d]
+            k = int(np.argmin(delta))
+            if delta[k] < -EPSILON:
+                j = i + 1 + k
+                t[i:j + 1] = t[i:j + 1][::-1].copy()
+                hubo_cambio = mejoro = True
+            if time.perf_counter() >= limite:
+                break
+    return t.tolist(), mejoro
+
+
+def mejorar_or_opt(recorrido, dist, limite, largo_maximo=3):
+    """
+    Or-opt: mueve tramos de 1 a `largo_maximo` paradas (en cualquier sentido)
+    al hueco donde cuestan menos. Los huecos se evalúan de forma vectorizada.
+    """
+    t = list(recorrido)
+    mejoro = False
+    hubo_cambio = True
+    while hubo_cambio and time.perf_counter() < limite:
+        hubo_cambio = False
+        for largo in range(1, largo_maximo + 1):
+            i = 1
+            while i + largo < len(t) and time.perf_counter() < limite:
+                prev, primero, ultimo, sig = t[i - 1], t[i], t[i + largo - 1], t[i + largo]
+                ahorro = dist[prev, primero] + dist[ultimo, sig] - dist[prev, sig]
+
+                resto = np.asarray(t[:i] + t[i + largo:])
+                u, v = resto[:-1], resto[1:]
+                base = dist[u, v]
+                directo = dist[u, primero] + dist[ultimo, v] - base
+                invertido = dist[u, ultimo] + dist[primero, v] - base
+                costo = np.minimum(directo, invertido)
+                k = int(np.argmin(costo))
+
+                if costo[k] < ahorro - EPSILON:
+                    tramo = t[i:i + largo]
+                    if invertido[k] < directo[k]:
+                        tramo = tramo[::-1]
+                    resto = resto.tolist()
+                    t = resto[:k + 1] + tramo + resto[k + 1:]
+                    hubo_cambio = mejoro = True
+                else:
+                    i += 1
+    return t, mejoro
+
+
+def busqueda_local(recorrido, dist, limite):
+    """2-opt / Or-opt alternados sobre un recorrido abierto que empieza en 0."""
+    n = dist.shape[0]
+    if n <= 3:
+        return list(recorrido)
+
+    ext = _con_nodo_final(dist)
+    recorrido = list(recorrido) + [n]
+    while time.perf_counter() < limite:
+        recorrido, mejoro_2opt = mejorar_2opt(recorrido, ext, limite)
+        recorrido, mejoro_oropt = mejorar_or_opt(recorrido, ext, limite)
+        if not (mejoro_2opt or mejoro_oropt):
+            break
+    return recorrido[:-1]
+
+
+def optimizar_2opt_oropt(dist, limite):
+    """Vecino más cercano + 2-opt / Or-opt alternados hasta no mejorar o agotar el tiempo."""
+    return busqueda_local(vecino_mas_cercano(dist), dist, limite)
+
+
+def insercion_mas_barata(recorrido, nuevos, dist):
+    """
+    Inserta cada nodo de `nuevos` en el hueco de `recorrido` donde menos
+    alarga la ruta (incluido el final, que es abierto). Cada inserción
+    evalúa todos los huecos de una vez: O(n·m) en total.
+    """
+    recorrido = list(recorrido)
+    for x in nuevos:
+        t = np.asarray(recorrido)
+        costos = np.empty(len(t))
+        costos[:-1] = dist[t[:-1], x] + dist[x, t[1:]] - dist[t[:-1], t[1:]]
+        costos[-1] = dist[t[-1], x]
+        recorrido.insert(int(np.argmin(costos)) + 1, x)
+    return recorrido
+
+
+def optimizar_vecino_mas_cercano(dist, limite):
+    return vecino_mas_cercano(dist)
+
+
+# Motores disponibles; se elige con settings.OPTIMIZADOR_RUTAS['MOTOR'].
+MOTORES = {
+    'vecino_mas_cercano': optimizar_vecino_mas_cercano,
+    '2opt_oropt': optimizar_2opt_oropt,
+}
+
+
+def registrar_motor(nombre, funcion):
+    """Registra un motor nuevo: funcion(dist, limite) -> recorrido que empieza en 0."""
+    MOTORES[nombre] = funcion
+
+
+def configuracion_optimizador():
+    config = {'MOTOR': '2opt_oropt', 'TIEMPO_LIMITE': 2.0, 'TIEMPO_LIMITE_INSERCION': 0.5}
+    config.update(getattr(settings, 'OPTIMIZADOR_RUTAS', {}))
+    return config
+
+
+# -----------------------------------------------------------------
+# API PRINCIPAL
+# -----------------------------------------------------------------
+
+def optimizar_ruta(puntos, origen=ORIGEN_POR_DEFECTO, motor=None, tiempo_limite=None, dist=None):
+    """
+    Ordena `puntos` [(lat, lng), ...] partiendo de `origen`.
+
+    `dist` es opcional: la matriz de distancias de [origen] + puntos ya
+    calculada (por ejemplo, leída de matriz_distancias.py).
+    Devuelve la lista de índices de `puntos` en orden de visita.
+    """
+    if not puntos:
+        return []
+
+    # Sólo se leen los settings si faltan parámetros: así la función también
+    # sirve dentro de procesos hijos que no cargaron Django.
+    if motor is None or tiempo_limite is None:
+        config = configuracion_optimizador()
+        motor = motor or config['MOTOR']
+        tiempo_limite = config['TIEMPO_LIMITE'] if tiempo_limite is None else tiempo_limite
+    funcion = MOTORES[motor]
+
+    if dist is None:
+        lats, lngs = a_arreglos([origen] + list(puntos))
+        dist = matriz_haversine(lats, lngs)
+
+    recorrido = funcion(dist, time.perf_counter() + tiempo_limite)
+    # El índice 0 es el origen; los pedidos empiezan en 1.
+    return [i - 1 for i in recorrido[1:]]
+
+
+def insertar_en_ruta(existentes, nuevos, origen=ORIGEN_POR_DEFECTO, tiempo_limite=None, dist=None):
+    """
+    Agrega `nuevos` a una ruta en curso cuyas paradas pendientes son
+    `existentes` (en su orden actual), ambos [(lat, lng), ...].
+
+    Cada punto nuevo va al lugar más barato entre las paradas pendientes y
+    luego, si `tiempo_limite` > 0, se corre una búsqueda local acotada.
+    `dist`, si se pasa, es la matriz de [origen] + existentes + nuevos.
+    Devuelve índices sobre `existentes + nuevos` en orden de visita.
+    """
+    if tiempo_limite is None:
+        tiempo_limite = configuracion_optimizador()['TIEMPO_LIMITE_INSERCION']
+
+    n_existentes = len(existentes)
+    total = n_existentes + len(nuevos)
+    if total == 0:
+        return []
+
+    if dist is None:
+        lats, lngs = a_arreglos([origen] + list(existentes) + list(nuevos))
+        dist = matriz_haversine(lats, lngs)
+
+    recorrido = insercion_mas_barata(range(n_existentes + 1), range(n_existentes + 1, total + 1), dist)
+    if tiempo_limite > 0:
+        recorrido = busqueda_local(recorrido, dist, time.perf_counter() + tiempo_limite)
+    return [i - 1 for i in recorrido[1:]]
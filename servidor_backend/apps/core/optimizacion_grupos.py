@@ -0,0 +1,19 @@
+# En: apps/core/optimizacion_grupos.py
+
+"""
+Lo que corre en los procesos hijos del despacho masivo (ver
+despacho.resolver_grupos).
+
+Con el método 'spawn' (Windows, macOS) cada hijo vuelve a importar el
+módulo de la función que recibe, sin django.setup(). Por eso acá no se
+importan modelos ni nada que los cargue: sólo optimizacion.py, que no lee
+los settings si recibe motor y tiempo límite.
+"""
+
+from .optimizacion import optimizar_ruta
+
+
+def resolver_grupo(trabajo):
+    """(puntos, origen, motor, tiempo_limite) -> orden de visita de `puntos`."""
+    puntos, origen, motor, tiempo_limite = trabajo
+    return optimizar_ruta(puntos, origen, motor=motor, tiempo_limite=tiempo_limite)
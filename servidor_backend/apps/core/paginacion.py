@@ -0,0 +1,36 @@
+# En: apps/core/paginacion.py
+
+"""
+Paginación por cursor (keyset) para todos los ViewSets del router.
+
+A diferencia de ?page=N, el cursor guarda la última clave vista y la
+siguiente página es un `WHERE id > <clave> ORDER BY id LIMIT n` sobre el
+índice: cuesta lo mismo en la página 1 que en la 10.000, y no hace el
+COUNT(*) de toda la tabla.
+
+Respuesta: {"next": url | null, "previous": url | null, "results": [...]}
+"""
+
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination
+
+
+class PaginacionCursor(CursorPagination):
+    # El tamaño por defecto sale de REST_FRAMEWORK['PAGE_SIZE']
+    page_size_query_param = 'limite'
+    max_page_size = 500
+    ordering = ('pk',)
+
+    def get_ordering(self, request, queryset, view):
+        """
+        ?orden=<clave> elige entre los órdenes que declara la vista en
+        `ordenes_cursor` ({clave: (campo, desempate), ...}). Cada orden debe
+        terminar en un campo único para que el cursor sea estable.
+        """
+        orden = request.query_params.get('orden')
+        if orden is None:
+            return self.ordering
+        ordenes = getattr(view, 'ordenes_cursor', {})
+        if orden not in ordenes:
+            raise ValidationError({"error": f"Orden inválido. Opciones: {', '.join(ordenes) or 'ninguna'}."})
+        return ordenes[orden]
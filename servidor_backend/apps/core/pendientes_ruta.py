@@ -0,0 +1,52 @@
+# En: apps/core/pendientes_ruta.py
+
+"""
+Ruta.pendientes (pedidos sin entregar) y Ruta.activa (pendientes > 0).
+
+Se mantienen con UPDATE ... SET pendientes = pendientes + n en la misma
+transacción que cambia los pedidos, a partir de las mismas fotos de
+estadisticas.foto_pedidos. Así saber si una ruta terminó o cuál es la ruta
+en curso de un conductor es leer una fila, no contar sus pedidos.
+"""
+
+from collections import Counter, defaultdict
+
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import BooleanField, Count, ExpressionWrapper, F, Q
+
+from .models import Ruta
+
+
+def _pendientes_por_ruta(foto):
+    return Counter(
+        ruta_id for _, estado, _, ruta_id in foto.values()
+        if ruta_id and estado != 'entregado'
+    )
+
+
+def registrar_pendientes(antes, despues):
+    """Aplica la diferencia entre dos fotos de estadisticas.foto_pedidos."""
+    deltas = _pendientes_por_ruta(despues)
+    deltas.subtract(_pendientes_por_ruta(antes))
+    # Un UPDATE por cada delta distinto (guardar_ruta: uno solo)
+    rutas_por_delta = defaultdict(list)
+    for ruta_id, delta in deltas.items():
+        if delta:
+            rutas_por_delta[delta].append(ruta_id)
+    for delta, ruta_ids in rutas_por_delta.items():
+        Ruta.objects.filter(pk__in=ruta_ids).update(
+            pendientes=F('pendientes') + delta,
+            # Compara con el valor anterior a este UPDATE
+            activa=ExpressionWrapper(Q(pendientes__gt=-delta), output_field=BooleanField()),
+        )
+
+
+def reconstruir_pendientes(using=DEFAULT_DB_ALIAS):
+    """Recalcula los contadores de todas las rutas."""
+    rutas = list(
+        Ruta.objects.using(using)
+        .annotate(n=Count('pedido', filter=~Q(pedido__estado='entregado')))
+    )
+    for ruta in rutas:
+        ruta.pendientes, ruta.activa = ruta.n, ruta.n > 0
+    Ruta.objects.using(using).bulk_update(rutas, ['pendientes', 'activa'], batch_size=1000)
@@ -0,0 +1,64 @@
+# En: apps/core/renderizadores.py
+
+"""
+JSON de la API con orjson (ver REST_FRAMEWORK en settings.py).
+
+Con listados de cientos de pedidos, json.dumps con el JSONEncoder de DRF se
+lleva buena parte del tiempo de la respuesta; orjson arma los mismos bytes
+varias veces más rápido. La salida es la del JSONRenderer de DRF:
+
+- Los campos DecimalField y DateTimeField ya llegan como texto desde los
+  serializadores ("3.50", "2024-05-01T12:00:00Z").
+- Un datetime suelto sale en ISO 8601 con "Z" para UTC (OPT_UTC_Z), igual
+  que en DRF.
+- Lo que orjson no conoce (Decimal sueltos, timedelta, QuerySet, lazy
+  strings...) pasa por el mismo JSONEncoder de DRF, así que un Decimal
+  suelto sigue saliendo como número.
+- \\u2028 y \\u2029 se escapan, para que el JSON sea JavaScript válido.
+
+Si se pide sangría (p. ej. la API navegable o Accept: ...; indent=4) se usa
+el renderer de DRF. Sin orjson instalado, los dos vuelven a los de DRF.
+"""
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pip install orjson
+    orjson = None
+
+OPCIONES = (orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY) if orjson else 0
+
+_codificador = JSONEncoder()
+
+
+class RenderizadorJSON(JSONRenderer):
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        contenido = orjson.dumps(data, default=_codificador.default, option=OPCIONES)
+        # U+2028 y U+2029 en UTF-8
+        if b'\xe2\x80\xa8' in contenido or b'\xe2\x80\xa9' in contenido:
+            contenido = contenido.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return contenido
+
+
+class ParserJSON(JSONParser):
+    renderer_class = RenderizadorJSON
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', 'utf-8')
+        # orjson sólo lee UTF-8 (y no acepta NaN ni Infinity, como STRICT_JSON)
+        if orjson is None or encoding.lower().replace('_', '-') not in ('utf-8', 'utf8') or not self.strict:
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
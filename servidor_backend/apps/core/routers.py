@@ -0,0 +1,30 @@
+# En: apps/core/routers.py
+
+"""
+Manda PosicionConductor a la base TELEMETRIA['BASE'] (ver telemetria.py).
+Con la base por defecto no cambia nada.
+"""
+
+from . import telemetria
+
+MODELO = ('core', 'posicionconductor')
+
+
+class RouterTelemetria:
+
+    def _es_telemetria(self, model):
+        return (model._meta.app_label, model._meta.model_name) == MODELO
+
+    def db_for_read(self, model, **hints):
+        return telemetria.base() if self._es_telemetria(model) else None
+
+    db_for_write = db_for_read
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        base = telemetria.base()
+        if base == 'default':
+            return None
+        if (app_label, model_name) == MODELO:
+            return db == base
+        # La base de telemetría sólo tiene esa tabla
+        return False if db == base else None
@@ -0,0 +1,403 @@
+# En: apps/core/ruteo_vial.py
+
+"""
+Ruteo por calles sin servicios externos.
+
+Lee un extracto de OpenStreetMap en XML (.osm, .osm.gz o .osm.bz2, por
+ejemplo exportado de la zona de Cochabamba) indicado en
+settings.RUTEO_VIAL['EXTRACTO_OSM'] y arma un grafo dirigido de calles.
+
+Para que las consultas sean rápidas se precalculan "landmarks" (ALT:
+A*, Landmarks y desigualdad Triangular): las distancias desde y hacia
+unos pocos nodos lejanos entre sí dan una cota inferior muy ajustada de
+la distancia restante, y A* sólo explora una franja estrecha alrededor
+del camino. El grafo y los landmarks se guardan en un .npz junto al
+extracto, así sólo se preprocesa una vez por archivo.
+"""
+
+import bz2
+import gzip
+import heapq
+import threading
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+from .espacial import IndiceEspacial
+from .optimizacion import RADIO_TIERRA_KM, a_arreglos, matriz_haversine
+
+# Tipos de vía por los que puede circular un camión de reparto.
+VIAS_TRANSITABLES = {
+    'motorway', 'trunk', 'primary', 'secondary', 'tertiary', 'unclassified', 'residential',
+    'motorway_link', 'trunk_link', 'primary_link', 'secondary_link', 'tertiary_link',
+    'living_street', 'service', 'road',
+}
+
+# Incrementar si cambia el formato del .npz para que se regenere.
+VERSION_GRAFO = 1
+
+
+class SinRuteoVial(Exception):
+    """No hay extracto OSM configurado, o no se encontró camino."""
+
+
+def _configuracion():
+    config = {
+        'EXTRACTO_OSM': None,
+        'LANDMARKS': 8,
+        'CACHE_RUTAS': 512,
+        'USAR_EN_OPTIMIZADOR': False,
+        'MAX_PUNTOS_OPTIMIZADOR': 40,
+    }
+    config.update(getattr(settings, 'RUTEO_VIAL', {}))
+    return config
+
+
+# -----------------------------------------------------------------
+# LECTURA DEL EXTRACTO
+# -----------------------------------------------------------------
+
+def _abrir_extracto(ruta):
+    ruta = str(ruta)
+    if ruta.endswith('.gz'):
+        return gzip.open(ruta, 'rb')
+    if ruta.endswith('.bz2'):
+        return bz2.open(ruta, 'rb')
+    return open(ruta, 'rb')
+
+
+def _sentido(etiquetas):
+    """1 = sólo hacia adelante, -1 = sólo en contra, 0 = doble sentido."""
+    oneway = etiquetas.get('oneway', '')
+    if oneway in ('yes', 'true', '1'):
+        return 1
+    if oneway == '-1':
+        return -1
+    if oneway in ('no', 'false', '0'):
+        return 0
+    if etiquetas.get('junction') == 'roundabout' or etiquetas.get('highway') == 'motorway':
+        return 1
+    return 0
+
+
+def leer_osm(ruta):
+    """
+    Devuelve (lats, lngs, origenes, destinos) con los nodos usados por
+    calles transitables (renumerados desde 0) y las aristas dirigidas.
+    """
+    coordenadas = {}
+    vias = []
+    with _abrir_extracto(ruta) as archivo:
+        for _, elem in ET.iterparse(archivo, events=('end',)):
+            if elem.tag == 'node':
+                coordenadas[int(elem.get('id'))] = (float(elem.get('lat')), float(elem.get('lon')))
+                elem.clear()
+            elif elem.tag == 'way':
+                etiquetas = {tag.get('k'): tag.get('v') for tag in elem.iter('tag')}
+                if etiquetas.get('highway') in VIAS_TRANSITABLES:
+                    vias.append(([int(nd.get('ref')) for nd in elem.iter('nd')], _sentido(etiquetas)))
+                elem.clear()
+            elif elem.tag == 'relation':
+                elem.clear()
+
+    indice = {}
+    origenes, destinos = [], []
+    for nodos, sentido in vias:
+        nodos = [n for n in nodos if n in coordenadas]
+        for a, b in zip(nodos, nodos[1:]):
+            ia = indice.setdefault(a, len(indice))
+            ib = indice.setdefault(b, len(indice))
+            if sentido >= 0:
+                origenes.append(ia)
+                destinos.append(ib)
+            if sentido <= 0:
+                origenes.append(ib)
+                destinos.append(ia)
+
+    lats = np.empty(len(indice))
+    lngs = np.empty(len(indice))
+    for osm_id, i in indice.items():
+        lats[i], lngs[i] = coordenadas[osm_id]
+    return lats, lngs, np.asarray(origenes, dtype=np.int64), np.asarray(destinos, dtype=np.int64)
+
+
+# -----------------------------------------------------------------
+# GRAFO
+# -----------------------------------------------------------------
+
+def _largo_aristas(lats, lngs, origenes, destinos):
+    """Largo en metros de cada arista (haversine entre sus extremos)."""
+    lat1, lng1 = np.radians(lats[origenes]), np.radians(lngs[origenes])
+    lat2, lng2 = np.radians(lats[destinos]), np.radians(lngs[destinos])
+    a = np.sin((lat2 - lat1) / 2.0) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2.0) ** 2
+    return 2000.0 * RADIO_TIERRA_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def _csr(n, origenes, destinos, pesos):
+    """Lista de adyacencia comprimida (CSR): vecinos de v en indices[inicio[v]:inicio[v+1]]."""
+    orden = np.argsort(origenes, kind='stable')
+    inicio = np.searchsorted(origenes[orden], np.arange(n + 1))
+    return inicio, destinos[orden], pesos[orden]
+
+
+def _dijkstra(inicio, indices, pesos, fuente, objetivos=None):
+    """
+    Distancias (m) desde `fuente` a todos los nodos; inf si no se llega.
+    Con `objetivos` se corta apenas todos tienen su distancia definitiva.
+    """
+    n = len(inicio) - 1
+    dist = [float('inf')] * n
+    dist[fuente] = 0.0
+    cola = [(0.0, fuente)]
+    faltan = set(objetivos) if objetivos is not None else None
+    while cola:
+        d, v = heapq.heappop(cola)
+        if d > dist[v]:
+            continue
+        if faltan is not None:
+            faltan.discard(v)
+            if not faltan:
+                break
+        for k in range(inicio[v], inicio[v + 1]):
+            w = indices[k]
+            nd = d + pesos[k]
+            if nd < dist[w]:
+                dist[w] = nd
+                heapq.heappush(cola, (nd, w))
+    return np.asarray(dist)
+
+
+class GrafoVial:
+    """Grafo de calles en CSR con landmarks precalculados para A*."""
+
+    def __init__(self, lats, lngs, origenes, destinos, desde_landmark=None, hacia_landmark=None, conexos=None):
+        self.lats, self.lngs = lats, lngs
+        self.n = len(lats)
+        pesos = _largo_aristas(lats, lngs, origenes, destinos)
+        self.origenes, self.destinos = origenes, destinos
+        self._adelante = _csr(self.n, origenes, destinos, pesos)
+        self._atras = _csr(self.n, destinos, origenes, pesos)
+        # Listas de Python: el bucle de A* es mucho más rápido que indexando NumPy.
+        self._inicio, self._indices, self._pesos = (a.tolist() for a in self._adelante)
+
+        if desde_landmark is None:
+            desde_landmark, hacia_landmark, conexos = self._calcular_landmarks(_configuracion()['LANDMARKS'])
+        self.desde_landmark = desde_landmark
+        self.hacia_landmark = hacia_landmark
+        self.conexos = conexos
+
+        ids = np.flatnonzero(conexos)
+        self._nodos = IndiceEspacial(lambda: zip(ids.tolist(), lats[ids], lngs[ids]))
+
+    def _calcular_landmarks(self, cantidad):
+        """
+        El primer landmark es el nodo con más conexiones (casi seguro en la
+        red principal); cada uno de los siguientes es el más lejano a los ya
+        elegidos. Sólo se usan nodos de la componente fuertemente conexa del
+        primero, para que siempre exista camino entre dos puntos.
+        """
+        grados = np.diff(self._adelante[0])
+        elegidos = [int(np.argmax(grados))]
+        adelante = [a.tolist() for a in self._adelante]
+        atras = [a.tolist() for a in self._atras]
+        desde = [_dijkstra(*adelante, elegidos[0])]
+        hacia = [_dijkstra(*atras, elegidos[0])]
+        conexos = np.isfinite(desde[0]) & np.isfinite(hacia[0])
+
+        while len(elegidos) < min(cantidad, int(conexos.sum())):
+            cercania = np.min(np.where(conexos, np.stack(desde), -np.inf), axis=0)
+            siguiente = int(np.argmax(np.where(conexos, cercania, -np.inf)))
+            if siguiente in elegidos:
+                break
+            elegidos.append(siguiente)
+            desde.append(_dijkstra(*adelante, siguiente))
+            hacia.append(_dijkstra(*atras, siguiente))
+
+        return np.stack(desde).astype(np.float32), np.stack(hacia).astype(np.float32), conexos
+
+    # --- persistencia ---
+
+    def guardar(self, ruta):
+        np.savez_compressed(
+            ruta, version=VERSION_GRAFO, lats=self.lats, lngs=self.lngs,
+            origenes=self.origenes, destinos=self.destinos,
+            desde_landmark=self.desde_landmark, hacia_landmark=self.hacia_landmark, conexos=self.conexos,
+        )
+
+    @classmethod
+    def cargar(cls, ruta):
+        datos = np.load(ruta)
+        if int(datos['version']) != VERSION_GRAFO:
+            raise ValueError("Versión de grafo distinta")
+        return cls(
+            datos['lats'], datos['lngs'], datos['origenes'], datos['destinos'],
+            datos['desde_landmark'], datos['hacia_landmark'], datos['conexos'],
+        )
+
+    # --- consultas ---
+
+    def nodo_mas_cercano(self, lat, lng):
+        encontrados = self._nodos.k_cercanos(lat, lng, 1)
+        if not encontrados:
+            raise SinRuteoVial("El grafo vial está vacío.")
+        return encontrados[0][0]
+
+    def _heuristica(self, destino):
+        """Cota inferior de la distancia de cada nodo a `destino` (desigualdad triangular)."""
+        with np.errstate(invalid='ignore'):
+            por_desde = self.desde_landmark[:, destino][:, None] - self.desde_landmark
+            por_hacia = self.hacia_landmark - self.hacia_landmark[:, destino][:, None]
+            cota = np.fmax(por_desde, por_hacia)
+        cota = np.where(np.isfinite(cota), cota, 0.0)
+        return np.maximum(cota.max(axis=0), 0.0).tolist()
+
+    def camino(self, origen, destino):
+        """(distancia_m, [nodos]) del camino más corto con A* + landmarks."""
+        if origen == destino:
+            return 0.0, [origen]
+        h = self._heuristica(destino)
+        inicio, indices, pesos = self._inicio, self._indices, self._pesos
+        dist = {origen: 0.0}
+        previo = {}
+        cola = [(h[origen], origen)]
+        cerrados = set()
+        while cola:
+            _, v = heapq.heappop(cola)
+            if v == destino:
+                break
+            if v in cerrados:
+                continue
+            cerrados.add(v)
+            dv = dist[v]
+            for k in range(inicio[v], inicio[v + 1]):
+                w = indices[k]
+                nd = dv + pesos[k]
+                if nd < dist.get(w, float('inf')):
+                    dist[w] = nd
+                    previo[w] = v
+                    heapq.heappush(cola, (nd + h[w], w))
+        if destino not in dist:
+            raise SinRuteoVial("No hay camino entre los puntos.")
+
+        nodos = [destino]
+        while nodos[-1] != origen:
+            nodos.append(previo[nodos[-1]])
+        nodos.reverse()
+        return dist[destino], nodos
+
+    def geometria(self, nodos):
+        return [[float(self.lats[v]), float(self.lngs[v])] for v in nodos]
+
+
+# -----------------------------------------------------------------
+# SERVICIO (un grafo por proceso, con caché de rutas)
+# -----------------------------------------------------------------
+
+class RuteoVial:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._grafo = None
+        self._extracto = None
+        self._rutas = OrderedDict()
+
+    def _ruta_npz(self, extracto):
+        extracto = Path(extracto)
+        return extracto.with_name(f'{extracto.name}.grafo.npz')
+
+    def grafo(self):
+        """Carga el grafo del extracto configurado (o su .npz si está al día)."""
+        extracto = _configuracion()['EXTRACTO_OSM']
+        if not disponible():
+            raise SinRuteoVial("No hay extracto OSM configurado (settings.RUTEO_VIAL['EXTRACTO_OSM']).")
+        with self._lock:
+            if self._grafo is None or self._extracto != str(extracto):
+                npz = self._ruta_npz(extracto)
+                grafo = None
+                if npz.exists() and npz.stat().st_mtime >= Path(extracto).stat().st_mtime:
+                    try:
+                        grafo = GrafoVial.cargar(npz)
+                    except (ValueError, KeyError):
+                        grafo = None
+                if grafo is None:
+                    grafo = GrafoVial(*leer_osm(extracto))
+                    grafo.guardar(npz)
+                self._grafo, self._extracto = grafo, str(extracto)
+                self._rutas.clear()
+            return self._grafo
+
+    def ruta(self, puntos):
+        """
+        Recorre `puntos` [(lat, lng), ...] en orden por calles. Devuelve
+        {'distancia_km', 'tramos_km', 'geometria'} (geometría en [lat, lng]).
+        El resultado se guarda por secuencia de paradas.
+        """
+        lats, lngs = a_arreglos(puntos)
+        clave = tuple(zip(np.round(lats, 6).tolist(), np.round(lngs, 6).tolist()))
+        with self._lock:
+            if clave in self._rutas:
+                self._rutas.move_to_end(clave)
+                return self._rutas[clave]
+
+        grafo = self.grafo()
+        nodos = [grafo.nodo_mas_cercano(lat, lng) for lat, lng in clave]
+        tramos_km, geometria = [], []
+        for a, b in zip(nodos, nodos[1:]):
+            metros, camino = grafo.camino(a, b)
+            tramos_km.append(round(metros / 1000.0, 3))
+            geometria.extend(grafo.geometria(camino)[1 if geometria else 0:])
+        resultado = {
+            'distancia_km': round(sum(tramos_km), 3),
+            'tramos_km': tramos_km,
+            'geometria': geometria,
+        }
+
+        with self._lock:
+            self._rutas[clave] = resultado
+            while len(self._rutas) > _configuracion()['CACHE_RUTAS']:
+                self._rutas.popitem(last=False)
+        return resultado
+
+    def matriz(self, puntos):
+        """
+        Matriz de distancias por calle (km) entre `puntos`: un Dijkstra por
+        punto, cortado cuando alcanzó a todos los demás. Se simetriza con el
+        promedio de ida y vuelta porque 2-opt supone d(a, b) == d(b, a). Un
+        par sin camino (no debería pasar: los puntos se llevan a nodos de la
+        misma componente) queda con la distancia en línea recta.
+        """
+        grafo = self.grafo()
+        lats, lngs = a_arreglos(puntos)
+        nodos = [grafo.nodo_mas_cercano(lat, lng) for lat, lng in zip(lats, lngs)]
+        dist = np.empty((len(nodos), len(nodos)))
+        for i, nodo in enumerate(nodos):
+            dist[i] = _dijkstra(grafo._inicio, grafo._indices, grafo._pesos, nodo, nodos)[nodos] / 1000.0
+        sin_camino = ~np.isfinite(dist)
+        if sin_camino.any():
+            dist[sin_camino] = matriz_haversine(lats, lngs)[sin_camino]
+        return (dist + dist.T) / 2.0
+
+
+ruteo_vial = RuteoVial()
+
+
+def disponible():
+    extracto = _configuracion()['EXTRACTO_OSM']
+    return bool(extracto) and Path(extracto).exists()
+
+
+def matriz_para_optimizador(puntos):
+    """
+    Matriz por calles para el optimizador, o None si no está activado, no
+    hay extracto o son demasiados puntos (una fila cuesta un Dijkstra).
+    """
+    config = _configuracion()
+    if not config['USAR_EN_OPTIMIZADOR'] or not disponible() or len(puntos) > config['MAX_PUNTOS_OPTIMIZADOR']:
+        return None
+    try:
+        return ruteo_vial.matriz(puntos)
+    except SinRuteoVial:
+        return None
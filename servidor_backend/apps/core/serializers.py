@@ -3,11 +3,16 @@
 from rest_framework import serializers
 # Asegúrate de importar todos los modelos, incluido User
 from django.contrib.auth.models import User
-from .models import Conductor, Vehiculo, Ruta, Cliente, Pedido, Categoria, Producto, DetallePedido, Incidencia
+from .models import Conductor, Vehiculo, Ruta, RutaParada, Cliente, Pedido, Categoria, Producto, DetallePedido, Incidencia
+from .campos import CamposDinamicos
+from .espacial import cliente_cercano_con_nombre
+from .imagenes import urls_variantes
 
 # --- SERIALIZADORES SIMPLES ---
+# Todos aceptan ?fields= y ?expand= (ver campos.py); Meta.expandibles dice
+# con qué serializador se expande cada clave primaria.
 
-class ConductorSerializer(serializers.ModelSerializer):
+class ConductorSerializer(CamposDinamicos, serializers.ModelSerializer):
     username = serializers.CharField(write_only=True)
     password = serializers.CharField(write_only=True)
     class Meta:
@@ -20,40 +25,57 @@ class ConductorSerializer(serializers.ModelSerializer):
         conductor = Conductor.objects.create(user=user, **validated_data)
         return conductor
 
-class VehiculoSerializer(serializers.ModelSerializer):
+class VehiculoSerializer(CamposDinamicos, serializers.ModelSerializer):
     class Meta:
         model = Vehiculo
         fields = '__all__'
+        expandibles = {'ruta_asignada': 'RutaSerializer'}
 
-class RutaSerializer(serializers.ModelSerializer):
+class RutaParadaSerializer(CamposDinamicos, serializers.ModelSerializer):
+    class Meta:
+        model = RutaParada
+        fields = ['secuencia', 'pedido', 'distancia_tramo', 'eta']
+        expandibles = {'pedido': 'PedidoSerializer'}
+
+class RutaSerializer(CamposDinamicos, serializers.ModelSerializer):
+    paradas = RutaParadaSerializer(many=True, read_only=True)
     class Meta:
         model = Ruta
         fields = '__all__'
+        expandibles = {'conductor': 'ConductorSerializer'}
 
-class ClienteSerializer(serializers.ModelSerializer):
+class ClienteSerializer(CamposDinamicos, serializers.ModelSerializer):
     class Meta:
         model = Cliente
         fields = '__all__'
 
-class CategoriaSerializer(serializers.ModelSerializer):
+class CategoriaSerializer(CamposDinamicos, serializers.ModelSerializer):
     class Meta:
         model = Categoria
         fields = '__all__'
 
-class ProductoSerializer(serializers.ModelSerializer):
+class ProductoSerializer(CamposDinamicos, serializers.ModelSerializer):
+    # {'thumb': {'webp': url, 'jpeg': url}, 'medium': {...}}; null mientras se generan
+    imagenes = serializers.SerializerMethodField()
+
     class Meta:
         model = Producto
-        fields = '__all__'
+        exclude = ['variantes']
+        expandibles = {'categoria': 'CategoriaSerializer'}
+
+    def get_imagenes(self, producto):
+        return urls_variantes(producto, self.context.get('request'))
 
 # --- SERIALIZADORES COMPLEJOS (PEDIDOS) ---
 
-class DetallePedidoSerializer(serializers.ModelSerializer):
+class DetallePedidoSerializer(CamposDinamicos, serializers.ModelSerializer):
     nombre_producto = serializers.ReadOnlyField(source='producto.nombre')
     class Meta:
         model = DetallePedido
         fields = ['id', 'producto', 'nombre_producto', 'cantidad', 'precio_unitario']
+        expandibles = {'producto': 'ProductoSerializer'}
 
-class PedidoSerializer(serializers.ModelSerializer):
+class PedidoSerializer(CamposDinamicos, serializers.ModelSerializer):
     detalles = DetallePedidoSerializer(many=True)
     conductor_asignado = serializers.ReadOnlyField(source='ruta.conductor.nombre')
     
@@ -73,6 +95,7 @@ class PedidoSerializer(serializers.ModelSerializer):
             'estado', 'detalles', 'latitud', 'longitud', 'conductor_asignado',
             'nombre_nuevo_cliente', 'telefono_nuevo_cliente'
         ]
+        expandibles = {'cliente': 'ClienteSerializer'}
 
     def create(self, validated_data):
         # 1. Sacar los datos que no van directos al modelo Pedido
@@ -86,15 +109,18 @@ class PedidoSerializer(serializers.ModelSerializer):
 
         # 2. Lógica de Cliente
         if not cliente and nombre_nuevo:
-            # Crear cliente nuevo
-            cliente = Cliente.objects.create(
-                nombre_cliente=nombre_nuevo,
-                telefono=telefono_nuevo,
-                direccion=f"Ubicación GPS: {lat}, {lon}",
-                email="",
-                latitud=lat,
-                longitud=lon
-            )
+            # Si ya existe un cliente con ese nombre en el mismo lugar, se reutiliza
+            cliente = cliente_cercano_con_nombre(nombre_nuevo, lat, lon)
+            if cliente is None:
+                # Crear cliente nuevo
+                cliente = Cliente.objects.create(
+                    nombre_cliente=nombre_nuevo,
+                    telefono=telefono_nuevo,
+                    direccion=f"Ubicación GPS: {lat}, {lon}",
+                    email="",
+                    latitud=lat,
+                    longitud=lon
+                )
             validated_data['cliente'] = cliente
         
         elif cliente:
@@ -119,7 +145,7 @@ class PedidoSerializer(serializers.ModelSerializer):
         return pedido 
 
 # Serializador para la vista del Conductor
-class PedidoConductorSerializer(serializers.ModelSerializer):
+class PedidoConductorSerializer(CamposDinamicos, serializers.ModelSerializer):
     detalles = DetallePedidoSerializer(many=True)
     nombre_cliente = serializers.ReadOnlyField(source='cliente.nombre_cliente')
     telefono_cliente = serializers.ReadOnlyField(source='cliente.telefono')
@@ -129,7 +155,15 @@ class PedidoConductorSerializer(serializers.ModelSerializer):
         model = Pedido
         fields = ['id', 'estado', 'latitud', 'longitud', 'detalles', 'nombre_cliente', 'telefono_cliente', 'direccion_texto']
 
-class IncidenciaSerializer(serializers.ModelSerializer):
+
+# Todo lo que leen PedidoSerializer y PedidoConductorSerializer (cliente,
+# conductor de la ruta y detalles con su producto) en una cantidad fija de
+# consultas, sin importar cuántos pedidos se serialicen.
+def pedidos_con_relaciones(queryset=None):
+    queryset = Pedido.objects.all() if queryset is None else queryset
+    return queryset.select_related('cliente', 'ruta__conductor').prefetch_related('detalles__producto')
+
+class IncidenciaSerializer(CamposDinamicos, serializers.ModelSerializer):
     class Meta:
         model = Incidencia
         fields = ['id', 'tipo', 'descripcion', 'fecha_reporte']
\ No newline at end of file
@@ -0,0 +1,266 @@
+# En: apps/core/signals.py
+
+from collections import Counter
+
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+
+from .models import Cliente, Pedido, DetallePedido, Producto, Ruta, RutaParada, Incidencia
+from .espacial import ESTADOS_INDEXADOS, indice_pedidos, indice_clientes
+from . import cache_mi_ruta, cache_respuestas, estadisticas, eventos, imagenes, matriz_distancias, pendientes_ruta
+
+
+# -----------------------------------------------------------------
+# ÍNDICE ESPACIAL (ver espacial.py)
+# -----------------------------------------------------------------
+
+@receiver(post_save, sender=Pedido)
+def indexar_pedido(sender, instance, **kwargs):
+    if instance.estado in ESTADOS_INDEXADOS:
+        indice_pedidos.agregar(instance.id, instance.latitud, instance.longitud)
+    else:
+        indice_pedidos.quitar(instance.id)
+
+
+@receiver(post_delete, sender=Pedido)
+def desindexar_pedido(sender, instance, **kwargs):
+    indice_pedidos.quitar(instance.id)
+
+
+@receiver(post_save, sender=Cliente)
+def indexar_cliente(sender, instance, **kwargs):
+    indice_clientes.agregar(instance.id, instance.latitud, instance.longitud)
+
+
+@receiver(post_delete, sender=Cliente)
+def desindexar_cliente(sender, instance, **kwargs):
+    indice_clientes.quitar(instance.id)
+
+
+# -----------------------------------------------------------------
+# CACHÉ DE DISTANCIAS ENTRE CLIENTES (ver matriz_distancias.py)
+# -----------------------------------------------------------------
+
+@receiver(post_save, sender=Cliente)
+def actualizar_distancias_cliente(sender, instance, **kwargs):
+    # Si el archivo aún no existe se arma completo la primera vez que se use.
+    if matriz_distancias.en_uso():
+        try:
+            matriz_distancias.matriz_clientes.actualizar_cliente(instance.id, instance.latitud, instance.longitud)
+        except matriz_distancias.MatrizLlena:
+            pass  # queda marcada como llena y el despacho deja de usarla
+
+
+@receiver(post_delete, sender=Cliente)
+def quitar_distancias_cliente(sender, instance, **kwargs):
+    if matriz_distancias.en_uso():
+        matriz_distancias.matriz_clientes.quitar_cliente(instance.id)
+
+
+# -----------------------------------------------------------------
+# ESTADÍSTICAS DIARIAS Y PENDIENTES POR RUTA (ver estadisticas.py y pendientes_ruta.py)
+# -----------------------------------------------------------------
+# pre_* toma la foto de lo que aportaba la fila antes del cambio y post_*
+# suma la diferencia con la foto nueva. La de un Pedido guardado se arma con
+# la instancia (foto_pedido_guardado) y la comparten los demás receptores
+# de post_save (mi-ruta, eventos): un save() normal no suma más consultas
+# que la foto de antes.
+
+@receiver(pre_save, sender=Pedido)
+def foto_pedido_antes(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    instance._estadisticas_antes = estadisticas.foto_pedidos(Pedido.objects.filter(pk=instance.pk)) if instance.pk else {}
+    instance._estadisticas_despues = None
+
+
+def _fotos_pedido(instance, update_fields=None):
+    """(antes, después) del save() en curso; la de después se arma una sola vez."""
+    antes = getattr(instance, '_estadisticas_antes', {})
+    despues = getattr(instance, '_estadisticas_despues', None)
+    if despues is None:
+        despues = estadisticas.foto_pedido_guardado(instance, antes, update_fields)
+        instance._estadisticas_despues = despues
+    return antes, despues
+
+
+@receiver(post_save, sender=Pedido)
+def registrar_estadisticas_pedido(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    antes, despues = _fotos_pedido(instance, update_fields)
+    estadisticas.registrar_pedidos(antes, despues)
+    pendientes_ruta.registrar_pendientes(antes, despues)
+    if antes and antes[instance.pk][0] != despues[instance.pk][0]:
+        estadisticas.mover_unidades_de_pedido(instance.pk, antes[instance.pk][0], despues[instance.pk][0])
+
+
+@receiver(pre_delete, sender=Pedido)
+def descontar_estadisticas_pedido(sender, instance, **kwargs):
+    # pre_delete: sus detalles se descuentan solos (también reciben pre_delete)
+    antes = estadisticas.foto_pedidos(Pedido.objects.filter(pk=instance.pk))
+    estadisticas.registrar_pedidos(antes, {})
+    pendientes_ruta.registrar_pendientes(antes, {})
+
+
+@receiver(pre_save, sender=DetallePedido)
+def foto_detalle_antes(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    instance._estadisticas_antes = (
+        estadisticas.foto_unidades(DetallePedido.objects.filter(pk=instance.pk)) if instance.pk else Counter()
+    )
+
+
+@receiver(post_save, sender=DetallePedido)
+def registrar_estadisticas_detalle(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    estadisticas.registrar_unidades(
+        getattr(instance, '_estadisticas_antes', Counter()),
+        estadisticas.foto_unidades(DetallePedido.objects.filter(pk=instance.pk)),
+    )
+
+
+@receiver(pre_delete, sender=DetallePedido)
+def descontar_estadisticas_detalle(sender, instance, **kwargs):
+    estadisticas.registrar_unidades(estadisticas.foto_unidades(DetallePedido.objects.filter(pk=instance.pk)), Counter())
+
+
+@receiver(pre_save, sender=Ruta)
+def foto_ruta_antes(sender, instance, raw=False, **kwargs):
+    # Si la ruta cambia de conductor, sus entregas pasan al nuevo
+    instance._estadisticas_antes = {}
+    if raw or not instance.pk:
+        return
+    anterior = Ruta.objects.filter(pk=instance.pk).values_list('conductor_id', flat=True).first()
+    if anterior != instance.conductor_id:
+        instance._estadisticas_antes = estadisticas.foto_pedidos(Pedido.objects.filter(ruta_id=instance.pk))
+
+
+@receiver(post_save, sender=Ruta)
+def registrar_estadisticas_ruta(sender, instance, raw=False, **kwargs):
+    antes = getattr(instance, '_estadisticas_antes', {})
+    if antes:
+        estadisticas.registrar_pedidos(antes, estadisticas.foto_pedidos(Pedido.objects.filter(ruta_id=instance.pk)))
+
+
+# -----------------------------------------------------------------
+# CACHÉ DE RESPUESTAS (ver cache_respuestas.py)
+# -----------------------------------------------------------------
+
+def invalidar_respuestas(sender, **kwargs):
+    cache_respuestas.invalidar_modelo(sender)
+
+
+for _modelo in cache_respuestas.GRUPOS_POR_MODELO:
+    post_save.connect(invalidar_respuestas, sender=_modelo, dispatch_uid=f'invalidar_respuestas_{_modelo.__name__}')
+    post_delete.connect(invalidar_respuestas, sender=_modelo, dispatch_uid=f'invalidar_respuestas_{_modelo.__name__}')
+
+
+# -----------------------------------------------------------------
+# CACHÉ DE MI-RUTA (ver cache_mi_ruta.py)
+# -----------------------------------------------------------------
+# Se marcan sólo las rutas en las que aparece lo que cambió. Al borrar un
+# pedido sus paradas se borran en cascada y avisan por su cuenta.
+
+@receiver(post_save, sender=Pedido)
+def invalidar_mi_ruta_pedido(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    antes, despues = _fotos_pedido(instance, update_fields)
+    ruta_id = despues[instance.pk][3]
+    rutas = {ruta_id}
+    if antes and antes[instance.pk][3] != ruta_id:
+        # Cambió de ruta: también las rutas donde todavía tenga paradas,
+        # incluidas las ya entregadas (el pedido sale de esa lista)
+        rutas |= {antes[instance.pk][3]} | cache_mi_ruta.rutas_con_paradas(pendientes=False, pedido_id=instance.pk)
+    cache_mi_ruta.invalidar_rutas(rutas)
+
+
+@receiver(post_delete, sender=Pedido)
+def invalidar_mi_ruta_pedido_borrado(sender, instance, **kwargs):
+    cache_mi_ruta.invalidar_rutas({instance.ruta_id})
+
+
+@receiver(post_save, sender=DetallePedido)
+@receiver(post_delete, sender=DetallePedido)
+def invalidar_mi_ruta_detalle(sender, instance, raw=False, **kwargs):
+    if not raw:
+        cache_mi_ruta.invalidar_rutas(cache_mi_ruta.rutas_con_paradas(pedido_id=instance.pedido_id))
+
+
+@receiver(post_save, sender=Cliente)
+def invalidar_mi_ruta_cliente(sender, instance, raw=False, **kwargs):
+    if not raw:
+        cache_mi_ruta.invalidar_rutas(cache_mi_ruta.rutas_con_paradas(pedido__cliente_id=instance.pk))
+
+
+@receiver(post_save, sender=Producto)
+def invalidar_mi_ruta_producto(sender, instance, raw=False, **kwargs):
+    if not raw:
+        cache_mi_ruta.invalidar_rutas(cache_mi_ruta.rutas_con_paradas(pedido__detalles__producto_id=instance.pk))
+
+
+@receiver(post_save, sender=Ruta)
+@receiver(post_delete, sender=Ruta)
+def invalidar_mi_ruta_ruta(sender, instance, **kwargs):
+    cache_mi_ruta.invalidar_rutas({instance.pk})
+
+
+@receiver(post_save, sender=RutaParada)
+@receiver(post_delete, sender=RutaParada)
+def invalidar_mi_ruta_parada(sender, instance, **kwargs):
+    cache_mi_ruta.invalidar_rutas({instance.ruta_id})
+
+
+# -----------------------------------------------------------------
+# EVENTOS EN VIVO (ver eventos.py)
+# -----------------------------------------------------------------
+# Las asignaciones de rutas las publica guardar_ruta (usa update()).
+
+def _conductor_de_ruta(ruta_id):
+    if not ruta_id:
+        return None
+    return Ruta.objects.filter(pk=ruta_id).values_list('conductor_id', flat=True).first()
+
+
+@receiver(post_save, sender=Pedido)
+def publicar_pedido(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    _, despues = _fotos_pedido(instance, update_fields)
+    eventos.publicar(
+        'pedido', {'id': instance.pk, 'estado': instance.estado, 'ruta_id': instance.ruta_id},
+        despues[instance.pk][2],
+    )
+
+
+@receiver(post_delete, sender=Pedido)
+def publicar_pedido_borrado(sender, instance, **kwargs):
+    eventos.publicar('pedido_borrado', {'id': instance.pk}, _conductor_de_ruta(instance.ruta_id))
+
+
+@receiver(post_save, sender=Incidencia)
+def publicar_incidencia(sender, instance, created=False, raw=False, **kwargs):
+    if created and not raw:
+        eventos.publicar(
+            'incidencia', {'id': instance.pk, 'tipo': instance.tipo, 'conductor_id': instance.conductor_id},
+            instance.conductor_id,
+        )
+
+
+# -----------------------------------------------------------------
+# VARIANTES DE IMÁGENES (ver imagenes.py)
+# -----------------------------------------------------------------
+
+@receiver(post_save, sender=Producto)
+def variantes_producto(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    if imagenes.necesita_variantes(instance):
+        imagenes.programar_variantes(instance.pk)
+    elif not instance.imagen and instance.variantes:
+        # Se quitó la imagen: el listado ya se invalida por la señal de caché
+        Producto.objects.filter(pk=instance.pk).update(variantes={})
+        instance.variantes = {}
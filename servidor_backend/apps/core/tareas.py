@@ -0,0 +1,61 @@
+# En: apps/core/tareas.py
+
+"""
+Tipos de tarea de la cola (ver cola.py). Cada función recibe argumentos
+JSON y devuelve lo que queda en Tarea.resultado.
+"""
+
+from django.core.exceptions import ObjectDoesNotExist
+
+from . import imagenes
+from .cola import ErrorTarea, tarea
+from .despacho import ConflictoAsignacion, asignar_a_conductor, despachar_pendientes
+from .estadisticas import reconstruir_estadisticas
+from .models import Conductor, Pedido
+
+
+@tarea('asignar_ruta', prioridad=10, sin_reintento=(ConflictoAsignacion, ObjectDoesNotExist))
+def asignar_ruta(conductor_id, pedido_ids, reasignar=False):
+    conductor = Conductor.objects.get(pk=conductor_id)
+    pedidos_nuevos = list(Pedido.objects.filter(id__in=pedido_ids))
+    # Mientras esperaba en la cola otro despachador pudo asignarlos
+    ya_asignados = [p.id for p in pedidos_nuevos if p.ruta_id is not None]
+    if ya_asignados and not reasignar:
+        raise ConflictoAsignacion("Algunos pedidos ya tienen ruta.")
+    ruta, mensaje = asignar_a_conductor(conductor, pedidos_nuevos, reasignar=reasignar)
+    return {"mensaje": mensaje, "ruta_id": ruta.id}
+
+
+@tarea('despacho_masivo', prioridad=5, sin_reintento=(ConflictoAsignacion,))
+def despacho_masivo(pedido_ids=None, conductor_ids=None):
+    rutas, sin_asignar = despachar_pendientes(pedido_ids=pedido_ids, conductor_ids=conductor_ids)
+    if not rutas:
+        raise ErrorTarea(
+            "No hay pedidos pendientes con ubicación o conductores disponibles.",
+            sin_asignar=[p.id for p in sin_asignar],
+        )
+    return {
+        "mensaje": f"{len(rutas)} rutas creadas.",
+        "rutas": [
+            {
+                "ruta_id": ruta.id,
+                "conductor_id": conductor.id,
+                "conductor": conductor.nombre,
+                "pedido_ids": [p.id for p in pedidos],
+                "carga": carga,
+                "capacidad": None if capacidad == float('inf') else capacidad,
+            }
+            for ruta, conductor, pedidos, carga, capacidad in rutas
+        ],
+        "sin_asignar": [p.id for p in sin_asignar],
+    }
+
+
+@tarea('generar_variantes', prioridad=-5)
+def generar_variantes(producto_id):
+    return {"generadas": imagenes.generar_variantes(producto_id)}
+
+
+@tarea('reconstruir_estadisticas', prioridad=-10, max_intentos=1)
+def estadisticas():
+    return reconstruir_estadisticas()
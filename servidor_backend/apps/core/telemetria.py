@@ -0,0 +1,218 @@
+# En: apps/core/telemetria.py
+
+"""
+Posiciones GPS de los conductores.
+
+La app del conductor junta muestras y las manda en lotes a
+POST /core/api/conductor/telemetria/. Cada lote se guarda con un único
+INSERT en PosicionConductor (sin señales ni claves foráneas) después de
+descartar las muestras que casi no aportan: las que llegan antes de
+INTERVALO_MINIMO_S desde la última guardada sin haberse movido
+DISTANCIA_MINIMA_M. Para que esas escrituras no compitan con las de los
+pedidos, TELEMETRIA['BASE'] puede apuntar a otra base de datos (ver
+routers.py).
+
+`posiciones_conductores` guarda en memoria la última posición conocida de
+cada conductor. Se llena al recibir muestras y, si un conductor no está
+(otro proceso recibió sus muestras, o el servidor recién arrancó), se
+busca su última fila con el índice (conductor_id, momento) y se recuerda
+por unos segundos.
+
+`python manage.py depurar_telemetria` borra lo más viejo que RETENCION_DIAS
+y deja una muestra por minuto en lo que tiene más de DIAS_DETALLE días.
+"""
+
+import datetime
+import math
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.db.models import Max, Min
+from django.db.models.functions import TruncMinute
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .espacial import distancia_km
+from .models import PosicionConductor
+
+Posicion = namedtuple('Posicion', 'momento latitud longitud')
+
+
+def _configuracion():
+    config = {
+        'BASE': 'default',
+        'MAX_MUESTRAS_POR_LOTE': 500,
+        'INTERVALO_MINIMO_S': 5,
+        'DISTANCIA_MINIMA_M': 25,
+        'VIGENCIA_MIN': 10,
+        'RETENCION_DIAS': 30,
+        'DIAS_DETALLE': 2,
+    }
+    config.update(getattr(settings, 'TELEMETRIA', {}))
+    return config
+
+
+def base():
+    return _configuracion()['BASE']
+
+
+class MuestraInvalida(ValueError):
+    pass
+
+
+# -----------------------------------------------------------------
+# ÚLTIMA POSICIÓN EN MEMORIA
+# -----------------------------------------------------------------
+
+class IndicePosiciones:
+    # Segundos que se recuerda haber buscado en la base a un conductor
+    REVISAR_CADA_S = 30
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._posiciones = {}
+        self._revisado = {}
+
+    def reiniciar(self):
+        with self._lock:
+            self._posiciones.clear()
+            self._revisado.clear()
+
+    def actualizar(self, conductor_id, posicion):
+        with self._lock:
+            actual = self._posiciones.get(conductor_id)
+            if actual is None or posicion.momento >= actual.momento:
+                self._posiciones[conductor_id] = posicion
+
+    def ultima(self, conductor_id):
+        """Última Posicion conocida del conductor (o None)."""
+        with self._lock:
+            posicion = self._posiciones.get(conductor_id)
+            revisado = self._revisado.get(conductor_id, 0)
+        if time.monotonic() - revisado < self.REVISAR_CADA_S:
+            return posicion
+
+        fila = (
+            PosicionConductor.objects.using(base()).filter(conductor_id=conductor_id)
+            .order_by('-momento').values_list('momento', 'latitud_e6', 'longitud_e6').first()
+        )
+        with self._lock:
+            self._revisado[conductor_id] = time.monotonic()
+        if fila:
+            self.actualizar(conductor_id, Posicion(fila[0], fila[1] / 1e6, fila[2] / 1e6))
+        with self._lock:
+            return self._posiciones.get(conductor_id)
+
+    def vigente(self, conductor_id):
+        """(lat, lng) si la última posición tiene menos de VIGENCIA_MIN minutos; si no, None."""
+        posicion = self.ultima(conductor_id)
+        limite = timezone.now() - datetime.timedelta(minutes=_configuracion()['VIGENCIA_MIN'])
+        if posicion is None or posicion.momento < limite:
+            return None
+        return (posicion.latitud, posicion.longitud)
+
+
+posiciones_conductores = IndicePosiciones()
+
+
+def ultimas_posiciones():
+    """{conductor_id: Posicion} de los que mandaron muestras dentro de VIGENCIA_MIN (para el mapa del despacho)."""
+    desde = timezone.now() - datetime.timedelta(minutes=_configuracion()['VIGENCIA_MIN'])
+    recientes = PosicionConductor.objects.using(base()).filter(momento__gte=desde)
+    ultimas = recientes.values('conductor_id').annotate(ultimo=Max('id')).values('ultimo')
+    return {
+        fila.conductor_id: Posicion(fila.momento, fila.latitud, fila.longitud)
+        for fila in PosicionConductor.objects.using(base()).filter(id__in=ultimas)
+    }
+
+
+# -----------------------------------------------------------------
+# INGESTA
+# -----------------------------------------------------------------
+
+def _leer_muestra(muestra, ahora, retencion):
+    """{'lat', 'lng', 't'} -> Posicion. `t` en milisegundos Unix o ISO 8601."""
+    try:
+        lat, lng, t = float(muestra['lat']), float(muestra['lng']), muestra['t']
+    except (KeyError, TypeError, ValueError):
+        raise MuestraInvalida("Cada muestra necesita lat, lng y t.")
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180) or math.isnan(lat) or math.isnan(lng):
+        raise MuestraInvalida("Coordenadas fuera de rango.")
+
+    if isinstance(t, (int, float)):
+        momento = datetime.datetime.fromtimestamp(t / 1000, tz=datetime.timezone.utc)
+    else:
+        momento = parse_datetime(str(t))
+        if momento is None:
+            raise MuestraInvalida("'t' debe ser milisegundos Unix o una fecha ISO 8601.")
+        if timezone.is_naive(momento):
+            momento = timezone.make_aware(momento)
+    if momento > ahora + datetime.timedelta(minutes=5) or momento < ahora - retencion:
+        raise MuestraInvalida("Muestra con fecha fuera de rango.")
+    return Posicion(momento, lat, lng)
+
+
+def registrar_muestras(conductor_id, muestras):
+    """
+    Guarda un lote de muestras del conductor y devuelve (guardadas,
+    descartadas). Lanza MuestraInvalida si alguna está mal formada (no se
+    guarda nada del lote).
+    """
+    config = _configuracion()
+    if not isinstance(muestras, list) or len(muestras) > config['MAX_MUESTRAS_POR_LOTE']:
+        raise MuestraInvalida(f"'muestras' debe ser una lista de hasta {config['MAX_MUESTRAS_POR_LOTE']} elementos.")
+    ahora = timezone.now()
+    retencion = datetime.timedelta(days=config['RETENCION_DIAS'])
+    posiciones = sorted((_leer_muestra(m, ahora, retencion) for m in muestras), key=lambda p: p.momento)
+
+    intervalo = datetime.timedelta(seconds=config['INTERVALO_MINIMO_S'])
+    distancia_minima_km = config['DISTANCIA_MINIMA_M'] / 1000
+    anterior = posiciones_conductores.ultima(conductor_id)
+    guardar = []
+    for posicion in posiciones:
+        if anterior is not None and (
+            posicion.momento <= anterior.momento
+            or (posicion.momento - anterior.momento < intervalo
+                and distancia_km(anterior.latitud, anterior.longitud, posicion.latitud, posicion.longitud) < distancia_minima_km)
+        ):
+            continue
+        guardar.append(posicion)
+        anterior = posicion
+
+    PosicionConductor.objects.using(config['BASE']).bulk_create([
+        PosicionConductor(
+            conductor_id=conductor_id, momento=p.momento,
+            latitud_e6=round(p.latitud * 1e6), longitud_e6=round(p.longitud * 1e6),
+        )
+        for p in guardar
+    ])
+    if guardar:
+        posiciones_conductores.actualizar(conductor_id, guardar[-1])
+    return len(guardar), len(posiciones) - len(guardar)
+
+
+# -----------------------------------------------------------------
+# RETENCIÓN
+# -----------------------------------------------------------------
+
+def depurar(ahora=None):
+    """
+    Borra las muestras más viejas que RETENCION_DIAS y reduce a una por
+    conductor y minuto las que tienen más de DIAS_DETALLE días. Devuelve
+    (borradas por antigüedad, borradas al reducir).
+    """
+    config = _configuracion()
+    ahora = ahora or timezone.now()
+    posiciones = PosicionConductor.objects.using(config['BASE'])
+
+    viejas, _ = posiciones.filter(momento__lt=ahora - datetime.timedelta(days=config['RETENCION_DIAS'])).delete()
+
+    a_reducir = posiciones.filter(momento__lt=ahora - datetime.timedelta(days=config['DIAS_DETALLE']))
+    conservar = (
+        a_reducir.annotate(minuto=TruncMinute('momento'))
+        .values('conductor_id', 'minuto').annotate(primera=Min('id')).values('primera')
+    )
+    reducidas, _ = a_reducir.exclude(id__in=conservar).delete()
+    return viejas, reducidas
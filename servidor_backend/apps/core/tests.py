@@ -1,3 +1,2013 @@
-from django.test import TestCase
+import asyncio
+import csv
+import datetime
+import gzip
+import io
+import json
+import math
+import multiprocessing
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import Sum
+from django.test import AsyncClient, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase
+
+from . import compresion, despacho, lectura_rapida
+from .analitica import resumen_dashboard
+from .cache_respuestas import reiniciar_contadores
+from .campos import arbol
+from .compresion import codificaciones_disponibles, negociar
+from .cola import ErrorTarea, activa, encolar, ejecutar, liberar_vencidas, sin_compartir, tarea, tomar, trabajar
+from .despacho import (
+    agrupar_por_barrido, asignar_a_conductor, guardar_ruta, reordenar_con_insercion, resolver_grupos, ruta_activa_de,
+    totales_ruta,
+)
+from .espacial import IndiceEspacial, codificar_geohash, distancia_km, indice_pedidos, indice_clientes
+from .estadisticas import reconstruir_estadisticas
+from .matriz_distancias import LIBRE, MatrizDistancias, MatrizLlena, matriz_clientes, matriz_para_pedidos
+from .eventos import CanalLocal, canal
+from .pendientes_ruta import reconstruir_pendientes
+from .optimizacion_grupos import resolver_grupo
+from .optimizacion import (
+    ORIGEN_POR_DEFECTO, MOTORES, a_arreglos, insertar_en_ruta, matriz_haversine, optimizar_ruta, vecino_mas_cercano,
+)
+from .renderizadores import ParserJSON, RenderizadorJSON
+from .routers import RouterTelemetria
+from .ruteo_vial import GrafoVial, RuteoVial, _dijkstra, leer_osm, matriz_para_optimizador
+from .telemetria import depurar, posiciones_conductores
+from .models import (
+    Conductor, Ruta, RutaParada, Cliente, Pedido, Categoria, Producto, DetallePedido, Incidencia,
+    PosicionConductor, Tarea,
+    EstadisticaPedidosDia, EstadisticaConductorDia, EstadisticaProductoDia,
+)
+from .serializers import PedidoConductorSerializer, PedidoSerializer, RutaParadaSerializer, pedidos_con_relaciones
+
+
+# La caché de distancias entre clientes (matriz_distancias.py) se escribe en
+# disco: durante las pruebas va a una carpeta temporal y no a la de settings.
+_matriz_de_pruebas = None
+
+
+def setUpModule():
+    global _matriz_de_pruebas
+    carpeta = tempfile.mkdtemp()
+    _matriz_de_pruebas = (carpeta, override_settings(MATRIZ_DISTANCIAS={'RUTA': carpeta}))
+    _matriz_de_pruebas[1].enable()
+    matriz_clientes.cerrar()
+
+
+def tearDownModule():
+    carpeta, ajuste = _matriz_de_pruebas
+    matriz_clientes.cerrar()
+    ajuste.disable()
+    shutil.rmtree(carpeta, ignore_errors=True)
+
+
+class PruebaMigracion(TransactionTestCase):
+    """Lleva la base a una migración de core (con sus datos) y al terminar la deja en la última."""
+
+    def migrar(self, nombre):
+        """Migra hasta `nombre` y devuelve los modelos históricos de ese punto."""
+        destino = ('core', nombre)
+        executor = MigrationExecutor(connection)
+        executor.migrate([destino])
+        return executor.loader.project_state([destino]).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes('core'))
+
+
+# -----------------------------------------------------------------
+# PRESUPUESTO DE CONSULTAS
+# -----------------------------------------------------------------
+# Cada endpoint tiene una cantidad fija de consultas, sin importar cuántos
+# pedidos devuelva. Si alguien agrega un campo al serializador sin sumar su
+# select_related / prefetch_related, estos tests fallan.
+
+class PresupuestoConsultasTests(APITestCase):
+    # Consultas esperadas por endpoint (la autenticación no cuenta: force_authenticate)
+    PRESUPUESTO = {
+        '/core/api/pedidos/': 2,             # pedidos + cliente + ruta + conductor, detalles + productos
+        '/core/api/detalles-pedido/': 1,
+        '/core/api/rutas/': 2,               # rutas, paradas
+        '/core/api/mi-ruta/': 4,             # conductor, ruta, paradas + pedido + cliente, detalles + productos
+        '/core/api/conductor/historial/': 3,  # conductor, pedidos + cliente, detalles + productos
+        '/core/api/reportes/dashboard/': 6,   # ver analitica.resumen_dashboard
+        '/core/api/reportes/': 6,
+    }
+
+    def setUp(self):
+        cache.clear()
+        indice_pedidos.reiniciar()
+        indice_clientes.reiniciar()
+        self.admin = User.objects.create_user('admin', password='x')
+        self.usuario_conductor = User.objects.create_user('chofer', password='x')
+        self.conductor = Conductor.objects.create(
+            user=self.usuario_conductor, nombre='Juan', licencia='L-1', placa_vehiculo='ABC-123'
+        )
+        self.productos = [Producto.objects.create(nombre=f'Producto {i}', precio=10) for i in range(3)]
+        self.ruta_cerrada = Ruta.objects.create(conductor=self.conductor, distancia=0, tiempo_estimado=0)
+        self.ruta_activa = Ruta.objects.create(conductor=self.conductor, distancia=0, tiempo_estimado=0)
+        self.sembrados = 0
+
+    def sembrar(self, cantidad):
+        """
+        Crea `cantidad` pedidos de clientes distintos, con 3 detalles cada
+        uno: la mitad entregados en una ruta vieja y la otra mitad en la ruta
+        actual del conductor (creada después, así que es la que devuelve `.last()`).
+        """
+        for _ in range(cantidad):
+            i = self.sembrados
+            self.sembrados += 1
+            cliente = Cliente.objects.create(
+                nombre_cliente=f'Cliente {i}', telefono='70000000', direccion='Calle',
+                latitud=-17.39 + i * 0.0001, longitud=-66.15,
+            )
+            entregado = i % 2 == 0
+            ruta = self.ruta_cerrada if entregado else self.ruta_activa
+            pedido = Pedido.objects.create(
+                cliente=cliente, direccion='Calle', latitud=cliente.latitud, longitud=cliente.longitud,
+                estado='entregado' if entregado else 'en_camino', ruta=ruta,
+            )
+            RutaParada.objects.create(ruta=ruta, pedido=pedido, secuencia=i)
+            for producto in self.productos:
+                DetallePedido.objects.create(pedido=pedido, producto=producto, cantidad=1, precio_unitario=10)
+
+    def contar_consultas(self, url, usuario):
+        self.client.force_authenticate(usuario)
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(url)
+        self.assertEqual(respuesta.status_code, 200, respuesta.content)
+        return len(consultas)
+
+    def verificar_presupuesto(self, url, usuario=None):
+        usuario = usuario or self.admin
+        self.sembrar(4)
+        pocos = self.contar_consultas(url, usuario)
+        self.sembrar(40)
+        muchos = self.contar_consultas(url, usuario)
+        self.assertEqual(pocos, muchos, f"{url}: las consultas crecen con la cantidad de filas")
+        self.assertLessEqual(muchos, self.PRESUPUESTO[url], f"{url}: se pasó del presupuesto de consultas")
+
+    def test_lista_pedidos(self):
+        self.verificar_presupuesto('/core/api/pedidos/')
+
+    def test_detalle_pedido(self):
+        self.sembrar(1)
+        pedido = Pedido.objects.get()
+        self.assertLessEqual(self.contar_consultas(f'/core/api/pedidos/{pedido.id}/', self.admin), 3)
+
+    def test_lista_detalles_pedido(self):
+        self.verificar_presupuesto('/core/api/detalles-pedido/')
+
+    def test_lista_rutas(self):
+        self.verificar_presupuesto('/core/api/rutas/')
+
+    def test_mi_ruta(self):
+        self.verificar_presupuesto('/core/api/mi-ruta/', self.usuario_conductor)
+
+    def test_historial_conductor(self):
+        self.verificar_presupuesto('/core/api/conductor/historial/', self.usuario_conductor)
+
+    def test_dashboard(self):
+        self.verificar_presupuesto('/core/api/reportes/dashboard/')
+
+    def test_reportes(self):
+        self.verificar_presupuesto('/core/api/reportes/')
+
+    def test_pedidos_cercanos(self):
+        self.sembrar(4)
+        url = '/core/api/pedidos/cercanos/?lat=-17.39&lng=-66.15&k=50'
+        self.contar_consultas(url, self.admin)  # carga el índice en memoria
+        pocos = self.contar_consultas(url, self.admin)
+        self.sembrar(40)
+        self.assertEqual(self.contar_consultas(url, self.admin), pocos)
+
+    def test_guardar_pedido(self):
+        self.sembrar(4)
+        pedido = Pedido.objects.filter(ruta=self.ruta_activa).first()
+        # Sin cambiar estado ni ruta: la foto de antes (señales) y el UPDATE
+        pedido.direccion = 'Otra calle'
+        with CaptureQueriesContext(connection) as consultas:
+            pedido.save()
+        self.assertEqual(len(consultas), 2, [c['sql'] for c in consultas])
+
+        # Al entregarlo se ajustan los contadores, pero sigue en la misma ruta:
+        # ni se busca el conductor ni en qué rutas tiene paradas
+        pedido.estado = 'entregado'
+        with CaptureQueriesContext(connection) as consultas:
+            pedido.save()
+        tablas = ' '.join(c['sql'] for c in consultas)
+        self.assertNotIn('core_rutaparada', tablas)
+        self.assertNotIn('FROM "core_ruta"', tablas)
+
+
+# -----------------------------------------------------------------
+# LECTURA RÁPIDA (values() en lugar del ModelSerializer)
+# -----------------------------------------------------------------
+
+class LecturaRapidaTests(APITestCase):
+    """El JSON armado desde values() tiene que ser idéntico al de los serializadores."""
+
+    def setUp(self):
+        cache.clear()
+        self.usuario = User.objects.create_user('chofer', password='x')
+        self.conductor = Conductor.objects.create(
+            user=self.usuario, nombre='Juan', licencia='L-1', placa_vehiculo='ABC-123'
+        )
+        producto = Producto.objects.create(nombre='Garrafa', precio=Decimal('3.5'))
+        otro = Producto.objects.create(nombre='Agua', precio=10)
+        self.ruta = Ruta.objects.create(conductor=self.conductor, distancia=Decimal('4.5'), tiempo_estimado=12)
+        sin_conductor = Ruta.objects.create(distancia=0, tiempo_estimado=0)
+        cliente = Cliente.objects.create(nombre_cliente='Ana', telefono='7000', direccion='Calle 1')
+        ahora = timezone.now()
+        casos = [
+            # (ruta, estado, latitud, detalles)
+            (self.ruta, 'en_camino', Decimal('-17.5'), [(producto, 2, Decimal('3.5')), (otro, 1, 10)]),
+            (self.ruta, 'entregado', Decimal('-17.39123'), [(otro, 3, Decimal('9.99'))]),
+            (self.ruta, 'pendiente', None, []),
+            (sin_conductor, 'pendiente', Decimal('-17.4'), [(producto, 1, 1)]),
+            (None, 'pendiente', Decimal('-17.41'), []),
+        ]
+        for i, (ruta, estado, latitud, detalles) in enumerate(casos):
+            pedido = Pedido.objects.create(
+                cliente=cliente, direccion='Calle 1', latitud=latitud,
+                longitud=None if latitud is None else Decimal('-66.15'), estado=estado, ruta=ruta,
+            )
+            if ruta is not None:
+                RutaParada.objects.create(
+                    ruta=ruta, pedido=pedido, secuencia=i,
+                    distancia_tramo=Decimal('1.2345') if i else None, eta=ahora + datetime.timedelta(minutes=i) if i else None,
+                )
+            for prod, cantidad, precio in detalles:
+                DetallePedido.objects.create(pedido=pedido, producto=prod, cantidad=cantidad, precio_unitario=precio)
+
+    def test_pedidos_igual_que_el_serializador(self):
+        queryset = pedidos_con_relaciones().order_by('id')
+        esperado = PedidoSerializer(queryset, many=True).data
+        obtenido = lectura_rapida.pedidos(lectura_rapida.filas_pedidos(queryset))
+        self.assertEqual(json.dumps(obtenido), json.dumps(esperado))
+        self.assertNotIn('conductor_asignado', obtenido[-1])
+
+    def test_pedidos_con_campos(self):
+        queryset = pedidos_con_relaciones().order_by('id')
+        for texto in ('id,estado,latitud,longitud', 'conductor_asignado,detalles.cantidad,detalles.precio_unitario'):
+            campos = arbol(texto)
+            esperado = PedidoSerializer(queryset, many=True, campos=campos).data
+            obtenido = lectura_rapida.pedidos(lectura_rapida.filas_pedidos(queryset, campos), campos)
+            self.assertEqual(json.dumps(obtenido), json.dumps(esperado))
+
+    def test_lista_paginada(self):
+        self.client.force_authenticate(self.usuario)
+        esperado = PedidoSerializer(pedidos_con_relaciones().order_by('pk'), many=True).data
+        recibidos, url = [], '/core/api/pedidos/?limite=2'
+        while url:
+            datos = self.client.get(url).json()
+            recibidos += datos['results']
+            url = datos['next']
+        self.assertEqual(json.dumps(recibidos), json.dumps(esperado))
+
+    def test_historial_y_mi_ruta(self):
+        self.client.force_authenticate(self.usuario)
+        entregados = pedidos_con_relaciones(Pedido.objects.filter(estado='entregado', ruta__conductor=self.conductor))
+        historial = self.client.get('/core/api/conductor/historial/').json()
+        self.assertEqual(historial, PedidoConductorSerializer(entregados.order_by('-id'), many=True).data)
+
+        paradas = (
+            RutaParada.objects.filter(ruta=self.ruta).exclude(pedido__estado='entregado')
+            .select_related('pedido__cliente').prefetch_related('pedido__detalles__producto').order_by('secuencia')
+        )
+        esperado = []
+        for parada in paradas:
+            fila = PedidoConductorSerializer(parada.pedido).data
+            datos_parada = RutaParadaSerializer(parada).data
+            fila.update({campo: datos_parada[campo] for campo in ('secuencia', 'distancia_tramo', 'eta')})
+            esperado.append(fila)
+        pedidos = self.client.get('/core/api/mi-ruta/').json()['pedidos']
+        self.assertEqual(len(pedidos), 2)
+        self.assertEqual(json.dumps(pedidos), json.dumps(esperado))
+
+
+# -----------------------------------------------------------------
+# ?fields= Y ?expand=
+# -----------------------------------------------------------------
+
+class CamposExpansionTests(APITestCase):
+
+    def setUp(self):
+        self.client.force_authenticate(User.objects.create_user('admin', password='x'))
+        self.conductor = Conductor.objects.create(nombre='Juan', licencia='L-1')
+        self.ruta = Ruta.objects.create(conductor=self.conductor, distancia=0, tiempo_estimado=0)
+        self.producto = Producto.objects.create(nombre='Leche', precio=8)
+        self.sembrados = 0
+        self.sembrar(3)
+
+    def sembrar(self, cantidad):
+        for _ in range(cantidad):
+            i = self.sembrados
+            self.sembrados += 1
+            cliente = Cliente.objects.create(nombre_cliente=f'Cliente {i}', direccion='-')
+            pedido = Pedido.objects.create(
+                cliente=cliente, direccion='-', latitud=-17.39, longitud=-66.15, estado='en_camino', ruta=self.ruta,
+            )
+            RutaParada.objects.create(ruta=self.ruta, pedido=pedido, secuencia=i)
+            DetallePedido.objects.create(pedido=pedido, producto=self.producto, cantidad=2, precio_unitario=8)
+
+    def consultar(self, url):
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(url)
+        self.assertEqual(respuesta.status_code, 200, respuesta.content)
+        datos = respuesta.json()
+        return datos.get('results', datos) if isinstance(datos, dict) else datos, consultas
+
+    def test_arbol(self):
+        self.assertEqual(arbol('id, detalles.cantidad,detalles.producto'),
+                         {'id': None, 'detalles': {'cantidad': None, 'producto': None}})
+        self.assertEqual(arbol('detalles,detalles.cantidad'), {'detalles': None})
+
+    def test_mapa_sin_joins_ni_detalles(self):
+        pedidos, consultas = self.consultar('/core/api/pedidos/?fields=id,estado,latitud,longitud,inexistente')
+        self.assertEqual(list(pedidos[0]), ['id', 'estado', 'latitud', 'longitud'])
+        self.assertEqual(len(consultas), 1)
+        self.assertNotIn('JOIN', consultas[0]['sql'])
+
+    def test_campos_anidados(self):
+        pedidos, consultas = self.consultar('/core/api/pedidos/?fields=id,detalles.cantidad')
+        self.assertEqual(pedidos[0], {'id': pedidos[0]['id'], 'detalles': [{'cantidad': 2}]})
+        self.assertEqual(len(consultas), 2)
+        self.assertNotIn('core_producto', consultas[1]['sql'])
+
+        pedido_id = pedidos[0]['id']
+        detalle, consultas = self.consultar(f'/core/api/pedidos/{pedido_id}/?fields=id,estado')
+        self.assertEqual(detalle, {'id': pedido_id, 'estado': 'en_camino'})
+        self.assertEqual(len(consultas), 1)
+
+    def test_expandir_sin_consultas_por_fila(self):
+        url = '/core/api/pedidos/?fields=id,cliente,detalles&expand=cliente,detalles.producto'
+        pedidos, pocas = self.consultar(url)
+        self.assertEqual(pedidos[0]['cliente']['nombre_cliente'], 'Cliente 0')
+        self.assertEqual(pedidos[0]['detalles'][0]['producto']['nombre'], 'Leche')
+        self.sembrar(10)
+        _, muchas = self.consultar(url)
+        self.assertEqual(len(pocas), len(muchas))
+
+        rutas, pocas = self.consultar('/core/api/rutas/?fields=id,conductor.nombre,paradas.pedido&expand=conductor,paradas.pedido')
+        self.assertEqual(rutas[0]['conductor'], {'nombre': 'Juan'})
+        self.assertEqual(rutas[0]['paradas'][0]['pedido']['nombre_cliente'], 'Cliente 0')
+        self.sembrar(10)
+        _, muchas = self.consultar('/core/api/rutas/?fields=id,conductor.nombre,paradas.pedido&expand=conductor,paradas.pedido')
+        self.assertEqual(len(pocas), len(muchas))
+
+    def test_escritura_ignora_campos(self):
+        pedido = Pedido.objects.first()
+        respuesta = self.client.patch(f'/core/api/pedidos/{pedido.id}/?fields=id', {'estado': 'pendiente'}, format='json')
+        self.assertEqual(respuesta.status_code, 200, respuesta.content)
+        self.assertIn('detalles', respuesta.json())
+
+
+# -----------------------------------------------------------------
+# PAGINACIÓN POR CURSOR Y FILTROS
+# -----------------------------------------------------------------
+
+class PaginacionFiltrosTests(APITestCase):
+
+    def setUp(self):
+        self.client.force_authenticate(User.objects.create_user('admin', password='x'))
+        self.cliente = Cliente.objects.create(nombre_cliente='Tienda', direccion='Calle', latitud=-17.39, longitud=-66.15)
+        conductor = Conductor.objects.create(nombre='Juan', licencia='L-1')
+        self.ruta = Ruta.objects.create(conductor=conductor, distancia=0, tiempo_estimado=0)
+        for i in range(25):
+            Pedido.objects.create(
+                cliente=self.cliente, direccion='Calle', latitud=-17.39 + i * 0.01, longitud=-66.15,
+                estado='en_camino' if i % 5 == 0 else 'pendiente',
+                ruta=self.ruta if i % 5 == 0 else None,
+            )
+
+    def recorrer(self, url):
+        ids = []
+        while url:
+            respuesta = self.client.get(url)
+            self.assertEqual(respuesta.status_code, 200, respuesta.content)
+            ids += [fila['id'] for fila in respuesta.data['results']]
+            url = respuesta.data['next']
+        return ids
+
+    def test_cursor_recorre_todo_sin_repetir(self):
+        ids = self.recorrer('/core/api/pedidos/?limite=10')
+        self.assertEqual(ids, list(Pedido.objects.order_by('id').values_list('id', flat=True)))
+
+    def test_orden_descendente(self):
+        ids = self.recorrer('/core/api/pedidos/?limite=7&orden=-id')
+        self.assertEqual(ids, sorted(ids, reverse=True))
+        self.assertEqual(len(ids), 25)
+
+    def test_orden_invalido(self):
+        self.assertEqual(self.client.get('/core/api/pedidos/?orden=cliente').status_code, 400)
+
+    def test_filtros_de_pedidos(self):
+        self.assertEqual(len(self.recorrer('/core/api/pedidos/?estado=en_camino')), 5)
+        self.assertEqual(len(self.recorrer(f'/core/api/pedidos/?ruta={self.ruta.id}')), 5)
+        self.assertEqual(len(self.recorrer('/core/api/pedidos/?sin_ruta=1&estado=pendiente,en_camino')), 20)
+        # Las primeras 5 latitudes: -17.39 a -17.35
+        self.assertEqual(len(self.recorrer('/core/api/pedidos/?caja=-17.395,-66.2,-17.345,-66.1')), 5)
+        self.assertEqual(self.client.get('/core/api/pedidos/?ruta=abc').status_code, 400)
+        self.assertEqual(self.client.get('/core/api/pedidos/?desde=ayer').status_code, 400)
+
+    def test_rango_de_fechas(self):
+        ayer = timezone.now() - datetime.timedelta(days=1)
+        Pedido.objects.filter(estado='en_camino').update(hora_entrega=ayer)
+        dia = timezone.localdate(ayer).isoformat()
+        self.assertEqual(len(self.recorrer(f'/core/api/pedidos/?desde={dia}&hasta={dia}')), 5)
+        self.assertEqual(len(self.recorrer('/core/api/pedidos/?orden=-hora_entrega')), 5)
+
+
+# -----------------------------------------------------------------
+# ANALÍTICA
+# -----------------------------------------------------------------
+
+class AnaliticaTests(APITestCase):
+
+    def test_resumen_dashboard(self):
+        ahora = timezone.now()
+        cliente = Cliente.objects.create(nombre_cliente='Tienda', direccion='Calle')
+        juan = Conductor.objects.create(nombre='Juan', licencia='L-1', estado='en_ruta')
+        Conductor.objects.create(nombre='Ana', licencia='L-2')
+        ruta = Ruta.objects.create(conductor=juan, distancia=0, tiempo_estimado=0)
+        producto = Producto.objects.create(nombre='Leche', precio=5)
+        Incidencia.objects.create(conductor=juan, tipo='retraso', descripcion='-')
+
+        def pedido(estado, hora_entrega=None):
+            p = Pedido.objects.create(cliente=cliente, direccion='-', estado=estado, ruta=ruta, hora_entrega=hora_entrega)
+            DetallePedido.objects.create(pedido=p, producto=producto, cantidad=2, precio_unitario=5)
+
+        pedido('pendiente')
+        pedido('pendiente')
+        pedido('en_camino')
+        pedido('entregado', ahora)
+        pedido('en_camino', ahora)
+        pedido('entregado', ahora - datetime.timedelta(days=400))
+
+        with self.assertNumQueries(6):
+            datos = resumen_dashboard(timezone.localdate(ahora))
+
+        self.assertEqual(datos['grafico_estados'], {'pendientes': 2, 'en_camino': 2, 'entregados_hoy': 1})
+        self.assertEqual(datos['kpis']['total_mes'], 2)
+        self.assertEqual(datos['kpis']['tasa_exito'], 50.0)
+        self.assertEqual(datos['kpis']['conductores_activos'], 1)
+        self.assertEqual(datos['kpis']['conductores_totales'], 2)
+        self.assertEqual(datos['kpis']['incidencias'], 1)
+        self.assertEqual(datos['grafico_dias']['data'], [2])
+        self.assertEqual(datos['top_conductores'][0], {'nombre': 'Juan', 'entregas': 2})
+        self.assertEqual(datos['top_productos'], [{'producto__nombre': 'Leche', 'total_vendido': 12}])
+
+
+# -----------------------------------------------------------------
+# ESTADÍSTICAS DIARIAS
+# -----------------------------------------------------------------
+# Lo que se mantiene por señales (y a mano en guardar_ruta) tiene que
+# coincidir siempre con recalcular todo desde cero.
+
+class EstadisticasDiariasTests(APITestCase):
+
+    def setUp(self):
+        self.ahora = timezone.now()
+        self.cliente = Cliente.objects.create(nombre_cliente='Tienda', direccion='Calle', latitud=-17.39, longitud=-66.15)
+        self.juan = Conductor.objects.create(nombre='Juan', licencia='L-1')
+        self.ana = Conductor.objects.create(nombre='Ana', licencia='L-2')
+        self.ruta = Ruta.objects.create(conductor=self.juan, distancia=0, tiempo_estimado=0)
+        self.leche = Producto.objects.create(nombre='Leche', precio=5)
+        self.pan = Producto.objects.create(nombre='Pan', precio=1)
+
+    def pedido(self, estado='pendiente', hora_entrega=None, ruta=None, cantidad=2):
+        p = Pedido.objects.create(
+            cliente=self.cliente, direccion='-', latitud=-17.39, longitud=-66.15,
+            estado=estado, ruta=ruta, hora_entrega=hora_entrega,
+        )
+        DetallePedido.objects.create(pedido=p, producto=self.leche, cantidad=cantidad, precio_unitario=5)
+        return p
+
+    def tablas(self):
+        """Contenido de las tres tablas, sin las filas que quedaron en cero."""
+        return (
+            {(f.fecha, f.estado): f.cantidad for f in EstadisticaPedidosDia.objects.exclude(cantidad=0)},
+            {(f.fecha, f.conductor_id): f.entregas for f in EstadisticaConductorDia.objects.exclude(entregas=0)},
+            {(f.fecha, f.producto_id): f.unidades for f in EstadisticaProductoDia.objects.exclude(unidades=0)},
+        )
+
+    def verificar_contra_reconstruccion(self):
+        incrementales = self.tablas()
+        reconstruir_estadisticas()
+        self.assertEqual(incrementales, self.tablas())
+
+    def test_altas_cambios_y_bajas(self):
+        entregado = self.pedido('entregado', self.ahora, self.ruta)
+        pendiente = self.pedido()
+        self.pedido('en_camino', self.ahora - datetime.timedelta(days=3), self.ruta, cantidad=5)
+
+        entregado.hora_entrega = self.ahora - datetime.timedelta(days=1)
+        entregado.save()
+        pendiente.estado, pendiente.ruta, pendiente.hora_entrega = 'entregado', self.ruta, self.ahora
+        pendiente.save()
+        detalle = pendiente.detalles.get()
+        detalle.cantidad, detalle.producto = 7, self.pan
+        detalle.save()
+        self.ruta.conductor = self.ana
+        self.ruta.save()
+        self.verificar_contra_reconstruccion()
+
+        self.assertEqual(EstadisticaConductorDia.objects.filter(conductor=self.ana).aggregate(n=Sum('entregas'))['n'], 2)
+        self.assertEqual(EstadisticaProductoDia.objects.get(producto=self.pan).unidades, 7)
+
+        entregado.delete()
+        pendiente.detalles.all().delete()
+        self.verificar_contra_reconstruccion()
+        Ruta.objects.get(pk=self.ruta.pk).delete()
+        self.verificar_contra_reconstruccion()
+
+    def test_filas_sin_fecha(self):
+        # Los pedidos sin hora_entrega van a la fila con fecha NULL: una sola por estado y producto
+        self.pedido()
+        self.pedido(cantidad=3)
+        self.assertEqual(EstadisticaPedidosDia.objects.get(fecha=None, estado='pendiente').cantidad, 2)
+        self.assertEqual(EstadisticaProductoDia.objects.get(fecha=None, producto=self.leche).unidades, 5)
+        self.verificar_contra_reconstruccion()
+
+        # Un segundo INSERT sin fecha choca como uno con fecha (y _sumar cae en el UPDATE)
+        for modelo, campos in (
+            (EstadisticaPedidosDia, {'estado': 'pendiente'}),
+            (EstadisticaConductorDia, {'conductor': self.juan}),
+            (EstadisticaProductoDia, {'producto': self.leche}),
+        ):
+            modelo.objects.get_or_create(fecha=None, **campos)
+            with self.assertRaises(IntegrityError), transaction.atomic():
+                modelo.objects.create(fecha=None, **campos)
+
+    def test_guardar_ruta(self):
+        pedidos = [self.pedido() for _ in range(3)]
+        guardar_ruta(self.juan, pedidos)
+        self.assertEqual(self.tablas()[0], {(None, 'en_camino'): 3})
+        self.verificar_contra_reconstruccion()
+
+    def test_guardar_solo_algunos_campos(self):
+        # La foto de después sale de la instancia: lo que no se escribe cuenta como estaba
+        pedido = self.pedido('en_camino', ruta=self.ruta)
+        pedido.estado, pedido.direccion = 'entregado', 'Otra calle'
+        pedido.save(update_fields=['direccion'])
+        self.verificar_contra_reconstruccion()
+        pedido.hora_entrega = self.ahora - datetime.timedelta(days=1)
+        pedido.save(update_fields=['estado', 'hora_entrega'])
+        self.verificar_contra_reconstruccion()
+        self.assertEqual(EstadisticaConductorDia.objects.get(conductor=self.juan).entregas, 1)
+
+
+class MigracionEstadisticasTests(PruebaMigracion):
+    """0013 y 0018 calculan las tablas desde los pedidos con los modelos históricos."""
+
+    def sembrar(self, apps):
+        juan = apps.get_model('core', 'Conductor').objects.create(nombre='Juan', licencia='L-1')
+        ruta = apps.get_model('core', 'Ruta').objects.create(conductor=juan, distancia=0, tiempo_estimado=0)
+        cliente = apps.get_model('core', 'Cliente').objects.create(nombre_cliente='Tienda', direccion='-')
+        leche = apps.get_model('core', 'Producto').objects.create(nombre='Leche', precio=5)
+        Pedido, Detalle = apps.get_model('core', 'Pedido'), apps.get_model('core', 'DetallePedido')
+        ahora = timezone.now()
+        for estado, hora, cantidad in (('entregado', ahora, 2), ('pendiente', None, 3), ('pendiente', None, 1)):
+            pedido = Pedido.objects.create(
+                cliente=cliente, direccion='-', estado=estado, hora_entrega=hora,
+                ruta=ruta if estado == 'entregado' else None,
+            )
+            Detalle.objects.create(pedido=pedido, producto=leche, cantidad=cantidad, precio_unitario=5)
+        return juan, leche, timezone.localdate(ahora)
+
+    def tablas(self, apps):
+        return (
+            set(apps.get_model('core', 'EstadisticaPedidosDia').objects.values_list('fecha', 'estado', 'cantidad')),
+            set(apps.get_model('core', 'EstadisticaConductorDia').objects.values_list('fecha', 'conductor_id', 'entregas')),
+            set(apps.get_model('core', 'EstadisticaProductoDia').objects.values_list('fecha', 'producto_id', 'unidades')),
+        )
+
+    def test_0013_llena_las_tablas(self):
+        juan, leche, hoy = self.sembrar(self.migrar('0012_indices_pedido_ruta'))
+        apps = self.migrar('0013_estadisticas_diarias')
+        self.assertEqual(self.tablas(apps), (
+            {(hoy, 'entregado', 1), (None, 'pendiente', 2)},
+            {(hoy, juan.id, 1)},
+            {(hoy, leche.id, 2), (None, leche.id, 4)},
+        ))
+
+    def test_0018_junta_las_filas_sin_fecha_repetidas(self):
+        apps = self.migrar('0017_tarea')
+        hoy = self.sembrar(apps)[2]
+        # Sin la restricción, dos filas sin fecha del mismo estado podían convivir
+        PedidosDia = apps.get_model('core', 'EstadisticaPedidosDia')
+        PedidosDia.objects.bulk_create([PedidosDia(fecha=None, estado='pendiente', cantidad=2) for _ in range(2)])
+
+        apps = self.migrar('0018_estadisticas_sin_fecha_unicas')
+        self.assertEqual(self.tablas(apps)[0], {(hoy, 'entregado', 1), (None, 'pendiente', 2)})
+
+
+# -----------------------------------------------------------------
+# CACHÉ DE RESPUESTAS
+# -----------------------------------------------------------------
+
+class CacheRespuestasTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        reiniciar_contadores()
+        self.client.force_authenticate(User.objects.create_user('admin', password='x'))
+        self.categoria = Categoria.objects.create(nombre='Lácteos')
+        Producto.objects.create(nombre='Leche', precio=5, categoria=self.categoria)
+
+    def test_acierto_invalidacion_y_etag(self):
+        primera = self.client.get('/core/api/productos/')
+        self.assertEqual(primera['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            segunda = self.client.get('/core/api/productos/')
+        self.assertEqual(segunda['X-Cache'], 'HIT')
+        self.assertEqual(segunda.json(), primera.json())
+
+        no_modificada = self.client.get('/core/api/productos/', HTTP_IF_NONE_MATCH=primera['ETag'])
+        self.assertEqual(no_modificada.status_code, 304)
+        self.assertEqual(no_modificada.content, b'')
+
+        # Borrar la categoría cambia productos.categoria sin pasar por Producto.save()
+        self.categoria.delete()
+        tercera = self.client.get('/core/api/productos/', HTTP_IF_NONE_MATCH=primera['ETag'])
+        self.assertEqual(tercera.status_code, 200)
+        self.assertEqual(tercera['X-Cache'], 'MISS')
+        self.assertIsNone(tercera.json()['results'][0]['categoria'])
+
+        self.assertEqual(
+            self.client.get('/core/api/cache/').json()['productos'],
+            {'aciertos': 2, 'fallos': 2, 'no_modificados': 1},
+        )
+
+    def test_reportes_tras_guardar_ruta(self):
+        cliente = Cliente.objects.create(nombre_cliente='Tienda', direccion='Calle', latitud=-17.39, longitud=-66.15)
+        pedido = Pedido.objects.create(cliente=cliente, direccion='-', latitud=-17.39, longitud=-66.15)
+        conductor = Conductor.objects.create(nombre='Juan', licencia='L-1')
+
+        antes = self.client.get('/core/api/reportes/').json()
+        self.assertEqual(self.client.get('/core/api/reportes/')['X-Cache'], 'HIT')
+        guardar_ruta(conductor, [pedido])
+        despues = self.client.get('/core/api/reportes/')
+        self.assertEqual(despues['X-Cache'], 'MISS')
+        self.assertEqual(antes['grafico_estados']['en_camino'], 0)
+        self.assertEqual(despues.json()['grafico_estados']['en_camino'], 1)
+        self.assertEqual(despues.json()['kpis']['conductores_activos'], 1)
+
+
+# -----------------------------------------------------------------
+# CACHÉ DE MI-RUTA
+# -----------------------------------------------------------------
+
+class MiRutaCacheTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        usuario = User.objects.create_user('chofer', password='x')
+        self.conductor = Conductor.objects.create(user=usuario, nombre='Juan', licencia='L-1')
+        self.ruta = Ruta.objects.create(conductor=self.conductor, distancia=0, tiempo_estimado=0)
+        producto = Producto.objects.create(nombre='Leche', precio=5)
+        self.clientes, self.pedidos = [], []
+        for i in range(3):
+            cliente = Cliente.objects.create(nombre_cliente=f'Cliente {i}', direccion='Calle', latitud=-17.39, longitud=-66.15)
+            pedido = Pedido.objects.create(
+                cliente=cliente, direccion='-', latitud=-17.39, longitud=-66.15, estado='en_camino', ruta=self.ruta,
+            )
+            RutaParada.objects.create(ruta=self.ruta, pedido=pedido, secuencia=i + 1)
+            DetallePedido.objects.create(pedido=pedido, producto=producto, cantidad=1, precio_unitario=5)
+            self.clientes.append(cliente)
+            self.pedidos.append(pedido)
+        self.client.force_authenticate(usuario)
+
+    def pedir(self, since=None):
+        respuesta = self.client.get('/core/api/mi-ruta/', {'since': since} if since else {})
+        self.assertEqual(respuesta.status_code, 200, respuesta.content)
+        return respuesta.json()
+
+    def test_cache_y_diferencias(self):
+        completa = self.pedir()
+        self.assertTrue(completa['completa'])
+        self.assertEqual([p['id'] for p in completa['pedidos']], [p.id for p in self.pedidos])
+
+        # Sin cambios sólo se busca la ruta actual (el conductor ya viene con el usuario)
+        with self.assertNumQueries(1):
+            igual = self.pedir(completa['version'])
+        self.assertEqual((igual['version'], igual['cambiados'], igual['quitados']), (completa['version'], [], []))
+
+        self.client.patch(f'/core/api/pedidos/{self.pedidos[0].id}/', {'estado': 'entregado'})
+        tras_entrega = self.pedir(completa['version'])
+        self.assertFalse(tras_entrega['completa'])
+        self.assertEqual((tras_entrega['cambiados'], tras_entrega['quitados']), ([], [self.pedidos[0].id]))
+
+        self.clientes[2].telefono = '70000000'
+        self.clientes[2].save()
+        tras_cliente = self.pedir(tras_entrega['version'])
+        self.assertEqual([p['id'] for p in tras_cliente['cambiados']], [self.pedidos[2].id])
+        self.assertEqual(tras_cliente['cambiados'][0]['telefono_cliente'], '70000000')
+        self.assertEqual(tras_cliente['quitados'], [])
+
+        # Desde la primera versión se acumulan los dos cambios
+        acumulado = self.pedir(completa['version'])
+        self.assertEqual(([p['id'] for p in acumulado['cambiados']], acumulado['quitados']), ([self.pedidos[2].id], [self.pedidos[0].id]))
+
+        # Una versión de otra ruta (o mal escrita) devuelve la lista completa
+        self.assertTrue(self.pedir(f'{self.ruta.id + 1}:1')['completa'])
+        self.assertTrue(self.pedir('basura')['completa'])
+
+    def test_guardar_ruta_invalida(self):
+        version = self.pedir()['version']
+        cliente = Cliente.objects.create(nombre_cliente='Nuevo', direccion='Calle', latitud=-17.38, longitud=-66.14)
+        nuevo = Pedido.objects.create(cliente=cliente, direccion='-', latitud=-17.38, longitud=-66.14)
+        guardar_ruta(self.conductor, self.pedidos + [nuevo], ruta_activa=self.ruta)
+        cambios = self.pedir(version)
+        self.assertIn(nuevo.id, [p['id'] for p in cambios['cambiados']])
+
+
+# -----------------------------------------------------------------
+# PENDIENTES POR RUTA
+# -----------------------------------------------------------------
+
+class PendientesRutaTests(APITestCase):
+
+    def setUp(self):
+        self.client.force_authenticate(User.objects.create_user('admin', password='x'))
+        self.conductor = Conductor.objects.create(nombre='Juan', licencia='L-1')
+        cliente = Cliente.objects.create(nombre_cliente='Tienda', direccion='Calle', latitud=-17.39, longitud=-66.15)
+        self.pedidos = [
+            Pedido.objects.create(cliente=cliente, direccion='-', latitud=-17.39 + i * 0.01, longitud=-66.15)
+            for i in range(3)
+        ]
+
+    def ruta(self, ruta):
+        ruta.refresh_from_db()
+        return ruta.pendientes, ruta.activa
+
+    def test_contador_y_liberar_conductor(self):
+        ruta, _ = guardar_ruta(self.conductor, self.pedidos[:2])
+        self.assertEqual(self.ruta(ruta), (2, True))
+        self.assertEqual(ruta_activa_de(self.conductor), ruta)
+
+        self.client.patch(f'/core/api/pedidos/{self.pedidos[0].id}/', {'estado': 'entregado'})
+        self.assertEqual(self.ruta(ruta), (1, True))
+        self.conductor.refresh_from_db()
+        self.assertEqual(self.conductor.estado, 'en_ruta')
+
+        self.client.patch(f'/core/api/pedidos/{self.pedidos[1].id}/', {'estado': 'entregado'})
+        self.assertEqual(self.ruta(ruta), (0, False))
+        self.assertIsNone(ruta_activa_de(self.conductor))
+        self.conductor.refresh_from_db()
+        self.assertEqual(self.conductor.estado, 'disponible')
+
+    def test_coincide_con_recalcular(self):
+        ruta, _ = guardar_ruta(self.conductor, self.pedidos[:2])
+        otra = Ruta.objects.create(conductor=self.conductor, distancia=0, tiempo_estimado=0)
+        movido = self.pedidos[1]
+        movido.ruta = otra
+        movido.save()
+        self.pedidos[2].ruta = otra
+        self.pedidos[2].save()
+        self.pedidos[0].delete()
+
+        incrementales = {r.id: (r.pendientes, r.activa) for r in Ruta.objects.all()}
+        reconstruir_pendientes()
+        self.assertEqual(incrementales, {r.id: (r.pendientes, r.activa) for r in Ruta.objects.all()})
+        self.assertEqual(incrementales, {ruta.id: (0, False), otra.id: (2, True)})
+
+
+class MigracionPendientesTests(PruebaMigracion):
+
+    def test_0014_cuenta_los_pendientes_de_cada_ruta(self):
+        apps = self.migrar('0013_estadisticas_diarias')
+        Ruta, Pedido = apps.get_model('core', 'Ruta'), apps.get_model('core', 'Pedido')
+        cliente = apps.get_model('core', 'Cliente').objects.create(nombre_cliente='Tienda', direccion='-')
+        en_curso, terminada, vacia = (Ruta.objects.create(distancia=0, tiempo_estimado=0) for _ in range(3))
+        pedidos = [(en_curso, 'en_camino'), (en_curso, 'entregado'), (en_curso, 'pendiente'), (terminada, 'entregado')]
+        for ruta, estado in pedidos:
+            Pedido.objects.create(cliente=cliente, direccion='-', ruta=ruta, estado=estado)
+
+        apps = self.migrar('0014_ruta_pendientes')
+        contadores = {r.id: (r.pendientes, r.activa) for r in apps.get_model('core', 'Ruta').objects.all()}
+        self.assertEqual(contadores, {en_curso.id: (2, True), terminada.id: (0, False), vacia.id: (0, False)})
+
+class AsignacionRutaTests(APITestCase):
+
+    def setUp(self):
+        self.client.force_authenticate(User.objects.create_user('admin', password='x'))
+        self.juan = Conductor.objects.create(nombre='Juan', licencia='L-1')
+        self.ana = Conductor.objects.create(nombre='Ana', licencia='L-2')
+        cliente = Cliente.objects.create(nombre_cliente='Tienda', direccion='Calle', latitud=-17.39, longitud=-66.15)
+        self.pedidos = [
+            Pedido.objects.create(cliente=cliente, direccion='-', latitud=-17.39 + i * 0.01, longitud=-66.15)
+            for i in range(3)
+        ]
+
+    def asignar(self, conductor, pedidos, **extra):
+        return self.client.post(
+            '/core/api/logistica/asignar-ruta/',
+            {'conductor_id': conductor.id, 'pedido_ids': [p.id for p in pedidos], **extra}, format='json',
+        )
+
+    def test_asignacion_concurrente_da_409_y_no_guarda_nada(self):
+        ordenar = despacho.ordenar_pedidos
+
+        def ana_se_adelanta(pedidos, origen):
+            # Otro despachador toma un pedido mientras se optimiza la ruta de Juan
+            guardar_ruta(self.ana, [Pedido.objects.get(pk=self.pedidos[1].pk)])
+            return ordenar(pedidos, origen)
+
+        with mock.patch.object(despacho, 'ordenar_pedidos', ana_se_adelanta):
+            respuesta = self.asignar(self.juan, self.pedidos[:2])
+        self.assertEqual(respuesta.status_code, 409)
+
+        self.assertFalse(Ruta.objects.filter(conductor=self.juan).exists())
+        self.assertFalse(RutaParada.objects.filter(pedido=self.pedidos[0]).exists())
+        libre, tomado = Pedido.objects.get(pk=self.pedidos[0].pk), Pedido.objects.get(pk=self.pedidos[1].pk)
+        self.assertEqual((libre.ruta_id, libre.estado), (None, 'pendiente'))
+        self.assertEqual(tomado.ruta.conductor, self.ana)
+        self.juan.refresh_from_db()
+        self.assertEqual(self.juan.estado, 'disponible')
+        self.assertEqual(EstadisticaPedidosDia.objects.get(fecha=None, estado='pendiente').cantidad, 2)
+
+    def test_reasignar_es_explicito(self):
+        self.assertEqual(self.asignar(self.ana, self.pedidos[:2]).status_code, 201)
+        de_ana = Ruta.objects.get(conductor=self.ana)
+
+        respuesta = self.asignar(self.juan, self.pedidos[:1])
+        self.assertEqual(respuesta.status_code, 409)
+        self.assertEqual(respuesta.data['pedido_ids'], [self.pedidos[0].id])
+
+        respuesta = self.asignar(self.juan, self.pedidos[:1], reasignar=True)
+        self.assertEqual(respuesta.status_code, 201)
+        de_juan = Ruta.objects.get(pk=respuesta.data['ruta_id'])
+        self.assertEqual(de_juan.conductor, self.juan)
+        self.assertEqual(list(de_juan.paradas.values_list('pedido_id', flat=True)), [self.pedidos[0].id])
+        self.assertEqual(list(de_ana.paradas.values_list('pedido_id', flat=True)), [self.pedidos[1].id])
+        incrementales = {r.id: (r.pendientes, r.activa) for r in Ruta.objects.all()}
+        reconstruir_pendientes()
+        self.assertEqual(incrementales, {de_ana.id: (1, True), de_juan.id: (1, True)})
+        self.assertEqual(incrementales, {r.id: (r.pendientes, r.activa) for r in Ruta.objects.all()})
+
+        # Ya está en la ruta en curso de Juan: no cambia nada
+        respuesta = self.asignar(self.juan, self.pedidos[:1], reasignar=True)
+        self.assertEqual(respuesta.status_code, 201)
+        self.assertEqual(respuesta.data['ruta_id'], de_juan.id)
+
+        # Uno entregado no se reasigna
+        self.client.patch(f'/core/api/pedidos/{self.pedidos[1].id}/', {'estado': 'entregado'})
+        respuesta = self.asignar(self.juan, self.pedidos[1:2], reasignar=True)
+        self.assertEqual(respuesta.status_code, 409)
+        self.assertEqual(Pedido.objects.get(pk=self.pedidos[1].pk).ruta, de_ana)
+
+    def test_reasignar_toda_la_ruta_libera_al_conductor(self):
+        self.assertEqual(self.asignar(self.ana, self.pedidos[:2]).status_code, 201)
+        de_ana = Ruta.objects.get(conductor=self.ana)
+
+        # Le quitan un pedido: la ruta sigue en curso y Ana sigue ocupada
+        self.assertEqual(self.asignar(self.juan, self.pedidos[:1], reasignar=True).status_code, 201)
+        self.ana.refresh_from_db()
+        self.assertEqual(self.ana.estado, 'en_ruta')
+
+        # Le quitan el último: la ruta se vacía y Ana queda disponible
+        self.assertEqual(self.asignar(self.juan, self.pedidos[1:2], reasignar=True).status_code, 201)
+        de_ana.refresh_from_db()
+        self.assertEqual((de_ana.pendientes, de_ana.activa), (0, False))
+        self.ana.refresh_from_db()
+        self.juan.refresh_from_db()
+        self.assertEqual((self.ana.estado, self.juan.estado), ('disponible', 'en_ruta'))
+        self.assertEqual(Conductor.objects.filter(estado='disponible').get(), self.ana)
+
+
+# -----------------------------------------------------------------
+# EVENTOS EN VIVO
+# -----------------------------------------------------------------
+
+class EventosTests(APITestCase):
+
+    def setUp(self):
+        self.conductor = Conductor.objects.create(
+            user=User.objects.create_user('chofer', password='x'), nombre='Juan', licencia='L-1'
+        )
+        self.otro = Conductor.objects.create(nombre='Ana', licencia='L-2')
+        self.token_conductor = Token.objects.create(user=self.conductor.user).key
+        self.token_despacho = Token.objects.create(user=User.objects.create_user('admin', password='x')).key
+
+    def test_publica_al_confirmar(self):
+        desde = canal().ultimo_id()
+        cliente = Cliente.objects.create(nombre_cliente='Tienda', direccion='Calle', latitud=-17.39, longitud=-66.15)
+        with self.captureOnCommitCallbacks(execute=True):
+            pedido = Pedido.objects.create(cliente=cliente, direccion='-', latitud=-17.39, longitud=-66.15)
+        with self.captureOnCommitCallbacks(execute=True):
+            ruta, _ = guardar_ruta(self.conductor, [pedido])
+        with self.captureOnCommitCallbacks(execute=True):
+            Incidencia.objects.create(conductor=self.otro, tipo='retraso', descripcion='-')
+
+        self.assertEqual([e.tipo for e in canal().desde(desde)], ['pedido', 'ruta', 'incidencia'])
+        # El conductor sólo ve lo de sus rutas
+        propios = canal().desde(desde, self.conductor.id)
+        self.assertEqual([(e.tipo, e.datos['id']) for e in propios], [('ruta', ruta.id)])
+
+    def test_requiere_asgi(self):
+        self.assertEqual(self.client.get(f'/core/api/eventos/?token={self.token_despacho}').status_code, 503)
+
+    async def test_transmision(self):
+        cliente = AsyncClient()
+        self.assertEqual((await cliente.get('/core/api/eventos/?token=malo')).status_code, 401)
+
+        respuesta = await cliente.get(f'/core/api/eventos/?token={self.token_conductor}')
+        self.assertEqual(respuesta['Content-Type'], 'text/event-stream')
+        flujo = aiter(respuesta.streaming_content)
+        leer = lambda: asyncio.wait_for(anext(flujo), 5)
+        self.assertEqual(await leer(), b'retry: 3000\n\n')
+
+        canal().publicar('incidencia', {'id': 1}, self.otro.id)
+        visto = canal().publicar('pedido', {'id': 2, 'estado': 'entregado'}, self.conductor.id)
+        self.assertEqual(
+            await leer(),
+            f'id: {visto.id}\nevent: pedido\ndata: {{"id": 2, "estado": "entregado"}}\n\n'.encode(),
+        )
+
+        # Al reconectar con Last-Event-ID se reenvía lo que se perdió
+        perdido = canal().publicar('pedido', {'id': 3, 'estado': 'en_camino'}, self.conductor.id)
+        reconexion = await cliente.get(
+            f'/core/api/eventos/?token={self.token_conductor}', headers={'Last-Event-ID': str(visto.id)}
+        )
+        flujo = aiter(reconexion.streaming_content)
+        await leer()
+        self.assertTrue((await leer()).startswith(f'id: {perdido.id}\n'.encode()))
+
+
+# -----------------------------------------------------------------
+# TELEMETRÍA GPS
+# -----------------------------------------------------------------
+
+class TelemetriaTests(APITestCase):
+
+    def setUp(self):
+        posiciones_conductores.reiniciar()
+        self.conductor = Conductor.objects.create(
+            user=User.objects.create_user('chofer', password='x'), nombre='Juan', licencia='L-1'
+        )
+        self.client.force_authenticate(self.conductor.user)
+
+    def muestra(self, segundos_atras, lat, lng=-66.157):
+        momento = timezone.now() - datetime.timedelta(seconds=segundos_atras)
+        return {'lat': lat, 'lng': lng, 't': int(momento.timestamp() * 1000)}
+
+    def test_ingesta_descarta_muestras_repetidas(self):
+        muestras = [
+            self.muestra(60, -17.400),
+            self.muestra(58, -17.40001),  # 2 s después y a un metro: se descarta
+            self.muestra(50, -17.40002),  # quieto pero pasaron 10 s
+            self.muestra(48, -17.410),    # 2 s después pero a más de 1 km
+        ]
+        respuesta = self.client.post('/core/api/conductor/telemetria/', {'muestras': muestras}, format='json')
+        self.assertEqual(respuesta.status_code, 202)
+        self.assertEqual(respuesta.data, {'guardadas': 3, 'descartadas': 1})
+        self.assertEqual(PosicionConductor.objects.filter(conductor_id=self.conductor.id).count(), 3)
+
+        # Lo que llega con fecha anterior a lo ya guardado no se vuelve a guardar
+        respuesta = self.client.post('/core/api/conductor/telemetria/', {'muestras': muestras[:1]}, format='json')
+        self.assertEqual(respuesta.data, {'guardadas': 0, 'descartadas': 1})
+        self.assertEqual(posiciones_conductores.vigente(self.conductor.id), (-17.41, -66.157))
+
+    def test_muestras_invalidas(self):
+        for muestras in ([{'lat': 'x', 'lng': 0, 't': 0}], [self.muestra(0, 95)], 'nada'):
+            respuesta = self.client.post('/core/api/conductor/telemetria/', {'muestras': muestras}, format='json')
+            self.assertEqual(respuesta.status_code, 400)
+        self.assertFalse(PosicionConductor.objects.exists())
+
+        self.client.force_authenticate(User.objects.create_user('admin', password='x'))
+        respuesta = self.client.post('/core/api/conductor/telemetria/', {'muestras': []}, format='json')
+        self.assertEqual(respuesta.status_code, 403)
+
+    def test_posiciones_y_ultima_desde_la_base(self):
+        otro = Conductor.objects.create(nombre='Ana', licencia='L-2')
+        ahora = timezone.now()
+        PosicionConductor.objects.bulk_create([
+            PosicionConductor(conductor_id=self.conductor.id, momento=ahora - datetime.timedelta(minutes=2),
+                              latitud_e6=-17400000, longitud_e6=-66157000),
+            PosicionConductor(conductor_id=self.conductor.id, momento=ahora - datetime.timedelta(minutes=1),
+                              latitud_e6=-17410000, longitud_e6=-66157000),
+            # Demasiado vieja para el mapa
+            PosicionConductor(conductor_id=otro.id, momento=ahora - datetime.timedelta(hours=1),
+                              latitud_e6=-17300000, longitud_e6=-66100000),
+        ])
+        respuesta = self.client.get('/core/api/logistica/posiciones/')
+        self.assertEqual(
+            [(fila['conductor_id'], fila['lat'], fila['lng']) for fila in respuesta.data],
+            [(self.conductor.id, -17.41, -66.157)],
+        )
+        # Sin nada en memoria, la última posición sale de la base
+        self.assertEqual(posiciones_conductores.vigente(self.conductor.id), (-17.41, -66.157))
+        self.assertIsNone(posiciones_conductores.vigente(otro.id))
+        self.assertEqual(posiciones_conductores.ultima(otro.id).latitud, -17.3)
+
+    def test_depurar(self):
+        ahora = timezone.now().replace(second=0, microsecond=0)
+        momentos = (
+            [ahora - datetime.timedelta(days=40)]
+            + [ahora - datetime.timedelta(days=5) + datetime.timedelta(seconds=s) for s in (0, 10, 20)]
+            + [ahora - datetime.timedelta(hours=1, seconds=s) for s in (0, 10, 20)]
+        )
+        PosicionConductor.objects.bulk_create([
+            PosicionConductor(conductor_id=self.conductor.id, momento=m, latitud_e6=0, longitud_e6=0)
+            for m in momentos
+        ])
+        # La más vieja se borra; de las de hace 5 días queda una por minuto
+        self.assertEqual(depurar(ahora), (1, 2))
+        self.assertEqual(PosicionConductor.objects.count(), 4)
+
+    def test_la_ruta_parte_de_la_posicion_del_conductor(self):
+        cliente = Cliente.objects.create(nombre_cliente='Tienda', direccion='Calle', latitud=-17.39, longitud=-66.15)
+        cerca_planta = Pedido.objects.create(cliente=cliente, direccion='-', latitud=-17.40, longitud=-66.157)
+        lejos = Pedido.objects.create(cliente=cliente, direccion='-', latitud=-17.50, longitud=-66.157)
+
+        self.client.post('/core/api/conductor/telemetria/', {'muestras': [self.muestra(5, -17.51)]}, format='json')
+        ruta, _ = asignar_a_conductor(self.conductor, [cerca_planta, lejos])
+        self.assertEqual(list(ruta.paradas.order_by('secuencia').values_list('pedido_id', flat=True)),
+                         [lejos.id, cerca_planta.id])
+        # mi-ruta muestra el origen desde el que se ordenó, no la planta
+        self.assertEqual(self.client.get('/core/api/mi-ruta/').data['origen'], {'lat': -17.51, 'lng': -66.157})
+
+        # Sin GPS reciente, un pedido nuevo se inserta desde la planta (no hay entregas)
+        posiciones_conductores.reiniciar()
+        PosicionConductor.objects.all().delete()
+        nuevo = Pedido.objects.create(cliente=cliente, direccion='-', latitud=-17.45, longitud=-66.157)
+        asignar_a_conductor(self.conductor, [nuevo])
+        self.assertEqual(
+            self.client.get('/core/api/mi-ruta/').data['origen'], {'lat': ORIGEN_POR_DEFECTO[0], 'lng': ORIGEN_POR_DEFECTO[1]},
+        )
+
+    def test_la_base_de_telemetria_solo_migra_su_tabla(self):
+        router = RouterTelemetria()
+        with self.settings(TELEMETRIA={'BASE': 'telemetria'}):
+            self.assertTrue(router.allow_migrate('telemetria', 'core', model_name='posicionconductor'))
+            self.assertFalse(router.allow_migrate('default', 'core', model_name='posicionconductor'))
+            # Ni las otras tablas ni los RunPython (sin model_name) corren en ella
+            self.assertFalse(router.allow_migrate('telemetria', 'core', model_name='pedido'))
+            self.assertFalse(router.allow_migrate('telemetria', 'core'))
+            self.assertIsNone(router.allow_migrate('default', 'core'))
+
+
+# -----------------------------------------------------------------
+# VARIANTES DE IMÁGENES
+# -----------------------------------------------------------------
+
+class VariantesImagenTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        ajustes = override_settings(MEDIA_ROOT=media)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.client.force_authenticate(User.objects.create_user('admin', password='x'))
+
+    def imagen(self, nombre='leche.jpg', color='blue', tamano=(1200, 800)):
+        contenido = io.BytesIO()
+        Image.new('RGB', tamano, color).save(contenido, 'JPEG')
+        return SimpleUploadedFile(nombre, contenido.getvalue(), content_type='image/jpeg')
+
+    def crear(self, **campos):
+        # Sin cola (el valor por defecto) las variantes se generan al confirmar
+        with self.captureOnCommitCallbacks(execute=True):
+            return Producto.objects.create(nombre='Leche', precio=10, **campos)
+
+    def test_genera_variantes_al_subir(self):
+        producto = self.crear(imagen=self.imagen())
+        producto.refresh_from_db()
+        self.assertEqual(producto.variantes['origen'], producto.imagen.name)
+        for tamano, lado in (('thumb', 200), ('medium', 600)):
+            for formato in ('webp', 'jpeg'):
+                with default_storage.open(producto.variantes[tamano][formato]) as archivo:
+                    variante = Image.open(archivo)
+                    self.assertEqual((variante.format.lower(), max(variante.size)), (formato, lado))
+
+        respuesta = self.client.get('/core/api/productos/')
+        imagenes = respuesta.data['results'][0]['imagenes']
+        self.assertTrue(imagenes['thumb']['webp'].startswith('http://testserver/media/productos/variantes/'))
+        self.assertNotIn('variantes', respuesta.data['results'][0])
+
+        servida = self.client.get(imagenes['thumb']['webp'].removeprefix('http://testserver'))
+        self.assertEqual(servida.status_code, 200)
+        self.assertIn('immutable', servida['Cache-Control'])
+
+    def test_cambiar_o_quitar_la_imagen(self):
+        producto = self.crear(imagen=self.imagen())
+        producto.refresh_from_db()
+        anteriores = producto.variantes
+
+        # La misma foto en otro producto reutiliza los archivos
+        otro = self.crear(imagen=self.imagen('otra.jpg'))
+        otro.refresh_from_db()
+        self.assertEqual(otro.variantes['thumb'], anteriores['thumb'])
+
+        producto.imagen = self.imagen(color='red')
+        with self.captureOnCommitCallbacks(execute=True):
+            producto.save()
+        producto.refresh_from_db()
+        self.assertNotEqual(producto.variantes['thumb']['webp'], anteriores['thumb']['webp'])
+
+        producto.imagen = None
+        producto.save()
+        producto.refresh_from_db()
+        self.assertEqual(producto.variantes, {})
+        self.assertIsNone(self.client.get(f'/core/api/productos/{producto.id}/').data['imagenes'])
+
+
+# -----------------------------------------------------------------
+# COLA DE TAREAS
+# -----------------------------------------------------------------
+
+fallos_prueba = []
+
+
+@tarea('prueba_falla', max_intentos=2)
+def tarea_que_falla(veces):
+    fallos_prueba.append(veces)
+    if len(fallos_prueba) <= veces:
+        raise RuntimeError("falla temporal")
+    return {"intentos": len(fallos_prueba)}
+
+
+@tarea('prueba_definitiva')
+def tarea_definitiva():
+    raise ErrorTarea("No hay nada que hacer.", detalle=1)
+
+
+class CanalCompartido(CanalLocal):
+    """Hace de canal compartido entre procesos (p. ej. uno respaldado por Redis)."""
+    compartido = True
+
+
+class ColaTareasTests(APITestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # La cola sólo se activa con caché y canal de eventos compartidos entre procesos
+        carpeta = cls.enterClassContext(tempfile.TemporaryDirectory())
+        cls.enterClassContext(override_settings(
+            TAREAS={'ACTIVA': True},
+            CACHES={'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': carpeta}},
+            EVENTOS={'CANAL': 'apps.core.tests.CanalCompartido'},
+        ))
+
+    def setUp(self):
+        canal.cache_clear()
+        self.addCleanup(canal.cache_clear)
+        cache.clear()
+        fallos_prueba.clear()
+        self.client.force_authenticate(User.objects.create_user('admin', password='x'))
+        self.conductor = Conductor.objects.create(nombre='Juan', licencia='L-1')
+        cliente = Cliente.objects.create(nombre_cliente='Tienda', direccion='Calle', latitud=-17.39, longitud=-66.15)
+        self.pedidos = [
+            Pedido.objects.create(cliente=cliente, direccion='-', latitud=-17.39 - i / 100, longitud=-66.15)
+            for i in range(3)
+        ]
+
+    def test_asignar_ruta_devuelve_la_tarea(self):
+        pedido_ids = [p.id for p in self.pedidos]
+        respuesta = self.client.post(
+            '/core/api/logistica/asignar-ruta/', {'conductor_id': self.conductor.id, 'pedido_ids': pedido_ids},
+            format='json',
+        )
+        self.assertEqual(respuesta.status_code, 202)
+        self.assertEqual(respuesta.data['estado'], 'pendiente')
+        self.assertFalse(Ruta.objects.exists())
+
+        self.assertEqual(trabajar('pruebas', una_vez=True), 1)
+        estado = self.client.get(f"/core/api/tareas/{respuesta.data['tarea_id']}/").data
+        self.assertEqual(estado['estado'], 'completada')
+        ruta = Ruta.objects.get(pk=estado['resultado']['ruta_id'])
+        self.assertEqual(set(ruta.paradas.values_list('pedido_id', flat=True)), set(pedido_ids))
+
+        # Sin cola, como antes: se asigna dentro de la request
+        otro = Conductor.objects.create(nombre='Ana', licencia='L-2')
+        Pedido.objects.filter(pk=self.pedidos[0].pk).update(ruta=None)
+        with override_settings(TAREAS={'ACTIVA': False}):
+            respuesta = self.client.post(
+                '/core/api/logistica/asignar-ruta/', {'conductor_id': otro.id, 'pedido_ids': pedido_ids[:1]},
+                format='json',
+            )
+        self.assertEqual(respuesta.status_code, 201)
+        self.assertEqual(Tarea.objects.count(), 1)
+
+    def test_sin_cache_ni_canal_compartidos_no_se_activa(self):
+        with self.settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            with self.assertLogs('apps.core.cola', 'WARNING'):
+                self.assertFalse(activa())
+        canal.cache_clear()
+        with self.settings(EVENTOS={'CANAL': 'apps.core.eventos.CanalLocal'}):
+            self.assertEqual(sin_compartir(), ["EVENTOS['CANAL'] es apps.core.eventos.CanalLocal"])
+        with self.settings(TAREAS={}):
+            self.assertFalse(activa())
+        self.assertTrue(activa())
+
+    def test_el_servidor_ve_lo_que_hace_el_trabajador(self):
+        self.conductor.user = User.objects.create_user('juan', password='x')
+        self.conductor.save()
+        desde = canal().ultimo_id()
+
+        def asignar(pedidos):
+            respuesta = self.client.post(
+                '/core/api/logistica/asignar-ruta/',
+                {'conductor_id': self.conductor.id, 'pedido_ids': [p.id for p in pedidos]}, format='json',
+            )
+            self.assertEqual(respuesta.status_code, 202)
+            with self.captureOnCommitCallbacks(execute=True):
+                call_command('trabajar_tareas', una_vez=True, stdout=io.StringIO(), stderr=io.StringIO())
+
+        def mi_ruta():
+            self.client.force_authenticate(self.conductor.user)
+            try:
+                return {p['id'] for p in self.client.get('/core/api/mi-ruta/').data['pedidos']}
+            finally:
+                self.client.force_authenticate(User.objects.get(username='admin'))
+
+        asignar(self.pedidos[:2])
+        self.assertEqual(mi_ruta(), {p.id for p in self.pedidos[:2]})
+        # Se inserta en la ruta en curso: la mi-ruta que quedó en caché se invalida
+        asignar(self.pedidos[2:])
+        self.assertEqual(mi_ruta(), {p.id for p in self.pedidos})
+        eventos = [e for e in canal().desde(desde, self.conductor.id) if e.tipo == 'ruta']
+        self.assertEqual(len(eventos), 2)
+
+    def test_prioridad_y_reintentos(self):
+        baja = encolar('prueba_falla', prioridad=-1, veces=0)
+        alta = encolar('prueba_falla', prioridad=5, veces=1)
+        self.assertEqual(tomar('pruebas').id, alta.id)
+
+        with self.assertLogs('apps.core.cola', 'WARNING'):
+            alta = ejecutar(Tarea.objects.get(pk=alta.id))
+        self.assertEqual((alta.estado, alta.error), ('pendiente', 'falla temporal'))
+        # Espera antes de reintentar: mientras tanto sale la otra
+        self.assertEqual(tomar('pruebas').id, baja.id)
+        self.assertIsNone(tomar('pruebas'))
+
+        Tarea.objects.filter(pk=alta.id).update(disponible_desde=timezone.now())
+        alta = ejecutar(tomar('pruebas'))
+        self.assertEqual((alta.estado, alta.intentos, alta.resultado), ('completada', 2, {'intentos': 2}))
+
+    def test_fallas_definitivas_y_trabajadores_caidos(self):
+        definitiva = encolar('prueba_definitiva')
+        trabajar('pruebas', una_vez=True)
+        definitiva.refresh_from_db()
+        self.assertEqual((definitiva.estado, definitiva.intentos), ('fallida', 1))
+        self.assertEqual((definitiva.error, definitiva.resultado), ('No hay nada que hacer.', {'detalle': 1}))
+
+        agotada = encolar('prueba_falla', veces=5)
+        with self.assertLogs('apps.core.cola', 'WARNING') as registro:
+            for _ in range(2):
+                Tarea.objects.filter(pk=agotada.id).update(disponible_desde=timezone.now())
+                ejecutar(tomar('pruebas'))
+        self.assertEqual([r.levelname for r in registro.records], ['WARNING', 'ERROR'])
+        agotada.refresh_from_db()
+        self.assertEqual((agotada.estado, agotada.intentos), ('fallida', 2))
+
+        # Un trabajador que murió con la tarea en curso: vuelve a la cola
+        colgada = encolar('prueba_falla', veces=0)
+        tomar('muerto')
+        Tarea.objects.filter(pk=colgada.id).update(vence=timezone.now() - datetime.timedelta(seconds=1))
+        self.assertEqual(liberar_vencidas(), 1)
+        self.assertEqual(ejecutar(tomar('pruebas')).estado, 'completada')
+
+    @override_settings(OPTIMIZADOR_RUTAS={'TIEMPO_LIMITE': 0.05})
+    def test_despacho_masivo_en_trabajador_daemonic(self):
+        # Un despacho grande con varios grupos usa un pool de procesos; dentro de
+        # un trabajador daemonic eso fallaba con AssertionError en cada intento
+        otro = Conductor.objects.create(nombre='Ana', licencia='L-2')
+        cliente = Cliente.objects.get()
+        for i in range(200):
+            Pedido.objects.create(
+                cliente=cliente, direccion='-', latitud=-17.39 + (i % 20) / 500, longitud=-66.15 + (i // 20) / 500,
+            )
+        tarea_despacho = encolar('despacho_masivo')
+
+        proceso = multiprocessing.current_process()
+        proceso.daemon = True
+        try:
+            self.assertEqual(trabajar('pruebas', una_vez=True), 1)
+        finally:
+            proceso.daemon = False
+
+        tarea_despacho.refresh_from_db()
+        self.assertEqual(tarea_despacho.estado, 'completada', tarea_despacho.error)
+        self.assertEqual({r['conductor_id'] for r in tarea_despacho.resultado['rutas']}, {self.conductor.id, otro.id})
+        self.assertFalse(Pedido.objects.filter(ruta__isnull=True).exists())
+
+
+# -----------------------------------------------------------------
+# EXPORTACIÓN
+# -----------------------------------------------------------------
+
+@override_settings(EXPORTACION={'CHUNK': 2})
+class ExportacionTests(APITestCase):
+
+    def setUp(self):
+        self.conductor = Conductor.objects.create(
+            user=User.objects.create_user('chofer', password='x'), nombre='Juan', licencia='L-1'
+        )
+        otro = Conductor.objects.create(nombre='Ana', licencia='L-2')
+        self.client.force_authenticate(User.objects.create_user('admin', password='x'))
+        cliente = Cliente.objects.create(nombre_cliente='Tienda, Sur', direccion='Calle', latitud=-17.39, longitud=-66.15)
+        leche, yogur = Producto.objects.create(nombre='Leche', precio=8), Producto.objects.create(nombre='Yogur', precio=5)
+        ayer = timezone.now() - datetime.timedelta(days=1)
+
+        self.ruta = Ruta.objects.create(conductor=self.conductor, distancia=3, tiempo_estimado=10)
+        ruta_otro = Ruta.objects.create(conductor=otro, distancia=1, tiempo_estimado=5)
+        self.pedidos = []
+        for i, (ruta, estado) in enumerate([(self.ruta, 'entregado'), (self.ruta, 'pendiente'), (ruta_otro, 'entregado')]):
+            pedido = Pedido.objects.create(
+                cliente=cliente, direccion='-', latitud=-17.39, longitud=-66.15,
+                estado=estado, ruta=ruta, hora_entrega=ayer if i < 2 else ayer - datetime.timedelta(days=30),
+            )
+            RutaParada.objects.create(ruta=ruta, pedido=pedido, secuencia=i)
+            self.pedidos.append(pedido)
+        DetallePedido.objects.create(pedido=self.pedidos[0], producto=leche, cantidad=2, precio_unitario=8)
+        DetallePedido.objects.create(pedido=self.pedidos[0], producto=yogur, cantidad=1, precio_unitario=5)
+
+    def leer(self, url):
+        respuesta = self.client.get(url)
+        self.assertTrue(respuesta.streaming)
+        return respuesta, b''.join(respuesta.streaming_content).decode()
+
+    def test_pedidos_csv_con_detalles(self):
+        with self.assertNumQueries(1):
+            respuesta, texto = self.leer('/core/api/exportar/pedidos/')
+        self.assertEqual(respuesta['Content-Disposition'], 'attachment; filename="pedidos.csv"')
+        filas = list(csv.DictReader(io.StringIO(texto)))
+        # Un pedido con dos detalles ocupa dos filas; los que no tienen, una
+        self.assertEqual([int(f['pedido_id']) for f in filas], [self.pedidos[0].id] * 2 + [p.id for p in self.pedidos[1:]])
+        self.assertEqual((filas[0]['cliente'], filas[0]['producto'], filas[0]['cantidad']), ('Tienda, Sur', 'Leche', '2'))
+        self.assertEqual(filas[2]['producto'], '')
+
+    def test_rutas_ndjson_con_filtro_de_fechas(self):
+        hoy = timezone.localdate()
+        desde = (hoy - datetime.timedelta(days=7)).isoformat()
+        respuesta, texto = self.leer(f'/core/api/exportar/rutas/?formato=ndjson&desde={desde}&hasta={hoy.isoformat()}')
+        self.assertEqual(respuesta['Content-Type'], 'application/x-ndjson')
+        filas = [json.loads(linea) for linea in texto.splitlines()]
+        self.assertEqual([(f['ruta_id'], f['secuencia'], f['conductor']) for f in filas],
+                         [(self.ruta.id, 0, 'Juan'), (self.ruta.id, 1, 'Juan')])
+
+        self.assertEqual(self.client.get('/core/api/exportar/rutas/?formato=xml').status_code, 400)
+        self.assertEqual(self.client.get('/core/api/exportar/rutas/?desde=ayer').status_code, 400)
+
+    def test_historial_del_conductor(self):
+        _, texto = self.leer('/core/api/exportar/historial/')
+        self.assertEqual({int(f['pedido_id']) for f in csv.DictReader(io.StringIO(texto))},
+                         {self.pedidos[0].id, self.pedidos[2].id})
+
+        # Un conductor sólo ve lo suyo, aunque pida el de otro
+        self.client.force_authenticate(self.conductor.user)
+        _, texto = self.leer('/core/api/exportar/historial/')
+        self.assertEqual({int(f['pedido_id']) for f in csv.DictReader(io.StringIO(texto))}, {self.pedidos[0].id})
+        _, texto = self.leer(f'/core/api/exportar/historial/?conductor={self.pedidos[2].ruta.conductor_id}')
+        self.assertEqual(list(csv.DictReader(io.StringIO(texto))), [])
+
+    async def test_asgi_transmite_de_a_bloques(self):
+        # Bajo ASGI el contenido es un iterador asíncrono: no se junta entero en memoria
+        usuario = await User.objects.aget(username='admin')
+        token = await Token.objects.acreate(user=usuario)
+        respuesta = await AsyncClient().get('/core/api/exportar/pedidos/', headers={'Authorization': f'Token {token.key}'})
+        self.assertTrue(respuesta.is_async)
+        bloques = [bloque async for bloque in respuesta.streaming_content]
+        self.assertEqual(len(bloques), 3)  # encabezado + 4 filas de a 2
+
+
+# -----------------------------------------------------------------
+# JSON CON ORJSON Y COMPRESIÓN
+# -----------------------------------------------------------------
+
+class RenderizadoCompresionTests(APITestCase):
+
+    def setUp(self):
+        self.client.force_authenticate(User.objects.create_user('admin', password='x'))
+        cliente = Cliente.objects.create(nombre_cliente='Tienda Sur', direccion='Calle', latitud=-17.39, longitud=-66.15)
+        producto = Producto.objects.create(nombre='Leche', precio=Decimal('8.50'))
+        for _ in range(30):
+            pedido = Pedido.objects.create(cliente=cliente, direccion='-', latitud=-17.39, longitud=-66.15)
+            DetallePedido.objects.create(pedido=pedido, producto=producto, cantidad=2, precio_unitario=Decimal('8.50'))
+
+    def test_mismo_json_que_drf(self):
+        datos = {
+            'precio': Decimal('3.50'),
+            'hora_entrega': timezone.now(),
+            'naive': datetime.datetime(2024, 5, 1, 12, 30),
+            'dia': datetime.date(2024, 5, 1),
+            'duracion': datetime.timedelta(minutes=5),
+            'texto': 'Peña\u2028',
+            'pedidos': PedidoSerializer(pedidos_con_relaciones()[:2], many=True).data,
+            'ids': Pedido.objects.values_list('id', flat=True)[:3],
+            1: None,
+        }
+        self.assertEqual(RenderizadorJSON().render(datos), JSONRenderer().render(datos))
+        self.assertEqual(RenderizadorJSON().render(None), b'')
+
+    def test_parser(self):
+        datos = ParserJSON().parse(io.BytesIO('{"nombre": "Peña", "latitud": -17.39}'.encode()))
+        self.assertEqual(datos, {'nombre': 'Peña', 'latitud': -17.39})
+        with self.assertRaises(ParseError):
+            ParserJSON().parse(io.BytesIO(b'{"latitud": NaN}'))
+        respuesta = self.client.post('/core/api/clientes/', '{"nombre_cliente": ', content_type='application/json')
+        self.assertEqual(respuesta.status_code, 400)
+
+    def test_negociar(self):
+        self.assertEqual(negociar('gzip, deflate'), 'gzip')
+        self.assertEqual(negociar('*'), codificaciones_disponibles()[0])
+        self.assertIsNone(negociar('gzip;q=0, deflate'))
+        self.assertIsNone(negociar('identity'))
+        self.assertIsNone(negociar(''))
+
+    def test_gzip_por_encima_del_umbral(self):
+        normal = self.client.get('/core/api/pedidos/')
+        self.assertFalse(normal.has_header('Content-Encoding'))
+        self.assertIn('Accept-Encoding', normal['Vary'])
+
+        comprimida = self.client.get('/core/api/pedidos/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(comprimida['Content-Encoding'], 'gzip')
+        self.assertEqual(int(comprimida['Content-Length']), len(comprimida.content))
+        self.assertLess(len(comprimida.content), len(normal.content) / 4)
+        self.assertEqual(gzip.decompress(comprimida.content), normal.content)
+
+        # Por debajo del umbral no vale la pena
+        chica = self.client.get('/core/api/pedidos/?limite=1', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(chica.has_header('Content-Encoding'))
+
+    def test_exportacion_streaming(self):
+        normal = b''.join(self.client.get('/core/api/exportar/pedidos/').streaming_content)
+        respuesta = self.client.get('/core/api/exportar/pedidos/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(respuesta['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(b''.join(respuesta.streaming_content)), normal)
+
+    @skipUnless(compresion.brotli, "brotli no está instalado")
+    def test_brotli_preferido(self):
+        normal = self.client.get('/core/api/pedidos/')
+        respuesta = self.client.get('/core/api/pedidos/', HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(respuesta['Content-Encoding'], 'br')
+        self.assertEqual(compresion.brotli.decompress(respuesta.content), normal.content)
+
+
+# -----------------------------------------------------------------
+# CACHÉ DE DISTANCIAS ENTRE CLIENTES
+# -----------------------------------------------------------------
+
+class MatrizDistanciasTests(APITestCase):
+
+    def setUp(self):
+        self.carpeta = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.carpeta, ignore_errors=True)
+        # matriz_clientes (la que usan el despacho y las señales) también va a esta carpeta
+        self.enterContext(self.settings(MATRIZ_DISTANCIAS={'RUTA': self.carpeta, 'CAPACIDAD_INICIAL': 2}))
+        matriz_clientes.cerrar()
+        self.addCleanup(matriz_clientes.cerrar)
+        self.matriz = MatrizDistancias(self.carpeta)
+        self.puntos = {1: (-17.39, -66.15), 2: (-17.40, -66.16), 3: (-17.38, -66.14), 4: (-17.41, -66.13)}
+
+    def comparar(self, ids):
+        puntos = [self.puntos[i] for i in ids]
+        esperada = matriz_haversine(*np.asarray(puntos).T)
+        # La matriz guarda float32: alcanza con el metro
+        np.testing.assert_allclose(self.matriz.matriz_para(puntos, ids), esperada, atol=1e-3)
+
+    def test_actualizar_quitar_y_crecer(self):
+        for id_, (lat, lng) in self.puntos.items():
+            self.matriz.actualizar_cliente(id_, lat, lng)
+        # Capacidad inicial 2: creció a 4 al agregar el tercero
+        self.assertEqual((len(self.matriz), len(self.matriz._ids)), (4, 4))
+        self.comparar([1, 2, 3, 4])
+        self.comparar([4, 2])
+
+        self.puntos[2] = (-17.45, -66.20)
+        self.matriz.actualizar_cliente(2, *self.puntos[2])
+        self.comparar([1, 2, 3, 4])
+
+        self.matriz.quitar_cliente(3)
+        self.assertEqual(len(self.matriz), 3)
+        self.assertEqual(self.matriz.filas_de([3], np.array([-17.38]), np.array([-66.14]))[0], LIBRE)
+        # Un cliente quitado o un punto fuera de la caché se calcula igual
+        self.comparar([1, 3, 4])
+        puntos = [(-17.0, -66.0), self.puntos[1], self.puntos[4]]
+        np.testing.assert_allclose(
+            self.matriz.matriz_para(puntos, [None, 1, 4]), matriz_haversine(*np.asarray(puntos).T), atol=1e-3,
+        )
+
+        # La fila libre se reutiliza sin crecer
+        self.matriz.actualizar_cliente(5, -17.42, -66.17)
+        self.assertEqual((len(self.matriz), len(self.matriz._ids)), (4, 4))
+
+        # Otro proceso ve lo mismo al abrir los archivos
+        otra = MatrizDistancias(self.carpeta)
+        self.assertEqual(len(otra), 4)
+        self.assertEqual(otra._fila_de, self.matriz._fila_de)
+
+    def test_se_corrige_contra_los_clientes(self):
+        clientes = [
+            Cliente.objects.create(nombre_cliente=f'Cliente {i}', direccion='-', latitud=lat, longitud=lng)
+            for i, (lat, lng) in self.puntos.items()
+        ]
+        # Archivos que quedaron de otra base: un id que no existe y un cliente en otra posición
+        self.matriz.actualizar_cliente(9999, -17.30, -66.10)
+        for cliente in clientes[:3]:
+            self.matriz.actualizar_cliente(cliente.id, cliente.latitud, cliente.longitud)
+        self.matriz.actualizar_cliente(clientes[3].id, -17.50, -66.30)
+
+        origen = (-17.37, -66.12)
+        pedidos = [Pedido(cliente=c, latitud=c.latitud, longitud=c.longitud) for c in clientes]
+        dist = matriz_para_pedidos(origen, pedidos)
+        self.assertTrue(matriz_clientes.sincronizada)
+        self.assertEqual(set(matriz_clientes._fila_de), {c.id for c in clientes})
+        puntos = [origen] + [(c.latitud, c.longitud) for c in clientes]
+        np.testing.assert_allclose(dist, matriz_haversine(*np.asarray(puntos).T), atol=1e-3)
+        self.assertEqual(matriz_clientes.sincronizar([(c.id, c.latitud, c.longitud) for c in clientes]), 0)
+
+    def test_no_reabre_los_archivos_en_cada_escritura(self):
+        self.matriz.actualizar_cliente(1, *self.puntos[1])
+        otra = MatrizDistancias(self.carpeta)
+        with mock.patch.object(self.matriz, '_abrir', wraps=self.matriz._abrir) as abrir:
+            # Lo que escribe otro proceso se ve por la memoria compartida
+            otra.actualizar_cliente(2, *self.puntos[2])
+            self.matriz.actualizar_cliente(1, -17.36, -66.15)
+            self.assertEqual(set(self.matriz._fila_de), {1, 2})
+            self.assertEqual(abrir.call_count, 0)
+
+            # Al crecer, el otro proceso reemplaza los archivos: recién ahí se reabren
+            otra.actualizar_cliente(3, *self.puntos[3])
+            self.matriz.quitar_cliente(2)
+            self.assertEqual(abrir.call_count, 1)
+        self.assertEqual((set(self.matriz._fila_de), len(self.matriz._ids)), ({1, 3}, 4))
+        self.puntos[1] = (-17.36, -66.15)
+        self.comparar([1, 3])
+
+    def test_no_pasa_de_max_clientes(self):
+        self.enterContext(self.settings(MATRIZ_DISTANCIAS={'RUTA': self.carpeta, 'CAPACIDAD_INICIAL': 2, 'MAX_CLIENTES': 3}))
+        for id_ in (1, 2, 3):
+            self.matriz.actualizar_cliente(id_, *self.puntos[id_])
+        self.assertEqual(len(self.matriz._ids), 3)
+        with self.assertRaises(MatrizLlena):
+            self.matriz.actualizar_cliente(4, *self.puntos[4])
+        self.assertTrue(self.matriz.llena)
+        self.comparar([1, 2, 3])
+        with self.assertRaises(MatrizLlena):
+            self.matriz.reconstruir([(id_, lat, lng) for id_, (lat, lng) in self.puntos.items()])
+
+        # Con más clientes que eso el despacho no la usa, y guardar clientes no falla
+        clientes = [
+            Cliente.objects.create(nombre_cliente=f'Cliente {i}', direccion='-', latitud=lat, longitud=lng)
+            for i, (lat, lng) in self.puntos.items()
+        ]
+        pedidos = [Pedido(cliente=c, latitud=c.latitud, longitud=c.longitud) for c in clientes]
+        self.assertIsNone(matriz_para_pedidos((-17.37, -66.12), pedidos))
+        self.assertTrue(matriz_clientes.llena)
+        Cliente.objects.create(nombre_cliente='Otro', direccion='-', latitud=-17.3, longitud=-66.1)
+        self.assertEqual(len(matriz_clientes._ids), 3)
+
+
+# -----------------------------------------------------------------
+# DISTANCIAS Y HORAS ESTIMADAS
+# -----------------------------------------------------------------
+
+class DistanciasEtasTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user('admin', password='x')
+        self.usuario = User.objects.create_user('chofer', password='x')
+        self.conductor = Conductor.objects.create(user=self.usuario, nombre='Juan', licencia='L-1')
+        cliente = Cliente.objects.create(nombre_cliente='Tienda', direccion='-')
+        coordenadas = [('-17.380000', '-66.150000'), ('-17.400000', '-66.170000'), ('-17.410000', '-66.140000')]
+        self.pedidos = [
+            Pedido.objects.create(cliente=cliente, direccion='-', latitud=Decimal(lat), longitud=Decimal(lng))
+            for lat, lng in coordenadas
+        ]
+        self.sin_gps = Pedido.objects.create(cliente=cliente, direccion='-')
+
+    def asignar(self, pedidos):
+        self.client.force_authenticate(self.admin)
+        respuesta = self.client.post('/core/api/logistica/asignar-ruta/', {
+            'conductor_id': self.conductor.id, 'pedido_ids': [p.id for p in pedidos],
+        }, format='json')
+        self.assertEqual(respuesta.status_code, 201, respuesta.data)
+
+    def verificar_mi_ruta(self, cantidad):
+        """Tramos, horas y totales de mi-ruta coherentes con las coordenadas de cada parada."""
+        self.client.force_authenticate(self.usuario)
+        datos = self.client.get('/core/api/mi-ruta/').data
+        paradas = datos['pedidos']
+        self.assertEqual(len(paradas), cantidad)
+
+        anterior = (datos['origen']['lat'], datos['origen']['lng'])
+        tramos, etas = [], []
+        for parada in paradas:
+            if parada['latitud'] is None:
+                self.assertEqual((parada['distancia_tramo'], parada['eta']), (None, None))
+                continue
+            actual = (parada['latitud'], parada['longitud'])
+            tramo = distancia_km(*anterior, *actual)
+            self.assertAlmostEqual(float(parada['distancia_tramo']), tramo, delta=0.0006)
+            tramos.append(tramo)
+            etas.append(datetime.datetime.fromisoformat(parada['eta']))
+            anterior = actual
+        # Los pedidos sin GPS van al final
+        self.assertEqual(paradas[-1]['id'], self.sin_gps.id)
+        self.assertEqual(etas, sorted(set(etas)))
+
+        # 25 km/h y 5 minutos por parada (ESTIMACION_TIEMPOS por defecto)
+        self.assertAlmostEqual(float(datos['distancia_total']), sum(tramos), delta=0.006)
+        self.assertEqual(datos['tiempo_estimado'], round(sum(tramos) / 25 * 60 + len(tramos) * 5))
+        ruta = Ruta.objects.get(pk=datos['ruta_id'])
+        self.assertEqual(str(ruta.distancia), datos['distancia_total'])
+
+    def test_ruta_nueva(self):
+        self.asignar(self.pedidos + [self.sin_gps])
+        self.verificar_mi_ruta(4)
+
+    def test_pedido_agregado_a_ruta_en_curso(self):
+        self.asignar(self.pedidos[:2] + [self.sin_gps])
+        self.asignar(self.pedidos[2:])
+        self.verificar_mi_ruta(4)
+
+    def test_totales_ruta(self):
+        self.assertEqual(totales_ruta([]), (Decimal('0.00'), 0))
+        self.assertEqual(totales_ruta([1.0, 2.5, 0.004]), (Decimal('3.50'), round(3.504 / 25 * 60 + 3 * 5)))
+        with self.settings(ESTIMACION_TIEMPOS={'VELOCIDAD_KMH': 60, 'SERVICIO_MIN': 0}):
+            self.assertEqual(totales_ruta([10, 20]), (Decimal('30.00'), 30))
+
+
+# -----------------------------------------------------------------
+# PARADAS DE RUTA
+# -----------------------------------------------------------------
+
+class RutaParadaTests(APITestCase):
+
+    def setUp(self):
+        self.ruta = Ruta.objects.create(distancia=0, tiempo_estimado=0)
+        cliente = Cliente.objects.create(nombre_cliente='Tienda', direccion='-')
+        self.pedidos = [Pedido.objects.create(cliente=cliente, direccion='-', ruta=self.ruta) for _ in range(3)]
+
+    def test_ordenadas_por_secuencia(self):
+        for secuencia, pedido in zip([2, 3, 1], self.pedidos):
+            RutaParada.objects.create(ruta=self.ruta, pedido=pedido, secuencia=secuencia)
+        esperado = [self.pedidos[2].id, self.pedidos[0].id, self.pedidos[1].id]
+        self.assertEqual(list(self.ruta.paradas.values_list('pedido_id', flat=True)), esperado)
+        self.assertEqual(list(RutaParada.objects.values_list('secuencia', flat=True)), [1, 2, 3])
+
+    def test_un_pedido_aparece_una_vez_por_ruta(self):
+        RutaParada.objects.create(ruta=self.ruta, pedido=self.pedidos[0], secuencia=1)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            RutaParada.objects.create(ruta=self.ruta, pedido=self.pedidos[0], secuencia=2)
+        # En otra ruta sí puede estar
+        otra = Ruta.objects.create(distancia=0, tiempo_estimado=0)
+        RutaParada.objects.create(ruta=otra, pedido=self.pedidos[0], secuencia=1)
+
+
+class MigracionParadasTests(PruebaMigracion):
+    """0011 pasa el texto puntos_de_entrega a RutaParada y, hacia atrás, lo vuelve a armar."""
+
+    antes = '0010_cliente_geocelda_pedido_geocelda'
+    despues = '0011_rutaparada'
+
+    def test_ida_y_vuelta(self):
+        apps = self.migrar(self.antes)
+        Ruta, Pedido = apps.get_model('core', 'Ruta'), apps.get_model('core', 'Pedido')
+        cliente = apps.get_model('core', 'Cliente').objects.create(nombre_cliente='Tienda', direccion='-')
+        texto = "(-17.400000, -66.160000); (-17.390000, -66.150000); (None, None); "
+        ruta = Ruta.objects.create(puntos_de_entrega=texto, distancia=0, tiempo_estimado=0)
+        vacia = Ruta.objects.create(puntos_de_entrega='', distancia=0, tiempo_estimado=0)
+        # Creados en otro orden que el del texto
+        sin_gps, cerca, lejos = (
+            Pedido.objects.create(cliente=cliente, direccion='-', latitud=lat, longitud=lng, ruta=ruta)
+            for lat, lng in [(None, None), (Decimal('-17.39'), Decimal('-66.15')), (Decimal('-17.4'), Decimal('-66.16'))]
+        )
+
+        apps = self.migrar(self.despues)
+        paradas = apps.get_model('core', 'RutaParada').objects.filter(ruta_id=ruta.id).order_by('secuencia')
+        self.assertEqual([(p.secuencia, p.pedido_id) for p in paradas], [(1, lejos.id), (2, cerca.id), (3, sin_gps.id)])
+        self.assertFalse(apps.get_model('core', 'RutaParada').objects.filter(ruta_id=vacia.id).exists())
+
+        apps = self.migrar(self.antes)
+        Ruta = apps.get_model('core', 'Ruta')
+        self.assertEqual(Ruta.objects.get(pk=ruta.id).puntos_de_entrega, texto)
+        self.assertEqual(Ruta.objects.get(pk=vacia.id).puntos_de_entrega, '')
+
+
+# -----------------------------------------------------------------
+# BÚSQUEDAS ESPACIALES
+# -----------------------------------------------------------------
+
+class BusquedasEspacialesTests(APITestCase):
+
+    def setUp(self):
+        indice_clientes.reiniciar()
+        self.addCleanup(indice_clientes.reiniciar)
+        self.client.force_authenticate(User.objects.create_user('admin', password='x'))
+        self.leche = Producto.objects.create(nombre='Leche', precio=5)
+
+    def crear_pedido(self, nombre, lat, lng):
+        respuesta = self.client.post('/core/api/pedidos/', {
+            'nombre_nuevo_cliente': nombre, 'latitud': lat, 'longitud': lng,
+            'detalles': [{'producto': self.leche.id, 'cantidad': 1, 'precio_unitario': '5.00'}],
+        }, format='json')
+        self.assertEqual(respuesta.status_code, 201, respuesta.data)
+        return Pedido.objects.get(pk=respuesta.data['id'])
+
+    def test_no_duplica_clientes_creados_por_otro_proceso(self):
+        self.assertEqual(len(indice_clientes), 0)
+        tienda = Cliente.objects.create(nombre_cliente='Tienda Sol', direccion='-', latitud=-17.39, longitud=-66.15)
+        # Como si lo hubiera creado otro proceso: el índice en memoria de este no lo tiene
+        indice_clientes.quitar(tienda.id)
+        self.assertEqual(indice_clientes.en_radio(-17.39, -66.15, 0.03), [])
+
+        # A unos 11 m y con otras mayúsculas: es el mismo
+        self.assertEqual(self.crear_pedido(' tienda sol', '-17.390100', '-66.150000').cliente_id, tienda.id)
+        # A más de 30 m, o con otro nombre, es otro cliente
+        self.assertNotEqual(self.crear_pedido('Tienda Sol', '-17.391000', '-66.150000').cliente_id, tienda.id)
+        self.assertNotEqual(self.crear_pedido('Kiosko', '-17.390000', '-66.150000').cliente_id, tienda.id)
+        self.assertEqual(Cliente.objects.count(), 3)
+
+    def test_cercanos_lejos_de_todos_los_clientes(self):
+        for i in range(30):
+            Cliente.objects.create(
+                nombre_cliente=f'Tienda {i}', direccion='-', latitud=-17.39 + i * 0.02, longitud=-66.15,
+            )
+        anillos = mock.patch.object(IndiceEspacial, '_anillo', autospec=True, side_effect=IndiceEspacial._anillo)
+        with anillos as anillo:
+            # A unos 15.000 km: no recorre anillos hasta llegar a Cochabamba
+            respuesta = self.client.get('/core/api/clientes/cercanos/?lat=60&lng=100&k=3')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertLessEqual(anillo.call_count, 3)
+        # El más cercano es el que está más al norte
+        self.assertEqual([fila['nombre_cliente'] for fila in respuesta.data], ['Tienda 29', 'Tienda 28', 'Tienda 27'])
+        esperadas = sorted(distancia_km(60, 100, c.latitud, c.longitud) for c in Cliente.objects.all())[:3]
+        self.assertEqual([fila['distancia_km'] for fila in respuesta.data], [round(d, 3) for d in esperadas])
+
+
+class MigracionGeoceldasTests(PruebaMigracion):
+
+    def test_calcula_la_geocelda_de_lo_que_ya_existe(self):
+        apps = self.migrar('0009_conductor_placa_vehiculo_conductor_telefono')
+        Cliente = apps.get_model('core', 'Cliente')
+        con_gps = Cliente.objects.create(nombre_cliente='Tienda', direccion='-', latitud=-17.39, longitud=-66.15)
+        sin_gps = Cliente.objects.create(nombre_cliente='Kiosko', direccion='-')
+        apps.get_model('core', 'Pedido').objects.create(
+            cliente=con_gps, direccion='-', latitud=Decimal('-17.4'), longitud=Decimal('-66.16'),
+        )
+
+        apps = self.migrar('0010_cliente_geocelda_pedido_geocelda')
+        geoceldas = dict(apps.get_model('core', 'Cliente').objects.values_list('id', 'geocelda'))
+        self.assertEqual(geoceldas, {con_gps.id: codificar_geohash(-17.39, -66.15), sin_gps.id: ''})
+        pedido = apps.get_model('core', 'Pedido').objects.get()
+        self.assertEqual(pedido.geocelda, codificar_geohash('-17.4', '-66.16'))
+
+
+# -----------------------------------------------------------------
+# RUTEO POR CALLES
+# -----------------------------------------------------------------
+
+def extracto_osm(carpeta):
+    """
+    Extracto OSM mínimo: una grilla de 4 x 4 cuadras (la primera fila de
+    calles es de un solo sentido), una senda peatonal que no cuenta y una
+    calle suelta a unos 10 km, sin conexión con la grilla.
+    """
+    nodos, vias = [], []
+    for fila in range(4):
+        for columna in range(4):
+            nodos.append((fila * 4 + columna + 1, -17.40 + fila * 0.002, -66.16 + columna * 0.002))
+    for i in range(4):
+        sentido = {'oneway': 'yes'} if i == 0 else {}
+        vias.append(([i * 4 + c + 1 for c in range(4)], {'highway': 'residential', **sentido}))
+        vias.append(([f * 4 + i + 1 for f in range(4)], {'highway': 'tertiary'}))
+    vias.append(([1, 6, 11, 16], {'highway': 'footway'}))
+    nodos += [(101, -17.30, -66.10), (102, -17.30, -66.098)]
+    vias.append(([101, 102], {'highway': 'residential'}))
+
+    lineas = ['<?xml version="1.0" encoding="UTF-8"?>', '<osm version="0.6">']
+    lineas += [f'<node id="{id_}" lat="{lat}" lon="{lng}"/>' for id_, lat, lng in nodos]
+    for i, (refs, etiquetas) in enumerate(vias, start=1000):
+        lineas.append(f'<way id="{i}">')
+        lineas += [f'<nd ref="{ref}"/>' for ref in refs]
+        lineas += [f'<tag k="{k}" v="{v}"/>' for k, v in etiquetas.items()]
+        lineas.append('</way>')
+    lineas.append('</osm>')
+    ruta = Path(carpeta) / 'ciudad.osm'
+    ruta.write_text('\n'.join(lineas))
+    return ruta
+
+
+class RuteoVialTests(APITestCase):
+
+    def setUp(self):
+        carpeta = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, carpeta, ignore_errors=True)
+        self.extracto = extracto_osm(carpeta)
+        self.enterContext(self.settings(RUTEO_VIAL={'EXTRACTO_OSM': str(self.extracto), 'LANDMARKS': 3}))
+        self.servicio = RuteoVial()
+
+    def test_a_estrella_igual_a_dijkstra(self):
+        grafo = self.servicio.grafo()
+        # La senda no entra; la calle suelta sí, pero fuera de la componente principal
+        self.assertEqual((grafo.n, int(grafo.conexos.sum())), (18, 16))
+        nodos = np.flatnonzero(grafo.conexos).tolist()
+        for origen in nodos:
+            dijkstra = _dijkstra(grafo._inicio, grafo._indices, grafo._pesos, origen)
+            for destino in nodos:
+                metros, camino = grafo.camino(origen, destino)
+                self.assertAlmostEqual(metros, dijkstra[destino], places=6)
+                self.assertEqual((camino[0], camino[-1]), (origen, destino))
+
+        # Se guardó el .npz y la segunda vez se lee de ahí
+        otra = RuteoVial().grafo()
+        np.testing.assert_array_equal(otra.desde_landmark, grafo.desde_landmark)
+
+    def test_nodo_mas_cercano_lejos_del_extracto(self):
+        grafo = self.servicio.grafo()
+        nodos = np.flatnonzero(grafo.conexos).tolist()
+        esperado = min(nodos, key=lambda v: distancia_km(60, 100, grafo.lats[v], grafo.lngs[v]))
+        with mock.patch.object(IndiceEspacial, '_anillo', autospec=True, side_effect=IndiceEspacial._anillo) as anillo:
+            self.assertEqual(grafo.nodo_mas_cercano(60, 100), esperado)
+        self.assertLessEqual(anillo.call_count, 3)
+
+    def test_matriz(self):
+        puntos = [(-17.40, -66.16), (-17.394, -66.154), (-17.398, -66.156), (-17.40, -66.154), (-17.394, -66.16)]
+        dist = self.servicio.matriz(puntos)
+        self.assertEqual(dist.shape, (5, 5))
+        np.testing.assert_allclose(dist, dist.T)
+        np.testing.assert_allclose(np.diag(dist), 0)
+        # Por calles nunca es más corto que en línea recta
+        self.assertTrue((dist >= matriz_haversine(*np.asarray(puntos).T) - 1e-6).all())
+
+        with self.settings(RUTEO_VIAL={'EXTRACTO_OSM': str(self.extracto), 'USAR_EN_OPTIMIZADOR': True}):
+            np.testing.assert_allclose(matriz_para_optimizador(puntos), dist)
+        with self.settings(RUTEO_VIAL={'EXTRACTO_OSM': str(self.extracto), 'USAR_EN_OPTIMIZADOR': True,
+                                       'MAX_PUNTOS_OPTIMIZADOR': 4}):
+            self.assertIsNone(matriz_para_optimizador(puntos))
+
+    def test_par_sin_camino_usa_la_linea_recta(self):
+        # Un grafo que da por conexa también la calle suelta (p. ej. un .npz armado con otros landmarks)
+        lats, lngs, origenes, destinos = leer_osm(self.extracto)
+        ceros = np.zeros((1, len(lats)), dtype=np.float32)
+        GrafoVial(lats, lngs, origenes, destinos, ceros, ceros, np.ones(len(lats), dtype=bool)).guardar(
+            self.servicio._ruta_npz(self.extracto),
+        )
+        puntos = [(-17.40, -66.16), (-17.30, -66.10), (-17.398, -66.16)]
+        dist = self.servicio.matriz(puntos)
+        recta = matriz_haversine(*np.asarray(puntos).T)
+        self.assertAlmostEqual(dist[0, 1], recta[0, 1])
+        self.assertAlmostEqual(dist[1, 2], recta[1, 2])
+        self.assertTrue(np.isfinite(dist).all())
+        self.assertGreater(dist[0, 2], 0)
+
+
+# -----------------------------------------------------------------
+# OPTIMIZACIÓN DE RUTAS
+# -----------------------------------------------------------------
+
+def puntos_al_azar(cantidad, semilla):
+    rng = np.random.default_rng(semilla)
+    return list(zip(-17.39 + rng.uniform(-0.05, 0.05, cantidad), -66.15 + rng.uniform(-0.05, 0.05, cantidad)))
+
+
+def largo_recorrido(orden, puntos, origen=ORIGEN_POR_DEFECTO):
+    """Km de origen -> puntos en `orden` (ruta abierta, sin volver)."""
+    dist = matriz_haversine(*a_arreglos([origen] + list(puntos)))
+    recorrido = [0] + [i + 1 for i in orden]
+    return float(sum(dist[a, b] for a, b in zip(recorrido, recorrido[1:])))
+
+
+class OptimizacionRutasTests(APITestCase):
+
+    def test_permutacion_y_no_peor_que_vecino_mas_cercano(self):
+        for motor in MOTORES:
+            for cantidad, semilla in ((5, 1), (20, 2), (60, 3)):
+                puntos = puntos_al_azar(cantidad, semilla)
+                orden = optimizar_ruta(puntos, motor=motor, tiempo_limite=0.5)
+                self.assertEqual(sorted(orden), list(range(cantidad)))
+
+                dist = matriz_haversine(*a_arreglos([ORIGEN_POR_DEFECTO] + puntos))
+                inicial = [i - 1 for i in vecino_mas_cercano(dist)[1:]]
+                self.assertLessEqual(largo_recorrido(orden, puntos), largo_recorrido(inicial, puntos) + 1e-9)
+
+    def test_pocos_puntos(self):
+        self.assertEqual(optimizar_ruta([]), [])
+        self.assertEqual(optimizar_ruta([(-17.40, -66.15)]), [0])
+        # Con dos puntos se va primero al más cercano al origen, que es lo óptimo
+        lejos, cerca = (-17.50, -66.15), (-17.40, -66.157)
+        self.assertEqual(optimizar_ruta([lejos, cerca]), [1, 0])
+        self.assertEqual(optimizar_ruta([cerca, lejos], origen=(-17.55, -66.15)), [1, 0])
+        # Repetidos: cada uno aparece una vez
+        self.assertEqual(sorted(optimizar_ruta([cerca, cerca, cerca])), [0, 1, 2])
+
+    def test_insercion_casos_borde(self):
+        self.assertEqual(insertar_en_ruta([], []), [])
+        # Sin ruta previa: es armar una ruta con los nuevos
+        nuevos = puntos_al_azar(6, 4)
+        self.assertEqual(sorted(insertar_en_ruta([], nuevos, tiempo_limite=0.2)), list(range(6)))
+        # Sin nuevos: sin búsqueda local queda igual; con ella, nunca más larga
+        existentes = puntos_al_azar(8, 5)
+        self.assertEqual(insertar_en_ruta(existentes, [], tiempo_limite=0), list(range(8)))
+        orden = insertar_en_ruta(existentes, [], tiempo_limite=0.2)
+        self.assertEqual(sorted(orden), list(range(8)))
+        self.assertLessEqual(largo_recorrido(orden, existentes), largo_recorrido(range(8), existentes) + 1e-9)
+
+        # Un punto en el camino entre dos paradas va entre ellas
+        existentes = [(-17.40, -66.157), (-17.42, -66.157)]
+        self.assertEqual(insertar_en_ruta(existentes, [(-17.41, -66.157)], tiempo_limite=0), [0, 2, 1])
+
+    def test_insercion_respeta_las_entregadas(self):
+        conductor = Conductor.objects.create(nombre='Juan', licencia='L-1')
+        cliente = Cliente.objects.create(nombre_cliente='Tienda', direccion='Calle', latitud=-17.39, longitud=-66.15)
+
+        def pedido(lat):
+            return Pedido.objects.create(cliente=cliente, direccion='-', latitud=lat, longitud=-66.157)
+
+        pedidos = [pedido(-17.40 - i / 100) for i in range(3)]
+        ruta, _ = guardar_ruta(conductor, pedidos)
+        entregado = pedidos[1]
+        entregado.estado = 'entregado'
+        entregado.save()
+        secuencia = RutaParada.objects.get(pedido=entregado).secuencia
+
+        # Sin nuevos sólo se devuelven las pendientes
+        paradas = list(ruta.paradas.select_related('pedido').order_by('secuencia'))
+        self.assertEqual({p.id for p in reordenar_con_insercion(paradas, [])}, {pedidos[0].id, pedidos[2].id})
+
+        nuevo = pedido(-17.415)
+        ruta_final, _ = asignar_a_conductor(conductor, [nuevo])
+        self.assertEqual(ruta_final.id, ruta.id)
+        self.assertEqual(RutaParada.objects.get(pedido=entregado).secuencia, secuencia)
+        pendientes = list(
+            ruta.paradas.exclude(pedido=entregado).order_by('secuencia').values_list('pedido_id', 'secuencia')
+        )
+        self.assertEqual({pedido_id for pedido_id, _ in pendientes}, {pedidos[0].id, pedidos[2].id, nuevo.id})
+        # Las pendientes se renumeran después de la última entregada
+        self.assertEqual([s for _, s in pendientes], list(range(secuencia + 1, secuencia + 4)))
+
+
+# -----------------------------------------------------------------
+# DESPACHO MASIVO
+# -----------------------------------------------------------------
+
+class DespachoMasivoTests(APITestCase):
+
+    def verificar_grupos(self, grupos, sobrantes, cargas, capacidades):
+        asignados = [i for grupo in grupos for i in grupo]
+        # Cada pedido en exactamente un grupo (o entre los que no entraron)
+        self.assertEqual(sorted(asignados + sobrantes), list(range(len(cargas))))
+        self.assertEqual(len(grupos), len(capacidades))
+        for grupo, capacidad in zip(grupos, capacidades):
+            self.assertLessEqual(sum(cargas[i] for i in grupo), capacidad)
+
+    def test_barrido_respeta_capacidades(self):
+        rng = np.random.default_rng(7)
+        for cantidad, capacidades in ((50, [40, 40, 40, 40]), (80, [30, math.inf, 25]), (60, [20, 20]), (1, [5, 5])):
+            puntos = puntos_al_azar(cantidad, cantidad)
+            cargas = rng.integers(1, 6, cantidad).tolist()
+            grupos, sobrantes = agrupar_por_barrido(puntos, cargas, capacidades)
+            self.verificar_grupos(grupos, sobrantes, cargas, capacidades)
+            if sum(cargas) <= sum(capacidades) - 5 * len(capacidades):
+                self.assertEqual(sobrantes, [])
+
+        # Un pedido más grande que cualquier vehículo queda afuera
+        grupos, sobrantes = agrupar_por_barrido(puntos_al_azar(3, 1), [1, 9, 1], [5, 5])
+        self.verificar_grupos(grupos, sobrantes, [1, 9, 1], [5, 5])
+        self.assertEqual(sobrantes, [1])
+
+    @override_settings(OPTIMIZADOR_RUTAS={'TIEMPO_LIMITE': 0.05}, DESPACHO={'PROCESOS': 2, 'MIN_PEDIDOS_PARALELO': 10})
+    def test_resolver_grupos(self):
+        puntos = puntos_al_azar(60, 8)
+        grupos, _ = agrupar_por_barrido(puntos, [1] * 60, [20, 20, 20])
+        # 60 pedidos >= MIN_PEDIDOS_PARALELO: se resuelven en el pool de procesos
+        ordenes = resolver_grupos([[puntos[i] for i in g] for g in grupos])
+        self.assertEqual([sorted(o) for o in ordenes], [list(range(len(g))) for g in grupos])
+
+    def test_resolver_grupo_con_spawn(self):
+        # Con 'spawn' el hijo importa optimizacion_grupos sin django.setup()
+        trabajos = [(puntos_al_azar(8, s), ORIGEN_POR_DEFECTO, '2opt_oropt', 0.05) for s in (1, 2)]
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+            ordenes = list(pool.map(resolver_grupo, trabajos))
+        self.assertEqual([sorted(o) for o in ordenes], [list(range(8))] * 2)
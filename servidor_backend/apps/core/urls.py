@@ -1,6 +1,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from . import views
+from .eventos import eventos_view
 
 router = DefaultRouter()
 router.register(r'conductores', views.ConductorViewSet)
@@ -16,12 +17,22 @@ router.register(r'detalles-pedido', views.DetallePedidoViewSet)
 urlpatterns = [
     path('api/', include(router.urls)),
     path('api/logistica/asignar-ruta/', views.asignar_ruta, name='asignar_ruta'),
+    path('api/logistica/despacho-masivo/', views.despacho_masivo, name='despacho_masivo'),
+    path('api/logistica/ruta-vial/', views.ruta_vial_view, name='ruta_vial'),
+    path('api/logistica/posiciones/', views.posiciones_view, name='posiciones_conductores'),
     path('api/login/', views.login_view, name='login'),
     path('api/mi-ruta/', views.mi_ruta_view, name='mi_ruta'),
     path('api/reportes/', views.reportes_view, name='reportes'),
     # En apps/core/urls.py
     path('api/reportes/dashboard/', views.dashboard_analytics_view, name='dashboard_analytics'),
+    path('api/cache/', views.cache_estado_view, name='cache_estado'),
+    path('api/exportar/pedidos/', views.exportar_pedidos_view, name='exportar_pedidos'),
+    path('api/exportar/rutas/', views.exportar_rutas_view, name='exportar_rutas'),
+    path('api/exportar/historial/', views.exportar_historial_view, name='exportar_historial'),
+    path('api/tareas/<int:pk>/', views.tarea_view, name='tarea'),
+    path('api/eventos/', eventos_view, name='eventos'),
     # --- NUEVAS RUTAS ---
     path('api/conductor/historial/', views.historial_conductor_view, name='historial_conductor'),
     path('api/conductor/incidencia/', views.reportar_incidencia_view, name='reportar_incidencia'),
+    path('api/conductor/telemetria/', views.telemetria_view, name='telemetria'),
 ]
\ No newline at end of file
@@ -1,37 +1,90 @@
 # En: apps/core/views.py
 
-import math
-import datetime
-from django.utils import timezone
-from django.db.models import Count, Sum, Q
-from django.db.models.functions import TruncDate
 from django.contrib.auth import authenticate
+from django.db import transaction
 
 from rest_framework import viewsets
 from rest_framework import status
 from rest_framework.authtoken.models import Token
-from rest_framework.decorators import api_view, permission_classes, authentication_classes
+from rest_framework.decorators import action, api_view, permission_classes, authentication_classes
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
 
 from .models import (
-    Conductor, Vehiculo, Ruta, Cliente, Pedido, 
-    Categoria, Producto, DetallePedido, Incidencia
+    Conductor, Vehiculo, Ruta, RutaParada, Cliente, Pedido,
+    Categoria, Producto, DetallePedido, Incidencia, Tarea
 )
 from .serializers import (
     ConductorSerializer, VehiculoSerializer, RutaSerializer, ClienteSerializer, 
     PedidoSerializer, CategoriaSerializer, ProductoSerializer, DetallePedidoSerializer,
-    PedidoConductorSerializer, IncidenciaSerializer
+    IncidenciaSerializer
 )
+from . import cache_mi_ruta, cola, lectura_rapida, tareas
+from .analitica import resumen_dashboard
+from .campos import ConsultaSegunCampos, solicitados
+from .cache_respuestas import ListadoCacheado, contadores, respuesta_cacheada
+from .despacho import ConflictoAsignacion
+from .espacial import indice_pedidos, indice_clientes, filtrar_por_caja
+from .exportacion import COLUMNAS_PARADAS, COLUMNAS_PEDIDOS, TIPOS_CONTENIDO, respuesta_exportacion
+from .optimizacion import ORIGEN_POR_DEFECTO
+from .telemetria import MuestraInvalida, registrar_muestras, ultimas_posiciones
+from .filtros import (
+    filtrar_pedidos, filtrar_clientes, filtrar_rutas, filtrar_conductores, filtrar_productos, filtrar_detalles
+)
+from .ruteo_vial import SinRuteoVial, ruteo_vial
+
+# -----------------------------------------------------------------
+# BÚSQUEDAS ESPACIALES (ver espacial.py)
+# -----------------------------------------------------------------
+
+def _buscar_cercanos(request, indice, queryset, serializar):
+    """
+    ?lat=&lng= y además ?radio=<km> (todos dentro del radio) o ?k=<n>
+    (los n más cercanos, 10 por defecto). Agrega `distancia_km` a cada fila.
+    """
+    try:
+        lat = float(request.query_params['lat'])
+        lng = float(request.query_params['lng'])
+        radio = request.query_params.get('radio')
+        if radio is not None:
+            encontrados = indice.en_radio(lat, lng, float(radio))
+        else:
+            encontrados = indice.k_cercanos(lat, lng, int(request.query_params.get('k', 10)))
+    except (KeyError, ValueError):
+        return Response({"error": "Parámetros inválidos: use lat, lng y k o radio."}, status=status.HTTP_400_BAD_REQUEST)
+
+    por_id = {obj.id: obj for obj in queryset.filter(id__in=[id_ for id_, _ in encontrados])}
+    data = []
+    for id_, distancia in encontrados:
+        if id_ in por_id:
+            fila = serializar(por_id[id_]).data
+            fila['distancia_km'] = round(distancia, 3)
+            data.append(fila)
+    return Response(data)
+
+
+def _buscar_en_zona(request, queryset, serializar):
+    """?sur=&oeste=&norte=&este= (grados). Usa el índice de `geocelda`."""
+    try:
+        caja = [float(request.query_params[clave]) for clave in ('sur', 'oeste', 'norte', 'este')]
+    except (KeyError, ValueError):
+        return Response({"error": "Parámetros inválidos: use sur, oeste, norte y este."}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(serializar(filtrar_por_caja(queryset, *caja), many=True).data)
+
 
 # -----------------------------------------------------------------
 # VIEWSETS (CRUD Estándar)
 # -----------------------------------------------------------------
+# Los listados se paginan por cursor (ver paginacion.py) y aceptan los
+# filtros de filtros.py como query params.
 
-class ConductorViewSet(viewsets.ModelViewSet):
+class ConductorViewSet(ConsultaSegunCampos, viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     queryset = Conductor.objects.all()
     serializer_class = ConductorSerializer
+
+    def get_queryset(self):
+        return filtrar_conductores(super().get_queryset(), self.request.query_params)
     
     def perform_destroy(self, instance):
         user_asociado = instance.user
@@ -40,63 +93,130 @@ class ConductorViewSet(viewsets.ModelViewSet):
         else:
             instance.delete()
 
-class VehiculoViewSet(viewsets.ModelViewSet):
+class VehiculoViewSet(ConsultaSegunCampos, viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     queryset = Vehiculo.objects.all()
     serializer_class = VehiculoSerializer
 
-class RutaViewSet(viewsets.ModelViewSet):
+class RutaViewSet(ConsultaSegunCampos, viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     queryset = Ruta.objects.all()
     serializer_class = RutaSerializer
 
-class ClienteViewSet(viewsets.ModelViewSet):
+    def get_queryset(self):
+        return filtrar_rutas(super().get_queryset(), self.request.query_params)
+
+class ClienteViewSet(ConsultaSegunCampos, viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     queryset = Cliente.objects.all()
     serializer_class = ClienteSerializer
 
-class PedidoViewSet(viewsets.ModelViewSet):
+    def get_queryset(self):
+        return filtrar_clientes(super().get_queryset(), self.request.query_params)
+
+    @action(detail=False, methods=['get'])
+    def cercanos(self, request):
+        return _buscar_cercanos(request, indice_clientes, self.get_queryset(), self.get_serializer)
+
+    @action(detail=False, methods=['get'])
+    def zona(self, request):
+        return _buscar_en_zona(request, self.get_queryset(), self.get_serializer)
+
+class PedidoViewSet(ConsultaSegunCampos, viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     queryset = Pedido.objects.all()
     serializer_class = PedidoSerializer
+    ordenes_cursor = {
+        'id': ('pk',),
+        '-id': ('-pk',),
+        'hora_entrega': ('hora_entrega', 'pk'),
+        '-hora_entrega': ('-hora_entrega', '-pk'),
+    }
 
+    def get_queryset(self):
+        return filtrar_pedidos(super().get_queryset(), self.request.query_params)
+
+    def list(self, request, *args, **kwargs):
+        campos, expandir = solicitados(request)
+        if expandir:
+            return super().list(request, *args, **kwargs)
+        # Mismo JSON que PedidoSerializer, armado desde values() (ver lectura_rapida.py)
+        filas = lectura_rapida.filas_pedidos(self.filter_queryset(self.get_queryset()), campos)
+        pagina = self.paginate_queryset(filas)
+        if pagina is not None:
+            return self.get_paginated_response(lectura_rapida.pedidos(pagina, campos))
+        return Response(lectura_rapida.pedidos(filas, campos))
+
+    @action(detail=False, methods=['get'])
+    def cercanos(self, request):
+        """Pedidos abiertos (pendientes o en camino) más cercanos a un punto."""
+        return _buscar_cercanos(request, indice_pedidos, self.get_queryset(), self.get_serializer)
+
+    @action(detail=False, methods=['get'])
+    def zona(self, request):
+        return _buscar_en_zona(request, self.get_queryset(), self.get_serializer)
+
+    @transaction.atomic
     def perform_update(self, serializer):
+        # Las señales de save() descuentan Ruta.pendientes en esta misma transacción
         pedido_actualizado = serializer.save()
         if pedido_actualizado.ruta and pedido_actualizado.estado == 'entregado':
             ruta = pedido_actualizado.ruta
-            pedidos_pendientes = Pedido.objects.filter(ruta=ruta).exclude(estado='entregado').count()
-            if pedidos_pendientes == 0:
+            ruta.refresh_from_db(fields=['pendientes', 'activa'])
+            if not ruta.activa:
                 conductor = ruta.conductor
                 if conductor:
                     conductor.estado = 'disponible'
                     conductor.save()
 
-class CategoriaViewSet(viewsets.ModelViewSet):
+class CategoriaViewSet(ListadoCacheado, ConsultaSegunCampos, viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
+    grupo_cache = 'categorias'
     queryset = Categoria.objects.all()
     serializer_class = CategoriaSerializer
 
-class ProductoViewSet(viewsets.ModelViewSet):
+class ProductoViewSet(ListadoCacheado, ConsultaSegunCampos, viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
+    grupo_cache = 'productos'
     queryset = Producto.objects.all()
     serializer_class = ProductoSerializer
 
-class DetallePedidoViewSet(viewsets.ModelViewSet):
+    def get_queryset(self):
+        return filtrar_productos(super().get_queryset(), self.request.query_params)
+
+class DetallePedidoViewSet(ConsultaSegunCampos, viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     queryset = DetallePedido.objects.all()
     serializer_class = DetallePedidoSerializer
 
+    def get_queryset(self):
+        return filtrar_detalles(super().get_queryset(), self.request.query_params)
+
 
 # -----------------------------------------------------------------
 # VISTAS PERSONALIZADAS (Lógica de Negocio)
 # -----------------------------------------------------------------
 
+def _encolada(tarea):
+    """202 con el estado de la tarea: el cliente consulta /core/api/tareas/<id>/ hasta que termine."""
+    return Response(cola.estado(tarea), status=status.HTTP_202_ACCEPTED)
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def asignar_ruta(request):
+    """
+    Agrega `pedido_ids` a la ruta del conductor. Con la cola de tareas
+    activa responde 202 con la tarea (ver cola.py); si no, 201 con el
+    resultado.
+
+    Un pedido que ya está en una ruta da 409, salvo con `reasignar: true`:
+    entonces se saca de la ruta de su conductor anterior.
+    """
     try:
         conductor_id = request.data.get('conductor_id')
         pedido_ids = request.data.get('pedido_ids')
+        reasignar = request.data.get('reasignar') in (True, 'true', '1', 1)
 
         if not conductor_id or not pedido_ids:
             return Response({"error": "Faltan datos."}, status=status.HTTP_400_BAD_REQUEST)
@@ -107,89 +227,119 @@ def asignar_ruta(request):
         if not pedidos_nuevos:
             return Response({"error": "Pedidos no encontrados."}, status=status.HTTP_404_NOT_FOUND)
 
-        # 1. Buscar ruta activa
-        ruta_actual = Ruta.objects.filter(conductor=conductor).last()
-        ruta_activa = None
-        if ruta_actual:
-            pendientes = Pedido.objects.filter(ruta=ruta_actual).exclude(estado='entregado').exists()
-            if pendientes:
-                ruta_activa = ruta_actual
-
-        # 2. Punto de partida
-        if ruta_activa:
-            ultimo_pedido = Pedido.objects.filter(ruta=ruta_activa).last()
-            if ultimo_pedido:
-                ubicacion_actual = {'lat': float(ultimo_pedido.latitud), 'lng': float(ultimo_pedido.longitud)}
-            else:
-                ubicacion_actual = {'lat': -17.393879, 'lng': -66.156944}
-        else:
-            ubicacion_actual = {'lat': -17.393879, 'lng': -66.156944}
-
-        # 3. Algoritmo Vecino Más Cercano
-        ruta_ordenada = []
-        
-        while pedidos_nuevos:
-            mas_cercano = None
-            distancia_minima = float('inf')
-
-            for pedido in pedidos_nuevos:
-                if not pedido.latitud or not pedido.longitud:
-                    continue
-                
-                lat_diff = float(pedido.latitud) - ubicacion_actual['lat']
-                lng_diff = float(pedido.longitud) - ubicacion_actual['lng']
-                distancia = math.sqrt(lat_diff**2 + lng_diff**2)
-
-                if distancia < distancia_minima:
-                    distancia_minima = distancia
-                    mas_cercano = pedido
-
-            if mas_cercano:
-                ruta_ordenada.append(mas_cercano)
-                ubicacion_actual = {'lat': float(mas_cercano.latitud), 'lng': float(mas_cercano.longitud)}
-                pedidos_nuevos.remove(mas_cercano)
-            else:
-                ruta_ordenada.extend(pedidos_nuevos)
-                break
-
-        # 4. Guardar
-        puntos_nuevos = ""
-        for pedido in ruta_ordenada:
-            puntos_nuevos += f"({pedido.latitud}, {pedido.longitud}); "
-
-        if ruta_activa:
-            ruta_final = ruta_activa
-            ruta_final.puntos_de_entrega += puntos_nuevos
-            ruta_final.save()
-            mensaje = f"Pedidos agregados a la Ruta #{ruta_final.id}."
-        else:
-            ruta_final = Ruta.objects.create(
-                conductor=conductor,
-                puntos_de_entrega=puntos_nuevos,
-                distancia=10.0, 
-                tiempo_estimado=60
+        ya_asignados = [p.id for p in pedidos_nuevos if p.ruta_id is not None]
+        if ya_asignados and not reasignar:
+            return Response(
+                {"error": "Algunos pedidos ya tienen ruta.", "pedido_ids": ya_asignados},
+                status=status.HTTP_409_CONFLICT
             )
-            mensaje = f"Nueva Ruta #{ruta_final.id} creada."
-
-        conductor.estado = 'en_ruta'
-        conductor.save()
-        
-        for pedido in ruta_ordenada:
-            pedido.ruta = ruta_final
-            pedido.estado = 'en_camino'
-            pedido.save()
 
-        return Response({"mensaje": mensaje}, status=status.HTTP_201_CREATED)
+        pedido_ids = [p.id for p in pedidos_nuevos]
+        if cola.activa():
+            return _encolada(cola.encolar(
+                'asignar_ruta', conductor_id=conductor.id, pedido_ids=pedido_ids, reasignar=reasignar,
+            ))
+        return Response(tareas.asignar_ruta(conductor.id, pedido_ids, reasignar), status=status.HTTP_201_CREATED)
 
+    except ConflictoAsignacion as e:
+        return Response({"error": str(e)}, status=status.HTTP_409_CONFLICT)
     except Conductor.DoesNotExist:
         return Response({"error": "Conductor no encontrado."}, status=status.HTTP_404_NOT_FOUND)
     except Exception as e:
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def despacho_masivo(request):
+    """
+    Reparte todos los pedidos pendientes entre los conductores disponibles
+    (respetando la capacidad de su vehículo) y crea una ruta por conductor.
+    Opcionalmente se puede limitar con `pedido_ids` y `conductor_ids`.
+    Como asignar_ruta, con la cola activa responde 202 con la tarea.
+    """
+    argumentos = {
+        'pedido_ids': request.data.get('pedido_ids'),
+        'conductor_ids': request.data.get('conductor_ids'),
+    }
+    if cola.activa():
+        return _encolada(cola.encolar('despacho_masivo', **argumentos))
+    try:
+        return Response(tareas.despacho_masivo(**argumentos), status=status.HTTP_201_CREATED)
+    except cola.ErrorTarea as e:
+        return Response({"error": str(e), **e.datos}, status=status.HTTP_400_BAD_REQUEST)
+    except ConflictoAsignacion as e:
+        return Response({"error": str(e)}, status=status.HTTP_409_CONFLICT)
+    except Exception as e:
+        return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def ruta_vial_view(request):
+    """
+    Recorrido por calles entre `puntos` [[lat, lng], ...] en el orden dado.
+    Se calcula en el servidor con el extracto OSM local (ver ruteo_vial.py).
+    """
+    puntos = request.data.get('puntos') or []
+    try:
+        puntos = [(float(lat), float(lng)) for lat, lng in puntos]
+    except (TypeError, ValueError):
+        return Response({"error": "'puntos' debe ser una lista de [lat, lng]."}, status=status.HTTP_400_BAD_REQUEST)
+    if len(puntos) < 2:
+        return Response({"error": "Se necesitan al menos 2 puntos."}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        return Response(ruteo_vial.ruta(puntos))
+    except SinRuteoVial as e:
+        return Response({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
+def _origen_de_ruta(ruta):
+    """Desde dónde se ordenó la ruta (las rutas anteriores a guardarlo salían de la planta)."""
+    if ruta.origen_latitud is None or ruta.origen_longitud is None:
+        return {"lat": ORIGEN_POR_DEFECTO[0], "lng": ORIGEN_POR_DEFECTO[1]}
+    return {"lat": float(ruta.origen_latitud), "lng": float(ruta.origen_longitud)}
+
+
+def _calcular_mi_ruta(ruta):
+    """(cabecera, filas) de la ruta: las paradas pendientes en orden de visita."""
+    # Las paradas ya vienen en el orden de visita (índice ruta + secuencia)
+    paradas = (
+        RutaParada.objects
+        .filter(ruta=ruta)
+        .exclude(pedido__estado='entregado')
+        .order_by('secuencia')
+    )
+    datos_pedidos = lectura_rapida.paradas_con_pedidos(paradas)
+    cabecera = {
+        "ruta_id": ruta.id,
+        "origen": _origen_de_ruta(ruta),
+        "distancia_total": str(ruta.distancia),
+        "tiempo_estimado": ruta.tiempo_estimado,
+    }
+    return cabecera, datos_pedidos
+
+
+def _version_pedida(request, ruta):
+    """?since=<ruta>:<versión> (la `version` de la respuesta anterior); None si es de otra ruta."""
+    ruta_id, _, version = request.query_params.get('since', '').partition(':')
+    if ruta_id != str(ruta.id):
+        return None
+    try:
+        return int(version)
+    except ValueError:
+        return None
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def mi_ruta_view(request):
+    """
+    Paradas pendientes de la ruta actual del conductor (ver cache_mi_ruta.py).
+    Con ?since=<version> devuelve sólo las paradas `cambiadas` y los ids
+    `quitados` desde esa versión; `completa` indica si la lista es entera.
+    """
     usuario_logueado = request.user
     try:
         conductor = usuario_logueado.conductor
@@ -200,91 +350,30 @@ def mi_ruta_view(request):
     if not ultima_ruta:
         return Response({"mensaje": "No tienes rutas asignadas."}, status=status.HTTP_200_OK)
 
-    pedidos = Pedido.objects.filter(ruta=ultima_ruta).exclude(estado='entregado')
-    if not pedidos.exists():
-         return Response({"mensaje": "Has completado tu ruta."}, status=status.HTTP_200_OK)
+    estado = cache_mi_ruta.obtener(ultima_ruta, lambda: _calcular_mi_ruta(ultima_ruta))
+    filas, quitados, completa = cache_mi_ruta.filas_desde(estado, _version_pedida(request, ultima_ruta))
+    version = f"{ultima_ruta.id}:{estado['version']}"
 
-    serializer = PedidoConductorSerializer(pedidos, many=True)
-    return Response({
-        "ruta_id": ultima_ruta.id,
-        "conductor": conductor.nombre,
-        "origen": {"lat": -17.393879, "lng": -66.156944},
-        "pedidos": serializer.data
-    })
+    if completa and not filas:
+        return Response({"mensaje": "Has completado tu ruta.", "version": version}, status=status.HTTP_200_OK)
+    datos = {**estado['cabecera'], "conductor": conductor.nombre, "version": version, "completa": completa}
+    if completa:
+        datos["pedidos"] = filas
+    else:
+        datos["cambiados"] = filas
+        datos["quitados"] = quitados
+    return Response(datos)
 
 
 # --- ESTA ES LA FUNCIÓN QUE TE FALTABA ---
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@respuesta_cacheada('reportes')
 def dashboard_analytics_view(request):
     """
     API para el Dashboard de Reportes.
     """
-    hoy = timezone.now().date()
-    inicio_mes = hoy.replace(day=1)
-    hace_7_dias = hoy - datetime.timedelta(days=7)
-
-    # KPIs
-    total_pedidos_mes = Pedido.objects.filter(hora_entrega__gte=inicio_mes).count()
-    entregados_mes = Pedido.objects.filter(hora_entrega__gte=inicio_mes, estado='entregado').count()
-    tasa_exito = round((entregados_mes / total_pedidos_mes * 100), 1) if total_pedidos_mes > 0 else 0
-    
-    conductores_activos = Conductor.objects.filter(estado='en_ruta').count()
-    conductores_totales = Conductor.objects.count()
-    incidencias_pendientes = Incidencia.objects.count()
-
-    # Gráfico Línea
-    pedidos_por_dia = (
-        Pedido.objects.filter(hora_entrega__date__gte=hace_7_dias)
-        .annotate(dia=TruncDate('hora_entrega'))
-        .values('dia')
-        .annotate(cantidad=Count('id'))
-        .order_by('dia')
-    )
-    grafico_dias_labels = [item['dia'].strftime("%d/%m") for item in pedidos_por_dia]
-    grafico_dias_data = [item['cantidad'] for item in pedidos_por_dia]
-
-    # Gráfico Dona
-    pendientes = Pedido.objects.filter(estado='pendiente').count()
-    en_camino = Pedido.objects.filter(estado='en_camino').count()
-    entregados_hoy = Pedido.objects.filter(estado='entregado', hora_entrega__date=hoy).count()
-
-    # Tops
-    top_conductores = (
-        Conductor.objects
-        .annotate(entregas=Count('ruta__pedido', filter=Q(ruta__pedido__estado='entregado')))
-        .order_by('-entregas')[:5]
-        .values('nombre', 'entregas')
-    )
-    
-    top_productos = (
-        DetallePedido.objects
-        .values('producto__nombre')
-        .annotate(total_vendido=Sum('cantidad'))
-        .order_by('-total_vendido')[:5]
-    )
-
-    data = {
-        "kpis": {
-            "total_mes": total_pedidos_mes,
-            "tasa_exito": tasa_exito,
-            "conductores_activos": conductores_activos,
-            "conductores_totales": conductores_totales,
-            "incidencias": incidencias_pendientes
-        },
-        "grafico_dias": {
-            "labels": grafico_dias_labels,
-            "data": grafico_dias_data
-        },
-        "grafico_estados": {
-            "pendientes": pendientes,
-            "en_camino": en_camino,
-            "entregados_hoy": entregados_hoy
-        },
-        "top_conductores": list(top_conductores),
-        "top_productos": list(top_productos)
-    }
-    return Response(data, status=status.HTTP_200_OK)
+    return Response(resumen_dashboard(), status=status.HTTP_200_OK)
 
 
 @api_view(['GET'])
@@ -292,10 +381,8 @@ def dashboard_analytics_view(request):
 def historial_conductor_view(request):
     try:
         conductor = request.user.conductor
-        rutas = Ruta.objects.filter(conductor=conductor)
-        pedidos = Pedido.objects.filter(ruta__in=rutas, estado='entregado').order_by('-id')
-        serializer = PedidoConductorSerializer(pedidos, many=True)
-        return Response(serializer.data)
+        pedidos = Pedido.objects.filter(ruta__conductor=conductor, estado='entregado').order_by('-id')
+        return Response(lectura_rapida.pedidos_conductor(pedidos))
     except AttributeError:
         return Response({"error": "No eres conductor."}, status=status.HTTP_403_FORBIDDEN)
 
@@ -320,74 +407,103 @@ def reportar_incidencia_view(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@respuesta_cacheada('reportes')
 def reportes_view(request):
-    """Dashboard de estadísticas y gráficos."""
-    hoy = timezone.now().date()
-    inicio_mes = hoy.replace(day=1)
-    hace_7_dias = hoy - datetime.timedelta(days=7)
-
-    # KPIs
-    total_entregados = Pedido.objects.filter(estado='entregado').count()
-    total_pendientes = Pedido.objects.filter(estado='pendiente').count()
-    total_en_camino = Pedido.objects.filter(estado='en_camino').count()
-    conductores_libres = Conductor.objects.filter(estado='disponible').count()
-    conductores_ocupados = Conductor.objects.filter(estado='en_ruta').count()
-    
-    incidencias = Incidencia.objects.count()
-
-    # Gráfico Línea (7 días)
-    pedidos_por_dia = (
-        Pedido.objects.filter(hora_entrega__date__gte=hace_7_dias)
-        .annotate(dia=TruncDate('hora_entrega'))
-        .values('dia')
-        .annotate(cantidad=Count('id'))
-        .order_by('dia')
-    )
-    grafico_dias_labels = [item['dia'].strftime("%d/%m") for item in pedidos_por_dia]
-    grafico_dias_data = [item['cantidad'] for item in pedidos_por_dia]
-
-    # Gráfico Dona (Estados actuales)
-    pendientes = Pedido.objects.filter(estado='pendiente').count()
-    en_camino = Pedido.objects.filter(estado='en_camino').count()
-    entregados_hoy = Pedido.objects.filter(estado='entregado', hora_entrega__date=hoy).count()
-
-    # Top Conductores
-    top_conductores = (
-        Conductor.objects
-        .annotate(entregas=Count('ruta__pedido', filter=Q(ruta__pedido__estado='entregado')))
-        .order_by('-entregas')[:5]
-        .values('nombre', 'entregas')
-    )
-    
-    # Top Productos
-    top_productos = (
-        DetallePedido.objects
-        .values('producto__nombre')
-        .annotate(total_vendido=Sum('cantidad'))
-        .order_by('-total_vendido')[:5]
-    )
+    """Dashboard de estadísticas y gráficos (mismos datos que dashboard_analytics_view)."""
+    return Response(resumen_dashboard(), status=status.HTTP_200_OK)
 
-    data = {
-        "kpis": {
-            "total_mes": total_entregados + total_pendientes + total_en_camino,
-            "tasa_exito": 95, # Simulado o calculado
-            "conductores_activos": conductores_ocupados,
-            "conductores_totales": conductores_libres + conductores_ocupados,
-            "incidencias": incidencias
-        },
-        "grafico_dias": {
-            "labels": grafico_dias_labels,
-            "data": grafico_dias_data
-        },
-        "grafico_estados": {
-            "pendientes": pendientes,
-            "en_camino": en_camino,
-            "entregados_hoy": entregados_hoy
-        },
-        "top_conductores": list(top_conductores),
-        "top_productos": list(top_productos)
-    }
-    return Response(data, status=status.HTTP_200_OK)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def tarea_view(request, pk):
+    """Estado de una tarea de la cola; `resultado` es lo que habría devuelto la vista que la creó."""
+    try:
+        return Response(cola.estado(Tarea.objects.get(pk=pk)))
+    except Tarea.DoesNotExist:
+        return Response({"error": "Tarea no encontrada."}, status=status.HTTP_404_NOT_FOUND)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def cache_estado_view(request):
+    """Aciertos, fallos y 304 de la caché de respuestas, por grupo (ver cache_respuestas.py)."""
+    return Response(contadores())
+
+# -----------------------------------------------------------------
+# EXPORTACIÓN CSV / NDJSON (ver exportacion.py)
+# -----------------------------------------------------------------
+# ?formato=csv (por defecto) o ndjson, y los mismos filtros que /pedidos/
+# (desde, hasta, estado, conductor, ruta, cliente, caja).
+
+def _exportar(request, queryset, columnas, nombre):
+    formato = request.query_params.get('formato', 'csv')
+    if formato not in TIPOS_CONTENIDO:
+        return Response({"error": "'formato' debe ser csv o ndjson."}, status=status.HTTP_400_BAD_REQUEST)
+    partes = [nombre, request.query_params.get('desde'), request.query_params.get('hasta')]
+    return respuesta_exportacion(request, queryset, columnas, formato, '_'.join(p for p in partes if p))
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def exportar_pedidos_view(request):
+    """Pedidos con sus detalles, una fila por detalle."""
+    pedidos = filtrar_pedidos(Pedido.objects.all(), request.query_params).order_by('id', 'detalles__id')
+    return _exportar(request, pedidos, COLUMNAS_PEDIDOS, 'pedidos')
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def exportar_rutas_view(request):
+    """Rutas con sus paradas en orden; las fechas y demás filtros se aplican a los pedidos de las paradas."""
+    pedidos = filtrar_pedidos(Pedido.objects.all(), request.query_params)
+    paradas = RutaParada.objects.filter(pedido__in=pedidos).order_by('ruta_id', 'secuencia')
+    return _exportar(request, paradas, COLUMNAS_PARADAS, 'rutas')
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def exportar_historial_view(request):
+    """
+    Entregas hechas, como historial_conductor_view. Un conductor sólo
+    exporta las suyas; el despacho puede elegir con ?conductor=.
+    """
+    pedidos = filtrar_pedidos(Pedido.objects.filter(estado='entregado'), request.query_params)
+    conductor = getattr(request.user, 'conductor', None)
+    if conductor is not None:
+        pedidos = pedidos.filter(ruta__conductor=conductor)
+    return _exportar(request, pedidos.order_by('-id', 'detalles__id'), COLUMNAS_PEDIDOS, 'historial')
+
+# -----------------------------------------------------------------
+# TELEMETRÍA GPS (ver telemetria.py)
+# -----------------------------------------------------------------
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def telemetria_view(request):
+    """
+    Lote de posiciones del conductor: {"muestras": [{"lat", "lng", "t"}, ...]}
+    con `t` en milisegundos Unix. Responde cuántas se guardaron y cuántas se
+    descartaron por repetidas.
+    """
+    try:
+        conductor = request.user.conductor
+    except AttributeError:
+        return Response({"error": "No eres conductor."}, status=status.HTTP_403_FORBIDDEN)
+    try:
+        guardadas, descartadas = registrar_muestras(conductor.id, request.data.get('muestras'))
+    except MuestraInvalida as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({"guardadas": guardadas, "descartadas": descartadas}, status=status.HTTP_202_ACCEPTED)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def posiciones_view(request):
+    """Última posición de cada conductor que mandó su GPS hace poco."""
+    return Response([
+        {"conductor_id": conductor_id, "lat": p.latitud, "lng": p.longitud, "momento": p.momento}
+        for conductor_id, p in sorted(ultimas_posiciones().items())
+    ])
 
 # -----------------------------------------------------------------
 # LOGIN
@@ -5,6 +5,11 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+Los eventos en vivo (/core/api/eventos/, ver apps/core/eventos.py) sólo
+funcionan sirviendo este módulo, p. ej.:
+
+    uvicorn djangoproject.asgi:application
 """
 
 import os
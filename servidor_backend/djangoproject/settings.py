@@ -49,6 +49,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # Comprime lo que devuelven los de abajo (ver COMPRESION)
+    'apps.core.compresion.CompresionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
 
     # --- AÑADIDO PARA CLIENTE-SERVIDOR ---
@@ -90,6 +92,15 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # El servidor y los trabajadores de la cola (trabajar_tareas) escriben a la vez:
+        # WAL deja leer mientras otro escribe, IMMEDIATE toma el bloqueo de escritura al
+        # empezar la transacción (si no, SQLite falla con "database is locked" en vez de
+        # esperar) y `timeout` es cuántos segundos se espera ese bloqueo.
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+            'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;',
+        },
     }
 }
 
@@ -131,7 +142,19 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.TokenAuthentication',
     ],
-    
+    # Listados por cursor: {"next", "previous", "results"} (ver apps/core/paginacion.py)
+    'DEFAULT_PAGINATION_CLASS': 'apps.core.paginacion.PaginacionCursor',
+    'PAGE_SIZE': 100,
+    # JSON con orjson (ver apps/core/renderizadores.py)
+    'DEFAULT_RENDERER_CLASSES': [
+        'apps.core.renderizadores.RenderizadorJSON',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'apps.core.renderizadores.ParserJSON',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
 # Lista de "orígenes" (tu app de React) que tienen permiso para conectarse
@@ -147,3 +170,178 @@ MEDIA_URL = '/media/'
 
 # Carpeta física donde se guardarán
 MEDIA_ROOT = BASE_DIR / 'media'
+
+# --- OPTIMIZACIÓN DE RUTAS ---
+# MOTOR: 'vecino_mas_cercano' o '2opt_oropt' (ver apps/core/optimizacion.py)
+# TIEMPO_LIMITE: segundos máximos de mejora local por asignación
+# TIEMPO_LIMITE_INSERCION: mejora local al agregar pedidos a una ruta en curso (0 = sólo inserción)
+OPTIMIZADOR_RUTAS = {
+    'MOTOR': '2opt_oropt',
+    'TIEMPO_LIMITE': 2.0,
+    'TIEMPO_LIMITE_INSERCION': 0.5,
+}
+
+# --- DESPACHO MASIVO ---
+# PROCESOS: procesos para optimizar grupos en paralelo (None = núcleos de la CPU)
+# MIN_PEDIDOS_PARALELO: por debajo de esto se optimiza en el mismo proceso
+DESPACHO = {
+    'PROCESOS': None,
+    'MIN_PEDIDOS_PARALELO': 200,
+}
+
+# --- ÍNDICE ESPACIAL ---
+# PRECISION_GEOHASH: caracteres de la columna `geocelda` (7 ≈ celdas de 150 m)
+# CELDA_GRADOS: lado de las celdas de la grilla en memoria (0.01° ≈ 1.1 km)
+# MAX_CELDAS_CAJA: máximo de rangos de geohash por consulta de zona
+INDICE_ESPACIAL = {
+    'PRECISION_GEOHASH': 7,
+    'CELDA_GRADOS': 0.01,
+    'MAX_CELDAS_CAJA': 32,
+}
+
+# --- ESTIMACIÓN DE TIEMPOS (distancias y ETA de cada parada) ---
+# VELOCIDAD_KMH: velocidad promedio en ciudad
+# SERVICIO_MIN: minutos que se demora en cada entrega
+ESTIMACION_TIEMPOS = {
+    'VELOCIDAD_KMH': 25.0,
+    'SERVICIO_MIN': 5.0,
+}
+
+# --- CACHÉ DE DISTANCIAS ENTRE CLIENTES ---
+# Archivos .npy con memoria mapeada (ver apps/core/matriz_distancias.py).
+# Se arma sola la primera vez; para rehacerla: python manage.py reconstruir_matriz_distancias
+# MAX_CLIENTES: la matriz ocupa MAX_CLIENTES² x 4 bytes en disco (256 MB con 8192). Con más
+#   clientes con GPS no se usa y el optimizador calcula las distancias de cada ruta.
+MATRIZ_DISTANCIAS = {
+    'ACTIVA': True,
+    'RUTA': BASE_DIR / 'cache' / 'matriz_clientes',
+    'CAPACIDAD_INICIAL': 1024,
+    'MAX_CLIENTES': 8192,
+}
+
+# --- RUTEO POR CALLES (sin servicios externos) ---
+# EXTRACTO_OSM: archivo .osm / .osm.gz / .osm.bz2 de la ciudad (None = desactivado, la API responde 503)
+#   La primera vez se arma el grafo y se guarda en <extracto>.grafo.npz
+# LANDMARKS: nodos de referencia para acelerar A* (más = consultas más rápidas, preproceso más largo)
+# CACHE_RUTAS: recorridos guardados en memoria por secuencia de paradas
+# USAR_EN_OPTIMIZADOR: ordenar las rutas con distancias por calle en vez de línea recta
+# MAX_PUNTOS_OPTIMIZADOR: por encima de esto el optimizador vuelve a la línea recta
+RUTEO_VIAL = {
+    'EXTRACTO_OSM': None,  # p. ej. BASE_DIR / 'datos' / 'cochabamba.osm.gz'
+    'LANDMARKS': 8,
+    'CACHE_RUTAS': 512,
+    'USAR_EN_OPTIMIZADOR': False,
+    'MAX_PUNTOS_OPTIMIZADOR': 40,
+}
+
+# --- CACHÉ ---
+# LocMemCache sirve con un solo proceso. Con varios workers conviene uno compartido
+# para que la invalidación llegue a todos, p. ej.:
+#   {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': BASE_DIR / 'cache' / 'django'}
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'pil',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    }
+}
+
+# --- CACHÉ DE RESPUESTAS (reportes y catálogo, ver apps/core/cache_respuestas.py) ---
+# ALIAS: qué entrada de CACHES usar
+# TTL: segundos por grupo; las escrituras invalidan antes por señales
+CACHE_RESPUESTAS = {
+    'ACTIVA': True,
+    'ALIAS': 'default',
+    'TTL': {'reportes': 60, 'productos': 300, 'categorias': 300},
+}
+
+# --- CACHÉ DE MI-RUTA (por ruta, con ?since= para traer sólo cambios, ver apps/core/cache_mi_ruta.py) ---
+# TTL: segundos que se guarda cada ruta; los cambios la invalidan antes por señales
+CACHE_MI_RUTA = {
+    'ACTIVA': True,
+    'ALIAS': 'default',
+    'TTL': 6 * 60 * 60,
+}
+
+# --- EVENTOS EN VIVO (SSE en /core/api/eventos/, ver apps/core/eventos.py) ---
+# Requiere ASGI: uvicorn djangoproject.asgi:application (con runserver la vista responde 503)
+# CANAL: clase del pub/sub; CanalLocal vive en memoria (un solo proceso)
+# HISTORIAL: eventos guardados para reenviar al reconectarse
+# MAX_COLA: eventos sin leer por cliente antes de pedirle que recargue
+# LATIDO: segundos entre comentarios vacíos que mantienen viva la conexión
+EVENTOS = {
+    'CANAL': 'apps.core.eventos.CanalLocal',
+    'HISTORIAL': 500,
+    'MAX_COLA': 200,
+    'LATIDO': 15,
+}
+
+# --- TELEMETRÍA GPS DE CONDUCTORES (ver apps/core/telemetria.py) ---
+# BASE: alias de DATABASES donde se guardan las muestras. Para que no compitan con
+#   las escrituras de pedidos (SQLite bloquea toda la base al escribir) se puede usar
+#   un archivo aparte, p. ej. DATABASES['telemetria'] = {'ENGINE': 'django.db.backends.sqlite3',
+#   'NAME': BASE_DIR / 'telemetria.sqlite3'}, BASE = 'telemetria' y
+#   python manage.py migrate --database telemetria
+# INTERVALO_MINIMO_S / DISTANCIA_MINIMA_M: se descartan muestras más seguidas que esto sin moverse
+# VIGENCIA_MIN: una posición más vieja no se usa como punto de partida del optimizador
+# RETENCION_DIAS / DIAS_DETALLE: python manage.py depurar_telemetria
+TELEMETRIA = {
+    'BASE': 'default',
+    'MAX_MUESTRAS_POR_LOTE': 500,
+    'INTERVALO_MINIMO_S': 5,
+    'DISTANCIA_MINIMA_M': 25,
+    'VIGENCIA_MIN': 10,
+    'RETENCION_DIAS': 30,
+    'DIAS_DETALLE': 2,
+}
+DATABASE_ROUTERS = ['apps.core.routers.RouterTelemetria']
+
+# --- VARIANTES DE IMÁGENES DE PRODUCTOS (ver apps/core/imagenes.py) ---
+# TAMANOS: lado máximo en px de cada variante; se generan en WebP y JPEG
+# MAX_AGE: Cache-Control de /media/productos/variantes/ (los nombres llevan el hash del contenido)
+# Para las imágenes cargadas antes: python manage.py generar_variantes
+VARIANTES = {
+    'TAMANOS': {'thumb': 200, 'medium': 600},
+    'CALIDAD': {'webp': 80, 'jpeg': 82},
+    'CARPETA': 'productos/variantes',
+    'MAX_AGE': 365 * 24 * 60 * 60,
+}
+
+# --- COLA DE TAREAS (ver apps/core/cola.py) ---
+# Asignar rutas, el despacho masivo, las variantes de imágenes y la reconstrucción de
+# estadísticas se guardan como Tarea y responden enseguida con su id. Las ejecuta:
+#   python manage.py trabajar_tareas     (junto a runserver / uvicorn)
+# ACTIVA: False = sin cola, todo se hace dentro de la request como antes. Para activarla
+#   CACHES no puede usar LocMemCache y EVENTOS['CANAL'] tiene que ser compartido (con
+#   compartido = True): si no, los trabajadores invalidarían y publicarían en su propia
+#   memoria y la cola se ignora con un aviso en el log
+# PROCESOS: procesos del trabajador; ESPERA_S: pausa cuando la cola está vacía
+# TIEMPO_MAXIMO_S: una tarea en curso por más tiempo se da por abandonada y vuelve a la cola
+# RETRASO_BASE_S: espera antes del primer reintento (se duplica en cada uno)
+# CONSERVAR_DIAS: las tareas terminadas se borran después de esto
+TAREAS = {
+    'ACTIVA': False,
+    'PROCESOS': 2,
+    'ESPERA_S': 1.0,
+    'TIEMPO_MAXIMO_S': 15 * 60,
+    'RETRASO_BASE_S': 10,
+    'CONSERVAR_DIAS': 7,
+}
+
+# --- EXPORTACIÓN CSV / NDJSON (/core/api/exportar/..., ver apps/core/exportacion.py) ---
+# CHUNK: filas que se leen de la base y se envían por bloque (la memoria no depende del total)
+EXPORTACION = {
+    'CHUNK': 2000,
+}
+
+# --- COMPRESIÓN DE RESPUESTAS (brotli o gzip según Accept-Encoding, ver apps/core/compresion.py) ---
+# brotli es opcional (pip install brotli); sin él se usa sólo gzip
+# UMBRAL: bytes mínimos para comprimir (las respuestas streaming se comprimen siempre)
+# TIPOS: Content-Type que se comprimen; text/event-stream (SSE) nunca
+COMPRESION = {
+    'ACTIVA': True,
+    'UMBRAL': 1024,
+    'NIVEL_GZIP': 6,
+    'CALIDAD_BROTLI': 5,
+    'TIPOS': ['application/json', 'application/x-ndjson', 'text/csv', 'text/plain', 'text/html'],
+}
@@ -4,6 +4,7 @@ from django.contrib import admin
 from django.urls import path, include  # <-- Asegúrate de importar 'include'
 from django.conf import settings
 from django.conf.urls.static import static
+from apps.core.imagenes import variante_view
 urlpatterns = [
     path('admin/', admin.site.urls),
     
@@ -11,6 +12,9 @@ urlpatterns = [
     # "Cualquier URL que empiece con 'core/', 
     # envíala al archivo 'apps.core.urls'".
     path('core/', include('apps.core.urls')), 
+
+    # Variantes de imágenes de productos: nombre con hash, caché de un año (ver apps/core/imagenes.py)
+    path('media/productos/variantes/<str:nombre>', variante_view, name='variante_imagen'),
 ]
 # --- AÑADE ESTO AL FINAL ---
 if settings.DEBUG: